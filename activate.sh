@@ -12,8 +12,8 @@ if [ -d "venv" ]; then
     echo "Nubilum: v$(python -c 'from nubilum import __version__; print(__version__)')"
     echo ""
     echo "To run the application:"
-    echo "  python -m nubilum.app         # Development server (port 5000)"
-    echo "  gunicorn nubilum.app:app      # Production server"
+    echo "  python -m nubilum.app                # Development server (port 5000)"
+    echo "  gunicorn 'nubilum.app:create_app()'  # Production server"
     echo ""
 else
     echo "Error: Virtual environment not found!"
@@ -0,0 +1,103 @@
+"""Columnar export benchmark.
+
+Exports anonymized ORU messages (default 20,000, 12 OBX segments each) to
+Parquet and compares, on the ER7 text and on the Parquet file:
+- loading every field into a table (splitting ER7 in Python vs reading Parquet)
+- counting segments by type (regex vs a grouped Parquet scan)
+- all OBX-5 values of glucose results (regex vs a Parquet scan with filters)
+
+Usage:
+    python -m benchmarks.bench_columnar [--messages 20000]
+"""
+
+import argparse
+import os
+import re
+import tempfile
+import time
+from collections import Counter
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from nubilum.columnar import anonymize_messages, export_messages, segment_rows
+
+
+def _message(n: int) -> str:
+    segments = [
+        f"MSH|^~\\&|LAB|HOSPITAL|EHR|HOSPITAL|20250107120000||ORU^R01|MSG{n}|P|2.5",
+        f"PID|1||{100000 + n}^^^HOSPITAL^MR||Silva^Ana||19800515|F",
+        "OBR|1|ORD1|FIL1|PANEL^Chemistry panel",
+    ]
+    for i in range(12):
+        code = 'GLU^Glucose' if i == 0 else f'T{i}^Test {i}'
+        segments.append(f"OBX|{i + 1}|NM|{code}||{(n + i) % 100 / 10}|mmol/L|||||F")
+    return '\n'.join(segments)
+
+
+def _report(name: str, text_seconds: float, parquet_seconds: float) -> None:
+    print(f"{name}")
+    print(f"  ER7 text {text_seconds * 1000:8.1f} ms")
+    print(f"  parquet  {parquet_seconds * 1000:8.1f} ms ({text_seconds / parquet_seconds:.1f}x)")
+
+
+def _timed(function):
+    started = time.perf_counter()
+    result = function()
+    return result, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--messages', type=int, default=20000)
+    args = parser.parse_args()
+
+    anonymized = list(anonymize_messages(_message(n) for n in range(args.messages)))
+    text = '\n\n'.join(anonymized)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, 'export.parquet')
+
+        stats, elapsed = _timed(lambda: export_messages(anonymized, path))
+        print(f"Export: {stats['rows']} rows in {elapsed:.2f} s "
+              f"({os.path.getsize(path) / 1024 / 1024:.1f} MB Parquet, "
+              f"{len(text) / 1024 / 1024:.1f} MB ER7)\n")
+
+        rows, text_seconds = _timed(lambda: [row for message in text.split('\n\n')
+                                             for row in segment_rows(message)])
+        table, parquet_seconds = _timed(lambda: pq.read_table(path))
+        assert len(rows) == table.num_rows
+        _report("Load all fields", text_seconds, parquet_seconds)
+
+        counts, text_seconds = _timed(
+            lambda: Counter(re.findall(r'^([A-Z0-9]{3})\|', text, re.M)))
+
+        def segment_counts():
+            # Every segment of the sample has field 1 (MSH-1 or a set ID)
+            table = pq.read_table(path, columns=['segment'], filters=[('field', '=', 1)])
+            return table.group_by('segment').aggregate([([], 'count_all')])
+
+        grouped, parquet_seconds = _timed(segment_counts)
+        assert sum(grouped['count_all'].to_pylist()) == sum(counts.values())
+        _report("Segments per type", text_seconds, parquet_seconds)
+
+        pattern = re.compile(r'^OBX\|[^|\n]*\|[^|\n]*\|GLU\^[^|\n]*\|[^|\n]*\|([^|\n]*)', re.M)
+        regex_values, text_seconds = _timed(lambda: pattern.findall(text))
+
+        def glucose():
+            obx = pq.read_table(path, columns=['message', 'segment_index', 'field', 'value'],
+                                filters=[('segment', '=', 'OBX'), ('field', 'in', [3, 5])])
+            # Segments are identified by (message, segment_index)
+            keys = pc.add(pc.multiply(obx['message'], 65536), obx['segment_index'].cast(pa.int64()))
+            is_glucose = pc.and_(pc.equal(obx['field'], 3), pc.starts_with(obx['value'], 'GLU^'))
+            glucose_keys = pc.filter(keys, is_glucose).combine_chunks()
+            return obx.filter(pc.and_(pc.equal(obx['field'], 5), pc.is_in(keys, glucose_keys)))['value']
+
+        values, parquet_seconds = _timed(glucose)
+        assert len(values) == len(regex_values)
+        _report(f"Glucose values ({len(values)})", text_seconds, parquet_seconds)
+
+
+if __name__ == '__main__':
+    main()
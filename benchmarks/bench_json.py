@@ -0,0 +1,86 @@
+"""JSON backend benchmark.
+
+Compares the standard library with the active backend (orjson when
+installed) on:
+- serializing a ~1 MB /api/anonymize response through the Flask provider
+- parsing a usage log (default 200 MB; use --log-mb 4096 for a multi-GB scan)
+
+Usage:
+    python -m benchmarks.bench_json [--log-mb 200] [--runs 20]
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+from nubilum import jsonutil
+from nubilum.jsonutil import FastJSONProvider
+
+_EVENT = {
+    "timestamp": "2025-01-07T14:23:45.123456", "date": "2025-01-07", "time": "14:23:45",
+    "message_type": "ADT^A01", "segment_counts": {"MSH": 1, "EVN": 1, "PID": 1, "PV1": 1, "OBX": 12},
+    "total_segments": 16, "message_length": 2048, "success": True, "error": None,
+}
+
+
+def _time(function, runs: int) -> float:
+    started = time.perf_counter()
+    for _ in range(runs):
+        function()
+    return (time.perf_counter() - started) / runs
+
+
+def bench_response(runs: int) -> None:
+    segment = "OBX|1|TX|NOTE||Example text with some content\\r|||||F\n"
+    payload = {
+        'success': True,
+        'anonymized_message': segment * (1024 * 1024 // len(segment)),
+        'message_count': 1000,
+    }
+    app = Flask(__name__)
+    providers = (('json', DefaultJSONProvider(app)), (jsonutil.BACKEND, FastJSONProvider(app)))
+
+    print("1 MB anonymize response")
+    for name, provider in providers:
+        print(f"  {name:8s} {_time(lambda: provider.dumps(payload), runs) * 1000:8.2f} ms")
+
+
+def bench_log_scan(log_mb: int) -> None:
+    line = (json.dumps(_EVENT) + '\n').encode('utf-8')
+    count = log_mb * 1024 * 1024 // len(line)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, 'usage_log.jsonl')
+        with open(path, 'wb') as f:
+            block = line * 10000
+            for _ in range(count // 10000):
+                f.write(block)
+
+        print(f"Usage log scan ({os.path.getsize(path) / 1024 / 1024:.0f} MB)")
+        for name, loads in (('json', json.loads), (jsonutil.BACKEND, jsonutil.loads)):
+            started = time.perf_counter()
+            with open(path, 'rb') as f:
+                for raw in f:
+                    loads(raw)
+            elapsed = time.perf_counter() - started
+            print(f"  {name:8s} {elapsed:8.2f} s ({log_mb / elapsed:.0f} MB/s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--log-mb', type=int, default=200)
+    parser.add_argument('--runs', type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"Active backend: {jsonutil.BACKEND}\n")
+    bench_response(args.runs)
+    bench_log_scan(args.log_mb)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,87 @@
+"""Shared pseudonym table benchmark.
+
+Forks N workers that each anonymize the same ADT messages end to end, one new
+HL7Anonymizer per message as the API does per request, with and without one
+SharedPseudonymTable created before forking, and reports each worker's time,
+table hit rate and private memory growth (Linux only).
+
+Usage (from the repository root):
+    python -m benchmarks.bench_pseudonym_table [--workers 4] [--messages 5000]
+"""
+
+import argparse
+import multiprocessing
+import os
+import time
+
+from nubilum.anonymizer import HL7Anonymizer
+from nubilum.pseudonym_table import SharedPseudonymTable
+
+_TEMPLATE = "\n".join([
+    "MSH|^~\\&|APP|FAC|REC|FAC|20250107120000||ADT^A01|MSG{n}|P|2.5",
+    "PID|1||{n:09d}^^^HOSP^MR~{m:09d}^^^SNS^NNPRT||Silva{n}^Ana^Maria||19800101|F|||"
+    "Rua das Flores {n}^^Porto^^4000-123||912345678",
+    "NK1|1|Costa{n}^Manuel|FTH",
+    "PV1|1|I|WARD^{n}^1||||{m:06d}^Doctor^Joao",
+])
+
+
+def _private_kb() -> int:
+    """Private (non-shared) memory of this process in kB."""
+    total = 0
+    with open('/proc/self/smaps_rollup') as f:
+        for line in f:
+            if line.startswith(('Private_Clean:', 'Private_Dirty:')):
+                total += int(line.split()[1])
+    return total
+
+
+def _worker(table, messages: list, results) -> None:
+    before = _private_kb()
+    started = time.perf_counter()
+
+    for message in messages:
+        HL7Anonymizer(pseudonym_table=table).anonymize_message(message)
+
+    results.put((os.getpid(), _private_kb() - before, time.perf_counter() - started,
+                 table.stats()['hit_rate'] if table is not None else None))
+
+
+def _run(workers: int, messages: list, shared: bool) -> list:
+    context = multiprocessing.get_context('fork')
+    table = SharedPseudonymTable(len(messages) * 8) if shared else None
+    results = context.Queue()
+
+    processes = [context.Process(target=_worker, args=(table, messages, results)) for _ in range(workers)]
+    for process in processes:
+        process.start()
+    output = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    if table is not None:
+        table.close()
+        table.unlink()
+    return output
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--messages', type=int, default=5000)
+    args = parser.parse_args()
+
+    messages = [_TEMPLATE.format(n=n, m=n * 7919 % 10 ** 9) for n in range(args.messages)]
+    # Import hl7apy and build the field tables before forking, as the preloaded master does
+    HL7Anonymizer().anonymize_message(messages[0])
+
+    for shared in (False, True):
+        print(f"\n{'Shared table' if shared else 'No table'} "
+              f"({args.workers} workers, {args.messages} messages each)")
+        for pid, private_kb, seconds, hit_rate in _run(args.workers, messages, shared):
+            hits = f", hit rate {hit_rate:.0%}" if hit_rate is not None else ""
+            print(f"  worker {pid}: {seconds:.2f}s, +{private_kb / 1024:.1f} MB private{hits}")
+
+
+if __name__ == '__main__':
+    main()
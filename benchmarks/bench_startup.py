@@ -0,0 +1,60 @@
+"""Startup-time benchmark.
+
+Measures, each in a fresh interpreter:
+- importing nubilum.app
+- the explicit warm-up phase
+- the first /api/field-name request on a cold worker vs a warmed-up worker
+
+Usage:
+    python -m benchmarks.bench_startup [--runs 5]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+_PROBE = r'''
+import json, os, time
+t0 = time.perf_counter()
+from nubilum.app import app, profile_registry
+from nubilum import warmup
+t1 = time.perf_counter()
+if os.environ['BENCH_WARM'] == '1':
+    warmup.warm_up(profile_registry)
+t2 = time.perf_counter()
+client = app.test_client()
+client.get('/api/field-name?segment=PID&field=5&version=2.5')
+t3 = time.perf_counter()
+client.get('/api/field-name?segment=PID&field=11&version=2.5')
+t4 = time.perf_counter()
+print(json.dumps({'import': t1 - t0, 'warmup': t2 - t1, 'first_request': t3 - t2, 'second_request': t4 - t3}))
+'''
+
+
+def _run(warm: bool, log_dir: str) -> dict:
+    env = dict(os.environ, BENCH_WARM='1' if warm else '0', NUBILUM_LOG_DIR=log_dir)
+    output = subprocess.run([sys.executable, '-c', _PROBE], env=env, check=True,
+                            capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as log_dir:
+        for warm in (False, True):
+            samples = [_run(warm, log_dir) for _ in range(args.runs)]
+            print(f"{'warmed-up' if warm else 'cold'} worker (median of {args.runs}):")
+            for key in ('import', 'warmup', 'first_request', 'second_request'):
+                median = statistics.median(sample[key] for sample in samples)
+                print(f"  {key:<15} {median * 1000:9.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""Usage statistics memory benchmark.
+
+Compares the peak memory and time of computing statistics from a list of
+event dicts (the previous approach) with the columnar UsageEventColumns.
+
+Usage:
+    python -m benchmarks.bench_usage_stats [--events 200000]
+"""
+
+import argparse
+import json
+import random
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from nubilum.usage_events import UsageEventColumns
+
+_TYPES = ['ADT^A01', 'ADT^A08', 'ORU^R01', 'ORM^O01', 'SIU^S12']
+_SEGMENTS = ['MSH', 'EVN', 'PID', 'PV1', 'NK1', 'OBR', 'OBX', 'NTE']
+
+
+def _generate_lines(count: int) -> list:
+    random.seed(42)
+    start = datetime(2024, 1, 1)
+    lines = []
+    for _ in range(count):
+        timestamp = start + timedelta(seconds=random.randint(0, 365 * 86400))
+        segment_counts = {segment: random.randint(1, 5) for segment in random.sample(_SEGMENTS, 5)}
+        lines.append(json.dumps({
+            "timestamp": timestamp.isoformat(),
+            "date": timestamp.strftime("%Y-%m-%d"),
+            "time": timestamp.strftime("%H:%M:%S"),
+            "message_type": random.choice(_TYPES),
+            "segment_counts": segment_counts,
+            "total_segments": sum(segment_counts.values()),
+            "message_length": random.randint(200, 4000),
+            "success": random.random() > 0.02,
+            "error": None,
+        }))
+    return lines
+
+
+def _dict_events(lines: list) -> int:
+    events = [json.loads(line) for line in lines]
+    return len(events)
+
+
+def _columnar(lines: list) -> int:
+    columns = UsageEventColumns()
+    for line in lines:
+        columns.append(json.loads(line))
+    columns.statistics()
+    return len(columns)
+
+
+def _measure(function, lines: list) -> tuple:
+    tracemalloc.start()
+    started = time.perf_counter()
+    function(lines)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--events', type=int, default=200000)
+    args = parser.parse_args()
+
+    lines = _generate_lines(args.events)
+    print(f"{args.events} events")
+
+    for name, function in (('dicts (load)', _dict_events), ('columnar', _columnar)):
+        peak, elapsed = _measure(function, lines)
+        print(f"  {name:14s} peak {peak / 1024 / 1024:8.1f} MB "
+              f"({peak / args.events:6.0f} B/event), {elapsed:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,24 @@
+"""Gunicorn configuration for Nubilum.
+
+The application is created once in the master (preload_app, with the
+'nubilum.app:create_app()' factory, which also sets up logging) and warmed up
+there before workers are forked, so hl7apy's reference tables, the field name
+cache and compiled anonymization profiles are shared copy-on-write.
+"""
+
+bind = '127.0.0.1:5000'
+workers = 4
+timeout = 60
+preload_app = True
+
+accesslog = '/var/log/nubilum/access.log'
+errorlog = '/var/log/nubilum/error.log'
+
+
+def on_starting(server):
+    """Warm up in the master after the preloaded app is imported, before forking."""
+    from nubilum.app import profile_registry
+    from nubilum.warmup import warm_up
+
+    state = warm_up(profile_registry)
+    server.log.info(f"Nubilum warm-up finished in {state['duration_seconds']}s")
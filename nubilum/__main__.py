@@ -0,0 +1,7 @@
+"""Allow running the Nubilum CLI with ``python -m nubilum``."""
+
+import sys
+
+from nubilum.cli import main
+
+sys.exit(main())
@@ -3,70 +3,241 @@
 import re
 import random
 import hashlib
+import hmac
 from datetime import datetime, timedelta
-from typing import Dict, Set
+from typing import Dict, List, Optional, Set, Tuple, Union
 import logging
 
+from nubilum.profiles import AnonymizationProfile, DEFAULT_PROFILE
+from nubilum.pseudonym_table import PseudonymCache, SharedPseudonymTable
+from nubilum.scrubber import FreeTextScrubber, collect_identifying_terms
+from nubilum.segment_cache import SegmentCache
+from nubilum.surrogates import dictionaries as surrogate_dictionaries
+
 logger = logging.getLogger(__name__)
 
 
 class HL7Anonymizer:
     """Anonymizes HL7 v2 messages while preserving structure."""
 
-    # Common Portuguese first names for pseudo-generation
-    FIRST_NAMES = [
-        "Patient", "Test", "Sample", "Demo", "Example",
-        "Anonymous", "Unknown", "John", "Jane", "Person"
-    ]
-
-    LAST_NAMES = [
-        "Doe", "Smith", "Test", "Sample", "Anonymous",
-        "Person", "User", "Patient", "Example", "Demo"
-    ]
+    # Built-in handler method for each segment type
+    SEGMENT_HANDLERS = {
+        'PID': '_anonymize_pid_segment',
+        'NK1': '_anonymize_nk1_segment',
+        'PV1': '_anonymize_pv1_segment',
+        'PV2': '_anonymize_pv2_segment',
+        'PD1': '_anonymize_pd1_segment',
+        'OBX': '_anonymize_obx_segment',
+        'NTE': '_anonymize_nte_segment',
+        'ORC': '_anonymize_order_segment',
+        'OBR': '_anonymize_order_segment',
+        'SCH': '_anonymize_scheduling_segment',
+        'AIG': '_anonymize_scheduling_segment',
+        'AIL': '_anonymize_scheduling_segment',
+        'AIP': '_anonymize_scheduling_segment',
+        'IN1': '_anonymize_insurance_segment',
+        'IN2': '_anonymize_insurance_segment',
+        'IN3': '_anonymize_insurance_segment',
+        'GT1': '_anonymize_guarantor_segment',
+        'ROL': '_anonymize_role_segment',
+        'CTI': '_anonymize_cti_segment',
+        'DG1': '_anonymize_dg1_segment',
+        'PR1': '_anonymize_pr1_segment',
+        'EVN': '_anonymize_generic_identifiers',
+    }
+
+    # OBX-2 value types whose OBX-5 is never free text
+    NON_TEXT_VALUE_TYPES = {'NM', 'SN', 'NR', 'DT', 'DTM', 'TM', 'TS', 'ED', 'RP', 'ID', 'IS'}
+
+    # Transform kinds reported in change maps (see record_changes)
+    CHANGE_KINDS = ('pseudonym', 'name', 'date', 'address', 'phone', 'scrub', 'redact', 'constant')
+
+    # Digits of keyed pseudonyms (reversible mode): ~53 bits, so collisions are
+    # negligible even for whole archives
+    KEYED_DIGITS = 16
+
+    def __init__(self, profile: Optional[AnonymizationProfile] = None,
+                 pseudonym_table: Optional[Union[SharedPseudonymTable, PseudonymCache]] = None,
+                 key: Optional[bytes] = None,
+                 segment_cache: Optional[SegmentCache] = None,
+                 record_changes: bool = False):
+        """
+        Initialize the anonymizer.
 
-    def __init__(self):
-        """Initialize the anonymizer."""
+        Args:
+            profile: Compiled anonymization profile (defaults to the built-in rules)
+            pseudonym_table: Table reusing pseudonyms across anonymizers (the
+                shared-memory table or a tenant's PseudonymCache); with a key
+                its entries are namespaced by the key
+            key: Secret key for reversible mode: identifiers and names get keyed
+                HMAC-SHA256 pseudonyms ending in KEYED_DIGITS digits, unique
+                enough to be mapped back (see nubilum.reversible)
+            segment_cache: Cache of anonymized segment lines, may be shared by
+                anonymizers with other profiles or keys
+            record_changes: Record where each message was rewritten in
+                `changes` (segments are then not taken from the cache)
+        """
+        self.profile = profile or DEFAULT_PROFILE
+        self.pseudonym_table = pseudonym_table
+        # Keyed pseudonyms must never be served to anonymizers with another key (or none)
+        self._table_namespace = (
+            hmac.new(key, b"pseudonym-table", hashlib.sha256).hexdigest()[:16] + "\x1f" if key is not None else "")
+        # Keyed once; each pseudonym only hashes the value on a copy
+        self._keyed_hmac = hmac.new(key, digestmod=hashlib.sha256) if key is not None else None
         self.processed_ids: Dict[str, str] = {}
         self.processed_names: Dict[str, str] = {}
+        self._free_text_terms: Dict = {}
+        self._free_text_lines: Optional[list] = None
+        self._scrubber: Optional[FreeTextScrubber] = None
+
+        # (segment, field, component, start, end, kind) of the last message;
+        # component is 1-based, None when the whole field was rewritten
+        self.record_changes = record_changes
+        self.changes: List[Tuple[int, int, Optional[int], int, int, str]] = []
+        # (output, kind) of every transform applied to the current segment
+        self._change_log: Optional[list] = None
+
+        self.segment_cache = segment_cache
+        self._recording: Optional[list] = None
+        self._recording_line = ""
+        # Prefix or name type each pseudonym was derived with, checked by _record()
+        self._pseudonym_sources: Dict[str, Dict[str, str]] = {'id': {}, 'name': {}}
+        # Lines answered from or stored in the cache, with their output
+        self._memo: Dict[str, str] = {}
+        self._memo_hits = 0
+        if segment_cache is not None:
+            key_id = hmac.new(key, b"segment-cache", hashlib.sha256).hexdigest() if key is not None else ""
+            self._cache_keyer = SegmentCache.keyer(self.profile.fingerprint, key_id)
 
     def _generate_pseudo_id(self, original: str, prefix: str = "ID") -> str:
         """Generate a consistent pseudo ID based on the original."""
         if not original or original.strip() == "":
             return f"{prefix}000000"
 
-        if original in self.processed_ids:
-            return self.processed_ids[original]
+        pseudo_id = self.processed_ids.get(original)
+        created = pseudo_id is None
+
+        if created:
+            # Shared entries are keyed by prefix too, so they never change the output
+            table_key = f"{self._table_namespace}id\x1f{prefix}\x1f{original}"
+            pseudo_id = self.pseudonym_table.get(table_key) if self.pseudonym_table is not None else None
+
+            if pseudo_id is None:
+                pseudo_id = self._derive_pseudo_id(original, prefix)
+                if self.pseudonym_table is not None:
+                    self.pseudonym_table.put(table_key, pseudo_id)
+
+            self.processed_ids[original] = pseudo_id
+
+        if self._change_log is not None:
+            self._change_log.append((pseudo_id, 'pseudonym'))
+        if self._recording is not None:
+            self._record('id', original, pseudo_id, prefix, created)
+        return pseudo_id
+
+    def _derive_pseudo_id(self, original: str, prefix: str) -> str:
+        """Pseudo ID of a value not seen before (keyed HMAC in reversible mode, else MD5)."""
+        if self._keyed_hmac is not None:
+            code, _ = self._keyed_code(f"id\x1f{prefix}\x1f{original}")
+            return f"{prefix}{code}"
 
         # Create a deterministic hash
         hash_obj = hashlib.md5(original.encode())
         hash_int = int(hash_obj.hexdigest()[:8], 16)
-        pseudo_id = f"{prefix}{hash_int % 1000000:06d}"
-
-        self.processed_ids[original] = pseudo_id
-        return pseudo_id
+        return f"{prefix}{hash_int % 1000000:06d}"
 
     def _generate_pseudo_name(self, original: str, field_type: str = "name") -> str:
         """Generate a pseudo name that indicates the field purpose."""
         if not original or original.strip() == "":
             return "ANONYMOUS"
 
-        if original in self.processed_names:
-            return self.processed_names[original]
+        pseudo = self.processed_names.get(original)
+        created = pseudo is None
 
-        # Generate based on hash for consistency
-        hash_obj = hashlib.md5(original.encode())
-        hash_int = int(hash_obj.hexdigest()[:8], 16)
+        if created:
+            table_key = f"{self._table_namespace}name\x1f{field_type}\x1f{original}"
+            pseudo = self.pseudonym_table.get(table_key) if self.pseudonym_table is not None else None
 
-        if field_type == "first_name":
-            pseudo = f"{self.FIRST_NAMES[hash_int % len(self.FIRST_NAMES)]}{hash_int % 100:02d}"
-        elif field_type == "last_name":
-            pseudo = f"{self.LAST_NAMES[hash_int % len(self.LAST_NAMES)]}{hash_int % 100:02d}"
-        else:
-            pseudo = f"Anonymous{hash_int % 1000:03d}"
+            if pseudo is None:
+                pseudo = self._derive_pseudo_name(original, field_type)
+                if self.pseudonym_table is not None:
+                    self.pseudonym_table.put(table_key, pseudo)
+
+            self.processed_names[original] = pseudo
 
-        self.processed_names[original] = pseudo
+        if self._change_log is not None:
+            self._change_log.append((pseudo, 'name'))
+        if self._recording is not None:
+            self._record('name', original, pseudo, field_type, created)
         return pseudo
 
+    def _derive_pseudo_name(self, original: str, field_type: str) -> str:
+        """Pseudo name of a value not seen before (keyed HMAC in reversible mode, else MD5)."""
+        if self._keyed_hmac is not None:
+            return self._keyed_name(original, field_type)
+
+        # Drawn from the surrogate dictionaries by 64 bits of the hash
+        hash_int = int.from_bytes(hashlib.md5(original.encode()).digest()[:8], 'big')
+        return self._surrogate_name(hash_int, original, field_type)
+
+    def _surrogate_name(self, hash_int: int, original: str, field_type: str) -> str:
+        """Given name or surname drawn by a 64-bit hash, never part of the original."""
+        table = 'given_names' if field_type == "first_name" else 'surnames'
+        return surrogate_dictionaries()[table].sample(hash_int, original)[1]
+
+    def _record(self, kind: str, original: str, pseudo: str, source: str, created: bool) -> None:
+        """
+        Record a pseudonym used by the segment being anonymized for the cache.
+
+        A pseudonym from the history that differs from what the value would
+        get fresh (first seen with another prefix, or restored state) makes
+        the segment uncacheable.
+
+        Args:
+            kind: 'id' or 'name'
+            original: Original value
+            pseudo: Pseudonym returned for it
+            source: Prefix or name type of this lookup
+            created: Whether the pseudonym was derived by this lookup
+        """
+        sources = self._pseudonym_sources[kind]
+        if created:
+            sources[original] = source
+        elif sources.get(original) != source:
+            # Derived outside a recorded segment or restored: compare once
+            derive = self._derive_pseudo_id if kind == 'id' else self._derive_pseudo_name
+            if original in sources or pseudo != derive(original, source):
+                self._recording = None
+                return
+            sources[original] = source
+
+        offset = self._recording_line.find(original)
+        if offset < 0:
+            self._recording = None
+            return
+        self._recording.append((kind, offset, len(original), pseudo))
+
+    def _keyed_code(self, data: str) -> Tuple[str, int]:
+        """Return (KEYED_DIGITS-digit code, 64-bit sampling hash) derived from data with the key."""
+        keyed = self._keyed_hmac.copy()
+        keyed.update(data.encode('utf-8'))
+        digest = keyed.digest()
+        code = int.from_bytes(digest[:8], 'big') % 10 ** self.KEYED_DIGITS
+        return f"{code:0{self.KEYED_DIGITS}d}", int.from_bytes(digest[8:16], 'big')
+
+    def _keyed_name(self, original: str, field_type: str) -> str:
+        """Reversible-mode name pseudonym: a surrogate name followed by a keyed code."""
+        code, hash_int = self._keyed_code(f"name\x1f{field_type}\x1f{original}")
+        return f"{self._surrogate_name(hash_int, original, field_type)}{code}"
+
+    def _surrogate_hash(self, kind: str, value: str) -> int:
+        """64-bit hash drawing the surrogate of a value (keyed HMAC in reversible mode, else MD5)."""
+        if self._keyed_hmac is not None:
+            keyed = self._keyed_hmac.copy()
+            keyed.update(f"{kind}\x1f{value}".encode('utf-8'))
+            return int.from_bytes(keyed.digest()[:8], 'big')
+        return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], 'big')
+
     def _anonymize_date(self, date_str: str) -> str:
         """Anonymize dates by shifting them randomly but consistently."""
         if not date_str or date_str.strip() == "":
@@ -95,6 +266,8 @@ class HL7Anonymizer:
                 if len(date_str) > 8:
                     result += "120000"  # Noon
 
+                if self._change_log is not None:
+                    self._change_log.append((result, 'date'))
                 return result
         except (ValueError, IndexError):
             pass
@@ -106,11 +279,32 @@ class HL7Anonymizer:
         if not address or address.strip() == "":
             return address
 
-        # Replace with generic address components
-        hash_obj = hashlib.md5(address.encode())
-        hash_int = int(hash_obj.hexdigest()[:8], 16)
+        # A surrogate street; the house number from the high bits of the hash
+        hash_int = self._surrogate_hash('address', address)
+        _, street = surrogate_dictionaries()['streets'].sample(hash_int, address)
+        result = f"{street} {(hash_int >> 48) % 200 + 1}"
+        if self._change_log is not None:
+            self._change_log.append((result, 'address'))
+        return result
+
+    def _surrogate_locality(self, value: str) -> Tuple[str, str, str]:
+        """
+        Surrogate (municipality, district, postal code) for a city or postal code.
 
-        return f"Street{hash_int % 100:02d}"
+        Args:
+            value: Postal code, or the city when there is none
+
+        Returns:
+            Municipality, its district and a postal code of its region (NNNN-NNN)
+        """
+        hash_int = self._surrogate_hash('locality', value)
+        municipalities = surrogate_dictionaries()['municipalities']
+        index, municipality = municipalities.sample(hash_int, value)
+        postal_code = f"{municipalities.value(index, 2)}-{(hash_int >> 48) % 1000:03d}"
+        if self._change_log is not None:
+            self._change_log.append((municipality, 'address'))
+            self._change_log.append((postal_code, 'address'))
+        return municipality, municipalities.value(index, 1), postal_code
 
     def _anonymize_phone(self, phone: str) -> str:
         """Anonymize phone numbers."""
@@ -121,7 +315,10 @@ class HL7Anonymizer:
         hash_obj = hashlib.md5(phone.encode())
         hash_int = int(hash_obj.hexdigest()[:8], 16)
 
-        return f"+351{hash_int % 1000000000:09d}"
+        result = f"+351{hash_int % 1000000000:09d}"
+        if self._change_log is not None:
+            self._change_log.append((result, 'phone'))
+        return result
 
     def anonymize_message(self, message: str) -> str:
         """
@@ -133,66 +330,323 @@ class HL7Anonymizer:
         Returns:
             Anonymized HL7 message string
         """
-        logger.info("Starting message anonymization")
+        logger.debug("Starting message anonymization")
 
         if not message or message.strip() == "":
             logger.warning("Empty message provided")
             return message
 
-        lines = message.split('\n')
+        lines = [line.strip() for line in message.split('\n')]
+        lines = [line for line in lines if line]
+
+        self.set_free_text_context(lines)
+
+        if self.record_changes:
+            anonymized_lines = self._anonymize_recording_changes(lines)
+        else:
+            anonymized_lines = [self._anonymize_line(line) for line in lines]
+            self._flush_memo_hits()
+
+        result = '\n'.join(anonymized_lines)
+        logger.debug("Message anonymization completed")
+        return result
+
+    def _anonymize_recording_changes(self, lines: list) -> list:
+        """Anonymize the segments of a message, recording its change map in `changes`."""
+        self.changes = []
         anonymized_lines = []
+        offset = 0
+
+        for index, line in enumerate(lines):
+            self._change_log = []
+            try:
+                anonymized = self._anonymize_fields(line)
+                self._record_segment_changes(index, line, anonymized, offset)
+            finally:
+                self._change_log = None
+            anonymized_lines.append(anonymized)
+            offset += len(anonymized) + 1
+
+        return anonymized_lines
+
+    def _record_segment_changes(self, index: int, line: str, anonymized: str, offset: int) -> None:
+        """
+        Add the rewritten fields and components of a segment to `changes`.
+
+        Args:
+            index: Segment index in the message
+            line: Original segment line
+            anonymized: Anonymized segment line
+            offset: Offset of the anonymized line in the anonymized message
+        """
+        # Handlers and rules rewrite fields in place, never add or remove them
+        position = offset
+        for field_index, (before, after) in enumerate(zip(line.split('|'), anonymized.split('|'))):
+            if before != after:
+                before_parts = before.split('^')
+                after_parts = after.split('^')
+                if len(before_parts) == len(after_parts):
+                    start = position
+                    for component, (old, new) in enumerate(zip(before_parts, after_parts), 1):
+                        if old != new:
+                            self.changes.append((index, field_index, component, start,
+                                                 start + len(new), self._change_kind(new)))
+                        start += len(new) + 1
+                else:
+                    self.changes.append((index, field_index, None, position,
+                                         position + len(after), self._change_kind(after)))
+            position += len(after) + 1
+
+    def _change_kind(self, value: str) -> str:
+        """Transform kind of a rewritten value, from the transforms logged for its segment."""
+        if not value:
+            return 'redact'
+        log = self._change_log
+        for output, kind in reversed(log):
+            if output == value:
+                return kind
+        # Composed values such as a provider's "Dr" + pseudonym
+        for output, kind in reversed(log):
+            if output and output in value:
+                return kind
+        return 'constant'
+
+    def get_state(self) -> Dict:
+        """
+        Snapshot the pseudonym state (original value -> pseudonym maps).
+
+        Returns:
+            JSON-serializable state for load_state()
+        """
+        return {
+            'ids': dict(self.processed_ids),
+            'names': dict(self.processed_names),
+        }
+
+    def load_state(self, state: Dict) -> None:
+        """Restore pseudonym state saved with get_state()."""
+        self.processed_ids.update(state.get('ids', {}))
+        self.processed_names.update(state.get('names', {}))
+        self._memo.clear()
+
+    def set_free_text_terms(self, terms: Dict) -> None:
+        """
+        Set the free-text scrubbing terms directly.
+
+        Args:
+            terms: Mapping as returned by collect_identifying_terms()
+        """
+        self._free_text_terms = terms
+        self._free_text_lines = None
+        self._scrubber = None
+
+    def set_free_text_context(self, lines: list) -> None:
+        """
+        Collect the names and identifiers of a message for free-text scrubbing.
+
+        Args:
+            lines: Segment lines of the message being anonymized
+        """
+        # Collected on the first free-text value: most messages have none
+        self._free_text_lines = lines
+        self._scrubber = None
+
+    def _scrub_free_text(self, text: str) -> str:
+        """Scrub names, identifiers and contact details from a free-text value."""
+        if not text:
+            return text
+
+        # The result depends on the names of the whole message
+        self._recording = None
+
+        # Built lazily: most messages have no free-text fields
+        if self._scrubber is None:
+            if self._free_text_lines is not None:
+                self._free_text_terms = collect_identifying_terms(self._free_text_lines)
+                self._free_text_lines = None
+            self._scrubber = FreeTextScrubber(self._free_text_terms, self._free_text_replacement)
+
+        scrubbed = self._scrubber.scrub(text)
+        if self._change_log is not None:
+            self._change_log.append((scrubbed, 'scrub'))
+        return scrubbed
+
+    def _free_text_replacement(self, kind: str, value: str) -> str:
+        """Pseudonym for a value found in free text, consistent with the structured fields."""
+        if kind in ('last_name', 'first_name'):
+            return self._generate_pseudo_name(value, kind)
+        if kind == 'id':
+            return self._generate_pseudo_id(value, "PID")
+        if kind == 'address':
+            return self._anonymize_address(value)
+        if kind == 'phone':
+            return self._anonymize_phone(value)
+        if kind == 'nif':
+            return self._generate_pseudo_id(value, "NIF")
+        if kind == 'cc':
+            return self._generate_pseudo_id(value, "CC")
+        if kind == 'email':
+            return f"{self._generate_pseudo_id(value, 'user')}@example.org"
+        if kind == 'postal_code':
+            return self._surrogate_locality(value)[2]
+        return "XXXXX"
+
+    def anonymize_segment(self, line: str) -> str:
+        """
+        Anonymize a single segment line.
+
+        With a segment cache, a line anonymized before is answered from the
+        cache, recording its pseudonyms as if it had been anonymized again.
+
+        Args:
+            line: Segment in ER7 format, without the segment terminator
+
+        Returns:
+            Anonymized segment line
+        """
+        result = self._anonymize_line(line)
+        self._flush_memo_hits()
+        return result
+
+    def _anonymize_line(self, line: str) -> str:
+        """Anonymize a segment line, through the segment cache if there is one."""
+        cache = self.segment_cache
+        if cache is None:
+            return self._anonymize_fields(line)
+
+        # Lines this anonymizer has produced from (or for) the cache: their
+        # pseudonyms are in the maps, which only grow, so the output is fixed
+        memoized = self._memo.get(line)
+        if memoized is not None:
+            self._memo_hits += 1
+            return memoized
+
+        # Segments nothing applies to (e.g. MSH) are cheaper to copy than to look up
+        segment_type = line.partition('|')[0]
+        if not ((self.profile.builtin and segment_type in self.SEGMENT_HANDLERS)
+                or self.profile.rules_for(segment_type)):
+            return self._anonymize_fields(line)
+
+        cache_key = cache.key(self._cache_keyer, line)
+        if cache_key is None:
+            return self._anonymize_fields(line)
+
+        cached, record = cache.get(cache_key)
+        if cached is not None:
+            if self._replay_pseudonyms(line, cached[1]):
+                self._memoize(line, cached[0])
+                return cached[0]
+            cache.record_conflict()
+        if not record:
+            return self._anonymize_fields(line)
+
+        self._recording = []
+        self._recording_line = line
+        try:
+            result = self._anonymize_fields(line)
+            recorded = self._recording
+        finally:
+            self._recording = None
 
-        for line in lines:
-            line = line.strip()
-            if not line:
+        if recorded is None:
+            cache.record_uncacheable()
+        else:
+            cache.put(cache_key, result, tuple(recorded))
+            self._memoize(line, result)
+        return result
+
+    def _memoize(self, line: str, result: str) -> None:
+        """Keep a cached line's output for this anonymizer (bounded like the cache)."""
+        if len(self._memo) >= self.segment_cache.max_entries:
+            self._memo.clear()
+        self._memo[line] = result
+
+    def _flush_memo_hits(self) -> None:
+        """Count the lines answered from the memo as cache hits."""
+        if self._memo_hits:
+            self.segment_cache.record_hits(self._memo_hits)
+            self._memo_hits = 0
+
+    def _replay_pseudonyms(self, line: str, pseudonyms) -> bool:
+        """
+        Record the pseudonyms of a cached segment in the pseudonym state.
+
+        Returns:
+            False (state unchanged) if a value already has another pseudonym
+        """
+        missing = []
+        for kind, offset, length, pseudo in pseudonyms:
+            processed = self.processed_ids if kind == 'id' else self.processed_names
+            original = line[offset:offset + length]
+            existing = processed.get(original)
+            if existing is None:
+                missing.append((processed, original, pseudo))
+            elif existing != pseudo:
+                return False
+
+        for processed, original, pseudo in missing:
+            processed.setdefault(original, pseudo)
+        return True
+
+    def _anonymize_fields(self, line: str) -> str:
+        """Anonymize a segment line with the built-in handler and the profile rules."""
+        # Split by field separator (|)
+        fields = line.split('|')
+        segment_type = fields[0]
+
+        rules = self.profile.rules_for(segment_type)
+        original_fields = fields.copy() if rules else fields
+
+        if self.profile.builtin:
+            handler = self.SEGMENT_HANDLERS.get(segment_type)
+            if handler is not None:
+                fields = getattr(self, handler)(fields)
+
+        if rules:
+            fields = self._apply_profile_rules(fields, original_fields, rules)
+
+        return '|'.join(fields)
+
+    def _apply_profile_rules(self, fields: list, original_fields: list, rules) -> list:
+        """Apply compiled profile rules, always reading the original field values."""
+        for rule in rules:
+            if rule.index >= len(fields):
                 continue
 
-            # Split by field separator (|)
-            fields = line.split('|')
+            original = original_fields[rule.index]
+            if not original:
+                continue
 
-            if len(fields) == 0:
-                anonymized_lines.append(line)
+            if rule.component is None:
+                fields[rule.index] = self._apply_action(rule, original)
                 continue
 
-            segment_type = fields[0]
-
-            # Anonymize based on segment type
-            if segment_type == 'PID':
-                fields = self._anonymize_pid_segment(fields)
-            elif segment_type == 'NK1':
-                fields = self._anonymize_nk1_segment(fields)
-            elif segment_type == 'PV1':
-                fields = self._anonymize_pv1_segment(fields)
-            elif segment_type == 'PV2':
-                fields = self._anonymize_pv2_segment(fields)
-            elif segment_type == 'PD1':
-                fields = self._anonymize_pd1_segment(fields)
-            elif segment_type == 'OBX':
-                fields = self._anonymize_obx_segment(fields)
-            elif segment_type == 'ORC' or segment_type == 'OBR':
-                fields = self._anonymize_order_segment(fields)
-            elif segment_type in ['SCH', 'AIG', 'AIL', 'AIP']:
-                fields = self._anonymize_scheduling_segment(fields)
-            elif segment_type in ['IN1', 'IN2', 'IN3']:
-                fields = self._anonymize_insurance_segment(fields)
-            elif segment_type == 'GT1':
-                fields = self._anonymize_guarantor_segment(fields)
-            elif segment_type == 'ROL':
-                fields = self._anonymize_role_segment(fields)
-            elif segment_type == 'CTI':
-                fields = self._anonymize_cti_segment(fields)
-            elif segment_type == 'DG1':
-                fields = self._anonymize_dg1_segment(fields)
-            elif segment_type == 'PR1':
-                fields = self._anonymize_pr1_segment(fields)
-            elif segment_type == 'EVN':
-                fields = self._anonymize_generic_identifiers(fields)
-
-            anonymized_lines.append('|'.join(fields))
+            original_parts = original.split('^')
+            if rule.component >= len(original_parts) or not original_parts[rule.component]:
+                continue
 
-        result = '\n'.join(anonymized_lines)
-        logger.info("Message anonymization completed")
-        return result
+            parts = fields[rule.index].split('^')
+            while len(parts) <= rule.component:
+                parts.append('')
+            parts[rule.component] = self._apply_action(rule, original_parts[rule.component])
+            fields[rule.index] = '^'.join(parts)
+
+        return fields
+
+    def _apply_action(self, rule, value: str) -> str:
+        """Apply a profile rule action to a single value."""
+        action = rule.action
+        if action == 'hash':
+            return self._generate_pseudo_id(value, rule.value)
+        if action == 'shift':
+            return self._anonymize_date(value)
+        if action == 'redact':
+            return ""
+        if action == 'constant':
+            return rule.value
+        if action == 'scrub':
+            return self._scrub_free_text(value)
+        return value  # keep
 
     def _anonymize_pid_segment(self, fields: list) -> list:
         """Anonymize PID (Patient Identification) segment."""
@@ -342,13 +796,29 @@ class HL7Anonymizer:
     def _anonymize_obx_segment(self, fields: list) -> list:
         """Anonymize OBX (Observation) segment - be careful with results."""
         # OBX fields
+        # 2: Value Type
+        # 5: Observation Value - free text for TX/FT/ST/CE/CWE...
         # 16: Responsible Observer
 
+        if len(fields) > 5 and fields[5]:
+            if fields[2].strip().upper() not in self.NON_TEXT_VALUE_TYPES:
+                fields[5] = self._scrub_free_text(fields[5])
+
         if len(fields) > 16 and fields[16]:
             fields[16] = self._anonymize_provider_name(fields[16])
 
         return fields
 
+    def _anonymize_nte_segment(self, fields: list) -> list:
+        """Anonymize NTE (Notes and Comments) segment."""
+        # NTE fields
+        # 3: Comment - free text
+
+        if len(fields) > 3 and fields[3]:
+            fields[3] = self._scrub_free_text(fields[3])
+
+        return fields
+
     def _anonymize_order_segment(self, fields: list) -> list:
         """Anonymize ORC/OBR (Order) segments."""
         # Common fields in order segments
@@ -438,12 +908,21 @@ class HL7Anonymizer:
         if len(parts) > 0 and parts[0]:
             parts[0] = self._anonymize_address(parts[0])
 
-        # Keep city/state/zip structure but anonymize
+        # Other designation (apartment, building) is dropped
         if len(parts) > 1 and parts[1]:
-            parts[1] = "City"
-
-        if len(parts) > 3 and parts[3]:
-            parts[3] = "12345"
+            parts[1] = ""
+
+        # City, state/province and zip from one surrogate municipality
+        city = parts[2] if len(parts) > 2 else ""
+        zip_code = parts[4] if len(parts) > 4 else ""
+        if city or zip_code:
+            municipality, district, postal_code = self._surrogate_locality(zip_code or city)
+            if city:
+                parts[2] = municipality
+            if len(parts) > 3 and parts[3]:
+                parts[3] = district
+            if zip_code:
+                parts[4] = postal_code
 
         return '^'.join(parts)
 
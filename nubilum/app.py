@@ -2,96 +2,276 @@
 
 import logging
 import os
+import time
 from datetime import datetime
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, request, jsonify, send_file, send_from_directory
 from flask_cors import CORS
+from werkzeug.middleware.proxy_fix import ProxyFix
 from nubilum.anonymizer import HL7Anonymizer
 from nubilum.usage_tracker import UsageTracker
+from nubilum import (change_map, columnar, compression, hl7ref, http_cache, ingest, ratelimit, tenants,
+                     usage_export, validator, warmup)
+from nubilum.jsonutil import FastJSONProvider
+from nubilum.columnar import ColumnarError
+from nubilum.ingest import IngestError, IngestLimits
+from nubilum.incremental import IncrementalError, build_state, reanonymize_segments
+from nubilum.session_state import StateTokenError, decode_state, encode_state
+from nubilum.profiles import ProfileError, registry_from_env
+from nubilum.pseudonym_table import table_from_env
+from nubilum.segment_cache import cache_from_env
+from nubilum.jobs import JobManager, JobNotFound, JobNotReady, JobQueueFull
+from nubilum.tenants import TenantAuthError, TenantError
 from nubilum import __version__
 
-# Configure logging
+# Log directory; created, and logging configured, by create_app() rather than
+# on import, so a preloading gunicorn master only builds the app and warms up
 log_dir = os.environ.get('NUBILUM_LOG_DIR', '/var/log/nubilum')
-os.makedirs(log_dir, exist_ok=True)
 
-log_file = os.path.join(log_dir, f'nubilum_{datetime.now().strftime("%Y%m%d")}.log')
+logger = logging.getLogger(__name__)
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(log_file),
-        logging.StreamHandler()
-    ]
-)
 
-logger = logging.getLogger(__name__)
+def configure_logging() -> None:
+    """Create the log directory and log to a daily file and stderr (once per process)."""
+    os.makedirs(log_dir, exist_ok=True)
+    log_file = os.path.join(log_dir, f'nubilum_{datetime.now().strftime("%Y%m%d")}.log')
+
+    # No-op once the root logger has handlers (forked workers inherit the master's)
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler(log_file),
+            logging.StreamHandler()
+        ]
+    )
 
 app = Flask(__name__, static_folder='static', static_url_path='')
+app.json = FastJSONProvider(app)  # orjson when installed
 CORS(app)
 
+# Trust X-Forwarded-For from this many proxies (1 behind the bundled nginx),
+# so rate limits apply to the real client address
+proxy_count = int(os.environ.get('NUBILUM_PROXY_COUNT', 0))
+if proxy_count:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=proxy_count, x_proto=proxy_count)
+
 # Configure Flask
 app.config['MAX_CONTENT_LENGTH'] = 1 * 1024 * 1024  # 1MB max message size
 
+# Per-client token bucket and concurrency cap, shared by all workers (created
+# in the gunicorn master with preload_app). Registered before decompression
+# so rejected requests are answered without reading their body. Only tenant
+# API keys get their own bucket; other requests are limited by address.
+rate_limiter = ratelimit.limiter_from_env()
+ratelimit.init_app(app, rate_limiter, endpoints=(
+    'validate', 'anonymize', 'anonymize_segments', 'create_job'),
+    key_validator=lambda api_key: tenant_registry is not None and tenant_registry.valid_api_key(api_key))
+
+# Response compression and compressed request bodies (Content-Encoding: gzip/deflate/br/zstd)
+app.config['COMPRESSION_MIN_SIZE'] = int(os.environ.get('NUBILUM_COMPRESSION_MIN_SIZE', 1024))
+app.config['MAX_DECOMPRESSED_LENGTH'] = int(
+    os.environ.get('NUBILUM_MAX_DECOMPRESSED_LENGTH', 10 * 1024 * 1024)
+)  # 10MB max after decompression
+compression.init_app(app)
+
+# Immutable caching for content-hashed bundles, revalidation for everything else
+http_cache.init_app(app)
+_package_modified = http_cache.file_last_modified(__file__)
+
+# Key for signing incremental anonymization state tokens. Without
+# NUBILUM_SECRET_KEY a random key is generated at import; with gunicorn's
+# preload_app it is shared by all workers, otherwise the variable must be set.
+secret_key = os.environ.get('NUBILUM_SECRET_KEY')
+app.config['SECRET_KEY'] = secret_key.encode('utf-8') if secret_key else os.urandom(32)
+app.config['STATE_TOKEN_MAX_AGE'] = int(os.environ.get('NUBILUM_STATE_TOKEN_MAX_AGE', 8 * 3600))
+
 # Initialize usage tracker
 usage_log_file = os.path.join(log_dir, 'usage_log.jsonl')
-usage_tracker = UsageTracker(usage_log_file)
+usage_tracker = UsageTracker(
+    usage_log_file,
+    stats_workers=int(os.environ.get('NUBILUM_STATS_WORKERS', 1)),
+    stats_cache_dir=os.environ.get('NUBILUM_STATS_CACHE_DIR'),
+)
+
+# Load and compile anonymization profiles once at startup (NUBILUM_PROFILE_DIR)
+profile_registry = registry_from_env()
+
+# Per-tenant keys and profiles (NUBILUM_TENANTS_FILE); each worker keeps an
+# LRU of initialised tenant engines
+tenant_registry = tenants.registry_from_env(profile_registry)
+
+# Pseudonyms shared by all workers (created in the gunicorn master with preload_app);
+# off unless NUBILUM_PSEUDONYM_TABLE_SLOTS is set
+pseudonym_table = table_from_env()
+
+# Anonymized segment lines of this worker, reused across requests and jobs
+# (NUBILUM_SEGMENT_CACHE_SIZE entries, 0 disables it)
+segment_cache = cache_from_env()
+
+# Structural limits on request input (messages, segments per message, fields
+# per segment); jobs accept more messages than synchronous requests
+ingest_limits = IngestLimits.from_env()
+job_ingest_limits = IngestLimits.from_env('NUBILUM_MAX_JOB_MESSAGES', ingest.DEFAULT_MAX_JOB_MESSAGES)
+
+# Default for /api/validate: 'auto' (local check, then the remote validator
+# for messages that pass), 'local' (no network access) or 'remote'
+validation_mode = validator.default_mode()
+REMOTE_VALIDATOR_URL = 'https://version2.hl7.pt/'
+
+# Asynchronous jobs for batches too large for a synchronous request
+job_manager = JobManager(
+    spool_dir=os.environ.get('NUBILUM_JOB_SPOOL_DIR'),
+    max_workers=int(os.environ.get('NUBILUM_JOB_WORKERS', 2)),
+    ttl=int(os.environ.get('NUBILUM_JOB_TTL', 300)),
+    max_queued=int(os.environ.get('NUBILUM_JOB_MAX_QUEUED', 16)),
+    message_callback=lambda message, success, error, duration_ms: usage_tracker.track_anonymization(
+        message, success=success, error=error, duration_ms=duration_ms),
+    pseudonym_table=pseudonym_table,
+    segment_cache=segment_cache,
+)
 
 
 def split_messages(text: str) -> list:
     """
     Split input text into individual HL7 messages.
     Messages are separated by blank lines or multiple MSH segments.
+
+    Raises:
+        IngestError: If the input exceeds the ingest limits
+    """
+    return ingest.split_messages(text, ingest_limits)
+
+
+def request_tenant():
     """
-    messages = []
-    current_message = []
+    Tenant selected by the request's API key or tenant header.
 
-    lines = text.split('\n')
+    Returns:
+        The tenant, or None without a tenants file or if the request selects none
+
+    Raises:
+        TenantAuthError: If the request may not use the tenant it selects
+    """
+    if tenant_registry is None:
+        return None
+    return tenant_registry.resolve(request.headers.get(ratelimit.API_KEY_HEADER),
+                                   request.headers.get(tenants.TENANT_HEADER))
+
+
+def request_tenant_id():
+    """Id of the request's tenant (None without one), for tenant-owned jobs."""
+    tenant = request_tenant()
+    return tenant.id if tenant is not None else None
+
+
+def request_engine():
+    """Cached engine of the request's tenant, or None (see request_tenant)."""
+    tenant = request_tenant()
+    return tenant_registry.engine(tenant) if tenant is not None else None
 
-    for line in lines:
-        stripped = line.strip()
 
-        # If we encounter a new MSH and we already have content, save the current message
-        if stripped.startswith('MSH|') and current_message:
-            messages.append('\n'.join(current_message))
-            current_message = [line]
-        # If line is not empty, add to current message
-        elif stripped:
-            current_message.append(line)
-        # If line is empty and we have content, it might be a message separator
-        elif not stripped and current_message:
-            # Check if next non-empty line is MSH (message separator)
-            # For now, just continue building the message
-            pass
+def create_anonymizer(engine, profile, record_changes: bool = False) -> HL7Anonymizer:
+    """Anonymizer for one request, from its tenant's engine if it has one."""
+    if engine is not None:
+        return engine.anonymizer(segment_cache=segment_cache, record_changes=record_changes)
+    return HL7Anonymizer(profile=profile, pseudonym_table=pseudonym_table,
+                         segment_cache=segment_cache, record_changes=record_changes)
 
-    # Add the last message
-    if current_message:
-        messages.append('\n'.join(current_message))
 
-    return messages
+def tenant_error_response(error: TenantError):
+    """401 for a rejected API key or tenant, 400 for a request that conflicts with its tenant."""
+    return jsonify({
+        'success': False,
+        'error': str(error)
+    }), 401 if isinstance(error, TenantAuthError) else 400
+
+
+def ingest_error_response(error: IngestError):
+    """413 response locating the part of the input that exceeded a limit."""
+    logger.warning(f"Rejected input: {error}")
+    return jsonify({
+        'success': False,
+        'error': str(error),
+        'limit': error.limit,
+        'position': error.position()
+    }), 413
 
 
 @app.route('/')
 def index():
-    """Serve the main application page."""
-    return send_from_directory(app.static_folder, 'index.html')
+    """Serve the main application page (the production build when available)."""
+    return send_from_directory(app.static_folder, http_cache.index_file(app))
 
 
 @app.route('/api/health', methods=['GET'])
 def health():
-    """Health check endpoint."""
-    return jsonify({
+    """Health check endpoint (the ETag ignores the timestamp)."""
+    return http_cache.cached_json({
         'status': 'healthy',
         'version': __version__,
         'timestamp': datetime.utcnow().isoformat()
+    }, etag_source=('healthy', __version__))
+
+
+@app.route('/api/ready', methods=['GET'])
+def ready():
+    """
+    Readiness endpoint.
+
+    Returns 200 once the warm-up (hl7apy reference tables, field name cache,
+    compiled profile rule plans) has completed, 503 while it is still running.
+    """
+    state = warmup.readiness()
+
+    if not state['ready']:
+        # Not preloaded by gunicorn (e.g. development server): warm up now
+        warmup.warm_up_in_background(profile_registry)
+        return jsonify({
+            'status': 'warming_up',
+            'warmup': state
+        }), 503
+
+    return jsonify({
+        'status': 'ready',
+        'warmup': state,
+        'pseudonym_table': pseudonym_table.stats() if pseudonym_table is not None else None,
+        'tenants': tenant_registry.stats() if tenant_registry is not None else None
     })
 
 
+@app.route('/api/rate-limit/metrics', methods=['GET'])
+def rate_limit_metrics():
+    """Rate limiter counters across all workers (no client identities)."""
+    if rate_limiter is None:
+        return jsonify({'enabled': False})
+
+    return jsonify({'enabled': True, **rate_limiter.metrics()})
+
+
+@app.route('/api/segment-cache/stats', methods=['GET'])
+def segment_cache_stats():
+    """Segment cache counters of the worker answering the request (no message content)."""
+    if segment_cache is None:
+        return jsonify({'enabled': False})
+
+    return jsonify({'enabled': True, 'pid': os.getpid(), **segment_cache.stats()})
+
+
 @app.route('/api/version', methods=['GET'])
 def version():
     """Return application version."""
-    return jsonify({
+    return http_cache.cached_json({
         'version': __version__,
         'name': 'Nubilum'
+    }, last_modified=_package_modified)
+
+
+@app.route('/api/profiles', methods=['GET'])
+def list_profiles():
+    """List the anonymization profiles that can be selected in /api/anonymize."""
+    return http_cache.cached_json({
+        'success': True,
+        'profiles': [profile.to_dict() for profile in profile_registry.profiles()]
     })
 
 
@@ -124,35 +304,175 @@ def usage_statistics():
         }), 500
 
 
+@app.route('/api/usage/export', methods=['GET'])
+def usage_export_stream():
+    """
+    Stream usage events or daily statistics as NDJSON or CSV.
+
+    Query parameters:
+    - view: events (default) or daily
+    - format: ndjson (default) or csv
+    - since, until: First and last date included (YYYY-MM-DD)
+    - message_type: Only these message types (repeatable; events only)
+    - success: true or false (events only)
+    - cursor: Resume after the event this cursor was returned with (events only)
+    - limit: Maximum number of events (events only)
+
+    Every event carries a 'cursor'; pass the last one received to continue.
+    """
+    view = request.args.get('view', 'events')
+    fmt = request.args.get('format', 'ndjson')
+    try:
+        if view not in ('events', 'daily'):
+            raise usage_export.UsageExportError("'view' must be events or daily")
+        if fmt not in usage_export.FORMATS:
+            raise usage_export.UsageExportError(f"'format' must be one of {', '.join(usage_export.FORMATS)}")
+
+        since = usage_export.parse_date(request.args.get('since'), 'since')
+        until = usage_export.parse_date(request.args.get('until'), 'until')
+
+        if view == 'daily':
+            chunks = usage_export.encode_rows(usage_export.daily_rows(usage_tracker.statistics, since, until),
+                                              fmt, usage_export.DAILY_COLUMNS)
+        else:
+            success = request.args.get('success')
+            if success not in (None, 'true', 'false'):
+                raise usage_export.UsageExportError("'success' must be true or false")
+            limit = request.args.get('limit', type=int)
+            if limit is not None and limit < 1:
+                raise usage_export.UsageExportError("'limit' must be a positive number")
+
+            event_filter = usage_export.EventFilter(
+                since, until, request.args.getlist('message_type'),
+                None if success is None else success == 'true')
+            events = usage_export.iter_events(usage_tracker.statistics, event_filter,
+                                              cursor=request.args.get('cursor'), limit=limit)
+            chunks = usage_export.encode_events(events, fmt)
+
+    except usage_export.CursorExpired as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 410
+    except usage_export.UsageExportError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+
+    extension = 'csv' if fmt == 'csv' else 'ndjson'
+    return Response(chunks, mimetype=usage_export.FORMATS[fmt], headers={
+        'Content-Disposition': f'attachment; filename="usage-{view}.{extension}"',
+        'Cache-Control': 'no-store'
+    })
+
+
+def local_validation_result(message_number: int, message: str) -> dict:
+    """Validate a message with the local validator, in the shape of a remote result."""
+    local = validator.validate_message(message)
+    issues = local['errors'] + local['warnings']
+
+    if local['valid']:
+        summary = f"Valid {local['structure'] or 'message'} (HL7 v{local['version']})"
+    else:
+        summary = f"{len(local['errors'])} error(s) found by local validation"
+
+    return {
+        'message_number': message_number,
+        'valid': local['valid'],
+        'message': summary,
+        'source': 'local',
+        'details': {
+            'statusCode': 'ok' if local['valid'] else 'error',
+            'message': summary,
+            'version': local['version'],
+            'structure': local['structure'],
+            'details': issues,
+        }
+    }
+
+
+def remote_validation_result(message_number: int, message: str) -> dict:
+    """Validate a message with the HL7 Portugal validator API."""
+    import requests
+
+    result = {'message_number': message_number, 'source': 'remote', 'details': None}
+    try:
+        response = requests.post(
+            f'{REMOTE_VALIDATOR_URL}api/hl7/v1/validate/',
+            json={'data': message},
+            headers={'Content-Type': 'application/json'},
+            timeout=10
+        )
+
+        if response.status_code == 200:
+            validation_result = response.json()
+            status_code = validation_result.get('statusCode', '')
+            is_valid = status_code.lower() == 'ok' or status_code.lower() == 'success'
+
+            result.update({
+                'valid': is_valid,
+                'message': validation_result.get('message', ''),
+                'details': validation_result
+            })
+            logger.info(f"Message {message_number} validation: {is_valid}")
+        else:
+            result.update({
+                'valid': False,
+                'message': f'Validator returned status code {response.status_code}'
+            })
+            logger.error(f"Message {message_number} validator error: {response.status_code}")
+
+    except requests.Timeout:
+        result.update({'valid': False, 'message': 'Validation service timeout'})
+        logger.error(f"Message {message_number} validation timeout")
+
+    except requests.RequestException as e:
+        result.update({
+            'valid': False,
+            'message': f'Failed to connect to validation service: {str(e)}'
+        })
+        logger.error(f"Message {message_number} validation error: {str(e)}")
+
+    return result
+
+
 @app.route('/api/validate', methods=['POST'])
 def validate():
     """
-    Validate one or more HL7 messages using HL7 Portugal validator API.
+    Validate one or more HL7 messages.
+
+    Messages are first checked locally against the hl7apy definitions of
+    their version (structure, cardinality, data types); the HL7 Portugal
+    validator API is only called in 'remote' mode, or in 'auto' mode for
+    messages that pass the local check.
 
     Expected JSON payload:
     {
-        "message": "MSH|^~\\&|..."
+        "message": "MSH|^~\\&|...",
+        "mode": "auto" | "local" | "remote"  (optional, default NUBILUM_VALIDATION_MODE)
     }
 
     Returns:
     {
         "success": true,
+        "mode": "auto",
         "validator_url": "https://version2.hl7.pt/",
         "results": [
             {
                 "message_number": 1,
                 "valid": true/false,
                 "message": "validation message",
-                "details": {...}
+                "source": "local" | "remote",
+                "details": {...},
+                "local": {...}  (local result, when the remote validator was also called)
             },
             ...
         ]
     }
     """
     try:
-        import requests
-
-        data = request.get_json()
+        data = compression.get_request_json()
 
         if not data:
             return jsonify({
@@ -161,6 +481,7 @@ def validate():
             }), 400
 
         input_text = data.get('message', '')
+        mode = data.get('mode') or validation_mode
 
         if not input_text or input_text.strip() == '':
             return jsonify({
@@ -168,6 +489,12 @@ def validate():
                 'error': 'Message is required'
             }), 400
 
+        if mode not in validator.MODES:
+            return jsonify({
+                'success': False,
+                'error': f"Unknown validation mode '{mode}' (use {', '.join(validator.MODES)})"
+            }), 400
+
         # Split into individual messages
         messages = split_messages(input_text)
 
@@ -177,66 +504,34 @@ def validate():
                 'error': 'No valid messages found'
             }), 400
 
-        logger.info(f"Validating {len(messages)} message(s)")
+        logger.info(f"Validating {len(messages)} message(s) ({mode})")
 
-        validator_url = 'https://version2.hl7.pt/api/hl7/v1/validate/'
         results = []
-
         for idx, message in enumerate(messages, 1):
-            try:
-                response = requests.post(
-                    validator_url,
-                    json={'data': message},
-                    headers={'Content-Type': 'application/json'},
-                    timeout=10
-                )
-
-                if response.status_code == 200:
-                    validation_result = response.json()
-                    status_code = validation_result.get('statusCode', '')
-                    is_valid = status_code.lower() == 'ok' or status_code.lower() == 'success'
-
-                    results.append({
-                        'message_number': idx,
-                        'valid': is_valid,
-                        'message': validation_result.get('message', ''),
-                        'details': validation_result
-                    })
-                    logger.info(f"Message {idx} validation: {is_valid}")
-                else:
-                    results.append({
-                        'message_number': idx,
-                        'valid': False,
-                        'message': f'Validator returned status code {response.status_code}',
-                        'details': None
-                    })
-                    logger.error(f"Message {idx} validator error: {response.status_code}")
-
-            except requests.Timeout:
-                results.append({
-                    'message_number': idx,
-                    'valid': False,
-                    'message': 'Validation service timeout',
-                    'details': None
-                })
-                logger.error(f"Message {idx} validation timeout")
-
-            except requests.RequestException as e:
-                results.append({
-                    'message_number': idx,
-                    'valid': False,
-                    'message': f'Failed to connect to validation service: {str(e)}',
-                    'details': None
-                })
-                logger.error(f"Message {idx} validation error: {str(e)}")
+            if mode == 'remote':
+                results.append(remote_validation_result(idx, message))
+                continue
+
+            local_result = local_validation_result(idx, message)
+            if mode == 'local' or not local_result['valid']:
+                results.append(local_result)
+                continue
+
+            result = remote_validation_result(idx, message)
+            result['local'] = local_result['details']
+            results.append(result)
 
         return jsonify({
             'success': True,
-            'validator_url': 'https://version2.hl7.pt/',
+            'mode': mode,
+            'validator_url': REMOTE_VALIDATOR_URL,
             'message_count': len(messages),
             'results': results
         })
 
+    except IngestError as e:
+        return ingest_error_response(e)
+
     except Exception as e:
         logger.error(f"Error during validation: {str(e)}", exc_info=True)
         return jsonify({
@@ -258,8 +553,6 @@ def field_name():
     Returns the human-readable field name.
     """
     try:
-        from hl7apy.core import Field
-
         segment_type = request.args.get('segment', '').upper()
         field_index = request.args.get('field', type=int)
         hl7_version = request.args.get('version', '2.5')
@@ -274,83 +567,21 @@ def field_name():
                 'error': 'Both segment and field parameters are required'
             }), 400
 
-        # HL7 field numbering is special for MSH
-        # In the message: MSH|^~\&|SendApp|SendFac|...
-        # After split by |: [0]=MSH, [1]=^~\&, [2]=SendApp, [3]=SendFac, ...
-        # But in HL7 spec: MSH-1=|, MSH-2=^~\&, MSH-3=SendApp, MSH-4=SendFac, ...
-        # So field_index 0 = MSH-0 (segment ID), field_index 1 = MSH-2, field_index 2 = MSH-3, etc.
-
-        if segment_type == 'MSH':
-            if field_index == 0:
-                return jsonify({
-                    'success': True,
-                    'field_name': 'Segment ID',
-                    'segment': segment_type,
-                    'field_index': field_index,
-                    'version': hl7_version
-                })
-            elif field_index == 1:
-                # This is the encoding characters field (MSH-2 in HL7 spec)
-                return jsonify({
-                    'success': True,
-                    'field_name': 'Encoding Characters',
-                    'segment': segment_type,
-                    'field_index': field_index,
-                    'version': hl7_version
-                })
-            else:
-                # For MSH fields after encoding chars, add 1 to the index
-                # field_index 2 -> MSH-3, field_index 3 -> MSH-4, etc.
-                hl7apy_index = field_index + 1
-        else:
-            # For other segments, field 0 is segment ID
-            if field_index == 0:
-                return jsonify({
-                    'success': True,
-                    'field_name': 'Segment ID',
-                    'segment': segment_type,
-                    'field_index': field_index,
-                    'version': hl7_version
-                })
-            hl7apy_index = field_index
-
-        try:
-            # Try to get field information from hl7apy with specified version
-            field = Field(f'{segment_type}_{hl7apy_index}', version=hl7_version)
-            field_name = field.long_name.replace('_', ' ').title()
+        # Cached lookup; MSH field numbering (MSH-1 is the separator) is handled there
+        resolved = hl7ref.resolve_field_name(segment_type, field_index, hl7_version)
 
-            return jsonify({
-                'success': True,
-                'field_name': field_name,
-                'segment': segment_type,
-                'field_index': field_index,
-                'version': hl7_version
-            })
+        result = {
+            'success': True,
+            'field_name': resolved['field_name'],
+            'segment': segment_type,
+            'field_index': field_index,
+            'version': resolved['version']
+        }
+        if 'note' in resolved:
+            result['note'] = resolved['note']
 
-        except Exception as field_error:
-            # If field is not found or version not supported, try default version
-            try:
-                field = Field(f'{segment_type}_{hl7apy_index}', version='2.5')
-                field_name = field.long_name.replace('_', ' ').title()
-
-                return jsonify({
-                    'success': True,
-                    'field_name': field_name,
-                    'segment': segment_type,
-                    'field_index': field_index,
-                    'version': '2.5',
-                    'note': f'Using v2.5 definitions (v{hl7_version} not available)'
-                })
-            except:
-                # If still fails, return a generic name
-                return jsonify({
-                    'success': True,
-                    'field_name': f'{segment_type}-{field_index}',
-                    'segment': segment_type,
-                    'field_index': field_index,
-                    'version': hl7_version,
-                    'note': 'Field definition not found'
-                })
+        # Reference data only changes with a new release
+        return http_cache.cached_json(result, max_age=86400)
 
     except Exception as e:
         logger.error(f"Error getting field name: {str(e)}", exc_info=True)
@@ -367,18 +598,24 @@ def anonymize():
 
     Expected JSON payload:
     {
-        "message": "MSH|^~\\&|..."
+        "message": "MSH|^~\\&|...",
+        "profile": "default",  (optional, see /api/profiles; fixed for tenants)
+        "include_state": true,  (optional, return a token for /api/anonymize/segments)
+        "include_changes": true  (optional, return where the output was rewritten)
     }
 
     Returns:
     {
         "success": true,
         "anonymized_message": "MSH|^~\\&|...",
-        "message_count": 2
+        "message_count": 2,
+        "state": "...",  (only with include_state)
+        "change_map": {...}  (only with include_changes, see nubilum.change_map)
     }
     """
+    request_started = time.perf_counter()
     try:
-        data = request.get_json()
+        data = compression.get_request_json()
 
         if not data:
             logger.warning("No JSON data provided")
@@ -396,6 +633,18 @@ def anonymize():
                 'error': 'Message is required'
             }), 400
 
+        try:
+            engine = request_engine()
+            profile = (engine.select_profile(data.get('profile')) if engine is not None
+                       else profile_registry.get(data.get('profile')))
+        except TenantError as e:
+            return tenant_error_response(e)
+        except ProfileError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
+
         # Split into individual messages
         messages = split_messages(input_text)
 
@@ -407,24 +656,36 @@ def anonymize():
 
         logger.info(f"Received {len(messages)} message(s) for anonymization")
 
-        # Create anonymizer instance
-        anonymizer = HL7Anonymizer()
+        include_changes = bool(data.get('include_changes'))
+
+        # Create anonymizer instance (the tenant's key and pseudonyms with a tenant)
+        anonymizer = create_anonymizer(engine, profile, record_changes=include_changes)
         anonymized_messages = []
+        message_changes = []
 
         for idx, message in enumerate(messages, 1):
+            started = time.perf_counter()
             try:
                 # Anonymize the message
                 anonymized = anonymizer.anonymize_message(message)
+                finished = time.perf_counter()
                 anonymized_messages.append(anonymized)
+                if include_changes:
+                    message_changes.append(anonymizer.changes)
 
-                logger.info(f"Message {idx} anonymized successfully")
+                logger.debug(f"Message {idx} anonymized successfully")
 
-                # Track successful anonymization
-                usage_tracker.track_anonymization(message, success=True)
+                # Track successful anonymization (the last message also carries the request time)
+                usage_tracker.track_anonymization(
+                    message, success=True, duration_ms=(finished - started) * 1000,
+                    request_duration_ms=(finished - request_started) * 1000 if idx == len(messages) else None)
 
             except Exception as anon_error:
-                # Track failed anonymization
-                usage_tracker.track_anonymization(message, success=False, error=str(anon_error))
+                # Track failed anonymization (it ends the request)
+                finished = time.perf_counter()
+                usage_tracker.track_anonymization(
+                    message, success=False, error=str(anon_error), duration_ms=(finished - started) * 1000,
+                    request_duration_ms=(finished - request_started) * 1000)
                 logger.error(f"Message {idx} anonymization failed: {str(anon_error)}")
                 raise
 
@@ -433,11 +694,24 @@ def anonymize():
 
         logger.info(f"All {len(messages)} message(s) anonymized successfully")
 
-        return jsonify({
+        response = {
             'success': True,
             'anonymized_message': combined_output,
             'message_count': len(messages)
-        })
+        }
+
+        if data.get('include_state'):
+            state = build_state(anonymizer, messages)
+            state['tenant'] = engine.tenant.id if engine is not None else None
+            response['state'] = encode_state(state, app.config['SECRET_KEY'])
+
+        if include_changes:
+            response['change_map'] = change_map.build_change_map(anonymized_messages, message_changes)
+
+        return jsonify(response)
+
+    except IngestError as e:
+        return ingest_error_response(e)
 
     except Exception as e:
         logger.error(f"Error during anonymization: {str(e)}", exc_info=True)
@@ -447,6 +721,239 @@ def anonymize():
         }), 500
 
 
+@app.route('/api/anonymize/segments', methods=['POST'])
+def anonymize_segments():
+    """
+    Re-anonymize only the edited segments of a previously anonymized input.
+
+    Expected JSON payload:
+    {
+        "state": "...",  (token from /api/anonymize with include_state)
+        "segments": [
+            {"message": 0, "segment": 2, "text": "PID|1||..."}
+        ]
+    }
+
+    Message and segment indices are 0-based; segments are counted after
+    dropping empty lines, as in the anonymized output.
+
+    Returns:
+    {
+        "success": true,
+        "segments": [{"message": 0, "segment": 2, "anonymized": "PID|1||..."}],
+        "state": "...",
+        "context_changed": [0]  (messages whose free text must be re-sent)
+    }
+    """
+    try:
+        data = compression.get_request_json()
+
+        if not data:
+            return jsonify({
+                'success': False,
+                'error': 'No data provided'
+            }), 400
+
+        try:
+            engine = request_engine()
+            state = decode_state(data.get('state'), app.config['SECRET_KEY'],
+                                 max_age=app.config['STATE_TOKEN_MAX_AGE'])
+            # Pseudonyms in the token were derived with its tenant's key
+            if state.get('tenant') != (engine.tenant.id if engine is not None else None):
+                raise TenantError("State token belongs to another tenant")
+            profile = (engine.select_profile(state.get('profile')) if engine is not None
+                       else profile_registry.get(state.get('profile')))
+            anonymizer = create_anonymizer(engine, profile)
+            results, new_state, context_changed = reanonymize_segments(
+                state, data.get('segments'), anonymizer)
+            new_state['tenant'] = state.get('tenant')
+        except TenantError as e:
+            return tenant_error_response(e)
+        except (StateTokenError, IncrementalError, ProfileError) as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
+
+        logger.info(f"Re-anonymized {len(results)} segment(s) incrementally")
+
+        return jsonify({
+            'success': True,
+            'segments': results,
+            'state': encode_state(new_state, app.config['SECRET_KEY']),
+            'context_changed': context_changed
+        })
+
+    except Exception as e:
+        logger.error(f"Error during incremental anonymization: {str(e)}", exc_info=True)
+        return jsonify({
+            'success': False,
+            'error': f'Anonymization failed: {str(e)}'
+        }), 500
+
+
+@app.route('/api/jobs', methods=['POST'])
+def create_job():
+    """
+    Submit HL7 messages for asynchronous anonymization.
+
+    Expected JSON payload:
+    {
+        "message": "MSH|^~\\&|...",
+        "profile": "default"  (optional; fixed for tenants)
+    }
+
+    Returns 202 with the job id. Poll /api/jobs/<id> for progress and fetch
+    the output from /api/jobs/<id>/result once the job has completed.
+    """
+    try:
+        data = compression.get_request_json()
+
+        if not data:
+            return jsonify({
+                'success': False,
+                'error': 'No data provided'
+            }), 400
+
+        input_text = data.get('message', '')
+
+        if not input_text or input_text.strip() == '':
+            return jsonify({
+                'success': False,
+                'error': 'Message is required'
+            }), 400
+
+        try:
+            engine = request_engine()
+            profile = (engine.select_profile(data.get('profile')) if engine is not None
+                       else profile_registry.get(data.get('profile')))
+        except TenantError as e:
+            return tenant_error_response(e)
+        except ProfileError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
+
+        # Reject pathological input before spooling it
+        ingest.check_messages(input_text, job_ingest_limits)
+
+        if engine is not None:
+            job = job_manager.submit(input_text, profile=profile, key=engine.key, tenant=engine.tenant.id)
+        else:
+            job = job_manager.submit(input_text, profile=profile)
+
+        return jsonify({
+            'success': True,
+            'job_id': job['job_id'],
+            'state': job['state'],
+            'status_url': f"/api/jobs/{job['job_id']}",
+            'result_url': f"/api/jobs/{job['job_id']}/result"
+        }), 202
+
+    except IngestError as e:
+        return ingest_error_response(e)
+
+    except JobQueueFull as e:
+        logger.warning(str(e))
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 503
+
+    except Exception as e:
+        logger.error(f"Error creating job: {str(e)}", exc_info=True)
+        return jsonify({
+            'success': False,
+            'error': f'Failed to create job: {str(e)}'
+        }), 500
+
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """Get the state and progress of an anonymization job."""
+    try:
+        return jsonify({
+            'success': True,
+            'job': job_manager.status(job_id, tenant=request_tenant_id())
+        })
+    except TenantAuthError as e:
+        return tenant_error_response(e)
+    except JobNotFound as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 404
+
+
+@app.route('/api/jobs/<job_id>/result', methods=['GET'])
+def job_result(job_id):
+    """
+    Stream the anonymized output of a completed job.
+
+    Plain HL7 text by default; ?format=parquet or ?format=arrow downloads one
+    row per segment field for analytics tools (requires pyarrow).
+    """
+    fmt = request.args.get('format', 'hl7')
+    if fmt != 'hl7' and fmt not in columnar.FORMATS:
+        return jsonify({
+            'success': False,
+            'error': f"Unknown format '{fmt}' (use hl7, {', '.join(columnar.FORMATS)})"
+        }), 400
+
+    try:
+        tenant_id = request_tenant_id()
+        if fmt != 'hl7':
+            export_path = job_manager.export_result(job_id, fmt, tenant=tenant_id)
+            return send_file(export_path, mimetype=columnar.FORMATS[fmt][1], as_attachment=True,
+                             download_name=f"anonymized-{job_id}{columnar.FORMATS[fmt][0]}",
+                             max_age=0, etag=False, conditional=False)
+
+        chunks = job_manager.iter_result(job_id, tenant=tenant_id)
+    except TenantAuthError as e:
+        return tenant_error_response(e)
+    except ColumnarError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 501
+    except JobNotFound as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 404
+    except JobNotReady as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 409
+
+    return Response(chunks, mimetype='text/plain', headers={
+        'Content-Disposition': f'attachment; filename="anonymized-{job_id}.hl7"',
+        'Cache-Control': 'no-store'
+    })
+
+
+@app.route('/api/jobs/<job_id>', methods=['DELETE'])
+def delete_job(job_id):
+    """Delete a finished job and its result before the TTL expires."""
+    try:
+        job_manager.delete(job_id, tenant=request_tenant_id())
+        return jsonify({'success': True})
+    except TenantAuthError as e:
+        return tenant_error_response(e)
+    except JobNotFound as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 404
+    except JobNotReady as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 409
+
+
 @app.errorhandler(413)
 def request_entity_too_large(error):
     """Handle file too large errors."""
@@ -477,10 +984,13 @@ def internal_error(error):
 
 
 def create_app():
-    """Application factory."""
+    """Application factory: sets up logging and returns the app (gunicorn 'nubilum.app:create_app()')."""
+    configure_logging()
     return app
 
 
 if __name__ == '__main__':
+    configure_logging()
     logger.info(f"Starting Nubilum v{__version__}")
+    warmup.warm_up(profile_registry)
     app.run(host='0.0.0.0', port=5000, debug=False)
@@ -0,0 +1,143 @@
+"""Production build of the web interface assets.
+
+In development the browser transpiles ``app.jsx`` with Babel standalone. The
+production build (run at image build time) instead:
+
+- transpiles and minifies ``app.jsx`` with esbuild and bundles it with
+  ``hl7_examples.js`` into ``dist/app.<hash>.js``
+- minifies ``styles.css`` into ``dist/styles.<hash>.css``
+- writes ``dist/index.html`` referencing the bundles (without Babel) and
+  ``dist/manifest.json``
+
+Bundle names contain a hash of their contents, so they can be cached forever
+(``Cache-Control: immutable``); only the small ``index.html`` is revalidated.
+
+This module only needs the standard library and an ``esbuild`` binary
+(``NUBILUM_ESBUILD`` or ``esbuild`` on PATH), so it can run before the
+application's dependencies are installed.
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+STATIC_DIR = Path(__file__).parent / 'static'
+DIST_DIR_NAME = 'dist'
+
+_HASH_LENGTH = 10
+
+
+class AssetBuildError(Exception):
+    """Raised when the production assets cannot be built."""
+
+
+def find_esbuild() -> Optional[str]:
+    """Path of the esbuild binary, or None if it is not installed."""
+    return os.environ.get('NUBILUM_ESBUILD') or shutil.which('esbuild')
+
+
+def _esbuild(esbuild: str, source: Path, loader: str) -> bytes:
+    """Transpile/minify one file with esbuild and return the output."""
+    command = [esbuild, str(source), '--minify', f'--loader:{source.suffix}={loader}',
+               '--target=es2018', '--charset=utf8', '--log-level=warning']
+    try:
+        result = subprocess.run(command, capture_output=True, check=True, timeout=120)
+    except subprocess.CalledProcessError as e:
+        raise AssetBuildError(f"esbuild failed for {source.name}: {e.stderr.decode(errors='replace')}") from e
+    except OSError as e:
+        raise AssetBuildError(f"Cannot run esbuild: {e}") from e
+    return result.stdout
+
+
+def _hashed_name(stem: str, suffix: str, content: bytes) -> str:
+    return f"{stem}.{hashlib.sha256(content).hexdigest()[:_HASH_LENGTH]}{suffix}"
+
+
+def _production_index(index_html: str, script: str, stylesheet: str) -> str:
+    """Rewrite the development index.html to load the bundles instead of Babel and JSX."""
+    replacements = [
+        (r'<link rel="stylesheet" href="styles\.css">', f'<link rel="stylesheet" href="/{stylesheet}">'),
+        (r'\s*<script src="[^"]*@babel/standalone[^"]*"></script>', ''),
+        (r'\s*<script src="hl7_examples\.js"></script>', ''),
+        (r'<script type="text/babel" src="app\.jsx"></script>', f'<script src="/{script}"></script>'),
+    ]
+    for pattern, replacement in replacements:
+        index_html, count = re.subn(pattern, replacement, index_html)
+        if count != 1:
+            raise AssetBuildError(f"index.html does not contain the expected tag: {pattern}")
+    return index_html
+
+
+def build_assets(static_dir=STATIC_DIR, esbuild: Optional[str] = None) -> Dict:
+    """
+    Build the content-hashed production bundles.
+
+    Args:
+        static_dir: Static directory containing index.html, app.jsx, hl7_examples.js, styles.css
+        esbuild: Path of the esbuild binary (default: find_esbuild())
+
+    Returns:
+        The manifest (source name -> bundle path relative to static_dir)
+
+    Raises:
+        AssetBuildError: If esbuild is missing or a build step fails
+    """
+    static_dir = Path(static_dir)
+    esbuild = esbuild or find_esbuild()
+    if not esbuild:
+        raise AssetBuildError("esbuild not found (install it with 'npm install -g esbuild' or set NUBILUM_ESBUILD)")
+
+    script = (_esbuild(esbuild, static_dir / 'hl7_examples.js', 'js') + b';\n'
+              + _esbuild(esbuild, static_dir / 'app.jsx', 'jsx'))
+    stylesheet = _esbuild(esbuild, static_dir / 'styles.css', 'css')
+
+    dist_dir = static_dir / DIST_DIR_NAME
+    if dist_dir.exists():
+        shutil.rmtree(dist_dir)
+    dist_dir.mkdir()
+
+    manifest = {
+        'app.js': f"{DIST_DIR_NAME}/{_hashed_name('app', '.js', script)}",
+        'styles.css': f"{DIST_DIR_NAME}/{_hashed_name('styles', '.css', stylesheet)}",
+    }
+    (static_dir / manifest['app.js']).write_bytes(script)
+    (static_dir / manifest['styles.css']).write_bytes(stylesheet)
+
+    index_html = (static_dir / 'index.html').read_text(encoding='utf-8')
+    (dist_dir / 'index.html').write_text(
+        _production_index(index_html, manifest['app.js'], manifest['styles.css']), encoding='utf-8')
+    (dist_dir / 'manifest.json').write_text(json.dumps(manifest, indent=2) + '\n', encoding='utf-8')
+
+    logger.info(f"Built {manifest['app.js']} ({len(script)} bytes), "
+                f"{manifest['styles.css']} ({len(stylesheet)} bytes)")
+    return manifest
+
+
+def main(argv=None) -> int:
+    """Entry point for ``python -m nubilum.assets`` (used at image build time)."""
+    parser = argparse.ArgumentParser(description='Build the production web assets')
+    parser.add_argument('--static-dir', default=str(STATIC_DIR), help='Static directory')
+    parser.add_argument('--esbuild', help='Path of the esbuild binary')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s - %(message)s')
+    try:
+        build_assets(args.static_dir, args.esbuild)
+    except AssetBuildError as e:
+        logger.error(str(e))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
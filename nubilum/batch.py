@@ -0,0 +1,463 @@
+"""Resumable batch anonymization of HL7 archive files.
+
+A batch job reads a manifest (one input file per line), anonymizes every
+message with a single ``HL7Anonymizer`` and writes one output file per input.
+Work is done in chunks; after each chunk the output is flushed and a checkpoint
+is written with the current input file, byte offset, output size and the
+length of the pseudonym-state journal. A restarted job truncates its output
+back to the checkpoint, replays the pseudonym state and continues, producing
+exactly the output an uninterrupted run would have produced.
+
+The checkpoint directory holds original identifiers (the pseudonym journal) and
+must be protected like the input archive. It is removed when the job completes,
+leaving only the status file.
+
+With a re-identification map the job runs in reversible mode (keyed
+pseudonyms, see nubilum.reversible); the map is appended at every checkpoint.
+"""
+
+import hashlib
+import itertools
+import logging
+import os
+import re
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import BinaryIO, Callable, Dict, Iterator, List, Optional, Tuple
+
+from nubilum import jsonutil
+from nubilum.anonymizer import HL7Anonymizer
+from nubilum.fileutil import atomic_write_json, read_json
+from nubilum.profiles import AnonymizationProfile
+from nubilum.pseudonym_table import SharedPseudonymTable
+from nubilum.reversible import ReidentificationMap
+from nubilum.segment_cache import SegmentCache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 500
+
+CHECKPOINT_FILE = 'checkpoint.json'
+STATUS_FILE = 'status.json'
+STATE_JOURNAL_FILE = 'pseudonyms.jsonl'
+
+_BLOCK_SIZE = 1024 * 1024
+_EOL = re.compile(rb'\r\n|\r|\n')
+
+# Failures kept in the status file (positions only, never message content)
+_MAX_REPORTED_FAILURES = 100
+
+
+class BatchError(Exception):
+    """Raised when a batch job cannot be started or resumed."""
+
+
+def read_manifest(manifest_path) -> List[Path]:
+    """
+    Read a batch manifest.
+
+    The manifest lists one input file per line; relative paths are resolved
+    against the manifest's directory. Blank lines and '#' comments are ignored.
+
+    Args:
+        manifest_path: Path to the manifest file
+
+    Returns:
+        List of input file paths
+    """
+    manifest_path = Path(manifest_path)
+    try:
+        lines = manifest_path.read_text(encoding='utf-8').splitlines()
+    except OSError as e:
+        raise BatchError(f"Cannot read manifest {manifest_path}: {e}") from e
+
+    files = []
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        path = Path(line)
+        if not path.is_absolute():
+            path = manifest_path.parent / path
+        if not path.is_file():
+            raise BatchError(f"Input file not found: {path}")
+        files.append(path)
+
+    names = [path.name for path in files]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        raise BatchError(f"Input files must have distinct names: {', '.join(duplicates)}")
+
+    return files
+
+
+def _iter_lines(f: BinaryIO, block_size: int = _BLOCK_SIZE) -> Iterator[Tuple[bytes, int]]:
+    """Yield (line, start offset) from the current position; accepts \\r, \\n and \\r\\n."""
+    pending = b''
+    pending_start = f.tell()
+
+    while True:
+        block = f.read(block_size)
+        if not block:
+            break
+
+        data = pending + block
+        start = 0
+        for match in _EOL.finditer(data):
+            yield data[start:match.start()], pending_start + start
+            start = match.end()
+
+        pending_start += start
+        pending = data[start:]
+
+    if pending:
+        yield pending, pending_start
+
+
+def iter_messages(f: BinaryIO, offset: int = 0) -> Iterator[Tuple[bytes, int, int]]:
+    """
+    Yield the HL7 messages of a binary file.
+
+    A message starts at each MSH segment. Blank lines are dropped.
+
+    Args:
+        f: File opened in binary mode
+        offset: Byte offset to start from (must be at a message boundary)
+
+    Yields:
+        (message bytes with '\\n'-separated segments, start offset, end offset);
+        the end offset is where the next message starts.
+    """
+    f.seek(offset)
+    current: List[bytes] = []
+    current_start = offset
+
+    for line, start in _iter_lines(f):
+        stripped = line.strip()
+        if stripped.startswith(b'MSH|') and current:
+            yield b'\n'.join(current), current_start, start
+            current = [line]
+            current_start = start
+        elif stripped:
+            if not current:
+                current_start = start
+            current.append(line)
+
+    if current:
+        yield b'\n'.join(current), current_start, f.tell()
+
+
+class BatchJob:
+    """Chunked, checkpointed anonymization of the files in a manifest."""
+
+    def __init__(self, manifest_path, output_dir, checkpoint_dir=None,
+                 chunk_size: int = DEFAULT_CHUNK_SIZE,
+                 profile: Optional[AnonymizationProfile] = None,
+                 encoding: str = 'utf-8',
+                 progress_callback: Optional[Callable[[Dict], None]] = None,
+                 message_callback: Optional[Callable[[str, bool, Optional[str], float], None]] = None,
+                 pseudonym_table: Optional[SharedPseudonymTable] = None,
+                 reidentification_map: Optional[ReidentificationMap] = None,
+                 segment_cache: Optional[SegmentCache] = None,
+                 key: Optional[bytes] = None):
+        """
+        Initialize the batch job.
+
+        Args:
+            manifest_path: Manifest listing the input files
+            output_dir: Directory for the anonymized output files
+            checkpoint_dir: Directory for checkpoint and status files
+                (default: <output_dir>/.nubilum-checkpoint)
+            chunk_size: Messages processed between checkpoints
+            profile: Anonymization profile (default: built-in rules)
+            encoding: Character encoding of the input and output files
+            progress_callback: Called with the status dict after each chunk
+            message_callback: Called with (original message, success, error,
+                milliseconds spent anonymizing it) for every message, e.g. for
+                usage tracking
+            pseudonym_table: Shared-memory pseudonym table
+            reidentification_map: Enables reversible mode: keyed pseudonyms, each
+                recorded in this encrypted map once per chunk
+            segment_cache: Cache of anonymized segments (repeated segments are
+                not anonymized again)
+            key: Pseudonym key for keyed pseudonyms without a map (e.g. a
+                tenant's key); the map's key takes precedence
+        """
+        if chunk_size < 1:
+            raise BatchError("chunk_size must be at least 1")
+
+        self.manifest_path = Path(manifest_path)
+        self.output_dir = Path(output_dir)
+        self.checkpoint_dir = Path(checkpoint_dir) if checkpoint_dir else self.output_dir / '.nubilum-checkpoint'
+        self.chunk_size = chunk_size
+        self.profile = profile
+        self.encoding = encoding
+        self.progress_callback = progress_callback
+        self.message_callback = message_callback
+        self.pseudonym_table = pseudonym_table
+        self.reidentification_map = reidentification_map
+        self.segment_cache = segment_cache
+        self.key = reidentification_map.pseudonym_key if reidentification_map is not None else key
+
+        self.checkpoint_file = self.checkpoint_dir / CHECKPOINT_FILE
+        self.status_file = self.checkpoint_dir / STATUS_FILE
+        self.journal_file = self.checkpoint_dir / STATE_JOURNAL_FILE
+
+        self._status: Dict = {}
+        self._failures: List[Dict] = []
+        self._journaled_ids = 0
+        self._journaled_names = 0
+        self._run_started = 0.0
+        self._elapsed_before_run = 0.0
+        self._bytes_before_run = 0
+
+    @staticmethod
+    def _manifest_digest(files: List[Path]) -> str:
+        digest = hashlib.sha256()
+        for path in files:
+            digest.update(f"{path.resolve()}\0{path.stat().st_size}\n".encode('utf-8'))
+        return digest.hexdigest()
+
+    def _load_checkpoint(self, manifest_digest: str, restart: bool) -> Dict:
+        checkpoint = None if restart else read_json(self.checkpoint_file)
+
+        if checkpoint is None:
+            return {
+                'manifest_digest': manifest_digest,
+                'file_index': 0,
+                'input_offset': 0,
+                'output_offset': 0,
+                'state_offset': 0,
+                'messages_done': 0,
+                'failed_messages': 0,
+                'bytes_done': 0,
+                'elapsed_seconds': 0.0,
+                'started_at': datetime.now().isoformat(),
+                'reversible': self.key is not None,
+            }
+
+        if checkpoint.get('manifest_digest') != manifest_digest:
+            raise BatchError("Checkpoint belongs to a different manifest; use restart to start over")
+
+        if checkpoint.get('reversible', False) != (self.key is not None):
+            raise BatchError("Checkpoint was written in a different pseudonymization mode "
+                             "(with or without a key); use restart to start over")
+
+        logger.info(f"Resuming batch job at file {checkpoint['file_index'] + 1}, "
+                    f"offset {checkpoint['input_offset']}")
+        return checkpoint
+
+    def _restore_state(self, anonymizer: HL7Anonymizer, state_offset: int) -> None:
+        """Replay the pseudonym journal up to the checkpointed offset."""
+        if not self.journal_file.exists():
+            if state_offset:
+                raise BatchError("Pseudonym journal is missing; cannot resume with identical output")
+            return
+
+        with open(self.journal_file, 'r+b') as f:
+            f.truncate(state_offset)
+            f.seek(0)
+            for line in f:
+                kind, original, pseudo = jsonutil.loads(line)
+                if kind == 'i':
+                    anonymizer.processed_ids[original] = pseudo
+                else:
+                    anonymizer.processed_names[original] = pseudo
+
+        self._journaled_ids = len(anonymizer.processed_ids)
+        self._journaled_names = len(anonymizer.processed_names)
+
+    def _journal_state(self, anonymizer: HL7Anonymizer) -> int:
+        """Append pseudonyms created since the last checkpoint; returns the journal size."""
+        new_ids = list(itertools.islice(anonymizer.processed_ids.items(), self._journaled_ids, None))
+        new_names = list(itertools.islice(anonymizer.processed_names.items(), self._journaled_names, None))
+
+        # Recorded before the checkpoint; pairs repeated after a crash are harmless
+        if self.reidentification_map is not None:
+            self.reidentification_map.append(
+                (pseudo, original) for original, pseudo in itertools.chain(new_ids, new_names))
+
+        lines = [jsonutil.dumps(['i', original, pseudo]) + '\n' for original, pseudo in new_ids]
+        lines += [jsonutil.dumps(['n', original, pseudo]) + '\n' for original, pseudo in new_names]
+
+        with open(self.journal_file, 'ab') as f:
+            if lines:
+                f.write(''.join(lines).encode('utf-8'))
+                f.flush()
+                os.fsync(f.fileno())
+            size = f.tell()
+
+        self._journaled_ids = len(anonymizer.processed_ids)
+        self._journaled_names = len(anonymizer.processed_names)
+        return size
+
+    def _elapsed(self) -> float:
+        """Total processing time including previous (interrupted) runs."""
+        return self._elapsed_before_run + time.monotonic() - self._run_started
+
+    def _save_checkpoint(self, checkpoint: Dict) -> None:
+        checkpoint['elapsed_seconds'] = self._elapsed()
+        atomic_write_json(self.checkpoint_file, checkpoint)
+
+    def _update_status(self, state: str, checkpoint: Dict, files: List[Path],
+                       bytes_total: int, error: Optional[str] = None) -> Dict:
+        elapsed = self._elapsed()
+        run_elapsed = time.monotonic() - self._run_started
+        run_bytes = checkpoint['bytes_done'] - self._bytes_before_run
+        bytes_per_second = run_bytes / run_elapsed if run_elapsed > 0 else 0.0
+        remaining = bytes_total - checkpoint['bytes_done']
+        file_index = checkpoint['file_index']
+
+        self._status = {
+            'state': state,
+            'manifest': str(self.manifest_path),
+            'files_total': len(files),
+            'files_done': file_index,
+            'current_file': str(files[file_index]) if file_index < len(files) else None,
+            'bytes_total': bytes_total,
+            'bytes_done': checkpoint['bytes_done'],
+            'progress': round(checkpoint['bytes_done'] / bytes_total * 100, 2) if bytes_total else 100.0,
+            'messages_done': checkpoint['messages_done'],
+            'failed_messages': checkpoint['failed_messages'],
+            'failures': self._failures[-_MAX_REPORTED_FAILURES:],
+            'started_at': checkpoint['started_at'],
+            'updated_at': datetime.now().isoformat(),
+            'elapsed_seconds': round(elapsed, 3),
+            'messages_per_second': round(checkpoint['messages_done'] / elapsed, 2) if elapsed > 0 else 0.0,
+            'bytes_per_second': round(bytes_per_second, 2),
+            'eta_seconds': round(remaining / bytes_per_second, 1) if bytes_per_second > 0 and state == 'running' else None,
+            'segment_cache': self.segment_cache.stats() if self.segment_cache is not None else None,
+            'error': error,
+        }
+
+        atomic_write_json(self.status_file, self._status, fsync=False)
+
+        if self.progress_callback:
+            self.progress_callback(dict(self._status))
+
+        return self._status
+
+    def run(self, restart: bool = False) -> Dict:
+        """
+        Run (or resume) the job until every file is processed.
+
+        Args:
+            restart: Ignore any existing checkpoint and start from the beginning
+
+        Returns:
+            Final status dictionary
+        """
+        files = read_manifest(self.manifest_path)
+        manifest_digest = self._manifest_digest(files)
+        bytes_total = sum(path.stat().st_size for path in files)
+
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.checkpoint_dir.mkdir(parents=True, exist_ok=True)
+
+        checkpoint = self._load_checkpoint(manifest_digest, restart)
+        if restart and self.journal_file.exists():
+            self.journal_file.unlink()
+
+        anonymizer = HL7Anonymizer(profile=self.profile, pseudonym_table=self.pseudonym_table, key=self.key,
+                                   segment_cache=self.segment_cache)
+        self._restore_state(anonymizer, checkpoint['state_offset'])
+
+        self._run_started = time.monotonic()
+        self._elapsed_before_run = checkpoint['elapsed_seconds']
+        self._bytes_before_run = checkpoint['bytes_done']
+
+        def status(state, error=None):
+            return self._update_status(state, checkpoint, files, bytes_total, error)
+
+        status('running')
+
+        try:
+            while checkpoint['file_index'] < len(files):
+                self._process_file(files[checkpoint['file_index']], anonymizer, checkpoint, status)
+
+                checkpoint['file_index'] += 1
+                checkpoint['input_offset'] = 0
+                checkpoint['output_offset'] = 0
+                self._save_checkpoint(checkpoint)
+
+        except Exception as e:
+            logger.error(f"Batch job failed: {e}", exc_info=True)
+            status('failed', error=str(e))
+            raise
+
+        final = status('completed')
+
+        # The checkpoint and journal contain original identifiers
+        for path in (self.checkpoint_file, self.journal_file):
+            if path.exists():
+                path.unlink()
+
+        logger.info(f"Batch job completed: {checkpoint['messages_done']} message(s), "
+                    f"{checkpoint['failed_messages']} failed")
+        return final
+
+    def _process_file(self, input_path: Path, anonymizer: HL7Anonymizer,
+                      checkpoint: Dict, status: Callable) -> None:
+        """Anonymize one input file, checkpointing after every chunk."""
+        output_path = self.output_dir / input_path.name
+        resuming = checkpoint['input_offset'] > 0 or checkpoint['output_offset'] > 0
+
+        logger.info(f"Anonymizing {input_path} -> {output_path}")
+
+        mode = 'r+b' if resuming and output_path.exists() else 'wb'
+        with open(input_path, 'rb') as source, open(output_path, mode) as target:
+            target.truncate(checkpoint['output_offset'])
+            target.seek(checkpoint['output_offset'])
+
+            chunk: List[str] = []
+            last_end = checkpoint['input_offset']
+
+            for raw, start, end in iter_messages(source, checkpoint['input_offset']):
+                message = ''
+                started = time.perf_counter()
+                try:
+                    message = raw.decode(self.encoding)
+                    chunk.append(anonymizer.anonymize_message(message) + '\n\n')
+                except Exception as e:
+                    duration_ms = (time.perf_counter() - started) * 1000
+                    checkpoint['failed_messages'] += 1
+                    self._failures.append({'file': str(input_path), 'offset': start, 'error': str(e)})
+                    logger.error(f"Message at {input_path}:{start} failed: {e}")
+                    if self.message_callback:
+                        self.message_callback(message, False, str(e), duration_ms)
+                else:
+                    if self.message_callback:
+                        self.message_callback(message, True, None, (time.perf_counter() - started) * 1000)
+
+                checkpoint['messages_done'] += 1
+                checkpoint['bytes_done'] += end - last_end
+                last_end = end
+
+                if len(chunk) >= self.chunk_size:
+                    self._commit_chunk(chunk, target, anonymizer, checkpoint, last_end)
+                    status('running')
+                    chunk = []
+
+            self._commit_chunk(chunk, target, anonymizer, checkpoint, last_end)
+
+            # Trailing bytes after the last message (e.g. blank lines)
+            checkpoint['bytes_done'] += input_path.stat().st_size - last_end
+
+    def _commit_chunk(self, chunk: List[str], target: BinaryIO, anonymizer: HL7Anonymizer,
+                      checkpoint: Dict, input_offset: int) -> None:
+        """Durably write a chunk of output and record the matching checkpoint."""
+        if chunk:
+            target.write(''.join(chunk).encode(self.encoding))
+        target.flush()
+        os.fsync(target.fileno())
+
+        checkpoint['input_offset'] = input_offset
+        checkpoint['output_offset'] = target.tell()
+        checkpoint['state_offset'] = self._journal_state(anonymizer)
+        self._save_checkpoint(checkpoint)
+
+
+def read_status(checkpoint_dir) -> Optional[Dict]:
+    """Read the status file of a batch job, or None if the job has not started."""
+    return read_json(Path(checkpoint_dir) / STATUS_FILE)
@@ -0,0 +1,69 @@
+"""Compact change maps of anonymized output.
+
+A change map says where each rewritten value sits in the anonymized text
+returned by /api/anonymize, so clients can highlight changes without
+re-parsing the original message and diffing it component by component, and
+label them without one /api/field-name request per field.
+
+Changes are rows of COLUMNS. Offsets are character offsets into the combined
+output (messages joined by a blank line), end exclusive; component is 1-based,
+or None when the whole field was rewritten. Field names are given once per
+message, keyed like "PID-5" by the '|'-split position used in the rows.
+"""
+
+from typing import Dict, List, Sequence
+
+from nubilum import hl7ref
+
+COLUMNS = ('segment', 'field', 'component', 'start', 'end', 'kind')
+
+# Separator between messages in the combined output
+MESSAGE_SEPARATOR = '\n\n'
+
+
+def message_version(segments: Sequence[str]) -> str:
+    """HL7 version of a message (MSH-12), or the default version."""
+    if segments and segments[0].startswith('MSH'):
+        fields = segments[0].split('|')
+        if len(fields) > 11 and fields[11]:
+            return fields[11].split('^')[0]
+    return hl7ref.DEFAULT_VERSION
+
+
+def build_change_map(anonymized_messages: Sequence[str], changes: Sequence[List[tuple]]) -> Dict:
+    """
+    Build the change map of a combined output.
+
+    Args:
+        anonymized_messages: Anonymized messages, in output order
+        changes: HL7Anonymizer.changes recorded for each message
+
+    Returns:
+        Dict with 'columns' and one entry per message with its 'version',
+        'fields' (names of the changed fields) and 'changes' rows
+    """
+    messages = []
+    base = 0
+
+    for number, (text, message_changes) in enumerate(zip(anonymized_messages, changes), 1):
+        segments = text.split('\n')
+        version = message_version(segments)
+        fields = {}
+        rows = []
+
+        for segment, field, component, start, end, kind in message_changes:
+            segment_type = segments[segment][:3]
+            label = f'{segment_type}-{field}'
+            if label not in fields:
+                fields[label] = hl7ref.resolve_field_name(segment_type, field, version)['field_name']
+            rows.append([segment, field, component, base + start, base + end, kind])
+
+        messages.append({
+            'message': number,
+            'version': version,
+            'fields': fields,
+            'changes': rows,
+        })
+        base += len(text) + len(MESSAGE_SEPARATOR)
+
+    return {'columns': list(COLUMNS), 'messages': messages}
@@ -0,0 +1,263 @@
+"""Command-line interface for offline Nubilum tasks."""
+
+import argparse
+import json
+import logging
+import signal
+import sys
+from pathlib import Path
+
+from nubilum import __version__
+from nubilum.assets import STATIC_DIR, AssetBuildError, build_assets
+from nubilum.batch import BatchError, BatchJob, DEFAULT_CHUNK_SIZE, read_status
+from nubilum.profiles import ProfileError, load_profile
+from nubilum import columnar, spool, surrogates
+from nubilum.reversible import (ReidentificationMap, ReversibleError, load_key_file,
+                                reidentify_file, write_key_file)
+from nubilum.segment_cache import cache_from_env
+
+logger = logging.getLogger(__name__)
+
+
+def _load_profile_arg(path):
+    """Load the --profile argument, if given."""
+    if not path:
+        return None
+    return load_profile(path)
+
+
+def _load_map_args(key_file, map_path):
+    """Open the re-identification map given by --key-file and --reidentification-map."""
+    if not key_file and not map_path:
+        return None
+    if not (key_file and map_path):
+        raise ReversibleError("Reversible mode needs both --key-file and --reidentification-map")
+    return ReidentificationMap(map_path, load_key_file(key_file))
+
+
+def _cmd_batch_run(args) -> int:
+    job = BatchJob(
+        manifest_path=args.manifest,
+        output_dir=args.output_dir,
+        checkpoint_dir=args.checkpoint_dir,
+        chunk_size=args.chunk_size,
+        profile=_load_profile_arg(args.profile),
+        encoding=args.encoding,
+        reidentification_map=_load_map_args(args.key_file, args.reidentification_map),
+        segment_cache=cache_from_env(),
+    )
+    status = job.run(restart=args.restart)
+
+    print(f"Anonymized {status['messages_done']} message(s) from {status['files_total']} file(s) "
+          f"in {status['elapsed_seconds']:.1f}s ({status['failed_messages']} failed)")
+    return 0 if status['failed_messages'] == 0 else 2
+
+
+def _cmd_batch_status(args) -> int:
+    status = read_status(args.checkpoint_dir)
+    if status is None:
+        print(f"No batch job status found in {args.checkpoint_dir}", file=sys.stderr)
+        return 1
+
+    print(json.dumps(status, indent=2))
+    return 0
+
+
+def _cmd_spool_watch(args) -> int:
+    daemon = spool.SpoolDaemon(
+        inbound_dirs=args.inbound,
+        outbound_dir=args.outbound,
+        state_dir=args.state_dir,
+        workers=args.workers,
+        batch_size=args.batch_size,
+        profile=_load_profile_arg(args.profile),
+        encoding=args.encoding,
+        poll_interval=args.poll_interval,
+        use_inotify=not args.poll,
+    )
+
+    def stop(signum, frame):
+        logger.info("Stopping after the files in progress")
+        daemon.stop()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    status = daemon.run()
+    print(f"Anonymized {status['files_processed']} file(s), {status['messages_processed']} message(s); "
+          f"{status['files_quarantined']} quarantined")
+    return 0
+
+
+def _cmd_spool_status(args) -> int:
+    status = spool.read_status(args.state_dir)
+    if status is None:
+        print(f"No spool daemon status found in {args.state_dir}", file=sys.stderr)
+        return 1
+
+    print(json.dumps(status, indent=2))
+    return 0
+
+
+def _cmd_export(args) -> int:
+    fmt = args.format or ('arrow' if args.output.endswith(('.arrow', '.feather')) else 'parquet')
+    messages = columnar.iter_file_messages(args.inputs, args.encoding)
+    if not args.anonymized:
+        messages = columnar.anonymize_messages(messages, _load_profile_arg(args.profile), cache_from_env())
+
+    stats = columnar.export_messages(messages, args.output, fmt, args.batch_rows)
+    print(f"Exported {stats['messages']} message(s) as {stats['rows']} rows "
+          f"in {stats['batches']} record batch(es) to {args.output}")
+    return 0
+
+
+def _cmd_keygen(args) -> int:
+    write_key_file(args.key_file)
+    print(f"Wrote master key to {args.key_file}; store it apart from the anonymized data")
+    return 0
+
+
+def _cmd_reidentify(args) -> int:
+    mapping = ReidentificationMap(args.map, load_key_file(args.key_file)).load()
+    output_dir = Path(args.output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    total = 0
+    for input_path in args.inputs:
+        output_path = output_dir / Path(input_path).name
+        count = reidentify_file(input_path, output_path, mapping, args.encoding)
+        logger.info(f"{input_path} -> {output_path}: {count} value(s) restored")
+        total += count
+
+    print(f"Restored {total} value(s) in {len(args.inputs)} file(s) using {len(mapping)} map entries")
+    return 0
+
+
+def _cmd_assets_build(args) -> int:
+    manifest = build_assets(args.static_dir, args.esbuild)
+    for source, bundle in manifest.items():
+        print(f"{source} -> {bundle}")
+    return 0
+
+
+def _cmd_surrogates_build(args) -> int:
+    sizes = surrogates.build(args.source_dir, args.output)
+    print(f"Wrote {args.output}: " + ", ".join(f"{size} {name}" for name, size in sizes.items()))
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """Build the argument parser."""
+    parser = argparse.ArgumentParser(prog='nubilum', description='Nubilum HL7 anonymization tools')
+    parser.add_argument('--version', action='version', version=f'%(prog)s {__version__}')
+    parser.add_argument('-v', '--verbose', action='store_true', help='Enable debug logging')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    batch = commands.add_parser('batch', help='Resumable anonymization of archive files')
+    batch_commands = batch.add_subparsers(dest='batch_command', required=True)
+
+    run = batch_commands.add_parser('run', help='Run or resume a batch job')
+    run.add_argument('manifest', help='File listing one input file per line')
+    run.add_argument('-o', '--output-dir', required=True, help='Directory for anonymized files')
+    run.add_argument('--checkpoint-dir', help='Checkpoint/status directory (default: OUTPUT_DIR/.nubilum-checkpoint)')
+    run.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='Messages between checkpoints')
+    run.add_argument('--profile', help='Anonymization profile file (.json/.yaml)')
+    run.add_argument('--encoding', default='utf-8', help='Input/output character encoding')
+    run.add_argument('--restart', action='store_true', help='Ignore existing checkpoint and start over')
+    run.add_argument('--key-file', help='Master key for reversible pseudonyms (see "nubilum keygen")')
+    run.add_argument('--reidentification-map', help='Encrypted map receiving pseudonym -> original pairs')
+    run.set_defaults(func=_cmd_batch_run)
+
+    status = batch_commands.add_parser('status', help='Show progress of a batch job')
+    status.add_argument('checkpoint_dir', help='Checkpoint directory of the job')
+    status.set_defaults(func=_cmd_batch_status)
+
+    export = commands.add_parser('export', help='Anonymize into Parquet/Arrow, one row per segment field')
+    export.add_argument('inputs', nargs='+', help='HL7 files')
+    export.add_argument('-o', '--output', required=True, help='Output file (.parquet or .arrow)')
+    export.add_argument('--format', choices=sorted(columnar.FORMATS),
+                        help='Output format (default: from the output suffix, else parquet)')
+    export.add_argument('--anonymized', action='store_true', help='Inputs are already anonymized')
+    export.add_argument('--profile', help='Anonymization profile file (.json/.yaml)')
+    export.add_argument('--encoding', default='utf-8', help='Input character encoding')
+    export.add_argument('--batch-rows', type=int, default=columnar.DEFAULT_BATCH_ROWS,
+                        help='Rows per record batch (bounds memory use)')
+    export.set_defaults(func=_cmd_export)
+
+    spool_parser = commands.add_parser('spool', help='Anonymize files dropped into spool directories')
+    spool_commands = spool_parser.add_subparsers(dest='spool_command', required=True)
+
+    watch = spool_commands.add_parser('watch', help='Watch inbound directories and anonymize new files')
+    watch.add_argument('inbound', nargs='+', help='Inbound spool directories')
+    watch.add_argument('-o', '--outbound', required=True, help='Directory for anonymized files')
+    watch.add_argument('--state-dir', help='Quarantine and status directory (default: OUTBOUND/.nubilum-spool)')
+    watch.add_argument('--workers', type=int, default=spool.DEFAULT_WORKERS, help='Anonymization processes')
+    watch.add_argument('--batch-size', type=int, default=spool.DEFAULT_BATCH_SIZE,
+                       help='Maximum files per worker batch')
+    watch.add_argument('--profile', help='Anonymization profile file (.json/.yaml)')
+    watch.add_argument('--encoding', default='utf-8', help='Input/output character encoding')
+    watch.add_argument('--poll', action='store_true', help='Poll the directories instead of using inotify')
+    watch.add_argument('--poll-interval', type=float, default=spool.DEFAULT_POLL_INTERVAL,
+                       help='Seconds between directory scans when polling')
+    watch.set_defaults(func=_cmd_spool_watch)
+
+    spool_status = spool_commands.add_parser('status', help='Show throughput and queue depth of the daemon')
+    spool_status.add_argument('state_dir', help='State directory of the daemon')
+    spool_status.set_defaults(func=_cmd_spool_status)
+
+    keygen = commands.add_parser('keygen', help='Create a master key for reversible pseudonymization')
+    keygen.add_argument('key_file', help='Key file to create (readable only by its owner)')
+    keygen.set_defaults(func=_cmd_keygen)
+
+    reidentify = commands.add_parser('reidentify', help='Restore original values in anonymized files')
+    reidentify.add_argument('inputs', nargs='+', help='Files anonymized in reversible mode')
+    reidentify.add_argument('-o', '--output-dir', required=True, help='Directory for re-identified files')
+    reidentify.add_argument('--key-file', required=True, help='Master key used for the batch run')
+    reidentify.add_argument('--map', required=True, help='Re-identification map written by the batch run')
+    reidentify.add_argument('--encoding', default='utf-8', help='Input/output character encoding')
+    reidentify.set_defaults(func=_cmd_reidentify)
+
+    assets = commands.add_parser('assets', help='Production web interface assets')
+    assets_commands = assets.add_subparsers(dest='assets_command', required=True)
+
+    build = assets_commands.add_parser('build', help='Build minified, content-hashed JS/CSS bundles')
+    build.add_argument('--static-dir', default=str(STATIC_DIR), help='Static directory')
+    build.add_argument('--esbuild', help='Path of the esbuild binary (default: NUBILUM_ESBUILD or PATH)')
+    build.set_defaults(func=_cmd_assets_build)
+
+    surrogates_parser = commands.add_parser('surrogates', help='Surrogate name and address dictionaries')
+    surrogates_commands = surrogates_parser.add_subparsers(dest='surrogates_command', required=True)
+
+    surrogates_build = surrogates_commands.add_parser('build',
+                                                      help='Compile the TSV sources into the dictionary file')
+    surrogates_build.add_argument('--source-dir', default=str(surrogates.SOURCE_DIR),
+                                  help='Directory with the TSV sources')
+    surrogates_build.add_argument('-o', '--output', default=str(surrogates.DEFAULT_PATH),
+                                  help='Dictionary file to write')
+    surrogates_build.set_defaults(func=_cmd_surrogates_build)
+
+    return parser
+
+
+def main(argv=None) -> int:
+    """Entry point for the ``nubilum`` command."""
+    args = build_parser().parse_args(argv)
+
+    logging.basicConfig(
+        level=logging.DEBUG if args.verbose else logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    )
+
+    try:
+        return args.func(args)
+    except (AssetBuildError, BatchError, ProfileError, ReversibleError, spool.SpoolError,
+            columnar.ColumnarError, surrogates.SurrogateError) as e:
+        logger.error(str(e))
+        return 1
+    except KeyboardInterrupt:
+        logger.warning("Interrupted")
+        return 130
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,273 @@
+"""Columnar export of anonymized messages for analytics.
+
+Anonymized messages are flattened to one row per non-empty field and written
+as Parquet or Arrow IPC (file format) in record batches of ``batch_rows``
+rows, so memory stays bounded whatever the size of the export. Columns:
+
+    message       int64   0-based message number in the export
+    control_id    string  MSH-10 of the message
+    message_type  string  MSH-9 of the message
+    segment_index int32   0-based position of the segment in its message
+    segment       string  segment type (PID, OBX, ...)
+    field         int32   HL7 field number (MSH-1 is the field separator)
+    value         string  field value, components and repetitions included
+
+message_type and segment are dictionary-encoded with one dictionary for the
+whole export (Arrow IPC files append it as deltas). pandas, DuckDB or
+Polars can then filter and aggregate by segment and field without parsing
+ER7 text.
+
+Requires the optional ``pyarrow`` package (``pip install nubilum[columnar]``).
+"""
+
+import logging
+import os
+import tempfile
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+
+from nubilum.anonymizer import HL7Anonymizer
+from nubilum.batch import iter_messages
+from nubilum.profiles import AnonymizationProfile
+from nubilum.segment_cache import SegmentCache
+
+logger = logging.getLogger(__name__)
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+DEFAULT_BATCH_ROWS = 64 * 1024
+
+# Format name -> (file suffix, media type)
+FORMATS = {
+    'parquet': ('.parquet', 'application/vnd.apache.parquet'),
+    'arrow': ('.arrow', 'application/vnd.apache.arrow.file'),
+}
+
+_DICTIONARY_COLUMNS = ('message_type', 'segment')
+
+
+class ColumnarError(Exception):
+    """Raised when a columnar export cannot be written."""
+
+
+def available() -> bool:
+    """Whether pyarrow is installed."""
+    return pa is not None
+
+
+def segment_rows(message: str) -> Iterator[Tuple[int, str, int, str]]:
+    """
+    Flatten a message into (segment index, segment, field number, value) rows.
+
+    Empty fields are skipped. Segments are separated by newlines or carriage returns.
+
+    Args:
+        message: HL7 message in ER7 format
+    """
+    segment_index = 0
+    for line in message.replace('\r', '\n').split('\n'):
+        line = line.strip()
+        if not line:
+            continue
+
+        fields = line.split('|')
+        segment = fields[0]
+        if segment == 'MSH':
+            # MSH-1 is the separator itself, so MSH-2 is the first split field
+            yield segment_index, segment, 1, '|'
+            offset = 1
+        else:
+            offset = 0
+
+        for position in range(1, len(fields)):
+            if fields[position]:
+                yield segment_index, segment, position + offset, fields[position]
+
+        segment_index += 1
+
+
+def _header_fields(message: str) -> Tuple[Optional[str], Optional[str]]:
+    """(MSH-10, MSH-9) of a message, or None for missing values."""
+    for line in message.replace('\r', '\n').split('\n'):
+        line = line.strip()
+        if line.startswith('MSH|'):
+            fields = line.split('|')
+            message_type = fields[8] if len(fields) > 8 and fields[8] else None
+            control_id = fields[9] if len(fields) > 9 and fields[9] else None
+            return control_id, message_type
+    return None, None
+
+
+class ColumnarWriter:
+    """Streams messages into a Parquet or Arrow IPC file in record batches."""
+
+    def __init__(self, path, fmt: str = 'parquet', batch_rows: int = DEFAULT_BATCH_ROWS):
+        """
+        Args:
+            path: Output file
+            fmt: 'parquet' or 'arrow'
+            batch_rows: Rows buffered before a record batch is written
+
+        Raises:
+            ColumnarError: If pyarrow is missing or the format is unknown
+        """
+        if pa is None:
+            raise ColumnarError("Columnar export requires the 'pyarrow' package "
+                                "(pip install \"nubilum[columnar]\")")
+        if fmt not in FORMATS:
+            raise ColumnarError(f"Unknown export format '{fmt}' (use {' or '.join(FORMATS)})")
+
+        self.path = Path(path)
+        self.format = fmt
+        self.batch_rows = batch_rows
+        self.messages = 0
+        self.rows = 0
+        self.batches = 0
+
+        dictionary = pa.dictionary(pa.int32(), pa.string())
+        self.schema = pa.schema([
+            ('message', pa.int64()),
+            ('control_id', pa.string()),
+            ('message_type', dictionary),
+            ('segment_index', pa.int32()),
+            ('segment', dictionary),
+            ('field', pa.int32()),
+            ('value', pa.string()),
+        ])
+        self._columns = {name: [] for name in self.schema.names}
+        # Value -> index, shared by all batches
+        self._dictionaries = {name: {} for name in _DICTIONARY_COLUMNS}
+
+        if fmt == 'parquet':
+            self._writer = pq.ParquetWriter(str(self.path), self.schema)
+        else:
+            self._sink = pa.OSFile(str(self.path), 'wb')
+            self._writer = pa.ipc.new_file(self._sink, self.schema,
+                                           options=pa.ipc.IpcWriteOptions(emit_dictionary_deltas=True))
+
+    def write_message(self, message: str) -> None:
+        """Append the rows of one (anonymized) message."""
+        columns = self._columns
+        control_id, message_type = _header_fields(message)
+        message_type = self._encode('message_type', message_type)
+        segments = self._dictionaries['segment']
+
+        for segment_index, segment, field, value in segment_rows(message):
+            segment_code = segments.get(segment)
+            if segment_code is None:
+                segment_code = segments[segment] = len(segments)
+
+            columns['message'].append(self.messages)
+            columns['control_id'].append(control_id)
+            columns['message_type'].append(message_type)
+            columns['segment_index'].append(segment_index)
+            columns['segment'].append(segment_code)
+            columns['field'].append(field)
+            columns['value'].append(value)
+
+        self.messages += 1
+        if len(columns['message']) >= self.batch_rows:
+            self._flush()
+
+    def _encode(self, column: str, value: Optional[str]) -> Optional[int]:
+        if value is None:
+            return None
+        dictionary = self._dictionaries[column]
+        code = dictionary.get(value)
+        if code is None:
+            code = dictionary[value] = len(dictionary)
+        return code
+
+    def _flush(self) -> None:
+        if not self._columns['message']:
+            return
+
+        arrays = []
+        for field in self.schema:
+            if field.name in _DICTIONARY_COLUMNS:
+                array = pa.DictionaryArray.from_arrays(
+                    pa.array(self._columns[field.name], type=pa.int32()),
+                    pa.array(list(self._dictionaries[field.name]), type=pa.string()))
+            else:
+                array = pa.array(self._columns[field.name], type=field.type)
+            arrays.append(array)
+            self._columns[field.name] = []
+
+        batch = pa.RecordBatch.from_arrays(arrays, schema=self.schema)
+        if self.format == 'parquet':
+            # Each batch becomes a row group
+            self._writer.write_table(pa.Table.from_batches([batch]))
+        else:
+            self._writer.write_batch(batch)
+        self.rows += batch.num_rows
+        self.batches += 1
+
+    def close(self) -> Dict:
+        """
+        Write the remaining rows and finish the file.
+
+        Returns:
+            Counts of messages, rows and record batches written
+        """
+        self._flush()
+        self._writer.close()
+        if self.format == 'arrow':
+            self._sink.close()
+        return {'messages': self.messages, 'rows': self.rows, 'batches': self.batches}
+
+    def __enter__(self) -> 'ColumnarWriter':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def export_messages(messages: Iterable[str], path, fmt: str = 'parquet',
+                    batch_rows: int = DEFAULT_BATCH_ROWS) -> Dict:
+    """
+    Write already anonymized messages to a columnar file atomically.
+
+    Returns:
+        Counts of messages, rows and record batches written
+    """
+    path = Path(path)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f'.{path.name}.', suffix='.tmp')
+    os.close(fd)
+    try:
+        with ColumnarWriter(tmp_path, fmt, batch_rows) as writer:
+            for message in messages:
+                writer.write_message(message)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+    stats = {'messages': writer.messages, 'rows': writer.rows, 'batches': writer.batches}
+    logger.info(f"Exported {stats['messages']} message(s), {stats['rows']} rows to {path}")
+    return stats
+
+
+def iter_file_messages(paths: Iterable, encoding: str = 'utf-8') -> Iterator[str]:
+    """Stream the messages of HL7 files (one message in memory at a time)."""
+    for path in paths:
+        with open(path, 'rb') as f:
+            for raw, _, _ in iter_messages(f):
+                yield raw.decode(encoding)
+
+
+def anonymize_messages(messages: Iterable[str],
+                       profile: Optional[AnonymizationProfile] = None,
+                       segment_cache: Optional[SegmentCache] = None) -> Iterator[str]:
+    """Anonymize a stream of messages with a single anonymizer."""
+    anonymizer = HL7Anonymizer(profile=profile, segment_cache=segment_cache)
+    for message in messages:
+        yield anonymizer.anonymize_message(message)
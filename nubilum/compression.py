@@ -0,0 +1,249 @@
+"""HTTP body compression for Nubilum API requests and responses."""
+
+import gzip
+import logging
+import zlib
+from typing import Callable, Dict, Optional
+
+from flask import current_app, g, jsonify, request
+
+logger = logging.getLogger(__name__)
+
+# Responses smaller than this are sent as-is; compressing them costs more than it saves
+DEFAULT_MIN_SIZE = 1024
+
+# Upper bound for a decompressed request body (protects against compression bombs)
+DEFAULT_MAX_DECOMPRESSED_LENGTH = 10 * 1024 * 1024
+
+_CHUNK_SIZE = 64 * 1024
+
+
+class DecompressionError(ValueError):
+    """Raised when a compressed request body cannot be decoded."""
+
+
+class DecompressedTooLarge(DecompressionError):
+    """Raised when a decompressed request body exceeds the configured limit."""
+
+
+def _gzip_compress(data: bytes) -> bytes:
+    return gzip.compress(data, compresslevel=6)
+
+
+def _deflate_compress(data: bytes) -> bytes:
+    return zlib.compress(data, 6)
+
+
+def _zlib_decompress(data: bytes, max_length: int, wbits: int) -> bytes:
+    """Decompress a gzip/deflate stream without ever exceeding max_length bytes."""
+    decompressor = zlib.decompressobj(wbits)
+    output = bytearray()
+    view = memoryview(data)
+
+    for start in range(0, len(view), _CHUNK_SIZE):
+        chunk = decompressor.decompress(view[start:start + _CHUNK_SIZE],
+                                        max_length - len(output) + 1)
+        output += chunk
+        if len(output) > max_length or decompressor.unconsumed_tail:
+            raise DecompressedTooLarge(f"Decompressed body exceeds {max_length} bytes")
+
+    output += decompressor.flush()
+    if len(output) > max_length:
+        raise DecompressedTooLarge(f"Decompressed body exceeds {max_length} bytes")
+
+    return bytes(output)
+
+
+def _gzip_decompress(data: bytes, max_length: int) -> bytes:
+    return _zlib_decompress(data, max_length, 16 + zlib.MAX_WBITS)
+
+
+def _deflate_decompress(data: bytes, max_length: int) -> bytes:
+    return _zlib_decompress(data, max_length, zlib.MAX_WBITS)
+
+
+def _build_codecs():
+    """
+    Build the encoder/decoder tables.
+
+    gzip and deflate are always available. zstd and br are enabled when the
+    optional ``zstandard`` / ``brotli`` packages are installed.
+    """
+    encoders: Dict[str, Callable[[bytes], bytes]] = {}
+    decoders: Dict[str, Callable[[bytes, int], bytes]] = {}
+
+    try:
+        import zstandard
+
+        def _zstd_compress(data: bytes) -> bytes:
+            return zstandard.ZstdCompressor(level=3).compress(data)
+
+        def _zstd_decompress(data: bytes, max_length: int) -> bytes:
+            reader = zstandard.ZstdDecompressor().stream_reader(data)
+            output = reader.read(max_length + 1)
+            if len(output) > max_length:
+                raise DecompressedTooLarge(f"Decompressed body exceeds {max_length} bytes")
+            return output
+
+        encoders['zstd'] = _zstd_compress
+        decoders['zstd'] = _zstd_decompress
+    except ImportError:
+        pass
+
+    try:
+        import brotli
+
+        def _br_compress(data: bytes) -> bytes:
+            return brotli.compress(data, quality=5)
+
+        def _br_decompress(data: bytes, max_length: int) -> bytes:
+            """Decompress a brotli stream without ever exceeding max_length bytes."""
+            decompressor = brotli.Decompressor()
+            output = bytearray()
+            view = memoryview(data)
+            for start in range(0, len(view), _CHUNK_SIZE):
+                chunk = bytes(view[start:start + _CHUNK_SIZE])
+                # Bounded output: the rest of a chunk is drained with empty input
+                while True:
+                    output += decompressor.process(chunk, output_buffer_limit=max_length - len(output) + 1)
+                    if len(output) > max_length:
+                        raise DecompressedTooLarge(f"Decompressed body exceeds {max_length} bytes")
+                    if decompressor.can_accept_more_data():
+                        break
+                    chunk = b''
+            if not decompressor.is_finished():
+                raise DecompressionError("Truncated br body")
+            return bytes(output)
+
+        encoders['br'] = _br_compress
+        # Older brotli releases cannot bound the output of a call, so they only encode
+        if hasattr(brotli.Decompressor, 'can_accept_more_data'):
+            decoders['br'] = _br_decompress
+    except ImportError:
+        pass
+
+    encoders['gzip'] = _gzip_compress
+    encoders['deflate'] = _deflate_compress
+    decoders['gzip'] = _gzip_decompress
+    decoders['x-gzip'] = _gzip_decompress
+    decoders['deflate'] = _deflate_decompress
+
+    return encoders, decoders
+
+
+ENCODERS, DECODERS = _build_codecs()
+
+# Server preference when the client accepts several encodings with equal quality
+PREFERRED_ENCODINGS = [name for name in ('zstd', 'br', 'gzip', 'deflate') if name in ENCODERS]
+
+
+def decompress(data: bytes, encoding: str, max_length: int = DEFAULT_MAX_DECOMPRESSED_LENGTH) -> bytes:
+    """
+    Decompress a request body.
+
+    Args:
+        data: Compressed bytes
+        encoding: Content-Encoding token (e.g. 'gzip')
+        max_length: Maximum allowed size of the decompressed body
+
+    Returns:
+        Decompressed bytes
+    """
+    decoder = DECODERS.get(encoding)
+    if decoder is None:
+        raise DecompressionError(f"Unsupported Content-Encoding: {encoding}")
+
+    try:
+        return decoder(data, max_length)
+    except DecompressionError:
+        raise
+    except Exception as e:
+        raise DecompressionError(f"Invalid {encoding} body: {e}") from e
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    """Compress a response body with the given encoding."""
+    return ENCODERS[encoding](data)
+
+
+def get_request_json() -> Optional[dict]:
+    """
+    Parse the JSON body of the current request.
+
+    Uses the body decoded by the compression layer when the client sent a
+    compressed payload, and falls back to Flask's parser otherwise.
+    """
+    body = g.get('decompressed_body')
+    if body is None:
+        return request.get_json()
+
+    try:
+        return current_app.json.loads(body)
+    except ValueError:
+        return None
+
+
+def init_app(app):
+    """Register request decompression and response compression on a Flask app."""
+    app.config.setdefault('COMPRESSION_MIN_SIZE', DEFAULT_MIN_SIZE)
+    app.config.setdefault('MAX_DECOMPRESSED_LENGTH', DEFAULT_MAX_DECOMPRESSED_LENGTH)
+
+    @app.before_request
+    def _decompress_request_body():
+        encoding = request.headers.get('Content-Encoding', '').strip().lower()
+        if not encoding or encoding == 'identity':
+            return None
+
+        if encoding not in DECODERS:
+            return jsonify({
+                'success': False,
+                'error': f'Unsupported Content-Encoding: {encoding}'
+            }), 415
+
+        # The compressed body is still bounded by MAX_CONTENT_LENGTH
+        raw = request.get_data(cache=False)
+        try:
+            g.decompressed_body = decompress(raw, encoding, app.config['MAX_DECOMPRESSED_LENGTH'])
+        except DecompressedTooLarge:
+            logger.warning("Decompressed request body too large")
+            return jsonify({
+                'success': False,
+                'error': 'Message too large after decompression.'
+            }), 413
+        except DecompressionError as e:
+            logger.warning(f"Failed to decompress request body: {e}")
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
+
+        logger.info(f"Decompressed {encoding} request body: {len(raw)} -> {len(g.decompressed_body)} bytes")
+        return None
+
+    @app.after_request
+    def _compress_response(response):
+        if (response.direct_passthrough or response.is_streamed
+                or response.status_code < 200 or response.status_code >= 300
+                or 'Content-Encoding' in response.headers
+                or not request.path.startswith('/api/')):
+            return response
+
+        response.vary.add('Accept-Encoding')
+
+        encoding = request.accept_encodings.best_match(PREFERRED_ENCODINGS)
+        if not encoding:
+            return response
+
+        body = response.get_data()
+        if len(body) < app.config['COMPRESSION_MIN_SIZE']:
+            return response
+
+        compressed = compress(body, encoding)
+        response.set_data(compressed)
+        response.headers['Content-Encoding'] = encoding
+
+        # A strong ETag identifies exact bytes; the compressed body is a different representation
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
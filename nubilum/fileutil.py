@@ -0,0 +1,49 @@
+"""Small file helpers shared by the offline processing modules."""
+
+import json
+import os
+import tempfile
+from pathlib import Path
+from typing import Dict, Optional
+
+
+def atomic_write_bytes(path, data: bytes, fsync: bool = True) -> None:
+    """
+    Write a file atomically (temporary file in the same directory + rename).
+
+    Readers either see the previous contents or the complete new contents.
+
+    Args:
+        path: Destination path
+        data: File contents
+        fsync: Flush the data to disk before renaming
+    """
+    path = Path(path)
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f'.{path.name}.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def atomic_write_json(path, data: Dict, fsync: bool = True) -> None:
+    """Write a JSON document atomically."""
+    atomic_write_bytes(path, json.dumps(data, indent=2).encode('utf-8'), fsync=fsync)
+
+
+def read_json(path) -> Optional[Dict]:
+    """Read a JSON document, returning None if it is missing or unreadable."""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
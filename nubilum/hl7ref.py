@@ -0,0 +1,116 @@
+"""HL7 reference data (field names) backed by hl7apy.
+
+hl7apy is imported lazily and every lookup is memoized, so the per-request
+cost of /api/field-name is a dictionary hit once the tables are warm.
+"""
+
+import logging
+from functools import lru_cache
+from typing import Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_VERSION = '2.5'
+
+
+def supported_versions() -> list:
+    """HL7 versions known to hl7apy."""
+    import hl7apy
+
+    return sorted(hl7apy.SUPPORTED_LIBRARIES)
+
+
+@lru_cache(maxsize=16384)
+def field_long_name(segment_type: str, field_number: int, version: str) -> Optional[str]:
+    """
+    Get the human-readable name of a field from the hl7apy reference tables.
+
+    Args:
+        segment_type: Segment type (e.g. 'PID')
+        field_number: HL7 field number (e.g. 3 for PID-3)
+        version: HL7 version (e.g. '2.5')
+
+    Returns:
+        Field name (e.g. 'Patient Identifier List') or None if unknown
+    """
+    from hl7apy.core import Field
+
+    try:
+        field = Field(f'{segment_type}_{field_number}', version=version)
+        return field.long_name.replace('_', ' ').title()
+    except Exception:
+        return None
+
+
+def resolve_field_name(segment_type: str, field_index: int, version: str = DEFAULT_VERSION) -> Dict:
+    """
+    Resolve the name of a field by its position in a '|'-split segment.
+
+    MSH positions are shifted by one: after splitting, [1] is MSH-2 (the
+    encoding characters), [2] is MSH-3, and so on.
+
+    Args:
+        segment_type: Segment type (e.g. 'PID', 'MSH')
+        field_index: Field index (0-based position after splitting on '|')
+        version: Requested HL7 version
+
+    Returns:
+        Dict with 'field_name', 'version' and, for fallbacks, a 'note'
+    """
+    if field_index == 0:
+        return {'field_name': 'Segment ID', 'version': version}
+
+    if segment_type == 'MSH':
+        if field_index == 1:
+            return {'field_name': 'Encoding Characters', 'version': version}
+        field_number = field_index + 1
+    else:
+        field_number = field_index
+
+    name = field_long_name(segment_type, field_number, version)
+    if name is not None:
+        return {'field_name': name, 'version': version}
+
+    # Fall back to the default version's definitions
+    name = field_long_name(segment_type, field_number, DEFAULT_VERSION)
+    if name is not None:
+        return {
+            'field_name': name,
+            'version': DEFAULT_VERSION,
+            'note': f'Using v{DEFAULT_VERSION} definitions (v{version} not available)'
+        }
+
+    return {
+        'field_name': f'{segment_type}-{field_index}',
+        'version': version,
+        'note': 'Field definition not found'
+    }
+
+
+def preload(versions: Iterable[str] = (DEFAULT_VERSION,)) -> int:
+    """
+    Load hl7apy libraries and fill the field name cache for the given versions.
+
+    Args:
+        versions: HL7 versions to preload
+
+    Returns:
+        Number of field names cached
+    """
+    import hl7apy
+
+    count = 0
+    for version in versions:
+        try:
+            library = hl7apy.load_library(version)
+        except Exception as e:
+            logger.warning(f"Cannot preload HL7 v{version} definitions: {e}")
+            continue
+
+        for name in library.FIELDS:
+            segment_type, _, number = name.rpartition('_')
+            if number.isdigit() and segment_type.isalnum():
+                field_long_name(segment_type, int(number), version)
+                count += 1
+
+    return count
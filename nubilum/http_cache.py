@@ -0,0 +1,92 @@
+"""HTTP caching for the web interface and metadata endpoints.
+
+- Content-hashed bundles under ``/dist/`` (see nubilum.assets) are immutable
+  and cached for a year.
+- Other static files and ``index.html`` are revalidated on every load
+  (``no-cache``) using the ETag/Last-Modified that Flask's static file
+  serving already provides, so an unchanged page costs a 304.
+- Metadata endpoints return JSON through cached_json(), which adds a weak
+  ETag (and optionally Last-Modified) and answers conditional requests with
+  304. Weak ETags stay valid when the response is compressed.
+"""
+
+import hashlib
+import os
+from datetime import datetime, timezone
+from typing import Optional
+
+from flask import Flask, jsonify, request
+
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+DIST_PREFIX = '/dist/'
+
+
+def cached_json(payload, etag_source=None, last_modified: Optional[datetime] = None,
+                max_age: int = 0):
+    """
+    Build a JSON response that supports conditional requests.
+
+    Args:
+        payload: Data passed to jsonify()
+        etag_source: Data the ETag is computed from (default: the response body);
+            use it to leave volatile fields such as timestamps out of the ETag
+        last_modified: Last-Modified date of the data
+        max_age: Seconds clients may reuse the response without revalidating
+
+    Returns:
+        Response (304 Not Modified if the client's copy is current)
+    """
+    response = jsonify(payload)
+
+    if etag_source is None:
+        data = response.get_data()
+    else:
+        data = repr(etag_source).encode('utf-8')
+    response.set_etag(hashlib.sha256(data).hexdigest()[:32], weak=True)
+
+    if last_modified is not None:
+        response.last_modified = last_modified
+
+    if max_age:
+        response.cache_control.public = True
+        response.cache_control.max_age = max_age
+    else:
+        response.cache_control.no_cache = True
+
+    return response.make_conditional(request)
+
+
+def file_last_modified(path) -> Optional[datetime]:
+    """Modification time of a file (e.g. the installed package), or None."""
+    try:
+        return datetime.fromtimestamp(int(os.path.getmtime(path)), timezone.utc)
+    except OSError:
+        return None
+
+
+def index_file(app: Flask) -> str:
+    """The production index.html if the assets were built, else the development one."""
+    if os.path.isfile(os.path.join(app.static_folder, 'dist', 'index.html')):
+        return 'dist/index.html'
+    return 'index.html'
+
+
+def init_app(app: Flask) -> None:
+    """Register cache headers for static files."""
+
+    @app.after_request
+    def _static_cache_headers(response):
+        if request.path.startswith('/api/') or response.status_code not in (200, 304):
+            return response
+
+        if request.path.startswith(DIST_PREFIX) and not request.path.endswith(('.html', '.json')):
+            response.cache_control.public = True
+            response.cache_control.max_age = IMMUTABLE_MAX_AGE
+            response.cache_control.immutable = True
+            response.cache_control.no_cache = None
+        else:
+            response.cache_control.no_cache = True
+            response.cache_control.max_age = None
+
+        return response
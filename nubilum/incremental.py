@@ -0,0 +1,152 @@
+"""Incremental re-anonymization of edited segments.
+
+After a full anonymization the client receives a state token (see
+nubilum.session_state). When the user edits the input, only the changed
+segments are sent back together with the token; they are re-anonymized with
+the same pseudonym maps and free-text context, so the result matches what a
+full re-anonymization of the edited text would produce.
+
+State layout:
+
+    {
+        "profile": "default",
+        "pseudonyms": {"ids": {...}, "names": {...}},
+        "terms": {"<message index>": {"<segment index>": {term: [value, kind]}}}
+    }
+
+Only PID/NK1 segments contribute terms. When one of them changes, the
+free-text segments of that message must be re-sent to be scrubbed with the new
+context; such messages are reported in ``context_changed``.
+"""
+
+from typing import Dict, List, Tuple
+
+from nubilum.anonymizer import HL7Anonymizer
+from nubilum.scrubber import collect_identifying_terms
+
+# Segment types whose content feeds the free-text scrubber
+CONTEXT_SEGMENTS = ('PID', 'NK1')
+
+
+class IncrementalError(ValueError):
+    """Raised for malformed incremental anonymization requests."""
+
+
+def _segment_terms(line: str) -> Dict:
+    if line[:3] not in CONTEXT_SEGMENTS:
+        return {}
+    return {term: [value, kind] for term, (value, kind) in collect_identifying_terms([line]).items()}
+
+
+def message_segments(message: str) -> List[str]:
+    """Segment lines of a message, indexed the same way as the anonymized output."""
+    lines = [line.strip() for line in message.split('\n')]
+    return [line for line in lines if line]
+
+
+def build_state(anonymizer: HL7Anonymizer, messages: List[str]) -> Dict:
+    """
+    Build the session state after a full anonymization.
+
+    Args:
+        anonymizer: Anonymizer that processed all messages
+        messages: Original messages (as split by split_messages)
+
+    Returns:
+        State dictionary for encode_state()
+    """
+    terms = {}
+    for message_index, message in enumerate(messages):
+        message_terms = {}
+        for segment_index, line in enumerate(message_segments(message)):
+            segment_terms = _segment_terms(line)
+            if segment_terms:
+                message_terms[str(segment_index)] = segment_terms
+        if message_terms:
+            terms[str(message_index)] = message_terms
+
+    return {
+        'profile': anonymizer.profile.name,
+        'pseudonyms': anonymizer.get_state(),
+        'terms': terms,
+    }
+
+
+def _validate_change(change, position: int) -> Tuple[int, int, str]:
+    if not isinstance(change, dict):
+        raise IncrementalError(f"Change {position}: must be an object")
+
+    message_index = change.get('message')
+    segment_index = change.get('segment')
+    text = change.get('text')
+
+    for name, value in (('message', message_index), ('segment', segment_index)):
+        if not isinstance(value, int) or isinstance(value, bool) or value < 0:
+            raise IncrementalError(f"Change {position}: '{name}' must be a non-negative integer")
+
+    if not isinstance(text, str):
+        raise IncrementalError(f"Change {position}: 'text' must be a string")
+    text = text.strip()
+    if '\n' in text or '\r' in text:
+        raise IncrementalError(f"Change {position}: 'text' must be a single segment")
+
+    return message_index, segment_index, text
+
+
+def reanonymize_segments(state: Dict, changes: list, anonymizer: HL7Anonymizer) -> Tuple[List[Dict], Dict, List[int]]:
+    """
+    Re-anonymize changed segments.
+
+    Args:
+        state: Decoded session state
+        changes: [{"message": int, "segment": int, "text": str}, ...]
+        anonymizer: Fresh anonymizer configured with the session's profile
+
+    Returns:
+        (results, new state, indices of messages whose free-text context changed)
+    """
+    if not isinstance(changes, list) or not changes:
+        raise IncrementalError("'segments' must be a non-empty list")
+
+    validated = [_validate_change(change, position) for position, change in enumerate(changes, 1)]
+
+    anonymizer.load_state(state.get('pseudonyms', {}))
+    terms = state.get('terms', {})
+    context_changed = set()
+
+    # Update the free-text context first so edits to PID/NK1 apply to all changed segments
+    for message_index, segment_index, text in validated:
+        message_terms = terms.setdefault(str(message_index), {})
+        old = message_terms.pop(str(segment_index), None)
+        new = _segment_terms(text)
+        if new:
+            message_terms[str(segment_index)] = new
+        if old != (new or None):
+            context_changed.add(message_index)
+
+    results = []
+    current_message = None
+    for message_index, segment_index, text in sorted(validated, key=lambda change: change[:2]):
+        if message_index != current_message:
+            current_message = message_index
+            # Same precedence as collect_identifying_terms(): first segment wins
+            message_terms = terms.get(str(message_index), {})
+            merged = {}
+            for key in sorted(message_terms, key=int):
+                for term, (value, kind) in message_terms[key].items():
+                    merged.setdefault(term, (value, kind))
+            anonymizer.set_free_text_terms(merged)
+
+        results.append({
+            'message': message_index,
+            'segment': segment_index,
+            'anonymized': anonymizer.anonymize_segment(text) if text else ''
+        })
+
+    new_state = {
+        'profile': anonymizer.profile.name,
+        'pseudonyms': anonymizer.get_state(),
+        'terms': {index: message_terms for index, message_terms in terms.items() if message_terms},
+    }
+
+    return results, new_state, sorted(context_changed)
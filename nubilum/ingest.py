@@ -0,0 +1,179 @@
+"""Guarded splitting of request input into HL7 messages.
+
+Input is scanned once, line by line, with ``str.find``/``str.count`` and
+without splitting segments into fields, so pathological input (a 1MB line of
+``|`` characters, tens of thousands of one-segment messages) is rejected
+before anything proportional to its structure is allocated. Limits:
+
+- messages per request
+- segments (non-empty lines) per message
+- fields per segment
+
+A limit of 0 disables that check. Violations raise IngestError with the
+1-based message number, line, column and character offset where the limit
+was crossed.
+
+Messages are split exactly as before: a message starts at each line beginning
+with ``MSH|`` (after leading whitespace), blank lines are dropped and the
+remaining lines are joined with ``\\n``.
+"""
+
+import os
+import re
+from typing import Dict, Iterator, List, Optional, Tuple
+
+DEFAULT_MAX_MESSAGES = 1000
+DEFAULT_MAX_JOB_MESSAGES = 100000
+DEFAULT_MAX_SEGMENTS = 1000
+DEFAULT_MAX_FIELDS = 1000
+
+_NON_WHITESPACE = re.compile(r'\S')  # same characters as str.strip()
+
+
+class IngestError(ValueError):
+    """Raised when input exceeds an ingest limit."""
+
+    def __init__(self, message: str, limit: str, message_number: Optional[int] = None,
+                 line: Optional[int] = None, column: Optional[int] = None,
+                 offset: Optional[int] = None):
+        super().__init__(message)
+        self.limit = limit
+        self.message_number = message_number
+        self.line = line
+        self.column = column
+        self.offset = offset
+
+    def position(self) -> Dict:
+        """Where the limit was crossed (1-based message, line and column; 0-based offset)."""
+        return {
+            'message': self.message_number,
+            'line': self.line,
+            'column': self.column,
+            'offset': self.offset,
+        }
+
+
+class IngestLimits:
+    """Structural limits applied when splitting input."""
+
+    def __init__(self, max_messages: int = DEFAULT_MAX_MESSAGES,
+                 max_segments: int = DEFAULT_MAX_SEGMENTS, max_fields: int = DEFAULT_MAX_FIELDS):
+        """
+        Args:
+            max_messages: Messages per input (0 for no limit)
+            max_segments: Segments per message (0 for no limit)
+            max_fields: Fields per segment, counting the segment name (0 for no limit)
+        """
+        self.max_messages = max_messages
+        self.max_segments = max_segments
+        self.max_fields = max_fields
+
+    @classmethod
+    def from_env(cls, max_messages_variable: str = 'NUBILUM_MAX_MESSAGES',
+                 default_max_messages: int = DEFAULT_MAX_MESSAGES) -> 'IngestLimits':
+        """
+        Limits from NUBILUM_MAX_MESSAGES, NUBILUM_MAX_SEGMENTS and NUBILUM_MAX_FIELDS.
+
+        Args:
+            max_messages_variable: Variable holding the message limit (jobs use their own)
+            default_max_messages: Message limit when the variable is unset
+        """
+        return cls(
+            max_messages=int(os.environ.get(max_messages_variable, default_max_messages)),
+            max_segments=int(os.environ.get('NUBILUM_MAX_SEGMENTS', DEFAULT_MAX_SEGMENTS)),
+            max_fields=int(os.environ.get('NUBILUM_MAX_FIELDS', DEFAULT_MAX_FIELDS)),
+        )
+
+
+def _nth_separator(text: str, start: int, n: int) -> int:
+    """Offset of the n-th '|' at or after start (only called once a limit is exceeded)."""
+    position = start - 1
+    for _ in range(n):
+        position = text.find('|', position + 1)
+    return position
+
+
+def _scan(text: str, limits: IngestLimits) -> Iterator[List[Tuple[int, int]]]:
+    """Yield each message as a list of (start, end) offsets of its non-empty lines."""
+    max_messages = limits.max_messages
+    max_segments = limits.max_segments
+    max_fields = limits.max_fields
+
+    current: List[Tuple[int, int]] = []
+    message_number = 0
+    line_number = 0
+    length = len(text)
+    start = 0
+
+    while start <= length:
+        end = text.find('\n', start)
+        if end < 0:
+            end = length
+        line_number += 1
+
+        match = _NON_WHITESPACE.search(text, start, end)
+        if match:
+            first = match.start()
+            if text.startswith('MSH|', first) and current:
+                yield current
+                current = []
+
+            if not current:
+                message_number += 1
+                if max_messages and message_number > max_messages:
+                    raise IngestError(
+                        f"Input has more than {max_messages} messages (message {message_number} "
+                        f"starts at line {line_number})",
+                        'messages', message_number, line_number, first - start + 1, first)
+
+            if max_segments and len(current) >= max_segments:
+                raise IngestError(
+                    f"Message {message_number} has more than {max_segments} segments "
+                    f"(line {line_number})",
+                    'segments', message_number, line_number, first - start + 1, first)
+
+            if max_fields and text.count('|', start, end) >= max_fields:
+                offset = _nth_separator(text, start, max_fields)
+                raise IngestError(
+                    f"Segment at line {line_number} has more than {max_fields} fields "
+                    f"(column {offset - start + 1})",
+                    'fields', message_number, line_number, offset - start + 1, offset)
+
+            current.append((start, end))
+
+        start = end + 1
+
+    if current:
+        yield current
+
+
+def split_messages(text: str, limits: Optional[IngestLimits] = None) -> List[str]:
+    """
+    Split input text into individual HL7 messages.
+
+    Args:
+        text: One or more messages; segments separated by newlines
+        limits: Structural limits (default: IngestLimits())
+
+    Returns:
+        Messages with blank lines removed
+
+    Raises:
+        IngestError: If the input exceeds a limit
+    """
+    limits = limits if limits is not None else IngestLimits()
+    return ['\n'.join(text[start:end] for start, end in lines) for lines in _scan(text, limits)]
+
+
+def check_messages(text: str, limits: Optional[IngestLimits] = None) -> int:
+    """
+    Check input against the limits without building the messages.
+
+    Returns:
+        Number of messages
+
+    Raises:
+        IngestError: If the input exceeds a limit
+    """
+    limits = limits if limits is not None else IngestLimits()
+    return sum(1 for _ in _scan(text, limits))
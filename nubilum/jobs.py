@@ -0,0 +1,430 @@
+"""Asynchronous anonymization jobs backed by a local worker pool and spool directory.
+
+Each job gets its own directory in the spool:
+
+    <spool>/<job id>/job.json       job metadata (state, timestamps, expiry, owning pid)
+    <spool>/<job id>/status.json    progress written by the batch runner
+    <spool>/<job id>/input.hl7      submitted messages (deleted once processed)
+    <spool>/<job id>/output/        anonymized result (deleted after the TTL)
+
+All state lives on disk, so any gunicorn worker can answer status and result
+requests for a job running in another worker. No external broker is needed.
+
+The process running a job touches its job.json on every cleanup tick, so an
+unfinished job is only removed once its process is gone or that heartbeat is
+older than the maximum age, never because the job itself takes long.
+"""
+
+import logging
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, Iterator, Optional, Set
+
+from nubilum import columnar
+from nubilum.batch import STATE_JOURNAL_FILE, BatchJob, read_status
+from nubilum.fileutil import atomic_write_json, read_json
+from nubilum.profiles import AnonymizationProfile
+from nubilum.pseudonym_table import SharedPseudonymTable
+from nubilum.segment_cache import SegmentCache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 2
+DEFAULT_TTL = 300  # seconds a finished job's result is kept
+DEFAULT_MAX_QUEUED = 16
+DEFAULT_MAX_AGE = 3600  # seconds without a heartbeat after which an unfinished job is abandoned
+
+_JOB_ID_RE = re.compile(r'^[0-9a-f]{32}$')
+
+_INPUT_FILE = 'input.hl7'
+_JOB_FILE = 'job.json'
+_CLEANUP_INTERVAL = 30.0
+
+
+class JobError(Exception):
+    """Raised for invalid job operations."""
+
+
+class JobNotFound(JobError):
+    """Raised when a job does not exist or has expired."""
+
+
+class JobQueueFull(JobError):
+    """Raised when too many jobs are queued in this worker."""
+
+
+class JobNotReady(JobError):
+    """Raised when a job's result is requested before it has completed."""
+
+
+def _process_alive(pid: int) -> bool:
+    """Whether a process with this pid exists on this host."""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class JobManager:
+    """Runs anonymization jobs on a bounded thread pool with on-disk spooling."""
+
+    def __init__(self, spool_dir: Optional[str] = None, max_workers: int = DEFAULT_WORKERS,
+                 ttl: int = DEFAULT_TTL, max_queued: int = DEFAULT_MAX_QUEUED,
+                 max_age: int = DEFAULT_MAX_AGE,
+                 message_callback: Optional[Callable[[str, bool, Optional[str], float], None]] = None,
+                 pseudonym_table: Optional[SharedPseudonymTable] = None,
+                 segment_cache: Optional[SegmentCache] = None):
+        """
+        Initialize the job manager.
+
+        Args:
+            spool_dir: Directory for job files (default: <tmp>/nubilum-jobs)
+            max_workers: Jobs processed concurrently by this process
+            ttl: Seconds a finished job and its result are kept
+            max_queued: Maximum queued + running jobs in this process
+            max_age: Seconds without a heartbeat after which unfinished jobs are removed
+            message_callback: Called for every processed message (usage tracking)
+            pseudonym_table: Shared-memory pseudonym table used by job runs
+            segment_cache: Cache of anonymized segments used by job runs
+        """
+        self.spool_dir = Path(spool_dir or os.path.join(tempfile.gettempdir(), 'nubilum-jobs'))
+        self.max_workers = max_workers
+        self.ttl = ttl
+        self.max_queued = max_queued
+        self.max_age = max_age
+        self.message_callback = message_callback
+        self.pseudonym_table = pseudonym_table
+        self.segment_cache = segment_cache
+
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._active = 0
+        # Directories of this process's unfinished jobs, kept alive by the heartbeat
+        self._owned: Set[Path] = set()
+        self._last_cleanup = 0.0
+        self._cleaner_pid: Optional[int] = None
+        self._stopped = threading.Event()
+        self._start_cleaner()
+
+    def _start_cleaner(self) -> None:
+        """Remove expired jobs on a timer, without waiting for the next request."""
+        # Threads do not survive fork: a pre-forked worker starts its own on first use
+        with self._lock:
+            if self._cleaner_pid == os.getpid() or self._stopped.is_set():
+                return
+            self._cleaner_pid = os.getpid()
+
+        # Often enough to expire results on time and to keep the heartbeat of running jobs fresh
+        interval = min(_CLEANUP_INTERVAL, max(1.0, self.ttl / 2), max(1.0, self.max_age / 4))
+
+        def clean():
+            while not self._stopped.wait(interval):
+                try:
+                    self._heartbeat()
+                    self.cleanup(force=True)
+                except Exception as e:
+                    logger.error(f"Job cleanup failed: {e}")
+
+        threading.Thread(target=clean, name='nubilum-job-cleanup', daemon=True).start()
+
+    def _heartbeat(self) -> None:
+        """Mark this process's queued and running jobs as alive."""
+        with self._lock:
+            owned = list(self._owned)
+        for job_dir in owned:
+            try:
+                os.utime(job_dir / _JOB_FILE)
+            except OSError:
+                pass
+
+    def close(self) -> None:
+        """Stop the cleanup timer."""
+        self._stopped.set()
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        # Created on first use so the pool's threads live in the worker process
+        # that runs the job, not in a pre-fork master
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                thread_name_prefix='nubilum-job')
+        return self._executor
+
+    def _job_dir(self, job_id: str) -> Path:
+        if not _JOB_ID_RE.match(job_id or ''):
+            raise JobNotFound(f"Unknown job: {job_id}")
+        return self.spool_dir / job_id
+
+    def _write_job(self, job_dir: Path, job: Dict) -> None:
+        atomic_write_json(job_dir / _JOB_FILE, job, fsync=False)
+
+    def submit(self, input_text: str, profile: Optional[AnonymizationProfile] = None,
+               key: Optional[bytes] = None, tenant: Optional[str] = None) -> Dict:
+        """
+        Spool messages and queue a job.
+
+        Args:
+            input_text: One or more HL7 messages
+            profile: Anonymization profile
+            key: Pseudonym key (keyed pseudonyms, e.g. the tenant's)
+            tenant: Tenant that owns the job; only it can see the job afterwards
+
+        Returns:
+            Job metadata including its id
+        """
+        self._start_cleaner()
+        self.cleanup()
+
+        with self._lock:
+            if self._active >= self.max_queued:
+                raise JobQueueFull("Too many jobs in progress, try again later")
+            self._active += 1
+
+        try:
+            job_id = uuid.uuid4().hex
+            job_dir = self.spool_dir / job_id
+            job_dir.mkdir(parents=True, mode=0o700)
+
+            input_path = job_dir / _INPUT_FILE
+            fd = os.open(input_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+            with os.fdopen(fd, 'w', encoding='utf-8', newline='') as f:
+                f.write(input_text)
+            (job_dir / 'manifest.txt').write_text(_INPUT_FILE + '\n', encoding='utf-8')
+
+            job = {
+                'job_id': job_id,
+                'state': 'queued',
+                'profile': profile.name if profile else None,
+                'tenant': tenant,
+                'input_bytes': input_path.stat().st_size,
+                'created_at': datetime.now().isoformat(),
+                'created': time.time(),
+                'finished_at': None,
+                'expires': None,
+                'pid': os.getpid(),
+            }
+            with self._lock:
+                self._owned.add(job_dir)
+            self._write_job(job_dir, job)
+
+            self._get_executor().submit(self._run, job_dir, dict(job), profile, key)
+        except Exception:
+            with self._lock:
+                self._active -= 1
+                self._owned.discard(job_dir)
+            raise
+
+        logger.info(f"Queued anonymization job {job_id} ({job['input_bytes']} bytes)")
+        return job
+
+    def _run(self, job_dir: Path, job: Dict, profile: Optional[AnonymizationProfile],
+             key: Optional[bytes] = None) -> None:
+        """Process a job on a pool thread."""
+        try:
+            job['state'] = 'running'
+            self._write_job(job_dir, job)
+
+            batch = BatchJob(
+                manifest_path=job_dir / 'manifest.txt',
+                output_dir=job_dir / 'output',
+                checkpoint_dir=job_dir,
+                profile=profile,
+                message_callback=self.message_callback,
+                pseudonym_table=self.pseudonym_table,
+                segment_cache=self.segment_cache,
+                key=key,
+            )
+            batch.run()
+            job['state'] = 'completed'
+
+        except Exception as e:
+            logger.error(f"Job {job['job_id']} failed: {e}")
+            job['state'] = 'failed'
+            job['error'] = str(e)
+
+        finally:
+            # Never keep submitted messages, or the journal of their original
+            # values, longer than needed (jobs are not resumed)
+            for path in (job_dir / _INPUT_FILE, job_dir / STATE_JOURNAL_FILE):
+                if path.exists():
+                    path.unlink()
+
+            job['finished_at'] = datetime.now().isoformat()
+            job['expires'] = time.time() + self.ttl
+            self._write_job(job_dir, job)
+
+            with self._lock:
+                self._active -= 1
+                self._owned.discard(job_dir)
+
+            logger.info(f"Job {job['job_id']} {job['state']}")
+
+    def status(self, job_id: str, tenant: Optional[str] = None) -> Dict:
+        """
+        Get the status and progress of a job.
+
+        Args:
+            job_id: Job id
+            tenant: Tenant of the request (jobs of other tenants are not found)
+
+        Raises:
+            JobNotFound: If the job does not exist, has expired or belongs to another tenant
+        """
+        self._start_cleaner()
+        job_dir = self._job_dir(job_id)
+        job = read_json(job_dir / _JOB_FILE)
+        if job is not None and self._expired(job, job_dir):
+            # Gone now, not at the next cleanup
+            shutil.rmtree(job_dir, ignore_errors=True)
+            raise JobNotFound(f"Unknown job: {job_id}")
+        if job is None or job.get('tenant') != tenant:
+            raise JobNotFound(f"Unknown job: {job_id}")
+
+        progress = read_status(job_dir) or {}
+        expires = job.get('expires')
+
+        return {
+            'job_id': job_id,
+            'state': job['state'],
+            'profile': job.get('profile'),
+            'tenant': job.get('tenant'),
+            'input_bytes': job.get('input_bytes'),
+            'progress': progress.get('progress', 0.0),
+            'messages_done': progress.get('messages_done', 0),
+            'failed_messages': progress.get('failed_messages', 0),
+            'messages_per_second': progress.get('messages_per_second', 0.0),
+            'eta_seconds': progress.get('eta_seconds'),
+            'created_at': job.get('created_at'),
+            'finished_at': job.get('finished_at'),
+            'expires_in': max(0, round(expires - time.time())) if expires else None,
+            'error': job.get('error'),
+        }
+
+    def _result_path(self, job_id: str, tenant: Optional[str] = None) -> Path:
+        """Anonymized output of a completed job."""
+        job = self.status(job_id, tenant)
+        if job['state'] != 'completed':
+            raise JobNotReady(f"Job {job_id} is {job['state']}")
+        return self._job_dir(job_id) / 'output' / _INPUT_FILE
+
+    def export_result(self, job_id: str, fmt: str, tenant: Optional[str] = None) -> Path:
+        """
+        Convert a completed job's result to a columnar file (Parquet or Arrow IPC).
+
+        The file is created on the first request and removed with the job.
+
+        Raises:
+            JobNotFound: If the job does not exist or has expired
+            JobNotReady: If the job has not completed successfully
+            ColumnarError: If pyarrow is missing or the format is unknown
+        """
+        if fmt not in columnar.FORMATS:
+            raise columnar.ColumnarError(f"Unknown export format '{fmt}'")
+
+        result_path = self._result_path(job_id, tenant)
+        export_path = result_path.with_suffix(columnar.FORMATS[fmt][0])
+        if not export_path.exists():
+            if not result_path.exists():
+                raise JobNotFound(f"Unknown job: {job_id}")
+            columnar.export_messages(columnar.iter_file_messages([result_path]), export_path, fmt)
+        return export_path
+
+    def iter_result(self, job_id: str, chunk_size: int = 64 * 1024,
+                    tenant: Optional[str] = None) -> Iterator[bytes]:
+        """
+        Open a completed job's result for streaming.
+
+        Raises:
+            JobNotFound: If the job does not exist or has expired
+            JobNotReady: If the job has not completed successfully
+        """
+        result_path = self._result_path(job_id, tenant)
+        try:
+            f = open(result_path, 'rb')
+        except FileNotFoundError as e:
+            raise JobNotFound(f"Unknown job: {job_id}") from e
+
+        def generate():
+            with f:
+                while True:
+                    chunk = f.read(chunk_size)
+                    if not chunk:
+                        break
+                    yield chunk
+
+        return generate()
+
+    def delete(self, job_id: str, tenant: Optional[str] = None) -> None:
+        """Delete a job and its result immediately (only by the tenant that owns it)."""
+        job_dir = self._job_dir(job_id)
+        job = read_json(job_dir / _JOB_FILE)
+        if job is None or job.get('tenant') != tenant:
+            raise JobNotFound(f"Unknown job: {job_id}")
+        if job['state'] in ('queued', 'running'):
+            raise JobNotReady(f"Job {job_id} is {job['state']}")
+        shutil.rmtree(job_dir, ignore_errors=True)
+
+    def _expired(self, job: Dict, job_dir: Path) -> bool:
+        """Finished job past its TTL, or unfinished job whose process is gone or silent."""
+        expires = job.get('expires')
+        if expires is not None:
+            return time.time() >= expires
+
+        pid = job.get('pid')
+        if pid is not None and not _process_alive(pid):
+            return True
+        try:
+            heartbeat = (job_dir / _JOB_FILE).stat().st_mtime
+        except OSError:
+            return False
+        return time.time() - heartbeat > self.max_age
+
+    def cleanup(self, force: bool = False) -> int:
+        """
+        Remove expired and abandoned jobs from the spool.
+
+        Runs at most every few seconds unless forced.
+
+        Returns:
+            Number of jobs removed
+        """
+        now = time.monotonic()
+        if not force and now - self._last_cleanup < _CLEANUP_INTERVAL:
+            return 0
+        self._last_cleanup = now
+
+        if not self.spool_dir.is_dir():
+            return 0
+
+        removed = 0
+        for job_dir in self.spool_dir.iterdir():
+            if not _JOB_ID_RE.match(job_dir.name):
+                continue
+            job = read_json(job_dir / _JOB_FILE)
+            if job is None:
+                # Half-created job: only remove once it is clearly stale
+                try:
+                    stale = time.time() - job_dir.stat().st_mtime > self.max_age
+                except OSError:
+                    continue
+                if not stale:
+                    continue
+            elif not self._expired(job, job_dir):
+                continue
+
+            shutil.rmtree(job_dir, ignore_errors=True)
+            removed += 1
+
+        if removed:
+            logger.info(f"Removed {removed} expired job(s)")
+        return removed
@@ -0,0 +1,92 @@
+"""Pluggable JSON backend.
+
+Uses orjson when it is installed (``pip install nubilum[fast-json]``) and the
+standard library otherwise. NUBILUM_JSON_BACKEND forces a backend ('json' or
+'orjson'); the default 'auto' picks the fastest available one.
+
+Both backends produce equivalent JSON; orjson writes compact output (no spaces
+after separators) and UTF-8 instead of \\u escapes.
+"""
+
+import json
+import logging
+import os
+from typing import Any, Union
+
+from flask.json.provider import DefaultJSONProvider
+
+logger = logging.getLogger(__name__)
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _select_backend() -> str:
+    requested = os.environ.get('NUBILUM_JSON_BACKEND', 'auto').lower()
+    if requested == 'orjson' and orjson is None:
+        logger.warning("NUBILUM_JSON_BACKEND=orjson but orjson is not installed, using json")
+        return 'json'
+    if requested in ('json', 'orjson'):
+        return requested
+    return 'orjson' if orjson is not None else 'json'
+
+
+BACKEND = _select_backend()
+
+if BACKEND == 'orjson':
+    # Usage statistics have integer and null keys (hourly distribution, message types)
+    _OPTIONS = orjson.OPT_NON_STR_KEYS
+
+    def dumps_bytes(obj: Any) -> bytes:
+        """Serialize to UTF-8 encoded JSON."""
+        return orjson.dumps(obj, option=_OPTIONS)
+
+    def dumps(obj: Any) -> str:
+        """Serialize to a JSON string."""
+        return orjson.dumps(obj, option=_OPTIONS).decode('utf-8')
+
+    def loads(data: Union[str, bytes]) -> Any:
+        """Parse JSON from a string or bytes (raises ValueError on invalid input)."""
+        return orjson.loads(data)
+
+else:
+    def dumps_bytes(obj: Any) -> bytes:
+        """Serialize to UTF-8 encoded JSON."""
+        return json.dumps(obj).encode('utf-8')
+
+    def dumps(obj: Any) -> str:
+        """Serialize to a JSON string."""
+        return json.dumps(obj)
+
+    def loads(data: Union[str, bytes]) -> Any:
+        """Parse JSON from a string or bytes (raises ValueError on invalid input)."""
+        return json.loads(data)
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider using orjson when available.
+
+    Keeps Flask's behaviour: sorted keys, and the default provider's handling
+    of dates, decimals, UUIDs and dataclasses. Indented output (debug mode
+    pretty-printing) goes through the standard library.
+    """
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        if BACKEND != 'orjson' or kwargs:
+            return super().dumps(obj, **kwargs)
+
+        option = _OPTIONS | orjson.OPT_PASSTHROUGH_DATETIME
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        try:
+            return orjson.dumps(obj, default=self.default, option=option).decode('utf-8')
+        except TypeError:
+            # e.g. integers beyond 64 bits
+            return super().dumps(obj)
+
+    def loads(self, s: Union[str, bytes], **kwargs: Any) -> Any:
+        if BACKEND != 'orjson' or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
@@ -0,0 +1,374 @@
+"""Configurable anonymization profiles.
+
+A profile lists per-field anonymization rules in JSON or YAML:
+
+    {
+        "name": "hospital-x",
+        "description": "Site rules for Hospital X",
+        "builtin": true,
+        "rules": [
+            {"segment": "ZPI", "field": 3, "action": "hash", "prefix": "ZPI"},
+            {"segment": "MRG", "field": 1, "component": 1, "action": "hash", "prefix": "PID"},
+            {"segment": "PID", "field": 8, "action": "keep"},
+            {"segment": "Z*", "field": 2, "action": "redact"}
+        ]
+    }
+
+Field and component numbers follow the HL7 specification (1-based, MSH-3 is
+the sending application). ``builtin`` keeps the hard-coded segment handlers of
+``HL7Anonymizer``; profile rules are applied on top of them and always see the
+original field values.
+
+Profiles are validated and compiled once into per-segment rule plans, and
+compiled profiles are memoized by the SHA-256 digest of their source.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+ACTIONS = ('hash', 'shift', 'redact', 'constant', 'keep', 'scrub')
+
+DEFAULT_PROFILE_NAME = 'default'
+
+_SEGMENT_RE = re.compile(r'^[A-Z][A-Z0-9]{2}$')
+_SEGMENT_WILDCARD_RE = re.compile(r'^[A-Z][A-Z0-9]{0,2}\*$')
+_PREFIX_RE = re.compile(r'^[A-Za-z0-9_]{1,16}$')
+_NAME_RE = re.compile(r'^[A-Za-z0-9_.-]{1,64}$')
+
+# Characters that would break the ER7 structure if written into a field value
+_DELIMITERS = '|^~\\&\r\n'
+
+
+class ProfileError(ValueError):
+    """Raised when a profile cannot be loaded or fails validation."""
+
+
+class Rule(NamedTuple):
+    """A compiled anonymization rule for one field or component."""
+    field: int  # HL7 field number
+    index: int  # position in the '|'-split segment
+    component: Optional[int]  # 0-based component index, None for the whole field
+    action: str
+    value: str  # constant value or pseudo-ID prefix
+
+
+class AnonymizationProfile:
+    """A validated profile compiled into per-segment rule plans."""
+
+    def __init__(self, name: str, rules: Dict[str, Tuple[Rule, ...]],
+                 wildcard_rules: List[Tuple[str, Tuple[Rule, ...]]],
+                 builtin: bool = True, description: str = "", digest: str = ""):
+        self.name = name
+        self.description = description
+        self.builtin = builtin
+        self.digest = digest
+        self._rules = rules
+        self._wildcard_rules = wildcard_rules
+        self._plans_lock = threading.Lock()
+        self._plans: Dict[str, Tuple[Rule, ...]] = {}
+        self._fingerprint: Optional[str] = None
+
+        # Segments with exact rules are planned now; others on first use
+        for segment_type in rules:
+            self._plans[segment_type] = self._plan(segment_type)
+
+    def __getstate__(self) -> Dict:
+        # Picklable for spool worker processes; the lock is per process
+        state = self.__dict__.copy()
+        del state['_plans_lock']
+        return state
+
+    def __setstate__(self, state: Dict) -> None:
+        self.__dict__.update(state)
+        self._plans_lock = threading.Lock()
+
+    @property
+    def fingerprint(self) -> str:
+        """Digest identifying what the profile does (its source digest, or its compiled rules)."""
+        if self._fingerprint is None:
+            if self.digest:
+                self._fingerprint = self.digest
+            else:
+                compiled = repr((self.builtin, sorted(self._rules.items()), self._wildcard_rules))
+                self._fingerprint = hashlib.sha256(compiled.encode('utf-8')).hexdigest()
+        return self._fingerprint
+
+    @property
+    def has_rules(self) -> bool:
+        """Whether the profile defines any rules at all."""
+        return bool(self._rules or self._wildcard_rules)
+
+    def rules_for(self, segment_type: str) -> Tuple[Rule, ...]:
+        """
+        Get the rule plan for a segment type.
+
+        Exact segment rules come first, followed by matching wildcard rules
+        (e.g. ``Z*``). Plans are resolved once per segment type.
+        """
+        plan = self._plans.get(segment_type)
+        if plan is None:
+            with self._plans_lock:
+                plan = self._plans.get(segment_type)
+                if plan is None:
+                    plan = self._plans[segment_type] = self._plan(segment_type)
+        return plan
+
+    def _plan(self, segment_type: str) -> Tuple[Rule, ...]:
+        plan = self._rules.get(segment_type, ())
+        for prefix, rules in self._wildcard_rules:
+            if segment_type.startswith(prefix):
+                plan = plan + rules
+        return plan
+
+    def to_dict(self) -> Dict:
+        """Describe the profile for API responses."""
+        return {
+            'name': self.name,
+            'description': self.description,
+            'builtin': self.builtin,
+            'digest': self.digest,
+        }
+
+
+def _validate_rule(raw, position: int) -> Tuple[str, Rule]:
+    """Validate one raw rule definition and compile it."""
+    where = f"rule {position}"
+    if not isinstance(raw, dict):
+        raise ProfileError(f"{where}: must be an object")
+
+    unknown = set(raw) - {'segment', 'field', 'component', 'action', 'value', 'prefix'}
+    if unknown:
+        raise ProfileError(f"{where}: unknown keys {sorted(unknown)}")
+
+    segment = raw.get('segment')
+    if not isinstance(segment, str) or not (_SEGMENT_RE.match(segment) or _SEGMENT_WILDCARD_RE.match(segment)):
+        raise ProfileError(f"{where}: 'segment' must be a segment ID such as 'PID' or a prefix wildcard such as 'Z*'")
+
+    field = raw.get('field')
+    if not isinstance(field, int) or isinstance(field, bool) or field < 1:
+        raise ProfileError(f"{where}: 'field' must be a positive integer")
+    if segment == 'MSH' and field <= 2:
+        raise ProfileError(f"{where}: MSH-1 and MSH-2 (delimiters) cannot be anonymized")
+
+    component = raw.get('component')
+    if component is not None and (not isinstance(component, int) or isinstance(component, bool) or component < 1):
+        raise ProfileError(f"{where}: 'component' must be a positive integer")
+
+    action = raw.get('action')
+    if action not in ACTIONS:
+        raise ProfileError(f"{where}: 'action' must be one of {', '.join(ACTIONS)}")
+
+    value = ""
+    if action == 'constant':
+        value = raw.get('value')
+        if not isinstance(value, str):
+            raise ProfileError(f"{where}: 'constant' action requires a string 'value'")
+        if any(ch in value for ch in _DELIMITERS):
+            raise ProfileError(f"{where}: 'value' must not contain HL7 delimiters")
+    elif action == 'hash':
+        value = raw.get('prefix', 'ID')
+        if not isinstance(value, str) or not _PREFIX_RE.match(value):
+            raise ProfileError(f"{where}: 'prefix' must be 1-16 alphanumeric characters")
+
+    # MSH-1 is the field separator itself, so MSH-n sits at split position n-1
+    index = field - 1 if segment == 'MSH' else field
+
+    return segment, Rule(
+        field=field,
+        index=index,
+        component=component - 1 if component is not None else None,
+        action=action,
+        value=value,
+    )
+
+
+def compile_profile(definition: Dict, digest: str = "") -> AnonymizationProfile:
+    """
+    Validate a parsed profile definition and compile it into rule plans.
+
+    Args:
+        definition: Parsed JSON/YAML profile
+        digest: Digest of the profile source (used as cache key)
+
+    Returns:
+        Compiled AnonymizationProfile
+    """
+    if not isinstance(definition, dict):
+        raise ProfileError("Profile must be an object")
+
+    name = definition.get('name')
+    if not isinstance(name, str) or not _NAME_RE.match(name):
+        raise ProfileError("Profile 'name' must be 1-64 characters of letters, digits, '_', '.' or '-'")
+
+    builtin = definition.get('builtin', True)
+    if not isinstance(builtin, bool):
+        raise ProfileError("Profile 'builtin' must be true or false")
+
+    raw_rules = definition.get('rules', [])
+    if not isinstance(raw_rules, list):
+        raise ProfileError("Profile 'rules' must be a list")
+
+    exact: Dict[str, List[Rule]] = {}
+    wildcard: Dict[str, List[Rule]] = {}
+
+    for position, raw in enumerate(raw_rules, 1):
+        segment, rule = _validate_rule(raw, position)
+        if segment.endswith('*'):
+            wildcard.setdefault(segment[:-1], []).append(rule)
+        else:
+            exact.setdefault(segment, []).append(rule)
+
+    return AnonymizationProfile(
+        name=name,
+        rules={segment: tuple(rules) for segment, rules in exact.items()},
+        wildcard_rules=[(prefix, tuple(rules)) for prefix, rules in wildcard.items()],
+        builtin=builtin,
+        description=str(definition.get('description', '')),
+        digest=digest,
+    )
+
+
+def _parse_source(source: bytes, fmt: str):
+    """Parse profile source bytes as JSON or YAML."""
+    if fmt == 'json':
+        try:
+            return json.loads(source)
+        except ValueError as e:
+            raise ProfileError(f"Invalid JSON profile: {e}") from e
+
+    try:
+        import yaml
+    except ImportError as e:
+        raise ProfileError("YAML profiles require the 'pyyaml' package") from e
+
+    try:
+        return yaml.safe_load(source)
+    except yaml.YAMLError as e:
+        raise ProfileError(f"Invalid YAML profile: {e}") from e
+
+
+_compiled_cache: Dict[str, AnonymizationProfile] = {}
+_cache_lock = threading.Lock()
+
+
+def load_profile_source(source: bytes, fmt: str = 'json') -> AnonymizationProfile:
+    """
+    Compile a profile from its source, memoized by the source digest.
+
+    Args:
+        source: Raw profile file contents
+        fmt: 'json' or 'yaml'
+
+    Returns:
+        Compiled AnonymizationProfile
+    """
+    digest = hashlib.sha256(source).hexdigest()
+
+    profile = _compiled_cache.get(digest)
+    if profile is not None:
+        return profile
+
+    profile = compile_profile(_parse_source(source, fmt), digest=digest)
+
+    with _cache_lock:
+        return _compiled_cache.setdefault(digest, profile)
+
+
+def load_profile(path) -> AnonymizationProfile:
+    """Load and compile a profile file (.json, .yaml or .yml)."""
+    path = Path(path)
+    suffix = path.suffix.lower()
+    if suffix not in ('.json', '.yaml', '.yml'):
+        raise ProfileError(f"Unsupported profile file type: {path.name}")
+
+    try:
+        source = path.read_bytes()
+    except OSError as e:
+        raise ProfileError(f"Cannot read profile {path}: {e}") from e
+
+    try:
+        return load_profile_source(source, 'json' if suffix == '.json' else 'yaml')
+    except ProfileError as e:
+        raise ProfileError(f"{path.name}: {e}") from e
+
+
+DEFAULT_PROFILE = compile_profile({
+    'name': DEFAULT_PROFILE_NAME,
+    'description': 'Built-in anonymization rules',
+})
+
+
+class ProfileRegistry:
+    """Named profiles loaded once from a directory."""
+
+    def __init__(self, profile_dir: Optional[str] = None):
+        """
+        Initialize the registry.
+
+        Args:
+            profile_dir: Directory with *.json/*.yaml/*.yml profiles (optional)
+        """
+        self.profile_dir = Path(profile_dir) if profile_dir else None
+        self._profiles: Dict[str, AnonymizationProfile] = {DEFAULT_PROFILE_NAME: DEFAULT_PROFILE}
+
+    def load(self) -> 'ProfileRegistry':
+        """Load every profile in the profile directory. Invalid files are logged and skipped."""
+        if not self.profile_dir or not self.profile_dir.is_dir():
+            return self
+
+        for path in sorted(self.profile_dir.iterdir()):
+            if path.suffix.lower() not in ('.json', '.yaml', '.yml'):
+                continue
+            try:
+                profile = load_profile(path)
+            except ProfileError as e:
+                logger.error(f"Skipping invalid anonymization profile: {e}")
+                continue
+
+            if profile.name in self._profiles and profile.name != DEFAULT_PROFILE_NAME:
+                logger.warning(f"Duplicate profile name '{profile.name}' in {path.name}, replacing")
+            self._profiles[profile.name] = profile
+            logger.info(f"Loaded anonymization profile '{profile.name}' from {path.name}")
+
+        return self
+
+    def get(self, name: Optional[str] = None) -> AnonymizationProfile:
+        """
+        Get a profile by name.
+
+        Args:
+            name: Profile name (None for the default profile)
+
+        Returns:
+            Compiled AnonymizationProfile
+
+        Raises:
+            ProfileError: If the name is not a string or no profile with that name is loaded
+        """
+        if name is not None and not isinstance(name, str):
+            raise ProfileError("Anonymization profile must be given by name")
+        profile = self._profiles.get(name or DEFAULT_PROFILE_NAME)
+        if profile is None:
+            raise ProfileError(f"Unknown anonymization profile: {name}")
+        return profile
+
+    def names(self) -> List[str]:
+        """Names of all loaded profiles."""
+        return sorted(self._profiles)
+
+    def profiles(self) -> List[AnonymizationProfile]:
+        """All loaded profiles, sorted by name."""
+        return [self._profiles[name] for name in self.names()]
+
+
+def registry_from_env() -> ProfileRegistry:
+    """Build a registry from the NUBILUM_PROFILE_DIR environment variable."""
+    return ProfileRegistry(os.environ.get('NUBILUM_PROFILE_DIR')).load()
@@ -0,0 +1,292 @@
+"""Shared-memory pseudonym table for pre-forked workers.
+
+A fixed-size open-addressing hash table in a ``multiprocessing.shared_memory``
+block, created once in the gunicorn master (``preload_app``) and inherited by
+every worker, so pseudonyms computed by one worker are reused by the others
+and the table's memory is paid once, not per worker.
+
+Layout (little-endian):
+
+    header   magic 'NBPT', version, slot count, slot size, used slots (uint32 each)
+    slot     status (uint8), value length (uint8), key digest (16 bytes), value (30 bytes)
+
+Keys are BLAKE2b digests, so no original identifier is ever stored in shared
+memory; values are the (non-identifying) pseudonyms. Lookups are lock-free:
+a writer fills the digest and value first and publishes the slot by setting
+its status byte last, under a process-shared lock. Entries are never removed;
+once the table is nearly full new pseudonyms are simply not shared.
+
+The table is off unless NUBILUM_PSEUDONYM_TABLE_SLOTS is set: pseudonyms are
+deterministic and every request builds a new anonymizer, so recomputing one
+is cheaper than the digest, probe and lock of a shared lookup (see
+benchmarks/bench_pseudonym_table.py).
+
+PseudonymCache has the same interface in process memory, bounded by LRU
+eviction instead of slot count; tenants get one each (see nubilum.tenants).
+"""
+
+import atexit
+import hashlib
+import logging
+import multiprocessing
+import os
+import struct
+import threading
+from collections import OrderedDict
+from multiprocessing import shared_memory
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SLOTS = 1 << 18  # 262144 slots, 12MB
+
+MAGIC = b'NBPT'
+VERSION = 1
+
+_HEADER = struct.Struct('<4sIIII')
+_HEADER_SIZE = 64
+_DIGEST_SIZE = 16
+_MAX_VALUE = 30
+_SLOT_SIZE = 2 + _DIGEST_SIZE + _MAX_VALUE
+_MAX_LOAD = 0.9
+
+_EMPTY = 0
+_USED = 1
+
+
+def _digest(key: str) -> bytes:
+    return hashlib.blake2b(key.encode('utf-8'), digest_size=_DIGEST_SIZE).digest()
+
+
+class SharedPseudonymTable:
+    """Fixed-slot hash table of key digest -> pseudonym in shared memory."""
+
+    def __init__(self, slots: int = DEFAULT_SLOTS):
+        """
+        Create the table. Create it before forking: children share it by inheritance.
+
+        Args:
+            slots: Number of slots (rounded up to a power of two)
+        """
+        slots = 1 << max(4, (slots - 1).bit_length())
+        self._shm = shared_memory.SharedMemory(create=True, size=_HEADER_SIZE + slots * _SLOT_SIZE)
+        _HEADER.pack_into(self._shm.buf, 0, MAGIC, VERSION, slots, _SLOT_SIZE, 0)
+        self._owner_pid = os.getpid()
+        atexit.register(self.unlink)
+
+        self.slots = slots
+        self._mask = slots - 1
+        self._max_used = int(slots * _MAX_LOAD)
+        self._buf = self._shm.buf
+        # Forked workers inherit both the mapping and the lock
+        self._lock = multiprocessing.Lock()
+
+        # Per-process counters
+        self.hits = 0
+        self.misses = 0
+        self.rejected = 0
+
+    def _used(self) -> int:
+        return _HEADER.unpack_from(self._buf, 0)[4]
+
+    def __len__(self) -> int:
+        return self._used()
+
+    def _find(self, digest: bytes):
+        """Return (slot offset, found) for a digest; offset of the first empty slot if absent."""
+        buf = self._buf
+        index = int.from_bytes(digest[:8], 'little') & self._mask
+
+        for _ in range(self.slots):
+            offset = _HEADER_SIZE + index * _SLOT_SIZE
+            if buf[offset] == _EMPTY:
+                return offset, False
+            if buf[offset + 2:offset + 2 + _DIGEST_SIZE] == digest:
+                return offset, True
+            index = (index + 1) & self._mask
+
+        return None, False
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Look up a pseudonym without locking.
+
+        Args:
+            key: Lookup key (namespaced original value)
+
+        Returns:
+            The shared pseudonym, or None if not present
+        """
+        offset, found = self._find(_digest(key))
+        if not found:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        length = self._buf[offset + 1]
+        start = offset + 2 + _DIGEST_SIZE
+        return bytes(self._buf[start:start + length]).decode('utf-8')
+
+    def put(self, key: str, value: str) -> bool:
+        """
+        Share a pseudonym with the other workers.
+
+        Args:
+            key: Lookup key (namespaced original value)
+            value: Pseudonym
+
+        Returns:
+            True if the pseudonym is in the table after the call
+        """
+        data = value.encode('utf-8')
+        if len(data) > _MAX_VALUE:
+            self.rejected += 1
+            return False
+
+        digest = _digest(key)
+        with self._lock:
+            offset, found = self._find(digest)
+            if found:
+                return True
+
+            used = self._used()
+            if offset is None or used >= self._max_used:
+                self.rejected += 1
+                return False
+
+            buf = self._buf
+            start = offset + 2 + _DIGEST_SIZE
+            buf[start:start + len(data)] = data
+            buf[offset + 1] = len(data)
+            buf[offset + 2:start] = digest
+            # Publish last: readers ignore the slot until its status is set
+            buf[offset] = _USED
+            struct.pack_into('<I', buf, 16, used + 1)
+
+        return True
+
+    def stats(self) -> Dict:
+        """Table occupancy and this process's hit/miss counters."""
+        lookups = self.hits + self.misses
+        used = self._used()
+        return {
+            'slots': self.slots,
+            'used': used,
+            'load_factor': round(used / self.slots, 4),
+            'size_bytes': self._shm.size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            'rejected': self.rejected,
+            'pid': os.getpid(),
+        }
+
+    def close(self) -> None:
+        """Detach from the shared memory block."""
+        self._buf = None
+        self._shm.close()
+
+    def unlink(self) -> None:
+        """Remove the shared memory block (only in the process that created it)."""
+        # Forked workers exiting must not remove the master's block
+        if self._owner_pid == os.getpid():
+            self._owner_pid = None
+            try:
+                self._shm.unlink()
+            except FileNotFoundError:
+                pass
+
+
+class PseudonymCache:
+    """Bounded, thread-safe LRU of key digest -> pseudonym in process memory."""
+
+    def __init__(self, max_entries: int):
+        """
+        Args:
+            max_entries: Entries kept before the least recently used is evicted
+        """
+        self.max_entries = max_entries
+        self._entries: 'OrderedDict[bytes, str]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        Look up a pseudonym.
+
+        Args:
+            key: Lookup key (namespaced original value)
+
+        Returns:
+            The cached pseudonym, or None if not present
+        """
+        digest = _digest(key)
+        with self._lock:
+            value = self._entries.get(digest)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(digest)
+            self.hits += 1
+            return value
+
+    def put(self, key: str, value: str) -> bool:
+        """
+        Cache a pseudonym, evicting the least recently used beyond max_entries.
+
+        Args:
+            key: Lookup key (namespaced original value)
+            value: Pseudonym
+
+        Returns:
+            True if the pseudonym is in the cache after the call
+        """
+        if self.max_entries <= 0:
+            return False
+
+        digest = _digest(key)
+        with self._lock:
+            self._entries[digest] = value
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return True
+
+    def stats(self) -> Dict:
+        """Occupancy and hit/miss counters."""
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            'evictions': self.evictions,
+        }
+
+
+def table_from_env() -> Optional[SharedPseudonymTable]:
+    """
+    Create the shared table sized by NUBILUM_PSEUDONYM_TABLE_SLOTS (unset or 0 disables it).
+
+    Returns:
+        The table, or None if disabled or shared memory is unavailable
+    """
+    slots = int(os.environ.get('NUBILUM_PSEUDONYM_TABLE_SLOTS', 0))
+    if slots <= 0:
+        return None
+
+    try:
+        table = SharedPseudonymTable(slots)
+    except OSError as e:
+        logger.warning(f"Shared pseudonym table disabled: {e}")
+        return None
+
+    logger.info(f"Shared pseudonym table: {table.slots} slots, {table.stats()['size_bytes']} bytes")
+    return table
@@ -0,0 +1,346 @@
+"""Per-client rate limiting and concurrency admission control.
+
+Each client (API key if the request has an ``X-API-Key`` header that the
+application validates, e.g. a tenant's key, otherwise the client IP) gets a
+token bucket and an in-flight request counter. The
+state lives in a ``multiprocessing.shared_memory`` block created in the
+gunicorn master (``preload_app``) and inherited by all workers, so limits
+apply across workers without an external store.
+
+Layout (little-endian):
+
+    header   magic 'NBRL', version, slot count, padding, then six uint64
+             counters: allowed, rejected (rate), rejected (concurrency),
+             untracked, released, clients seen
+    slot     key digest (16 bytes), tokens (double), last update (double),
+             last admission (double), in-flight requests (uint32), padding
+
+In-flight requests are released when they finish. A worker killed mid-request
+(gunicorn timeout, OOM killer) never releases its request, so a client's
+in-flight count is dropped once its last admission is older than the lease,
+which must exceed the worker timeout: any request admitted before then has
+finished or been killed.
+
+Only BLAKE2b digests of client keys are stored. A client slot can be reused
+for another client once its bucket has refilled and it has nothing in
+flight, since such a slot is indistinguishable from a fresh one. If no slot
+is free within the probe window the request is admitted (fail open) and
+counted as untracked.
+"""
+
+import atexit
+import hashlib
+import logging
+import multiprocessing
+import os
+import struct
+import time
+from multiprocessing import shared_memory
+from typing import Callable, Dict, Optional, Tuple
+
+from flask import Flask, g, jsonify, request
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SLOTS = 4096
+DEFAULT_RATE = 2.0  # tokens per second
+DEFAULT_BURST = 30.0
+DEFAULT_MAX_CONCURRENT = 2
+DEFAULT_BYTES_PER_TOKEN = 64 * 1024
+DEFAULT_LEASE = 120.0  # seconds; twice the gunicorn worker timeout
+
+API_KEY_HEADER = 'X-API-Key'
+
+MAGIC = b'NBRL'
+VERSION = 2
+
+_HEADER = struct.Struct('<4sII4x6Q')
+_HEADER_SIZE = 64
+_COUNTERS_OFFSET = 16
+_SLOT = struct.Struct('<16sdddI4x')
+_PROBES = 16
+
+_COUNTER_NAMES = ('allowed', 'rejected_rate', 'rejected_concurrency', 'untracked', 'released',
+                  'clients_seen')
+_ALLOWED, _REJECTED_RATE, _REJECTED_CONCURRENCY, _UNTRACKED, _RELEASED, _CLIENTS = range(6)
+
+_EMPTY_DIGEST = bytes(16)
+
+
+class RateLimitDecision:
+    """Outcome of an admission check."""
+
+    __slots__ = ('allowed', 'reason', 'retry_after', 'slot', 'admitted')
+
+    def __init__(self, allowed: bool, reason: Optional[str] = None,
+                 retry_after: float = 0.0, slot: Optional[int] = None, admitted: float = 0.0):
+        self.allowed = allowed
+        self.reason = reason
+        self.retry_after = retry_after
+        self.slot = slot
+        self.admitted = admitted
+
+
+class SharedRateLimiter:
+    """Token buckets and in-flight counters per client in shared memory."""
+
+    def __init__(self, rate: float = DEFAULT_RATE, burst: float = DEFAULT_BURST,
+                 max_concurrent: int = DEFAULT_MAX_CONCURRENT, slots: int = DEFAULT_SLOTS,
+                 lease: float = DEFAULT_LEASE):
+        """
+        Create the limiter. Create it before forking: children share it by inheritance.
+
+        Args:
+            rate: Tokens added per second
+            burst: Bucket capacity
+            max_concurrent: In-flight requests allowed per client (0 for no limit)
+            slots: Number of client slots
+            lease: Seconds after a client's last admission when its requests
+                still in flight are assumed killed (longer than the worker timeout)
+        """
+        self.rate = rate
+        self.burst = burst
+        self.max_concurrent = max_concurrent
+        self.lease = lease
+        self.slots = max(slots, _PROBES)
+
+        self._shm = shared_memory.SharedMemory(create=True, size=_HEADER_SIZE + self.slots * _SLOT.size)
+        _HEADER.pack_into(self._shm.buf, 0, MAGIC, VERSION, self.slots, *([0] * len(_COUNTER_NAMES)))
+        self._buf = self._shm.buf
+        self._lock = multiprocessing.Lock()
+        self._owner_pid = os.getpid()
+        atexit.register(self.unlink)
+
+    @staticmethod
+    def _digest(client: str) -> bytes:
+        return hashlib.blake2b(client.encode('utf-8'), digest_size=16).digest()
+
+    def _count(self, counter: int, amount: int = 1) -> None:
+        offset = _COUNTERS_OFFSET + counter * 8
+        value = struct.unpack_from('<Q', self._buf, offset)[0]
+        struct.pack_into('<Q', self._buf, offset, value + amount)
+
+    def _slot_offset(self, index: int) -> int:
+        return _HEADER_SIZE + index * _SLOT.size
+
+    def _refill(self, tokens: float, updated: float, now: float) -> float:
+        return min(self.burst, tokens + (now - updated) * self.rate)
+
+    def _in_flight(self, in_flight: int, admitted: float, now: float) -> int:
+        # Every request in flight was admitted at or before the last admission
+        return in_flight if now - admitted < self.lease else 0
+
+    def _find_slot(self, digest: bytes, now: float) -> Tuple[Optional[int], bool]:
+        """Return (slot index, existing) for a client, claiming a free or idle slot if needed."""
+        start = int.from_bytes(digest[:8], 'little') % self.slots
+        candidate = None
+
+        for probe in range(_PROBES):
+            index = (start + probe) % self.slots
+            slot_digest, tokens, updated, admitted, in_flight = _SLOT.unpack_from(
+                self._buf, self._slot_offset(index))
+            if slot_digest == digest:
+                return index, True
+            if candidate is None and (slot_digest == _EMPTY_DIGEST or (
+                    self._in_flight(in_flight, admitted, now) == 0
+                    and self._refill(tokens, updated, now) >= self.burst)):
+                candidate = index
+
+        return candidate, False
+
+    def acquire(self, client: str, cost: float = 1.0) -> RateLimitDecision:
+        """
+        Admit or reject a request.
+
+        Args:
+            client: Client identity (API key or IP address)
+            cost: Tokens the request consumes
+
+        Returns:
+            Decision; call release(decision) when an admitted request finishes
+        """
+        digest = self._digest(client)
+        cost = min(cost, self.burst)
+        now = time.monotonic()
+
+        with self._lock:
+            index, existing = self._find_slot(digest, now)
+            if index is None:
+                self._count(_UNTRACKED)
+                self._count(_ALLOWED)
+                return RateLimitDecision(True)
+
+            offset = self._slot_offset(index)
+            if existing:
+                _, tokens, updated, admitted, in_flight = _SLOT.unpack_from(self._buf, offset)
+                tokens = self._refill(tokens, updated, now)
+                in_flight = self._in_flight(in_flight, admitted, now)
+            else:
+                tokens, admitted, in_flight = self.burst, 0.0, 0
+                self._count(_CLIENTS)
+
+            if self.max_concurrent and in_flight >= self.max_concurrent:
+                self._count(_REJECTED_CONCURRENCY)
+                _SLOT.pack_into(self._buf, offset, digest, tokens, now, admitted, in_flight)
+                return RateLimitDecision(False, 'concurrency', retry_after=1.0)
+
+            if tokens < cost:
+                self._count(_REJECTED_RATE)
+                _SLOT.pack_into(self._buf, offset, digest, tokens, now, admitted, in_flight)
+                # A zero rate never refills the bucket
+                retry_after = (cost - tokens) / self.rate if self.rate > 0 else self.lease
+                return RateLimitDecision(False, 'rate', retry_after=retry_after)
+
+            _SLOT.pack_into(self._buf, offset, digest, tokens - cost, now, now, in_flight + 1)
+            self._count(_ALLOWED)
+
+        return RateLimitDecision(True, slot=index, admitted=now)
+
+    def release(self, decision: RateLimitDecision) -> None:
+        """Mark an admitted request as finished."""
+        if decision.slot is None:
+            return
+
+        offset = self._slot_offset(decision.slot)
+        with self._lock:
+            digest, tokens, updated, admitted, in_flight = _SLOT.unpack_from(self._buf, offset)
+            # Requests older than the lease were already dropped from the count
+            if time.monotonic() - decision.admitted < self.lease:
+                in_flight = max(0, in_flight - 1)
+            _SLOT.pack_into(self._buf, offset, digest, tokens, updated, admitted, in_flight)
+            self._count(_RELEASED)
+
+    def metrics(self) -> Dict:
+        """Counters shared by all workers, plus current occupancy."""
+        values = _HEADER.unpack_from(self._buf, 0)[3:]
+        metrics = dict(zip(_COUNTER_NAMES, values))
+
+        now = time.monotonic()
+        active = in_flight_total = 0
+        for index in range(self.slots):
+            digest, tokens, updated, admitted, in_flight = _SLOT.unpack_from(self._buf, self._slot_offset(index))
+            in_flight = self._in_flight(in_flight, admitted, now)
+            if digest != _EMPTY_DIGEST and (in_flight or self._refill(tokens, updated, now) < self.burst):
+                active += 1
+                in_flight_total += in_flight
+
+        metrics.update({
+            'active_clients': active,
+            'in_flight': in_flight_total,
+            'slots': self.slots,
+            'rate_per_second': self.rate,
+            'burst': self.burst,
+            'max_concurrent': self.max_concurrent,
+        })
+        return metrics
+
+    def close(self) -> None:
+        """Detach from the shared memory block."""
+        self._buf = None
+        self._shm.close()
+
+    def unlink(self) -> None:
+        """Remove the shared memory block (only in the process that created it)."""
+        # Forked workers exiting must not remove the master's block
+        if self._owner_pid == os.getpid():
+            self._owner_pid = None
+            try:
+                self._shm.unlink()
+            except FileNotFoundError:
+                pass
+
+
+def limiter_from_env() -> Optional[SharedRateLimiter]:
+    """
+    Create the limiter from NUBILUM_RATE_LIMIT_* variables (NUBILUM_RATE_LIMIT_SLOTS=0 disables it).
+
+    Returns:
+        The limiter, or None if disabled or shared memory is unavailable
+    """
+    slots = int(os.environ.get('NUBILUM_RATE_LIMIT_SLOTS', DEFAULT_SLOTS))
+    if slots <= 0:
+        return None
+
+    try:
+        limiter = SharedRateLimiter(
+            rate=float(os.environ.get('NUBILUM_RATE_LIMIT_RATE', DEFAULT_RATE)),
+            burst=float(os.environ.get('NUBILUM_RATE_LIMIT_BURST', DEFAULT_BURST)),
+            max_concurrent=int(os.environ.get('NUBILUM_RATE_LIMIT_CONCURRENCY', DEFAULT_MAX_CONCURRENT)),
+            slots=slots,
+            lease=float(os.environ.get('NUBILUM_RATE_LIMIT_LEASE', DEFAULT_LEASE)),
+        )
+    except OSError as e:
+        logger.warning(f"Rate limiting disabled: {e}")
+        return None
+
+    logger.info(f"Rate limiting: {limiter.rate}/s, burst {limiter.burst}, "
+                f"{limiter.max_concurrent} concurrent per client")
+    return limiter
+
+
+def client_identity(key_validator: Optional[Callable[[str], bool]] = None) -> str:
+    """
+    Validated API key if present, otherwise the client address.
+
+    Args:
+        key_validator: Tells whether an API key is valid; without one keys are
+            ignored (a new random key per request would otherwise get a fresh
+            bucket every time)
+    """
+    api_key = request.headers.get(API_KEY_HEADER)
+    if api_key and key_validator is not None and key_validator(api_key):
+        return f"key:{api_key}"
+    return f"ip:{request.remote_addr}"
+
+
+def request_cost(bytes_per_token: int = DEFAULT_BYTES_PER_TOKEN) -> float:
+    """One token per request plus one per started bytes_per_token of body."""
+    return 1.0 + (request.content_length or 0) // bytes_per_token
+
+
+def init_app(app: Flask, limiter: Optional[SharedRateLimiter], endpoints,
+             key_validator: Optional[Callable[[str], bool]] = None) -> None:
+    """
+    Apply the limiter to the given endpoints.
+
+    Register before other before_request handlers (e.g. body decompression),
+    so rejected requests are answered without reading their body.
+
+    Args:
+        app: Flask application
+        limiter: Shared limiter (None disables rate limiting)
+        endpoints: Endpoint names to limit
+        key_validator: Tells whether an API key is valid, so it gets its own
+            bucket (see client_identity)
+    """
+    if limiter is None:
+        return
+
+    endpoints = frozenset(endpoints)
+    bytes_per_token = int(os.environ.get('NUBILUM_RATE_LIMIT_BYTES_PER_TOKEN', DEFAULT_BYTES_PER_TOKEN))
+
+    @app.before_request
+    def _admit():
+        if request.endpoint not in endpoints or request.method == 'OPTIONS':
+            return None
+
+        decision = limiter.acquire(client_identity(key_validator), request_cost(bytes_per_token))
+        if decision.allowed:
+            g.rate_limit_decision = decision
+            return None
+
+        error = ('Too many concurrent requests' if decision.reason == 'concurrency'
+                 else 'Rate limit exceeded')
+        response = jsonify({
+            'success': False,
+            'error': f'{error}, try again later'
+        })
+        response.status_code = 429
+        response.headers['Retry-After'] = str(max(1, int(decision.retry_after + 0.999)))
+        return response
+
+    @app.teardown_request
+    def _release(exc):
+        decision = g.pop('rate_limit_decision', None)
+        if decision is not None:
+            limiter.release(decision)
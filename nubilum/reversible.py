@@ -0,0 +1,233 @@
+"""Reversible pseudonymization for authorised re-identification.
+
+In reversible mode the anonymizer derives identifier and name pseudonyms with
+HMAC-SHA256 under a secret key, ending in a 16-digit code (see
+``HL7Anonymizer.KEYED_DIGITS``) instead of the lossy 6-digit hash. Batch jobs
+record every new ``code -> (pseudonym, original)`` pair in an encrypted
+re-identification map:
+
+- the map is append-only, one Fernet token per line (AES-128-CBC +
+  HMAC-SHA256, from the optional ``cryptography`` package); each token holds
+  all pairs created by one batch chunk, so an archive run costs one write and
+  fsync per checkpoint rather than one per identifier
+- the pseudonym key and the map key are derived from one master key file
+  (``nubilum keygen``), which must be kept apart from the anonymized data
+
+Dates, addresses, phone numbers and free-text replacements other than names
+and identifiers stay one-way.
+"""
+
+import base64
+import hashlib
+import hmac
+import os
+import re
+import secrets
+from pathlib import Path
+from typing import Dict, Iterable, Tuple
+
+from nubilum import jsonutil
+
+try:
+    from cryptography.fernet import Fernet, InvalidToken
+except ImportError:
+    Fernet = None
+    InvalidToken = None
+
+MASTER_KEY_BYTES = 32
+
+_PSEUDONYM_KEY_LABEL = b'nubilum pseudonym key v1'
+_MAP_KEY_LABEL = b'nubilum reidentification map key v1'
+
+# The code ending every keyed pseudonym
+_CODE_RE = re.compile(r'(?<![0-9])[0-9]{16}(?![0-9])')
+_EMAIL_DOMAIN = '@example.org'
+_PROVIDER_TITLE = 'Dr'
+
+
+class ReversibleError(Exception):
+    """Raised for missing keys, unreadable maps or a missing cryptography package."""
+
+
+def generate_key() -> str:
+    """A new random master key, URL-safe base64 encoded."""
+    return base64.urlsafe_b64encode(secrets.token_bytes(MASTER_KEY_BYTES)).decode('ascii')
+
+
+def write_key_file(path) -> None:
+    """
+    Create a master key file readable only by its owner.
+
+    Raises:
+        ReversibleError: If the file already exists
+    """
+    try:
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    except FileExistsError:
+        raise ReversibleError(f"Key file already exists: {path}")
+    with os.fdopen(fd, 'w', encoding='ascii') as f:
+        f.write(generate_key() + '\n')
+
+
+def load_key_file(path) -> bytes:
+    """
+    Read a master key written by write_key_file().
+
+    Raises:
+        ReversibleError: If the file is missing or does not hold a valid key
+    """
+    try:
+        key = base64.urlsafe_b64decode(Path(path).read_text(encoding='ascii').strip())
+    except (OSError, ValueError) as e:
+        raise ReversibleError(f"Cannot read key file {path}: {e}")
+
+    if len(key) != MASTER_KEY_BYTES:
+        raise ReversibleError(f"Key file {path} does not contain a {MASTER_KEY_BYTES}-byte key")
+    return key
+
+
+def pseudonym_key(master_key: bytes) -> bytes:
+    """Key for HL7Anonymizer(key=...), derived from the master key."""
+    return hmac.new(master_key, _PSEUDONYM_KEY_LABEL, hashlib.sha256).digest()
+
+
+def _fernet(master_key: bytes):
+    if Fernet is None:
+        raise ReversibleError(
+            "The re-identification map requires the 'cryptography' package "
+            "(pip install \"nubilum[reversible]\")")
+    map_key = hmac.new(master_key, _MAP_KEY_LABEL, hashlib.sha256).digest()
+    return Fernet(base64.urlsafe_b64encode(map_key))
+
+
+class ReidentificationMap:
+    """Append-only encrypted map of keyed pseudonyms to original values.
+
+    Also carries the pseudonym key, so an anonymizer and its map always
+    come from the same master key.
+    """
+
+    def __init__(self, path, master_key: bytes):
+        """
+        Args:
+            path: Map file (created on the first append)
+            master_key: Master key from load_key_file()
+
+        Raises:
+            ReversibleError: If cryptography is not installed
+        """
+        self.path = Path(path)
+        self.pseudonym_key = pseudonym_key(master_key)
+        self._fernet = _fernet(master_key)
+
+    def append(self, pairs: Iterable[Tuple[str, str]]) -> int:
+        """
+        Durably append (pseudonym, original) pairs as one encrypted record.
+
+        Returns:
+            Number of pairs written
+        """
+        entries = [[pseudonym[-16:], pseudonym, original] for pseudonym, original in pairs]
+        if not entries:
+            return 0
+
+        token = self._fernet.encrypt(jsonutil.dumps_bytes(entries))
+        fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+        with os.fdopen(fd, 'ab') as f:
+            f.write(token + b'\n')
+            f.flush()
+            os.fsync(f.fileno())
+        return len(entries)
+
+    def load(self) -> Dict[str, Tuple[str, str]]:
+        """
+        Decrypt the whole map.
+
+        Returns:
+            Mapping of 16-digit code to (pseudonym, original)
+
+        Raises:
+            ReversibleError: If the map cannot be read or was written with another key
+        """
+        mapping: Dict[str, Tuple[str, str]] = {}
+        try:
+            data = self.path.read_bytes()
+        except OSError as e:
+            raise ReversibleError(f"Cannot read re-identification map {self.path}: {e}")
+
+        lines = data.split(b'\n')
+        # A record without its newline was interrupted mid-write; it never
+        # preceded a checkpoint, so the pairs are written again on resume
+        for line_number, line in enumerate(lines[:-1], 1):
+            if not line:
+                continue
+            try:
+                entries = jsonutil.loads(self._fernet.decrypt(line))
+            except InvalidToken:
+                raise ReversibleError(
+                    f"Cannot decrypt record {line_number} of {self.path} (wrong key or corrupted map)")
+            for code, pseudonym, original in entries:
+                mapping[code] = (pseudonym, original)
+
+        return mapping
+
+
+def reidentify_text(text: str, mapping: Dict[str, Tuple[str, str]]) -> Tuple[str, int]:
+    """
+    Replace keyed pseudonyms in anonymized text with the original values.
+
+    Args:
+        text: Anonymized HL7 text
+        mapping: Map from ReidentificationMap.load()
+
+    Returns:
+        (re-identified text, number of replacements)
+    """
+    pieces = []
+    position = 0
+    count = 0
+
+    for match in _CODE_RE.finditer(text):
+        entry = mapping.get(match.group(0))
+        if entry is None:
+            continue
+
+        pseudonym, original = entry
+        start = match.end() - len(pseudonym)
+        if start < position or text[start:match.end()] != pseudonym:
+            continue
+
+        # Drop what the anonymizer added around the pseudonym: the title of
+        # provider names and the placeholder domain of e-mail addresses
+        title_start = start - len(_PROVIDER_TITLE)
+        if title_start >= position and text.startswith(_PROVIDER_TITLE, title_start):
+            start = title_start
+        end = match.end()
+        if '@' in original and text.startswith(_EMAIL_DOMAIN, end):
+            end += len(_EMAIL_DOMAIN)
+
+        pieces.append(text[position:start])
+        pieces.append(original)
+        position = end
+        count += 1
+
+    pieces.append(text[position:])
+    return ''.join(pieces), count
+
+
+def reidentify_file(input_path, output_path, mapping: Dict[str, Tuple[str, str]],
+                    encoding: str = 'utf-8') -> int:
+    """
+    Re-identify an anonymized file line by line.
+
+    Returns:
+        Number of replacements
+    """
+    count = 0
+    with open(input_path, 'r', encoding=encoding, newline='') as source, \
+            open(output_path, 'w', encoding=encoding, newline='') as target:
+        for line in source:
+            line, replaced = reidentify_text(line, mapping)
+            target.write(line)
+            count += replaced
+    return count
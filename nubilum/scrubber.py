@@ -0,0 +1,248 @@
+"""Free-text PHI scrubbing for narrative fields (OBX-5, NTE-3).
+
+Two matchers are combined into a single pass over each text:
+
+- an Aho-Corasick automaton over the names, identifiers and streets found in
+  the PID/NK1 segments of the same message, and
+- one precompiled regular expression with an alternative per Portuguese
+  identifier format (phones, NIF/SNS, Cartão de Cidadão, postal codes, e-mail).
+
+Both run in time linear in the length of the text, independent of how many
+terms or formats are searched for.
+"""
+
+import re
+from collections import deque
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+# Shortest name/identifier from the message that is searched for in free text
+MIN_TERM_LENGTH = 3
+
+# One alternative per identifier format; earlier alternatives win at the same position.
+# A bare run of nine digits starting with 2 is a NIF: landlines need a prefix or separator.
+IDENTIFIER_PATTERN = re.compile(
+    r'(?P<email>\b[\w.+-]+@[\w-]+(?:\.[\w-]+)+\b)'
+    r'|(?P<phone>(?:(?<![\w+])\+351[\s.-]?|(?<![\w+])00351[\s.-]?|\b(?!2\d{8}\b))(?:9[1236]\d|2\d\d)[\s.-]?\d{3}[\s.-]?\d{3}\b)'
+    r'|(?P<cc>\b\d{8}[\s-]?\d[\s-]?[A-Z]{2}\d\b)'
+    r'|(?P<nif>\b\d{9}\b)'
+    r'|(?P<postal_code>\b\d{4}-\d{3}\b)'
+)
+
+# Segment fields whose components identify the patient or next of kin:
+# (segment, field index, kind of each component by position)
+_NAME_KINDS = ('last_name', 'first_name', 'first_name')
+_TERM_FIELDS = (
+    ('PID', 2, ('id',)),
+    ('PID', 3, ('id',)),
+    ('PID', 4, ('id',)),
+    ('PID', 5, _NAME_KINDS),
+    ('PID', 6, _NAME_KINDS),
+    ('PID', 9, _NAME_KINDS),
+    ('PID', 11, ('address',)),
+    ('PID', 18, ('id',)),
+    ('PID', 19, ('id',)),
+    ('PID', 20, ('id',)),
+    ('NK1', 2, _NAME_KINDS),
+    ('NK1', 4, ('address',)),
+)
+
+
+class AhoCorasick:
+    """Aho-Corasick automaton reporting the longest accepted term ending at each position."""
+
+    def __init__(self, terms: Dict[str, object]):
+        """
+        Build the automaton.
+
+        Args:
+            terms: Mapping of (already lower-cased) term to an arbitrary value
+        """
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        # (term length, value) of the term spelled by each state, or None
+        self._out: List[Optional[Tuple[int, object]]] = [None]
+        # Nearest state along the failure links that spells a term (0 if none)
+        self._output: List[int] = [0]
+
+        for term, value in terms.items():
+            if term:
+                self._insert(term, value)
+
+        self._build_failure_links()
+
+    def _insert(self, term: str, value) -> None:
+        state = 0
+        for char in term:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(None)
+                self._output.append(0)
+            state = next_state
+        self._out[state] = (len(term), value)
+
+    def _build_failure_links(self) -> None:
+        queue = deque(self._goto[0].values())
+
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[next_state] = target if target != next_state else 0
+
+                suffix = self._fail[next_state]
+                self._output[next_state] = suffix if self._out[suffix] is not None else self._output[suffix]
+
+    def __bool__(self) -> bool:
+        return bool(self._goto[0])
+
+    def iter_matches(self, text: str,
+                     accept: Optional[Callable[[int, int], bool]] = None) -> Iterator[Tuple[int, int, object]]:
+        """
+        Yield (start, end, value) for the longest term ending at each position.
+
+        Args:
+            text: Text to search
+            accept: Optional predicate on (start, end); a rejected term falls
+                back to the next shorter term ending at the same position
+
+        Returns:
+            Iterator of (start, end, value) tuples
+        """
+        goto = self._goto
+        fail = self._fail
+        out = self._out
+        output = self._output
+        state = 0
+
+        for position, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+
+            candidate = state if out[state] is not None else output[state]
+            while candidate:
+                length, value = out[candidate]
+                end = position + 1
+                if accept is None or accept(end - length, end):
+                    yield end - length, end, value
+                    break
+                candidate = output[candidate]
+
+
+def _is_word_char(char: str) -> bool:
+    return char.isalnum() or char == '_'
+
+
+def collect_identifying_terms(lines: List[str]) -> Dict[str, Tuple[str, str]]:
+    """
+    Collect names, identifiers and streets from the PID/NK1 segments of a message.
+
+    Args:
+        lines: Segment lines of one message
+
+    Returns:
+        Mapping of lower-cased term to (original value, kind)
+    """
+    terms: Dict[str, Tuple[str, str]] = {}
+
+    for line in lines:
+        segment_type = line[:3]
+        if segment_type not in ('PID', 'NK1'):
+            continue
+
+        fields = line.strip().split('|')
+        for term_segment, index, kinds in _TERM_FIELDS:
+            if term_segment != segment_type or index >= len(fields) or not fields[index]:
+                continue
+
+            for repetition in fields[index].split('~'):
+                components = repetition.split('^')
+                for position, kind in enumerate(kinds):
+                    if position >= len(components):
+                        break
+                    value = components[position].strip()
+                    if len(value) >= MIN_TERM_LENGTH:
+                        terms.setdefault(value.lower(), (value, kind))
+
+    return terms
+
+
+class FreeTextScrubber:
+    """Replaces message-specific terms and identifier patterns in free text."""
+
+    def __init__(self, terms: Dict[str, Tuple[str, str]],
+                 replace: Callable[[str, str], str]):
+        """
+        Initialize the scrubber.
+
+        Args:
+            terms: Mapping of lower-cased term to (original value, kind),
+                as returned by collect_identifying_terms()
+            replace: Callback returning the replacement for (kind, original value)
+        """
+        self._automaton = AhoCorasick(terms)
+        self._replace = replace
+
+    def _find_spans(self, text: str) -> List[Tuple[int, int, str, str]]:
+        """Find candidate (start, end, kind, value) spans from both matchers."""
+        spans = []
+
+        if self._automaton:
+            lowered = text.lower()
+            # Case-insensitive matching only when lower-casing keeps offsets intact
+            haystack = lowered if len(lowered) == len(text) else text
+            length = len(text)
+
+            def on_word_boundaries(start: int, end: int) -> bool:
+                return ((start == 0 or not _is_word_char(text[start - 1]))
+                        and (end == length or not _is_word_char(text[end])))
+
+            for start, end, (value, kind) in self._automaton.iter_matches(haystack, on_word_boundaries):
+                spans.append((start, end, kind, value))
+
+        for match in IDENTIFIER_PATTERN.finditer(text):
+            spans.append((match.start(), match.end(), match.lastgroup, match.group()))
+
+        return spans
+
+    def scrub(self, text: str) -> str:
+        """
+        Scrub a free-text value.
+
+        Overlapping matches are resolved leftmost-longest.
+
+        Args:
+            text: Free-text field value
+
+        Returns:
+            Text with identifying terms replaced
+        """
+        if not text:
+            return text
+
+        spans = self._find_spans(text)
+        if not spans:
+            return text
+
+        spans.sort(key=lambda span: (span[0], span[0] - span[1]))
+
+        pieces = []
+        position = 0
+        for start, end, kind, value in spans:
+            if start < position:
+                continue
+            pieces.append(text[position:start])
+            pieces.append(self._replace(kind, value))
+            position = end
+        pieces.append(text[position:])
+
+        return ''.join(pieces)
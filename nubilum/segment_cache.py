@@ -0,0 +1,169 @@
+"""Memoization of anonymized segments.
+
+Feeds from one interface repeat the same EVN, PV1, ORC or AIL segments
+thousands of times. A SegmentCache maps a keyed BLAKE2b digest of the raw
+segment line (keyed by the profile fingerprint and the pseudonym key) to the
+anonymized line, so repeated segments skip splitting and hashing. A line is
+stored the second time it is seen; lines that never repeat are not recorded.
+
+Cached and fresh output are identical because an entry is only stored when
+the segment's output depends on nothing but the line:
+
+- segments whose anonymization scrubbed free text (which depends on the names
+  of the whole message) are not cached
+- a pseudonym taken from the anonymizer's history must equal the one the
+  value would get fresh; otherwise (same value seen before with another
+  prefix, or restored state) the segment is not cached
+
+Each entry also lists the pseudonyms the segment creates, as offsets into the
+line, so a hit records them in the anonymizer's state (incremental state
+tokens and re-identification maps stay complete) and falls back to fresh
+anonymization if the anonymizer already holds a different pseudonym for one
+of those values. Only digests, anonymized lines and offsets are kept, never
+original values.
+"""
+
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ENTRIES = 65536
+DEFAULT_MAX_LINE_LENGTH = 4096
+
+# (kind, offset, length, pseudonym); kind is 'id' or 'name'
+Pseudonyms = Tuple[Tuple[str, int, int, str], ...]
+
+
+class SegmentCache:
+    """Bounded, thread-safe LRU cache of anonymized segment lines."""
+
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES,
+                 max_line_length: int = DEFAULT_MAX_LINE_LENGTH):
+        """
+        Args:
+            max_entries: Entries kept before the least recently used is evicted
+            max_line_length: Longer segments are not cached
+        """
+        self.max_entries = max_entries
+        self.max_line_length = max_line_length
+        self._entries: 'OrderedDict[bytes, Tuple[str, Pseudonyms]]' = OrderedDict()
+        self._seen: Set[bytes] = set()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.uncacheable = 0
+        self.conflicts = 0
+        self.evictions = 0
+
+    @staticmethod
+    def keyer(*parts: str):
+        """
+        Keyed BLAKE2b hasher for the lines of one anonymizer configuration.
+
+        Args:
+            parts: What else determines the output (profile fingerprint, key id)
+
+        Returns:
+            Hasher copied by key() for every line
+        """
+        context = hashlib.blake2b('\x1f'.join(parts).encode('utf-8'), digest_size=32).digest()
+        return hashlib.blake2b(digest_size=16, key=context)
+
+    def key(self, keyer, line: str) -> Optional[bytes]:
+        """Cache key of a segment line, or None if the line is too long to cache."""
+        if len(line) > self.max_line_length:
+            return None
+        hasher = keyer.copy()
+        hasher.update(line.encode('utf-8'))
+        return hasher.digest()
+
+    def get(self, key: bytes) -> Tuple[Optional[Tuple[str, Pseudonyms]], bool]:
+        """
+        Look up a segment line and mark its entry as recently used.
+
+        Lines are only admitted on their second miss (a doorkeeper set of
+        digests), so lines that never repeat, such as ones carrying unique
+        order numbers, cost a lookup but are never recorded or stored.
+
+        Returns:
+            ((anonymized line, pseudonyms) or None, whether to record the
+            line for put())
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry, False
+
+            self.misses += 1
+            if key in self._seen:
+                self._seen.discard(key)
+                return None, True
+            if len(self._seen) >= self.max_entries:
+                self._seen.clear()
+            self._seen.add(key)
+            return None, False
+
+    def put(self, key: bytes, line: str, pseudonyms: Pseudonyms) -> None:
+        """Store an anonymized line, evicting the least recently used entry when full."""
+        with self._lock:
+            self._entries[key] = (line, pseudonyms)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def record_hits(self, count: int) -> None:
+        """Count hits answered by an anonymizer's own memo of cached lines."""
+        with self._lock:
+            self.hits += count
+
+    def record_uncacheable(self) -> None:
+        """Count a segment whose output depends on more than its line."""
+        with self._lock:
+            self.uncacheable += 1
+
+    def record_conflict(self) -> None:
+        """Count a hit discarded because the anonymizer holds other pseudonyms."""
+        with self._lock:
+            self.conflicts += 1
+
+    def clear(self) -> None:
+        """Drop all entries (counters are kept)."""
+        with self._lock:
+            self._entries.clear()
+            self._seen.clear()
+
+    def stats(self) -> Dict:
+        """Counters and occupancy of this cache."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'uncacheable': self.uncacheable,
+                'conflicts': self.conflicts,
+                'evictions': self.evictions,
+            }
+
+
+def cache_from_env() -> Optional[SegmentCache]:
+    """
+    Create a cache from NUBILUM_SEGMENT_CACHE_SIZE (0 disables it).
+
+    Returns:
+        The cache, or None if disabled
+    """
+    max_entries = int(os.environ.get('NUBILUM_SEGMENT_CACHE_SIZE', DEFAULT_MAX_ENTRIES))
+    if max_entries <= 0:
+        return None
+    return SegmentCache(max_entries)
@@ -0,0 +1,93 @@
+"""Signed pseudonym-state tokens for incremental re-anonymization.
+
+The interactive editor keeps a state token between requests instead of the
+server keeping a session. The token carries the anonymizer's pseudonym maps
+and, per message, the names/identifiers found in each PID/NK1 segment (needed
+to scrub free text consistently). It is zlib-compressed JSON signed with
+HMAC-SHA256, so the server can trust it without storing anything.
+
+The token is not encrypted: it contains values from the messages the client
+itself submitted and must be handled like the input text.
+"""
+
+import base64
+import hashlib
+import hmac
+import json
+import time
+import zlib
+from typing import Dict
+
+DEFAULT_MAX_AGE = 8 * 3600  # seconds
+
+_VERSION = 1
+
+
+class StateTokenError(ValueError):
+    """Raised when a state token is malformed, tampered with or expired."""
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+def encode_state(state: Dict, key: bytes) -> str:
+    """
+    Serialize and sign a session state.
+
+    Args:
+        state: JSON-serializable state
+        key: HMAC key
+
+    Returns:
+        Opaque token string
+    """
+    payload = json.dumps({'v': _VERSION, 'iat': int(time.time()), 'state': state},
+                         separators=(',', ':')).encode('utf-8')
+    body = _b64encode(zlib.compress(payload, 6))
+    signature = hmac.new(key, body.encode('ascii'), hashlib.sha256).digest()
+    return f"{body}.{_b64encode(signature)}"
+
+
+def decode_state(token: str, key: bytes, max_age: int = DEFAULT_MAX_AGE) -> Dict:
+    """
+    Verify and deserialize a session state token.
+
+    Args:
+        token: Token returned by encode_state()
+        key: HMAC key
+        max_age: Maximum token age in seconds
+
+    Returns:
+        The state dictionary
+
+    Raises:
+        StateTokenError: If the token is invalid or expired
+    """
+    if not isinstance(token, str) or token.count('.') != 1 or not token.isascii():
+        raise StateTokenError("Malformed state token")
+
+    body, signature = token.split('.')
+    expected = hmac.new(key, body.encode('ascii'), hashlib.sha256).digest()
+    try:
+        valid = hmac.compare_digest(expected, _b64decode(signature))
+    except (ValueError, TypeError):
+        valid = False
+    if not valid:
+        raise StateTokenError("Invalid state token signature")
+
+    try:
+        payload = json.loads(zlib.decompress(_b64decode(body)))
+    except (ValueError, zlib.error) as e:
+        raise StateTokenError("Corrupt state token") from e
+
+    if payload.get('v') != _VERSION:
+        raise StateTokenError("Unsupported state token version")
+    if time.time() - payload.get('iat', 0) > max_age:
+        raise StateTokenError("State token expired, anonymize the full text again")
+
+    return payload['state']
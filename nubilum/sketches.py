@@ -0,0 +1,283 @@
+"""Mergeable probabilistic sketches for usage analytics.
+
+Usage sketches are updated per worker and day as events are tracked, then
+merged (see nubilum.usage_sketches). HyperLogLog and DDSketch merge exactly: merging the
+sketches of two halves of a log gives the same sketch as one pass over it.
+SpaceSaving counts are exact while fewer items than its capacity were seen,
+and keep an overcount bound per item otherwise.
+
+- HyperLogLog: distinct counts (senders, facilities, message control IDs)
+  in at most 2**precision bytes, about 1.6% standard error at precision 12
+- DDSketch: quantiles (message length, segments per message) with a bounded
+  relative error, one counter per logarithmic bucket
+- SpaceSaving: the most frequent items (senders) in a fixed number of
+  counters, with an upper bound on the overcount of each
+
+All sketches serialize to small JSON-compatible dicts.
+"""
+
+import base64
+import hashlib
+import math
+import zlib
+from typing import Dict, Hashable, Iterable, List, Optional, Tuple
+
+DEFAULT_PRECISION = 12
+DEFAULT_RELATIVE_ACCURACY = 0.01
+DEFAULT_CAPACITY = 100
+
+_MASK64 = (1 << 64) - 1
+
+
+def hash64(value: str) -> int:
+    """64-bit hash of a string, as added to a HyperLogLog."""
+    return int.from_bytes(hashlib.blake2b(value.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+class HyperLogLog:
+    """HyperLogLog distinct counter over 64-bit hashes."""
+
+    __slots__ = ('precision', '_sparse', '_registers')
+
+    def __init__(self, precision: int = DEFAULT_PRECISION):
+        """
+        Args:
+            precision: Index bits; 2**precision registers
+        """
+        self.precision = precision
+        # Few distinct values: {register: rank}; dense bytearray once that is larger
+        self._sparse: Optional[Dict[int, int]] = {}
+        self._registers: Optional[bytearray] = None
+
+    def add_hash(self, value: int) -> None:
+        """Add a 64-bit hash (see hash64)."""
+        precision = self.precision
+        index = value >> (64 - precision)
+        remainder = (value << precision) & _MASK64
+        rank = 64 - precision + 1 if remainder == 0 else 65 - remainder.bit_length()
+        self._set(index, rank)
+
+    def add(self, value: str) -> None:
+        """Add a string value."""
+        self.add_hash(hash64(value))
+
+    def _set(self, index: int, rank: int) -> None:
+        sparse = self._sparse
+        if sparse is not None:
+            if rank > sparse.get(index, 0):
+                sparse[index] = rank
+                if len(sparse) > (1 << self.precision) // 8:
+                    self._densify()
+        elif rank > self._registers[index]:
+            self._registers[index] = rank
+
+    def _densify(self) -> None:
+        registers = bytearray(1 << self.precision)
+        for index, rank in self._sparse.items():
+            registers[index] = rank
+        self._registers = registers
+        self._sparse = None
+
+    def merge(self, other: 'HyperLogLog') -> 'HyperLogLog':
+        """Take the register maxima of another sketch of the same precision (returns self)."""
+        if other.precision != self.precision:
+            raise ValueError("Cannot merge HyperLogLogs of different precision")
+        if other._sparse is not None:
+            for index, rank in other._sparse.items():
+                self._set(index, rank)
+            return self
+        if self._sparse is not None:
+            self._densify()
+        self._registers = bytearray(map(max, self._registers, other._registers))
+        return self
+
+    def count(self) -> int:
+        """Estimated number of distinct values."""
+        m = 1 << self.precision
+        if self._sparse is not None:
+            ranks = list(self._sparse.values())
+            zeros = m - len(ranks)
+            harmonic = zeros + sum(2.0 ** -rank for rank in ranks)
+        else:
+            zeros = self._registers.count(0)
+            harmonic = sum(2.0 ** -rank for rank in self._registers)
+
+        estimate = 0.7213 / (1 + 1.079 / m) * m * m / harmonic
+        if estimate <= 2.5 * m and zeros:
+            # Linear counting is more accurate for small cardinalities
+            estimate = m * math.log(m / zeros)
+        return round(estimate)
+
+    def to_dict(self) -> Dict:
+        """Compact form: sparse [register, rank] pairs, or zlib-compressed registers in base64."""
+        if self._sparse is not None:
+            return {'p': self.precision, 'sparse': sorted(self._sparse.items())}
+        return {'p': self.precision,
+                'dense': base64.b64encode(zlib.compress(bytes(self._registers))).decode('ascii')}
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'HyperLogLog':
+        """Rebuild a sketch saved with to_dict()."""
+        sketch = cls(data['p'])
+        if 'dense' in data:
+            sketch._sparse = None
+            sketch._registers = bytearray(zlib.decompress(base64.b64decode(data['dense'])))
+        else:
+            sketch._sparse = {index: rank for index, rank in data['sparse']}
+        return sketch
+
+
+class DDSketch:
+    """Quantile sketch with relative accuracy, for non-negative values."""
+
+    __slots__ = ('relative_accuracy', '_gamma', '_log_gamma', 'zero_count', 'bins')
+
+    def __init__(self, relative_accuracy: float = DEFAULT_RELATIVE_ACCURACY):
+        """
+        Args:
+            relative_accuracy: Maximum relative error of a returned quantile
+        """
+        self.relative_accuracy = relative_accuracy
+        self._gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self._gamma)
+        self.zero_count = 0
+        self.bins: Dict[int, int] = {}
+
+    @property
+    def count(self) -> int:
+        return self.zero_count + sum(self.bins.values())
+
+    def add(self, value: float, count: int = 1) -> None:
+        """Add a value (count times)."""
+        if value <= 0:
+            self.zero_count += count
+            return
+        key = math.ceil(math.log(value) / self._log_gamma)
+        self.bins[key] = self.bins.get(key, 0) + count
+
+    def merge(self, other: 'DDSketch') -> 'DDSketch':
+        """Add another sketch's bucket counts (returns self)."""
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Cannot merge DDSketches of different accuracy")
+        self.zero_count += other.zero_count
+        bins = self.bins
+        for key, count in other.bins.items():
+            bins[key] = bins.get(key, 0) + count
+        return self
+
+    def quantiles(self, quantiles: Iterable[float]) -> List[Optional[float]]:
+        """
+        Estimate several quantiles in one pass over the buckets.
+
+        Args:
+            quantiles: Values in [0, 1]
+
+        Returns:
+            Estimates in the same order (None for an empty sketch)
+        """
+        quantiles = list(quantiles)
+        total = self.count
+        if total == 0:
+            return [None] * len(quantiles)
+
+        order = sorted(range(len(quantiles)), key=lambda i: quantiles[i])
+        results: List[Optional[float]] = [None] * len(quantiles)
+        buckets = [(None, self.zero_count)] + sorted(self.bins.items())
+        position = 0
+        seen = buckets[0][1]
+
+        for i in order:
+            rank = quantiles[i] * (total - 1)
+            while seen <= rank:
+                position += 1
+                seen += buckets[position][1]
+            key = buckets[position][0]
+            results[i] = 0.0 if key is None else 2 * self._gamma ** key / (self._gamma + 1)
+        return results
+
+    def to_dict(self) -> Dict:
+        """Compact form: zero count and sorted [bucket, count] pairs."""
+        return {'alpha': self.relative_accuracy, 'zero': self.zero_count,
+                'bins': sorted(self.bins.items())}
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'DDSketch':
+        """Rebuild a sketch saved with to_dict()."""
+        sketch = cls(data['alpha'])
+        sketch.zero_count = data['zero']
+        sketch.bins = {key: count for key, count in data['bins']}
+        return sketch
+
+
+class SpaceSaving:
+    """Space-Saving top-K summary: approximate counts of the most frequent items."""
+
+    __slots__ = ('capacity', 'counters')
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY):
+        """
+        Args:
+            capacity: Items monitored; counts are exact while fewer distinct items were seen
+        """
+        self.capacity = capacity
+        # item -> [count, overcount bound]
+        self.counters: Dict[Hashable, List[int]] = {}
+
+    def _min_count(self) -> int:
+        """Count every unmonitored item may have had (0 until the summary is full)."""
+        if len(self.counters) < self.capacity:
+            return 0
+        return min(count for count, _ in self.counters.values())
+
+    def add(self, item: Hashable, count: int = 1) -> None:
+        """Count an item (count times), replacing the least frequent one when full."""
+        counter = self.counters.get(item)
+        if counter is not None:
+            counter[0] += count
+        elif len(self.counters) < self.capacity:
+            self.counters[item] = [count, 0]
+        else:
+            smallest = min(self.counters, key=lambda key: self.counters[key][0])
+            floor = self.counters.pop(smallest)[0]
+            self.counters[item] = [floor + count, floor]
+
+    def merge(self, other: 'SpaceSaving') -> 'SpaceSaving':
+        """Combine with another summary, keeping the `capacity` largest counts (returns self)."""
+        own_floor, other_floor = self._min_count(), other._min_count()
+        merged = {}
+        for item in self.counters.keys() | other.counters.keys():
+            count, error = self.counters.get(item, (own_floor, own_floor))
+            other_count, other_error = other.counters.get(item, (other_floor, other_floor))
+            merged[item] = [count + other_count, error + other_error]
+
+        if len(merged) > self.capacity:
+            kept = sorted(merged.items(), key=lambda kv: (-kv[1][0], repr(kv[0])))[:self.capacity]
+            merged = dict(kept)
+        self.counters = merged
+        return self
+
+    def top(self, k: Optional[int] = None) -> List[Tuple[Hashable, int, int]]:
+        """
+        The most frequent items.
+
+        Args:
+            k: Number of items (default: all monitored items)
+
+        Returns:
+            (item, count, overcount bound) tuples, most frequent first
+        """
+        ranked = sorted(self.counters.items(), key=lambda kv: (-kv[1][0], repr(kv[0])))
+        return [(item, count, error) for item, (count, error) in ranked[:k]]
+
+    def to_dict(self) -> Dict:
+        """Compact form: [item, count, error] triples (tuple items become lists)."""
+        return {'capacity': self.capacity,
+                'items': [[item, count, error] for item, (count, error) in self.counters.items()]}
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'SpaceSaving':
+        """Rebuild a summary saved with to_dict()."""
+        summary = cls(data['capacity'])
+        for item, count, error in data['items']:
+            summary.counters[tuple(item) if isinstance(item, list) else item] = [count, error]
+        return summary
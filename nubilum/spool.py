@@ -0,0 +1,502 @@
+"""Spool-directory ingestion daemon.
+
+Watches inbound spool directories (where an interface engine drops HL7
+files), anonymizes every new file and writes the result atomically to the
+outbound directory under the same name (temporary file + rename), then
+removes the input.
+
+- New files are detected with inotify (``IN_CLOSE_WRITE``/``IN_MOVED_TO``)
+  through ctypes; where inotify is unavailable the directories are polled
+  and a file is picked up once its size and mtime stop changing.
+- Files that arrive together are grouped into batches (up to ``batch_size``
+  files, spread over the workers) and anonymized in a bounded process pool;
+  at most two batches per worker are in flight, the rest wait in the queue.
+- A file that cannot be decoded, exceeds the ingest limits or fails to
+  anonymize is moved to the quarantine directory with a ``.error.json``
+  sidecar (error and positions only, never message content).
+- A file whose output cannot be written (e.g. outbound disk full) stays in
+  the spool and is retried with exponential backoff (``retry_delay``, up to
+  five minutes), since the watchers will not report it again.
+- Throughput and queue depth are written to ``status.json`` in the state
+  directory (``nubilum spool status``).
+
+Files whose name starts with a dot are ignored, so writers can create
+``.name.tmp`` and rename it when complete.
+"""
+
+import ctypes
+import ctypes.util
+import errno
+import logging
+import math
+import os
+import select
+import shutil
+import signal
+import struct
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+from nubilum import ingest
+from nubilum.anonymizer import HL7Anonymizer
+from nubilum.fileutil import atomic_write_bytes, atomic_write_json, read_json
+from nubilum.profiles import AnonymizationProfile
+from nubilum.segment_cache import SegmentCache, cache_from_env
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 2
+DEFAULT_BATCH_SIZE = 32
+DEFAULT_POLL_INTERVAL = 1.0
+DEFAULT_MAX_FILE_SIZE = 64 * 1024 * 1024
+DEFAULT_RETRY_DELAY = 5.0
+
+STATUS_FILE = 'status.json'
+QUARANTINE_DIR = 'quarantine'
+
+_STATUS_INTERVAL = 1.0
+_MAX_RETRY_DELAY = 300.0
+
+# inotify(7)
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_TO = 0x00000080
+_IN_Q_OVERFLOW = 0x00004000
+_IN_ISDIR = 0x40000000
+_EVENT = struct.Struct('iIII')
+
+
+class SpoolError(Exception):
+    """Raised when the spool directories cannot be watched."""
+
+
+def _is_candidate(path: Path) -> bool:
+    return not path.name.startswith('.') and path.is_file()
+
+
+def _scan(directories: Sequence[Path]) -> List[Path]:
+    """Files currently waiting in the inbound directories, oldest first."""
+    files = []
+    for directory in directories:
+        for path in directory.iterdir():
+            if _is_candidate(path):
+                try:
+                    files.append((path.stat().st_mtime, path))
+                except FileNotFoundError:
+                    pass
+    return [path for _, path in sorted(files)]
+
+
+class _InotifyWatcher:
+    """Reports files closed after writing or moved into the directories."""
+
+    name = 'inotify'
+
+    def __init__(self, directories: Sequence[Path]):
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        if not hasattr(libc, 'inotify_init1'):
+            raise OSError(errno.ENOSYS, "inotify is not available")
+
+        self.directories = list(directories)
+        self._fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+        self._watches: Dict[int, Path] = {}
+        for directory in self.directories:
+            wd = libc.inotify_add_watch(self._fd, os.fsencode(str(directory)),
+                                        _IN_CLOSE_WRITE | _IN_MOVED_TO)
+            if wd < 0:
+                os.close(self._fd)
+                raise OSError(ctypes.get_errno(), f"Cannot watch {directory}")
+            self._watches[wd] = directory
+
+    def wait(self, timeout: float) -> List[Path]:
+        readable, _, _ = select.select([self._fd], [], [], timeout)
+        if not readable:
+            return []
+
+        data = b''
+        while True:
+            try:
+                data += os.read(self._fd, 64 * 1024)
+            except BlockingIOError:
+                break
+
+        paths = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = _EVENT.unpack_from(data, offset)
+            name = data[offset + _EVENT.size:offset + _EVENT.size + length].rstrip(b'\0')
+            offset += _EVENT.size + length
+
+            if mask & _IN_Q_OVERFLOW:
+                logger.warning("inotify queue overflowed; rescanning spool directories")
+                return _scan(self.directories)
+            if mask & _IN_ISDIR or wd not in self._watches or name.startswith(b'.'):
+                continue
+            paths.append(self._watches[wd] / os.fsdecode(name))
+
+        return paths
+
+    def close(self) -> None:
+        os.close(self._fd)
+
+
+class _PollingWatcher:
+    """Reports files whose size and mtime did not change between two scans."""
+
+    name = 'polling'
+
+    def __init__(self, directories: Sequence[Path], interval: float = DEFAULT_POLL_INTERVAL):
+        self.directories = list(directories)
+        self.interval = interval
+        self._seen: Dict[Path, tuple] = {}
+        self._reported = set()
+        self._next_scan = 0.0
+
+    def wait(self, timeout: float) -> List[Path]:
+        delay = self._next_scan - time.monotonic()
+        if delay > timeout:
+            time.sleep(timeout)
+            return []
+        time.sleep(max(0.0, delay))
+        self._next_scan = time.monotonic() + self.interval
+
+        current = {}
+        for directory in self.directories:
+            for path in directory.iterdir():
+                try:
+                    if _is_candidate(path):
+                        stat = path.stat()
+                        current[path] = (stat.st_size, stat.st_mtime_ns)
+                except FileNotFoundError:
+                    pass
+
+        stable = [path for path, signature in current.items()
+                  if self._seen.get(path) == signature and path not in self._reported]
+        self._reported = {path for path in self._reported if path in current}
+        self._reported.update(stable)
+        self._seen = current
+        return stable
+
+    def close(self) -> None:
+        pass
+
+
+def _make_watcher(directories: Sequence[Path], poll_interval: float):
+    try:
+        return _InotifyWatcher(directories)
+    except (OSError, AttributeError, TypeError) as e:
+        logger.info(f"inotify unavailable ({e}); polling spool directories every {poll_interval}s")
+        return _PollingWatcher(directories, poll_interval)
+
+
+def _quarantine(path: Path, quarantine_dir: Path, error: str) -> None:
+    """Move a poison file out of the spool with a sidecar describing the error."""
+    target = quarantine_dir / path.name
+    if target.exists():
+        target = quarantine_dir / f"{path.stem}-{time.time_ns()}{path.suffix}"
+    shutil.move(str(path), str(target))  # the state directory may be on another filesystem
+    atomic_write_json(target.with_name(target.name + '.error.json'), {
+        'file': path.name,
+        'source': str(path.parent),
+        'error': error,
+        'quarantined_at': datetime.now().isoformat(),
+    }, fsync=False)
+
+
+def _process_file(path: Path, outbound_dir: Path, quarantine_dir: Path,
+                  profile: Optional[AnonymizationProfile], encoding: str,
+                  limits: ingest.IngestLimits, max_file_size: int,
+                  segment_cache: Optional[SegmentCache] = None) -> Dict:
+    """Anonymize one spooled file; returns its outcome."""
+    result = {'file': str(path), 'state': 'done', 'messages': 0, 'bytes': 0,
+              'cached_segments': 0, 'error': None}
+
+    try:
+        size = path.stat().st_size
+        if size > max_file_size:
+            raise ValueError(f"File is larger than {max_file_size} bytes")
+        data = path.read_bytes()
+    except FileNotFoundError:
+        result['state'] = 'missing'
+        return result
+    except (OSError, ValueError) as e:
+        error = str(e)
+    else:
+        result['bytes'] = len(data)
+        try:
+            text = data.decode(encoding).replace('\r\n', '\n').replace('\r', '\n')
+            messages = ingest.split_messages(text, limits)
+            if not messages:
+                raise ValueError("No HL7 messages found")
+
+            hits_before = segment_cache.hits if segment_cache is not None else 0
+            anonymizer = HL7Anonymizer(profile=profile, segment_cache=segment_cache)
+            output = ''.join(anonymizer.anonymize_message(message) + '\n\n' for message in messages)
+            if segment_cache is not None:
+                result['cached_segments'] = segment_cache.hits - hits_before
+        except UnicodeDecodeError as e:
+            error = f"Not valid {encoding} at byte {e.start}"
+        except Exception as e:
+            error = str(e)
+        else:
+            try:
+                atomic_write_bytes(outbound_dir / path.name, output.encode(encoding))
+                path.unlink()
+            except OSError as e:
+                # Not the file's fault (e.g. outbound disk full): leave it in the spool
+                logger.error(f"Cannot write output for {path.name}: {e}")
+                result['state'] = 'failed'
+                result['error'] = str(e)
+                return result
+            result['messages'] = len(messages)
+            return result
+
+    logger.warning(f"Quarantining {path.name}: {error}")
+    try:
+        _quarantine(path, quarantine_dir, error)
+    except FileNotFoundError:
+        result['state'] = 'missing'
+        return result
+
+    result['state'] = 'quarantined'
+    result['error'] = error
+    return result
+
+
+# Set in each pool worker by _init_worker
+_worker_settings: Dict = {}
+
+
+def _init_worker(settings: Dict) -> None:
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _worker_settings.update(settings)
+    # Segments repeat across the files of an interface; kept for the worker's lifetime
+    _worker_settings['segment_cache'] = cache_from_env()
+
+
+def _process_batch(paths: List[str]) -> List[Dict]:
+    """Process a batch of files in a pool worker."""
+    settings = _worker_settings
+    return [_process_file(Path(path), settings['outbound_dir'], settings['quarantine_dir'],
+                          settings['profile'], settings['encoding'], settings['limits'],
+                          settings['max_file_size'], settings['segment_cache'])
+            for path in paths]
+
+
+class SpoolDaemon:
+    """Watches inbound directories and anonymizes new files into an outbound directory."""
+
+    def __init__(self, inbound_dirs: Sequence, outbound_dir, state_dir=None,
+                 workers: int = DEFAULT_WORKERS, batch_size: int = DEFAULT_BATCH_SIZE,
+                 profile: Optional[AnonymizationProfile] = None, encoding: str = 'utf-8',
+                 poll_interval: float = DEFAULT_POLL_INTERVAL,
+                 max_file_size: int = DEFAULT_MAX_FILE_SIZE,
+                 limits: Optional[ingest.IngestLimits] = None,
+                 use_inotify: bool = True, retry_delay: float = DEFAULT_RETRY_DELAY):
+        """
+        Initialize the daemon.
+
+        Args:
+            inbound_dirs: Directories the interface engine writes to
+            outbound_dir: Directory for anonymized files
+            state_dir: Directory for the quarantine and status file
+                (default: <outbound_dir>/.nubilum-spool)
+            workers: Anonymization processes
+            batch_size: Maximum files handed to a worker at once
+            profile: Anonymization profile (default: built-in rules)
+            encoding: Character encoding of the files
+            poll_interval: Seconds between scans when polling
+            max_file_size: Larger files are quarantined without being read
+            limits: Ingest limits per file (default: the job limits from the environment)
+            use_inotify: Use inotify when available (otherwise always poll)
+            retry_delay: Seconds before a file whose output could not be
+                written is retried (doubled on every further failure)
+        """
+        if workers < 1 or batch_size < 1:
+            raise SpoolError("workers and batch_size must be at least 1")
+
+        self.inbound_dirs = [Path(d) for d in inbound_dirs]
+        self.outbound_dir = Path(outbound_dir)
+        self.state_dir = Path(state_dir) if state_dir else self.outbound_dir / '.nubilum-spool'
+        self.quarantine_dir = self.state_dir / QUARANTINE_DIR
+        self.status_file = self.state_dir / STATUS_FILE
+        self.workers = workers
+        self.batch_size = batch_size
+        self.profile = profile
+        self.encoding = encoding
+        self.poll_interval = poll_interval
+        self.max_file_size = max_file_size
+        self.limits = limits or ingest.IngestLimits.from_env(
+            'NUBILUM_MAX_JOB_MESSAGES', ingest.DEFAULT_MAX_JOB_MESSAGES)
+        self.use_inotify = use_inotify
+        self.retry_delay = retry_delay
+
+        self._stop = threading.Event()
+        self._pending: deque = deque()
+        self._queued = set()
+        # File -> (monotonic time of the next attempt, failed attempts)
+        self._retries: Dict[str, tuple] = {}
+        self._in_flight: Dict = {}
+        self._counters = {'files_processed': 0, 'files_quarantined': 0, 'files_failed': 0,
+                          'messages_processed': 0, 'bytes_processed': 0, 'cached_segments': 0}
+        self._started = 0.0
+        self._started_at = None
+        self._watcher_name = None
+        self._last_status = 0.0
+
+    def stop(self) -> None:
+        """Ask run() to return once the batches in flight have finished."""
+        self._stop.set()
+
+    def _enqueue(self, paths: Sequence[Path]) -> None:
+        for path in paths:
+            key = str(path)
+            if key not in self._queued:
+                self._queued.add(key)
+                self._pending.append(key)
+
+    def _enqueue_retries(self) -> None:
+        """Queue the failed files whose backoff has elapsed."""
+        now = time.monotonic()
+        for path, (retry_at, attempts) in list(self._retries.items()):
+            if retry_at <= now:
+                # Not due again until this attempt has failed too
+                self._retries[path] = (math.inf, attempts)
+                self._enqueue([Path(path)])
+
+    def _retry_wait(self, timeout: float) -> float:
+        """Shorten a watcher wait so the next retry is not delayed."""
+        if not self._retries:
+            return timeout
+        return max(0.0, min(timeout, min(retry_at for retry_at, _ in self._retries.values()) - time.monotonic()))
+
+    def _next_batch(self) -> List[str]:
+        # Spread a burst over all workers rather than filling one batch
+        size = min(self.batch_size, max(1, math.ceil(len(self._pending) / self.workers)))
+        return [self._pending.popleft() for _ in range(min(size, len(self._pending)))]
+
+    def _record(self, results: List[Dict]) -> None:
+        for result in results:
+            self._queued.discard(result['file'])
+            if result['state'] == 'done':
+                self._counters['files_processed'] += 1
+                self._counters['messages_processed'] += result['messages']
+                self._counters['bytes_processed'] += result['bytes']
+                self._counters['cached_segments'] += result['cached_segments']
+            elif result['state'] == 'quarantined':
+                self._counters['files_quarantined'] += 1
+            elif result['state'] == 'failed':
+                self._counters['files_failed'] += 1
+                _, attempts = self._retries.get(result['file'], (0.0, 0))
+                delay = min(self.retry_delay * 2 ** attempts, _MAX_RETRY_DELAY)
+                self._retries[result['file']] = (time.monotonic() + delay, attempts + 1)
+                continue
+            self._retries.pop(result['file'], None)
+
+    def status(self, state: str = 'running') -> Dict:
+        """Current counters, throughput and queue depth."""
+        elapsed = time.monotonic() - self._started if self._started else 0.0
+        counters = self._counters
+        return {
+            'state': state,
+            'inbound': [str(d) for d in self.inbound_dirs],
+            'outbound': str(self.outbound_dir),
+            'watcher': self._watcher_name,
+            'workers': self.workers,
+            **counters,
+            'queue_depth': len(self._pending),
+            'retry_pending': len(self._retries),
+            'in_flight': sum(len(batch) for batch in self._in_flight.values()),
+            'files_per_second': round(counters['files_processed'] / elapsed, 2) if elapsed > 0 else 0.0,
+            'messages_per_second': round(counters['messages_processed'] / elapsed, 2) if elapsed > 0 else 0.0,
+            'started_at': self._started_at,
+            'updated_at': datetime.now().isoformat(),
+        }
+
+    def _write_status(self, state: str = 'running', force: bool = False) -> None:
+        now = time.monotonic()
+        if force or now - self._last_status >= _STATUS_INTERVAL:
+            self._last_status = now
+            atomic_write_json(self.status_file, self.status(state), fsync=False)
+
+    def run(self) -> Dict:
+        """
+        Process the files already waiting, then watch for new ones until stop().
+
+        Returns:
+            Final status
+        """
+        for directory in self.inbound_dirs:
+            if not directory.is_dir():
+                raise SpoolError(f"Inbound directory does not exist: {directory}")
+        self.outbound_dir.mkdir(parents=True, exist_ok=True)
+        self.quarantine_dir.mkdir(parents=True, exist_ok=True)
+
+        watcher = _make_watcher(self.inbound_dirs, self.poll_interval) if self.use_inotify \
+            else _PollingWatcher(self.inbound_dirs, self.poll_interval)
+        self._watcher_name = watcher.name
+        self._started = time.monotonic()
+        self._started_at = datetime.now().isoformat()
+
+        # Watch before scanning, so files arriving in between are not missed
+        self._enqueue(_scan(self.inbound_dirs))
+        logger.info(f"Watching {', '.join(map(str, self.inbound_dirs))} ({watcher.name}), "
+                    f"{len(self._pending)} file(s) waiting")
+
+        settings = {
+            'outbound_dir': self.outbound_dir,
+            'quarantine_dir': self.quarantine_dir,
+            'profile': self.profile,
+            'encoding': self.encoding,
+            'limits': self.limits,
+            'max_file_size': self.max_file_size,
+        }
+
+        try:
+            with ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                     initargs=(settings,)) as pool:
+                while not self._stop.is_set() or self._in_flight:
+                    busy = self._in_flight or self._pending
+                    if not self._stop.is_set():
+                        self._enqueue(watcher.wait(self._retry_wait(0.05 if busy else self.poll_interval)))
+                        self._enqueue_retries()
+
+                    while (self._pending and not self._stop.is_set()
+                           and len(self._in_flight) < self.workers * 2):
+                        batch = self._next_batch()
+                        self._in_flight[pool.submit(_process_batch, batch)] = batch
+
+                    for future in [f for f in self._in_flight if f.done()]:
+                        del self._in_flight[future]
+                        try:
+                            self._record(future.result())
+                        except BrokenProcessPool as e:
+                            # A worker died (e.g. killed by the OOM killer); unprocessed
+                            # files stay in the spool and are picked up on restart
+                            raise SpoolError(f"Anonymization worker died: {e}") from e
+
+                    if self._stop.is_set() and self._in_flight:
+                        time.sleep(0.05)
+
+                    self._write_status()
+        finally:
+            watcher.close()
+            final = self.status('stopped')
+            atomic_write_json(self.status_file, final, fsync=False)
+
+        logger.info(f"Spool daemon stopped: {final['files_processed']} file(s), "
+                    f"{final['files_quarantined']} quarantined")
+        return final
+
+
+def read_status(state_dir) -> Optional[Dict]:
+    """Read the status file of a spool daemon, or None if it has not started."""
+    return read_json(Path(state_dir) / STATUS_FILE)
@@ -1,10 +1,10 @@
-const { useState, useEffect } = React;
+const { useState, useEffect, useMemo } = React;
 
 // Cache for field names to avoid repeated API calls
 const fieldNameCache = {};
 
 // HL7 Message Display Component with inline editing
-function HL7MessageDisplay({ message, originalMessage = '' }) {
+function HL7MessageDisplay({ message, originalMessage = '', changeMap = null }) {
     const [fieldNameTooltip, setFieldNameTooltip] = useState(null);
     const [tooltipPosition, setTooltipPosition] = useState({ x: 0, y: 0 });
     const [hl7Version, setHl7Version] = useState('2.5');
@@ -29,6 +29,27 @@ function HL7MessageDisplay({ message, originalMessage = '' }) {
         }
     }, [message]);
 
+    // Index the server's change map by displayed line: "field:component" -> transform kind
+    const changesByLine = useMemo(() => {
+        if (!changeMap || !message) return null;
+
+        const index = {};
+        const segmentCounts = message.split('\n\n').map(msg => msg.split('\n').length);
+        let firstLine = 0;
+
+        changeMap.messages.forEach((entry, messageIdx) => {
+            Object.entries(entry.fields).forEach(([label, name]) => {
+                fieldNameCache[`${label}-${entry.version}`] = `${label}: ${name}`;
+            });
+            entry.changes.forEach(([segment, field, component, , , kind]) => {
+                const line = (index[firstLine + segment] = index[firstLine + segment] || {});
+                line[`${field}:${component === null ? '*' : component}`] = kind;
+            });
+            firstLine += segmentCounts[messageIdx] || 0;
+        });
+        return index;
+    }, [changeMap, message]);
+
     // Fetch field name from API
     const fetchFieldName = async (segmentType, fieldIndex) => {
         const cacheKey = `${segmentType}-${fieldIndex}-${hl7Version}`;
@@ -58,11 +79,11 @@ function HL7MessageDisplay({ message, originalMessage = '' }) {
     };
 
     // Handle mouse enter on field
-    const handleFieldMouseEnter = async (e, segmentType, fieldIndex) => {
+    const handleFieldMouseEnter = async (e, segmentType, fieldIndex, kind) => {
         const rect = e.currentTarget.getBoundingClientRect();
         const fieldName = await fetchFieldName(segmentType, fieldIndex);
 
-        setFieldNameTooltip(fieldName);
+        setFieldNameTooltip(kind ? `${fieldName} (${kind})` : fieldName);
         setTooltipPosition({
             x: rect.left + rect.width / 2,
             y: rect.top - 10
@@ -84,11 +105,29 @@ function HL7MessageDisplay({ message, originalMessage = '' }) {
         });
     };
 
-    // Check if a component has changed by comparing with original
-    const hasComponentChanged = (lineIndex, fieldIndex, compIndex, component) => {
-        if (!originalMessage || originalMessage.trim() === '') return false;
+    const originalParsed = useMemo(() => parseMessage(originalMessage), [originalMessage]);
 
-        const originalParsed = parseMessage(originalMessage);
+    // Transform kind of a changed component, or null if unchanged
+    const componentChange = (lineIndex, fieldIndex, compIndex) => {
+        const line = changesByLine[lineIndex];
+        if (!line) return null;
+        return line[`${fieldIndex}:*`] || line[`${fieldIndex}:${compIndex + 1}`] || null;
+    };
+
+    // Transform kinds applied to a field, for its tooltip
+    const fieldChangeKinds = (lineIndex, fieldIndex) => {
+        const line = changesByLine && changesByLine[lineIndex];
+        if (!line) return null;
+        const kinds = Object.keys(line)
+            .filter(key => key.split(':')[0] === String(fieldIndex))
+            .map(key => line[key]);
+        return kinds.length ? [...new Set(kinds)].join(', ') : null;
+    };
+
+    // Check if a component has changed, from the change map or by comparing with original
+    const hasComponentChanged = (lineIndex, fieldIndex, compIndex, component) => {
+        if (changesByLine) return componentChange(lineIndex, fieldIndex, compIndex) !== null;
+        if (originalParsed.length === 0) return false;
 
         if (lineIndex >= originalParsed.length) return false;
         if (fieldIndex >= originalParsed[lineIndex].length) return false;
@@ -136,7 +175,7 @@ function HL7MessageDisplay({ message, originalMessage = '' }) {
                                 )}
                                 <span
                                     className="hl7-field"
-                                    onMouseEnter={(e) => handleFieldMouseEnter(e, segmentType, fieldIndex)}
+                                    onMouseEnter={(e) => handleFieldMouseEnter(e, segmentType, fieldIndex, fieldChangeKinds(lineIndex, fieldIndex))}
                                     onMouseLeave={handleFieldMouseLeave}
                                 >
                                     {field.split('^').map((component, compIndex) => {
@@ -217,6 +256,30 @@ function ExampleModal({ isOpen, onClose, onSelect }) {
     );
 }
 
+// Split input into messages and segments the same way the server does
+// (split_messages() and anonymize_message()), so indices line up
+const splitSegments = (text) => {
+    const messages = [];
+    let current = null;
+
+    text.split('\n').forEach((line) => {
+        const stripped = line.trim();
+        if (!stripped) {
+            return;
+        }
+        if (current === null || (stripped.startsWith('MSH|') && current.length > 0)) {
+            current = [];
+            messages.push(current);
+        }
+        current.push(stripped);
+    });
+
+    return messages;
+};
+
+const sameStructure = (a, b) =>
+    a.length === b.length && a.every((segments, idx) => segments.length === b[idx].length);
+
 // Main App Component
 function App() {
     const [inputMessage, setInputMessage] = useState('');
@@ -228,6 +291,10 @@ function App() {
     const [showExampleModal, setShowExampleModal] = useState(false);
     const [validationResult, setValidationResult] = useState(null);
     const [expandedValidations, setExpandedValidations] = useState({});
+    // Last full anonymization: state token plus input/output segments for incremental updates
+    const [anonymizationState, setAnonymizationState] = useState(null);
+    // Where the server rewrote the last full output (dropped after incremental updates)
+    const [changeMap, setChangeMap] = useState(null);
 
     useEffect(() => {
         // Fetch version on load
@@ -247,18 +314,33 @@ function App() {
         setAlert(null);
 
         try {
+            const segments = splitSegments(inputMessage);
+
+            // Only re-send edited segments when the message structure is unchanged
+            if (anonymizationState && sameStructure(segments, anonymizationState.input)) {
+                if (await anonymizeIncrementally(segments)) {
+                    return;
+                }
+            }
+
             const response = await fetch('/api/anonymize', {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
                 },
-                body: JSON.stringify({ message: inputMessage }),
+                body: JSON.stringify({ message: inputMessage, include_state: true, include_changes: true }),
             });
 
             const data = await response.json();
 
             if (data.success) {
                 setOutputMessage(data.anonymized_message);
+                setChangeMap(data.change_map || null);
+                setAnonymizationState(data.state ? {
+                    token: data.state,
+                    input: segments,
+                    output: data.anonymized_message.split('\n\n').map(message => message.split('\n')),
+                } : null);
                 const successMsg = data.message_count === 1
                     ? 'Message anonymized successfully!'
                     : `${data.message_count} messages anonymized successfully!`;
@@ -273,9 +355,65 @@ function App() {
         }
     };
 
+    // Returns false when the server rejects the state token, so the caller falls back to a full request
+    const anonymizeIncrementally = async (segments) => {
+        const changes = [];
+
+        segments.forEach((message, messageIdx) => {
+            const previous = anonymizationState.input[messageIdx];
+            const changed = message.map((segment, idx) => segment !== previous[idx]);
+            // Names in PID/NK1 feed free-text scrubbing of the whole message
+            const isContext = segment => ['PID', 'NK1'].includes(segment.slice(0, 3));
+            const contextChanged = message.some((segment, idx) =>
+                changed[idx] && (isContext(segment) || isContext(previous[idx])));
+
+            message.forEach((segment, idx) => {
+                if (contextChanged || changed[idx]) {
+                    changes.push({ message: messageIdx, segment: idx, text: segment });
+                }
+            });
+        });
+
+        if (changes.length === 0) {
+            setAlert({ type: 'info', message: 'No changes since the last anonymization.' });
+            return true;
+        }
+
+        const response = await fetch('/api/anonymize/segments', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({ state: anonymizationState.token, segments: changes }),
+        });
+
+        const data = await response.json();
+
+        if (!data.success) {
+            setAnonymizationState(null);
+            return false;
+        }
+
+        const output = anonymizationState.output.map(message => [...message]);
+        data.segments.forEach(result => {
+            output[result.message][result.segment] = result.anonymized;
+        });
+
+        setOutputMessage(output.map(message => message.join('\n')).join('\n\n'));
+        setChangeMap(null);
+        setAnonymizationState({ token: data.state, input: segments, output });
+        setAlert({
+            type: 'success',
+            message: `${data.segments.length} changed segment(s) re-anonymized successfully!`
+        });
+        return true;
+    };
+
     const handleClear = () => {
         setInputMessage('');
         setOutputMessage('');
+        setChangeMap(null);
+        setAnonymizationState(null);
         setValidationResult(null);
         setExpandedValidations({});
         setAlert({ type: 'info', message: 'Messages cleared.' });
@@ -302,6 +440,8 @@ function App() {
     const handleSelectExample = (exampleMessage) => {
         setInputMessage(exampleMessage);
         setOutputMessage('');  // Clear previous output
+        setChangeMap(null);
+        setAnonymizationState(null);
         setValidationResult(null);  // Clear validation result
         setExpandedValidations({});  // Clear expanded state
         setAlert({ type: 'info', message: 'Example message loaded.' });
@@ -554,14 +694,16 @@ function App() {
                                                         </div>
                                                     )}
                                                 </div>
-                                                <a
-                                                    href={validationResult.validatorUrl}
-                                                    target="_blank"
-                                                    rel="noopener noreferrer"
-                                                    className="validation-details-link"
-                                                >
-                                                    View full details at HL7 PT Validator →
-                                                </a>
+                                                {result.source !== 'local' && (
+                                                    <a
+                                                        href={validationResult.validatorUrl}
+                                                        target="_blank"
+                                                        rel="noopener noreferrer"
+                                                        className="validation-details-link"
+                                                    >
+                                                        View full details at HL7 PT Validator →
+                                                    </a>
+                                                )}
                                             </div>
                                         )}
                                     </div>
@@ -578,6 +720,7 @@ function App() {
                     <HL7MessageDisplay
                         message={outputMessage}
                         originalMessage={inputMessage}
+                        changeMap={changeMap}
                     />
                     <div className="button-group">
                         <button
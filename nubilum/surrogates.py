@@ -0,0 +1,374 @@
+"""Portuguese surrogate dictionaries with constant-time weighted sampling.
+
+Pseudonymized names and addresses are drawn from bundled dictionaries of
+Portuguese given names, surnames, streets and municipalities (with their
+district and a region-consistent postal code prefix), weighted by approximate
+frequency, so anonymized messages look like real ones.
+
+The sources are TSV files in ``nubilum/data/surrogates``. They are compiled
+into one binary file, ``surrogates.bin``, which is memory-mapped on first use:
+loading it reads no data, and processes forked after the warm-up share its
+pages. For each table the file holds:
+
+- the strings, UTF-8 encoded in one blob, with a uint32 offset array, and
+- a precomputed alias table (Walker/Vose): a uint32 threshold and a uint32
+  alias index per entry.
+
+Sampling from a 64-bit hash is then O(1) and deterministic: the low 32 bits
+pick an entry uniformly, the high 32 bits are compared with its threshold to
+keep it or take its alias. A draw reads two words of the mapped file and
+decodes the string (once per entry and process), independent of the
+dictionary size.
+
+Rebuild the binary after editing a source file::
+
+    nubilum surrogates build      # or: python -m nubilum.surrogates
+
+``NUBILUM_SURROGATES`` may point to a file built from other sources.
+"""
+
+import argparse
+import array
+import logging
+import mmap
+import os
+import struct
+import sys
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+DATA_DIR = Path(__file__).parent / 'data'
+SOURCE_DIR = DATA_DIR / 'surrogates'
+DEFAULT_PATH = DATA_DIR / 'surrogates.bin'
+
+# Table name -> string columns of its source file (the weight is the last column)
+TABLES = {
+    'given_names': ('name',),
+    'surnames': ('name',),
+    'streets': ('name',),
+    'municipalities': ('name', 'district', 'postal_prefix'),
+}
+
+_MAGIC = b'NBSURR01'
+_HEADER = struct.Struct('<8sII')            # magic, table count, reserved
+_DIRECTORY = struct.Struct('<24sIIIIII')    # name, entries, columns, alias, offsets, blob, blob length
+_ALIAS = struct.Struct('<II')               # threshold, alias index
+
+_MASK32 = 0xFFFFFFFF
+# Entries drawn for an original before falling back to a suffixed entry (an
+# original containing every entry would otherwise be redrawn forever)
+_MAX_REDRAWS = 8
+_MASK64 = (1 << 64) - 1
+
+
+class SurrogateError(Exception):
+    """Raised when surrogate dictionaries cannot be built or loaded."""
+
+
+def _remix(value: int) -> int:
+    """Next 64-bit hash in a deterministic sequence (SplitMix64 step)."""
+    value = (value + 0x9E3779B97F4A7C15) & _MASK64
+    value = ((value ^ (value >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+    value = ((value ^ (value >> 27)) * 0x94D049BB133111EB) & _MASK64
+    return value ^ (value >> 31)
+
+
+class SurrogateTable:
+    """One memory-mapped dictionary table."""
+
+    __slots__ = ('name', 'size', 'columns', '_buffer', '_words', '_alias', '_offsets', '_blob', '_strings')
+
+    def __init__(self, name: str, buffer, words, size: int, columns: int, alias: int, offsets: int,
+                 blob: int):
+        """
+        Args:
+            name: Table name
+            buffer: Mapped file
+            words: The file as uint32 words
+            size: Number of entries
+            columns: Strings per entry
+            alias: Byte offset of the alias table
+            offsets: Byte offset of the string offsets
+            blob: Byte offset of the string blob
+        """
+        self.name = name
+        self.size = size
+        self.columns = columns
+        self._buffer = buffer
+        self._words = words
+        self._alias = alias // 4
+        self._offsets = offsets // 4
+        self._blob = blob
+        # Decoded on first use: a draw is then two word reads and a list lookup
+        self._strings: List[Optional[str]] = [None] * (size * columns)
+
+    def __len__(self) -> int:
+        return self.size
+
+    def index(self, value: int) -> int:
+        """Entry drawn with the table's weights by a 64-bit hash."""
+        slot = ((value & _MASK32) * self.size) >> 32
+        position = self._alias + 2 * slot
+        return slot if (value >> 32) < self._words[position] else self._words[position + 1]
+
+    def value(self, index: int, column: int = 0) -> str:
+        """String in a column of an entry."""
+        item = index * self.columns + column
+        string = self._strings[item]
+        if string is None:
+            words, position, blob = self._words, self._offsets + item, self._blob
+            string = str(self._buffer[blob + words[position]:blob + words[position + 1]], 'utf-8')
+            self._strings[item] = string
+        return string
+
+    def sample(self, value: int, avoid: Optional[str] = None) -> Tuple[int, str]:
+        """
+        Draw an entry by a 64-bit hash.
+
+        Args:
+            value: 64-bit hash of the original value
+            avoid: Original value; an entry that is part of it (ignoring
+                case), so would reveal it, is redrawn from the next hash in a
+                deterministic sequence, up to _MAX_REDRAWS times; then the
+                last entry gets a hash-derived suffix of letters
+
+        Returns:
+            (entry index, string in its first column)
+        """
+        # index() and value() inlined: this runs for every new name and every address
+        words = self._words
+        slot = ((value & _MASK32) * self.size) >> 32
+        position = self._alias + 2 * slot
+        index = slot if (value >> 32) < words[position] else words[position + 1]
+        surrogate = self._strings[index * self.columns] or self.value(index)
+        if avoid is not None and surrogate.casefold() in avoid.casefold():
+            avoid = avoid.casefold()
+            for _ in range(_MAX_REDRAWS):
+                value = _remix(value)
+                index = self.index(value)
+                surrogate = self.value(index)
+                if surrogate.casefold() not in avoid:
+                    break
+            else:
+                suffix = ''.join(chr(ord('a') + (value >> shift) % 26) for shift in range(0, 40, 8))
+                surrogate = f"{surrogate}-{suffix}"
+        return index, surrogate
+
+
+class SurrogateDictionaries:
+    """The tables of a surrogate dictionary file."""
+
+    def __init__(self, path: Path):
+        """
+        Memory-map a file written by build().
+
+        Args:
+            path: Dictionary file
+
+        Raises:
+            SurrogateError: If the file is missing or not a dictionary file
+        """
+        self.path = Path(path)
+        try:
+            with open(self.path, 'rb') as f:
+                self._buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError) as e:
+            raise SurrogateError(f"Cannot open surrogate dictionaries {self.path}: {e}") from e
+
+        if len(self._buffer) < _HEADER.size:
+            raise SurrogateError(f"{self.path} is not a surrogate dictionary file")
+        magic, count, _ = _HEADER.unpack_from(self._buffer, 0)
+        if magic != _MAGIC or len(self._buffer) < _HEADER.size + count * _DIRECTORY.size:
+            raise SurrogateError(f"{self.path} is not a surrogate dictionary file")
+
+        # Little-endian uint32 words (copied and swapped on big-endian hosts)
+        if sys.byteorder == 'little':
+            words = memoryview(self._buffer)[:len(self._buffer) // 4 * 4].cast('I')
+        else:
+            words = array.array('I', self._buffer[:len(self._buffer) // 4 * 4])
+            words.byteswap()
+
+        self.tables: Dict[str, SurrogateTable] = {}
+        for n in range(count):
+            name, size, columns, alias, offsets, blob, blob_length = _DIRECTORY.unpack_from(
+                self._buffer, _HEADER.size + n * _DIRECTORY.size)
+            if blob + blob_length > len(self._buffer) or size == 0:
+                raise SurrogateError(f"{self.path} is truncated")
+            name = name.rstrip(b'\0').decode('ascii')
+            self.tables[name] = SurrogateTable(name, self._buffer, words, size, columns, alias, offsets, blob)
+
+        missing = set(TABLES) - set(self.tables)
+        if missing:
+            raise SurrogateError(f"{self.path} has no {', '.join(sorted(missing))} table")
+
+    def __getitem__(self, name: str) -> SurrogateTable:
+        return self.tables[name]
+
+    def preload(self) -> int:
+        """Decode every string (during the warm-up, before workers fork); returns the entry count."""
+        for table in self.tables.values():
+            for index in range(table.size):
+                for column in range(table.columns):
+                    table.value(index, column)
+        return sum(table.size for table in self.tables.values())
+
+
+_lock = threading.Lock()
+_dictionaries: Optional[SurrogateDictionaries] = None
+
+
+def dictionaries() -> SurrogateDictionaries:
+    """The process-wide dictionaries (NUBILUM_SURROGATES or the bundled file), mapped on first use."""
+    return _dictionaries or _load()
+
+
+def _load() -> SurrogateDictionaries:
+    global _dictionaries
+    with _lock:
+        if _dictionaries is None:
+            path = os.environ.get('NUBILUM_SURROGATES') or DEFAULT_PATH
+            _dictionaries = SurrogateDictionaries(path)
+            logger.debug(f"Mapped surrogate dictionaries {path}")
+    return _dictionaries
+
+
+def alias_table(weights: Sequence[int]) -> List[Tuple[int, int]]:
+    """
+    Vose's alias method with 32-bit thresholds.
+
+    Entry i is kept with probability threshold / 2**32 when drawn uniformly,
+    otherwise its alias is taken, so entries come out proportional to their
+    weights.
+
+    Args:
+        weights: Positive integer weights
+
+    Returns:
+        (threshold, alias) per entry
+    """
+    count = len(weights)
+    total = sum(weights)
+    # Probabilities scaled so the mean is 2**32, in exact integer arithmetic
+    scaled = [weight * count << 32 for weight in weights]
+    full = total << 32
+    small = [i for i, value in enumerate(scaled) if value < full]
+    large = [i for i, value in enumerate(scaled) if value >= full]
+    # Entries never paired keep themselves as alias
+    table = [(_MASK32, i) for i in range(count)]
+
+    while small and large:
+        less, more = small.pop(), large.pop()
+        table[less] = (scaled[less] // total, more)
+        scaled[more] -= full - scaled[less]
+        (small if scaled[more] < full else large).append(more)
+
+    return table
+
+
+def read_source(path: Path, columns: int) -> Tuple[List[Tuple[str, ...]], List[int]]:
+    """
+    Read a TSV source: string columns followed by an integer weight, '#' comments.
+
+    Returns:
+        (entries, weights)
+    """
+    entries, weights = [], []
+    with open(path, encoding='utf-8') as f:
+        for number, line in enumerate(f, 1):
+            line = line.rstrip('\n')
+            if not line or line.startswith('#'):
+                continue
+            values = line.split('\t')
+            if len(values) != columns + 1 or not all(values[:-1]):
+                raise SurrogateError(f"{path}:{number}: expected {columns} value(s) and a weight")
+            try:
+                weight = int(values[-1])
+            except ValueError:
+                raise SurrogateError(f"{path}:{number}: weight must be an integer")
+            if weight <= 0:
+                raise SurrogateError(f"{path}:{number}: weight must be positive")
+            entries.append(tuple(values[:-1]))
+            weights.append(weight)
+    if len(entries) < 2:
+        raise SurrogateError(f"{path} needs at least two entries")
+    return entries, weights
+
+
+def build(source_dir: Path = SOURCE_DIR, output: Path = DEFAULT_PATH) -> Dict[str, int]:
+    """
+    Compile the TSV sources into a dictionary file.
+
+    The output only depends on the sources, so rebuilding unchanged sources
+    gives an identical file.
+
+    Args:
+        source_dir: Directory with one <table>.tsv per table in TABLES
+        output: Dictionary file to write
+
+    Returns:
+        Entries per table
+
+    Raises:
+        SurrogateError: If a source is missing or malformed
+    """
+    source_dir = Path(source_dir)
+    sections = []
+    for name, columns in TABLES.items():
+        path = source_dir / f'{name}.tsv'
+        if not path.exists():
+            raise SurrogateError(f"Missing surrogate source {path}")
+        entries, weights = read_source(path, len(columns))
+
+        blob = bytearray()
+        offsets = []
+        for entry in entries:
+            for value in entry:
+                offsets.append(len(blob))
+                blob += value.encode('utf-8')
+        offsets.append(len(blob))
+
+        alias = b''.join(_ALIAS.pack(threshold, index) for threshold, index in alias_table(weights))
+        sections.append((name, len(entries), len(columns), alias,
+                         struct.pack(f'<{len(offsets)}I', *offsets), bytes(blob)))
+
+    position = _HEADER.size + len(sections) * _DIRECTORY.size
+    directory, body = [], []
+    for name, size, columns, alias, offsets, blob in sections:
+        alias_at = position
+        offsets_at = alias_at + len(alias)
+        blob_at = offsets_at + len(offsets)
+        padding = -(blob_at + len(blob)) % 4
+        directory.append(_DIRECTORY.pack(name.encode('ascii'), size, columns, alias_at, offsets_at,
+                                         blob_at, len(blob)))
+        body += [alias, offsets, blob, b'\0' * padding]
+        position = blob_at + len(blob) + padding
+
+    output = Path(output)
+    temp = output.with_name(output.name + '.tmp')
+    temp.write_bytes(_HEADER.pack(_MAGIC, len(sections), 0) + b''.join(directory) + b''.join(body))
+    os.replace(temp, output)
+    return {name: size for name, size, *_ in sections}
+
+
+def main(argv=None) -> int:
+    """Entry point for ``python -m nubilum.surrogates``."""
+    parser = argparse.ArgumentParser(description='Build the surrogate dictionary file')
+    parser.add_argument('--source-dir', default=str(SOURCE_DIR), help='Directory with the TSV sources')
+    parser.add_argument('-o', '--output', default=str(DEFAULT_PATH), help='Dictionary file to write')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s - %(message)s')
+    try:
+        sizes = build(args.source_dir, args.output)
+    except SurrogateError as e:
+        logger.error(str(e))
+        return 1
+    logger.info(f"Wrote {args.output}: " + ", ".join(f"{size} {name}" for name, size in sizes.items()))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
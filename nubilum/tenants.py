@@ -0,0 +1,340 @@
+"""Multi-tenant anonymization with per-tenant keys, profiles and cached engines.
+
+One instance can serve several organisations, each with its own pseudonym key
+and anonymization profile. Tenants are listed in a JSON or YAML file
+(NUBILUM_TENANTS_FILE):
+
+    require_tenant: true          # reject requests that select no tenant
+    tenants:
+      - id: hospital-a
+        api_keys: [<SHA-256 hex digest of each API key>]
+        profile: radiology        # profile from NUBILUM_PROFILE_DIR, or
+        profile_file: a.yaml      # a profile file only this tenant uses
+        key_file: hospital-a.key  # master key from `nubilum keygen`
+
+A request selects its tenant with its API key (X-API-Key); tenants without
+api_keys are selected by id with X-Nubilum-Tenant, for deployments where an
+authenticating gateway sets that header. Only key digests are kept.
+
+A TenantEngine holds what would otherwise be rebuilt for every request: the
+compiled profile, the pseudonym key derived from the key file and a private
+PseudonymCache. Engines are built on first use and kept in an LRU
+(NUBILUM_TENANT_ENGINES), so switching tenants between requests reuses them
+and memory stays bounded with many tenants; an evicted tenant's key and
+pseudonyms are dropped with its engine.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from nubilum.anonymizer import HL7Anonymizer
+from nubilum.profiles import AnonymizationProfile, ProfileError, ProfileRegistry, load_profile
+from nubilum.pseudonym_table import PseudonymCache
+from nubilum.reversible import load_key_file, pseudonym_key
+from nubilum.segment_cache import SegmentCache
+
+logger = logging.getLogger(__name__)
+
+TENANT_HEADER = 'X-Nubilum-Tenant'
+
+DEFAULT_MAX_ENGINES = 32
+DEFAULT_PSEUDONYM_CACHE_SIZE = 16384
+
+_ID_RE = re.compile(r'^[A-Za-z0-9_.-]{1,64}$')
+_DIGEST_RE = re.compile(r'^[0-9a-f]{64}$')
+
+
+class TenantError(ValueError):
+    """Raised for invalid tenant configuration or a request that conflicts with its tenant."""
+
+
+class TenantAuthError(TenantError):
+    """Raised when a request's API key or tenant header selects no tenant it may use."""
+
+
+def api_key_digest(api_key: str) -> str:
+    """SHA-256 hex digest of an API key, as listed in the tenants file."""
+    return hashlib.sha256(api_key.encode('utf-8')).hexdigest()
+
+
+class Tenant:
+    """One organisation: its API key digests, profile and key file."""
+
+    __slots__ = ('id', 'key_digests', 'profile', 'key_file')
+
+    def __init__(self, tenant_id: str, key_digests: List[str], profile: AnonymizationProfile,
+                 key_file: Optional[Path] = None):
+        self.id = tenant_id
+        self.key_digests = key_digests
+        self.profile = profile
+        self.key_file = key_file
+
+
+class TenantEngine:
+    """Fully initialised anonymization state of one tenant, shared by its requests."""
+
+    def __init__(self, tenant: Tenant, pseudonym_cache_size: int = DEFAULT_PSEUDONYM_CACHE_SIZE):
+        """
+        Args:
+            tenant: Tenant to build the engine for
+            pseudonym_cache_size: Pseudonyms kept for the tenant's requests
+
+        Raises:
+            ReversibleError: If the tenant's key file cannot be read
+        """
+        self.tenant = tenant
+        self.profile = tenant.profile
+        self.key = pseudonym_key(load_key_file(tenant.key_file)) if tenant.key_file is not None else None
+        self.pseudonyms = PseudonymCache(pseudonym_cache_size)
+
+    def select_profile(self, name: Optional[str] = None) -> AnonymizationProfile:
+        """
+        The tenant's profile, checked against the one a request asked for.
+
+        Raises:
+            TenantError: If the request names another profile
+        """
+        if name is not None and name != self.profile.name:
+            raise TenantError(f"Tenant '{self.tenant.id}' anonymizes with profile '{self.profile.name}'")
+        return self.profile
+
+    def anonymizer(self, segment_cache: Optional[SegmentCache] = None,
+                   record_changes: bool = False) -> HL7Anonymizer:
+        """Anonymizer for one request, using the tenant's profile, key and pseudonyms."""
+        return HL7Anonymizer(profile=self.profile, pseudonym_table=self.pseudonyms, key=self.key,
+                             segment_cache=segment_cache, record_changes=record_changes)
+
+
+def _parse_source(source: bytes, fmt: str):
+    """Parse a tenants file as JSON or YAML."""
+    if fmt == 'json':
+        try:
+            return json.loads(source)
+        except ValueError as e:
+            raise TenantError(f"Invalid JSON tenants file: {e}") from e
+
+    try:
+        import yaml
+    except ImportError as e:
+        raise TenantError("YAML tenants files require the 'pyyaml' package") from e
+
+    try:
+        return yaml.safe_load(source)
+    except yaml.YAMLError as e:
+        raise TenantError(f"Invalid YAML tenants file: {e}") from e
+
+
+def _validate_tenant(raw, position: int, base_dir: Path, profile_registry: ProfileRegistry) -> Tenant:
+    """Check one tenant entry and load its profile."""
+    if not isinstance(raw, dict):
+        raise TenantError(f"Tenant {position} must be an object")
+
+    tenant_id = raw.get('id')
+    if not isinstance(tenant_id, str) or not _ID_RE.match(tenant_id):
+        raise TenantError(f"Tenant {position}: 'id' must be 1-64 characters of letters, digits, '_', '.' or '-'")
+
+    key_digests = raw.get('api_keys', [])
+    if not isinstance(key_digests, list) or not all(
+            isinstance(digest, str) and _DIGEST_RE.match(digest) for digest in key_digests):
+        raise TenantError(f"Tenant '{tenant_id}': 'api_keys' must list SHA-256 hex digests of the keys")
+
+    if 'profile' in raw and 'profile_file' in raw:
+        raise TenantError(f"Tenant '{tenant_id}': use either 'profile' or 'profile_file'")
+    try:
+        if 'profile_file' in raw:
+            profile = load_profile(base_dir / str(raw['profile_file']))
+        else:
+            profile = profile_registry.get(raw.get('profile'))
+    except ProfileError as e:
+        raise TenantError(f"Tenant '{tenant_id}': {e}") from e
+
+    key_file = None
+    if raw.get('key_file') is not None:
+        key_file = base_dir / str(raw['key_file'])
+        if not key_file.is_file():
+            raise TenantError(f"Tenant '{tenant_id}': key file {key_file} not found")
+
+    return Tenant(tenant_id, key_digests, profile, key_file)
+
+
+class TenantRegistry:
+    """Tenants by id and API key digest, with an LRU of their engines."""
+
+    def __init__(self, tenants: List[Tenant], require_tenant: bool = False,
+                 max_engines: int = DEFAULT_MAX_ENGINES,
+                 pseudonym_cache_size: int = DEFAULT_PSEUDONYM_CACHE_SIZE):
+        """
+        Args:
+            tenants: Configured tenants
+            require_tenant: Reject requests that select no tenant
+            max_engines: Engines kept before the least recently used is dropped
+            pseudonym_cache_size: Pseudonyms kept per engine
+
+        Raises:
+            TenantError: If a tenant id or API key is listed twice
+        """
+        self.require_tenant = require_tenant
+        self.max_engines = max(1, max_engines)
+        self.pseudonym_cache_size = pseudonym_cache_size
+        self._tenants: Dict[str, Tenant] = {}
+        self._by_key: Dict[str, Tenant] = {}
+        for tenant in tenants:
+            if tenant.id in self._tenants:
+                raise TenantError(f"Tenant '{tenant.id}' is listed twice")
+            self._tenants[tenant.id] = tenant
+            for digest in tenant.key_digests:
+                if digest in self._by_key:
+                    raise TenantError(f"API key of tenant '{tenant.id}' is also used by '{self._by_key[digest].id}'")
+                self._by_key[digest] = tenant
+
+        self._engines: 'OrderedDict[str, TenantEngine]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @classmethod
+    def load(cls, path, profile_registry: ProfileRegistry, **kwargs) -> 'TenantRegistry':
+        """
+        Load a tenants file (.json, .yaml or .yml).
+
+        Args:
+            path: Tenants file; relative profile and key file paths are resolved
+                from its directory
+            profile_registry: Registry the tenants' profile names refer to
+            kwargs: Passed to TenantRegistry()
+
+        Raises:
+            TenantError: If the file cannot be read or is invalid
+        """
+        path = Path(path)
+        suffix = path.suffix.lower()
+        if suffix not in ('.json', '.yaml', '.yml'):
+            raise TenantError(f"Unsupported tenants file type: {path.name}")
+
+        try:
+            source = path.read_bytes()
+        except OSError as e:
+            raise TenantError(f"Cannot read tenants file {path}: {e}") from e
+
+        definition = _parse_source(source, 'json' if suffix == '.json' else 'yaml')
+        if not isinstance(definition, dict) or not isinstance(definition.get('tenants'), list):
+            raise TenantError("Tenants file must be an object with a 'tenants' list")
+
+        require_tenant = definition.get('require_tenant', False)
+        if not isinstance(require_tenant, bool):
+            raise TenantError("'require_tenant' must be true or false")
+
+        tenants = [_validate_tenant(raw, position, path.parent, profile_registry)
+                   for position, raw in enumerate(definition['tenants'], 1)]
+        return cls(tenants, require_tenant=require_tenant, **kwargs)
+
+    def __len__(self) -> int:
+        return len(self._tenants)
+
+    def resolve(self, api_key: Optional[str] = None, tenant_id: Optional[str] = None) -> Optional[Tenant]:
+        """
+        Select the tenant of a request.
+
+        Args:
+            api_key: The request's API key
+            tenant_id: The request's tenant header (only for tenants without API keys)
+
+        Returns:
+            The tenant, or None if the request selects none and none is required
+
+        Raises:
+            TenantAuthError: If the key is unknown, the header names an unknown
+                tenant or one that requires a key, or a required tenant is missing
+        """
+        if api_key:
+            tenant = self._by_key.get(api_key_digest(api_key))
+            if tenant is None or (tenant_id and tenant_id != tenant.id):
+                raise TenantAuthError("Invalid API key")
+            return tenant
+
+        if tenant_id:
+            tenant = self._tenants.get(tenant_id)
+            if tenant is None or tenant.key_digests:
+                raise TenantAuthError(f"Unknown tenant or API key required: {tenant_id}")
+            return tenant
+
+        if self.require_tenant:
+            raise TenantAuthError("An API key is required")
+        return None
+
+    def valid_api_key(self, api_key: str) -> bool:
+        """Whether an API key belongs to a tenant (used to key rate limits)."""
+        return api_key_digest(api_key) in self._by_key
+
+    def engine(self, tenant: Tenant) -> TenantEngine:
+        """
+        The tenant's engine, built on first use and then reused.
+
+        Raises:
+            ReversibleError: If the tenant's key file cannot be read
+        """
+        with self._lock:
+            engine = self._engines.get(tenant.id)
+            if engine is not None:
+                self._engines.move_to_end(tenant.id)
+                self.hits += 1
+                return engine
+            self.misses += 1
+
+        # Built outside the lock so other tenants are not held up by key file reads
+        engine = TenantEngine(tenant, self.pseudonym_cache_size)
+
+        with self._lock:
+            engine = self._engines.setdefault(tenant.id, engine)
+            self._engines.move_to_end(tenant.id)
+            while len(self._engines) > self.max_engines:
+                evicted, _ = self._engines.popitem(last=False)
+                self.evictions += 1
+                logger.debug(f"Dropped engine of tenant '{evicted}'")
+        return engine
+
+    def stats(self) -> Dict:
+        """Tenant count and engine cache counters (no tenant ids)."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'tenants': len(self._tenants),
+                'engines': len(self._engines),
+                'max_engines': self.max_engines,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'pseudonyms': sum(len(engine.pseudonyms) for engine in self._engines.values()),
+            }
+
+
+def registry_from_env(profile_registry: ProfileRegistry) -> Optional[TenantRegistry]:
+    """
+    Load the tenants file named by NUBILUM_TENANTS_FILE.
+
+    Engines kept are set by NUBILUM_TENANT_ENGINES and pseudonyms cached per
+    engine by NUBILUM_TENANT_PSEUDONYMS.
+
+    Returns:
+        The registry, or None if no tenants file is configured
+    """
+    path = os.environ.get('NUBILUM_TENANTS_FILE')
+    if not path:
+        return None
+
+    registry = TenantRegistry.load(
+        path, profile_registry,
+        max_engines=int(os.environ.get('NUBILUM_TENANT_ENGINES', DEFAULT_MAX_ENGINES)),
+        pseudonym_cache_size=int(os.environ.get('NUBILUM_TENANT_PSEUDONYMS', DEFAULT_PSEUDONYM_CACHE_SIZE)),
+    )
+    logger.info(f"Loaded {len(registry)} tenant(s) from {path}")
+    return registry
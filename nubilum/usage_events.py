@@ -0,0 +1,400 @@
+"""Compact columnar storage for usage events.
+
+Instead of keeping one JSON dict (with a nested segment_counts dict) per
+event, events are appended to typed arrays:
+
+    message_type   array('I')  index into the interned message types
+    day            array('I')  index into the interned dates
+    ordinal        array('I')  date ordinal of the timestamp, 0 if unparsable
+    hour           array('b')  hour of the timestamp, -1 if unparsable
+    success        array('B')
+    total_segments array('I')
+    message_length array('Q')
+    duration       array('q')  anonymization time in microseconds, -1 if unknown
+    request_duration array('q')  time of the whole request (on its last event), or -1
+
+Segment counts form a sparse event x segment-type matrix in CSR layout
+(segment_indptr, segment_ids, segment_counts). A year of events costs a few
+bytes per event plus the interned strings, and statistics are computed in a
+single pass using C-level counting over the arrays.
+
+Aggregates (UsageAggregate) are mergeable: counters add and latency sketches
+merge (see nubilum.sketches), so partial results for separate log ranges or
+days can be combined (see nubilum.usage_stats). Distinct counts, percentiles
+and top senders are not derived from the log; they are kept as events are
+tracked (see nubilum.usage_sketches).
+"""
+
+from array import array
+from collections import Counter
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+from nubilum.sketches import DDSketch
+from nubilum.usage_sketches import UsageSketches
+
+LATENCY_PERCENTILES = (50, 95, 99)
+
+
+class LatencySummary:
+    """Mergeable processing times: a DDSketch of milliseconds and their exact total."""
+
+    __slots__ = ('sketch', 'total_us')
+
+    def __init__(self):
+        self.sketch = DDSketch()
+        self.total_us = 0
+
+    def add(self, duration_us: int) -> None:
+        """Add one duration in microseconds."""
+        self.sketch.add(duration_us / 1000)
+        self.total_us += duration_us
+
+    def merge(self, other: 'LatencySummary') -> 'LatencySummary':
+        """Add another summary (returns self)."""
+        self.sketch.merge(other.sketch)
+        self.total_us += other.total_us
+        return self
+
+    def to_dict(self) -> Dict:
+        return {'sketch': self.sketch.to_dict(), 'total_us': self.total_us}
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'LatencySummary':
+        summary = cls()
+        summary.sketch = DDSketch.from_dict(data['sketch'])
+        summary.total_us = data['total_us']
+        return summary
+
+    def to_statistics(self) -> Dict:
+        """
+        Count, latency percentiles and throughput (timed items per second of processing).
+
+        Returns:
+            Dict with 'count', 'p50_ms', 'p95_ms', 'p99_ms' and 'throughput_per_second'
+        """
+        count = self.sketch.count
+        if count == 0:
+            return {'count': 0}
+
+        values = self.sketch.quantiles(p / 100 for p in LATENCY_PERCENTILES)
+        statistics = {'count': count}
+        statistics.update({f'p{p}_ms': round(value, 3) for p, value in zip(LATENCY_PERCENTILES, values)})
+        statistics['throughput_per_second'] = (round(count * 1_000_000 / self.total_us, 1)
+                                               if self.total_us else None)
+        return statistics
+
+
+def _merge_latencies(target: Dict, source: Dict) -> None:
+    for key, summary in source.items():
+        if key in target:
+            target[key].merge(summary)
+        else:
+            target[key] = LatencySummary().merge(summary)
+
+
+class UsageAggregate:
+    """Mergeable usage counters for a set of events."""
+
+    __slots__ = ('total', 'successful', 'total_segments', 'total_message_length',
+                 'message_types', 'segments', 'daily', 'hourly', 'latency', 'request_latency',
+                 'latency_by_type', 'latency_by_day')
+
+    def __init__(self):
+        self.total = 0
+        self.successful = 0
+        self.total_segments = 0
+        self.total_message_length = 0
+        self.message_types: Counter = Counter()
+        self.segments: Counter = Counter()
+        self.daily: Counter = Counter()
+        self.hourly: Counter = Counter()
+        # Processing times of messages (overall, per message type, per day) and of requests
+        self.latency = LatencySummary()
+        self.request_latency = LatencySummary()
+        self.latency_by_type: Dict[Optional[str], LatencySummary] = {}
+        self.latency_by_day: Dict[str, LatencySummary] = {}
+
+    def merge(self, other: 'UsageAggregate') -> 'UsageAggregate':
+        """Add another aggregate's counters to this one (returns self)."""
+        self.total += other.total
+        self.successful += other.successful
+        self.total_segments += other.total_segments
+        self.total_message_length += other.total_message_length
+        self.message_types.update(other.message_types)
+        self.segments.update(other.segments)
+        self.daily.update(other.daily)
+        self.hourly.update(other.hourly)
+        self.latency.merge(other.latency)
+        self.request_latency.merge(other.request_latency)
+        _merge_latencies(self.latency_by_type, other.latency_by_type)
+        _merge_latencies(self.latency_by_day, other.latency_by_day)
+        return self
+
+    def to_dict(self) -> Dict:
+        """JSON-serializable form (counters as [key, count] pairs, keys may be null)."""
+        return {
+            'total': self.total,
+            'successful': self.successful,
+            'total_segments': self.total_segments,
+            'total_message_length': self.total_message_length,
+            'message_types': list(self.message_types.items()),
+            'segments': list(self.segments.items()),
+            'daily': list(self.daily.items()),
+            'hourly': list(self.hourly.items()),
+            'latency': self.latency.to_dict(),
+            'request_latency': self.request_latency.to_dict(),
+            'latency_by_type': [[key, summary.to_dict()] for key, summary in self.latency_by_type.items()],
+            'latency_by_day': [[key, summary.to_dict()] for key, summary in self.latency_by_day.items()],
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'UsageAggregate':
+        """Rebuild an aggregate saved with to_dict()."""
+        aggregate = cls()
+        aggregate.total = data['total']
+        aggregate.successful = data['successful']
+        aggregate.total_segments = data['total_segments']
+        aggregate.total_message_length = data['total_message_length']
+        aggregate.message_types = Counter(dict(data['message_types']))
+        aggregate.segments = Counter(dict(data['segments']))
+        aggregate.daily = Counter(dict(data['daily']))
+        aggregate.hourly = Counter(dict(data['hourly']))
+        aggregate.latency = LatencySummary.from_dict(data['latency'])
+        aggregate.request_latency = LatencySummary.from_dict(data['request_latency'])
+        aggregate.latency_by_type = {key: LatencySummary.from_dict(summary)
+                                     for key, summary in data['latency_by_type']}
+        aggregate.latency_by_day = {key: LatencySummary.from_dict(summary)
+                                    for key, summary in data['latency_by_day']}
+        return aggregate
+
+    def to_statistics(self, sketches: Optional[UsageSketches] = None) -> Dict:
+        """
+        Usage statistics (same structure as UsageTracker.get_statistics()).
+
+        Args:
+            sketches: Tracked sketches of the same days (distinct counts,
+                percentiles, top senders); empty if None
+
+        Returns:
+            Dictionary with computed statistics
+        """
+        total = self.total
+        successful = self.successful
+        failed = total - successful
+        total_segments = self.total_segments
+        total_message_length = self.total_message_length
+
+        return {
+            "total_anonymizations": total,
+            "successful_anonymizations": successful,
+            "failed_anonymizations": failed,
+            "success_rate": round((successful / total * 100) if total > 0 else 0.0, 2),
+            "message_types": dict(sorted(self.message_types.items(), key=lambda x: x[1], reverse=True)),
+            "segments_processed": dict(sorted(self.segments.items(), key=lambda x: x[1], reverse=True)),
+            "total_segments": total_segments,
+            "total_message_length": total_message_length,
+            "average_message_length": round(total_message_length / total) if total > 0 else 0,
+            "average_segments_per_message": round(total_segments / total, 1) if total > 0 else 0,
+            "daily_counts": dict(sorted(self.daily.items())),
+            "hourly_distribution": dict(sorted(self.hourly.items())),
+            **(sketches or UsageSketches()).to_statistics(),
+            "latency": self.latency.to_statistics(),
+            "request_latency": self.request_latency.to_statistics(),
+            "latency_by_message_type": {
+                key: summary.to_statistics()
+                for key, summary in sorted(self.latency_by_type.items(), key=lambda x: x[1].sketch.count,
+                                           reverse=True)
+            },
+            "latency_by_day": {key: summary.to_statistics()
+                               for key, summary in sorted(self.latency_by_day.items())},
+        }
+
+
+class UsageEventColumns:
+    """Usage events stored column-wise in typed arrays."""
+
+    __slots__ = ('message_types', 'dates', 'segment_types', '_message_type_index', '_date_index',
+                 '_segment_index', 'message_type', 'day', 'ordinal', 'hour', 'success',
+                 'total_segments', 'message_length', 'duration', 'request_duration',
+                 'segment_indptr', 'segment_ids', 'segment_counts')
+
+    def __init__(self):
+        # Interned values, in order of first occurrence
+        self.message_types: List[Optional[str]] = []
+        self.dates: List[str] = []
+        self.segment_types: List[str] = []
+        self._message_type_index: Dict[Optional[str], int] = {}
+        self._date_index: Dict[str, int] = {}
+        self._segment_index: Dict[str, int] = {}
+
+        self.message_type = array('I')
+        self.day = array('I')
+        self.ordinal = array('I')
+        self.hour = array('b')
+        self.success = array('B')
+        self.total_segments = array('I')
+        self.message_length = array('Q')
+        self.duration = array('q')
+        self.request_duration = array('q')
+
+        self.segment_indptr = array('I', [0])
+        self.segment_ids = array('I')
+        self.segment_counts = array('I')
+
+    def __len__(self) -> int:
+        return len(self.success)
+
+    @staticmethod
+    def _intern(value, values: list, index: dict) -> int:
+        position = index.get(value)
+        if position is None:
+            position = index[value] = len(values)
+            values.append(value)
+        return position
+
+    @staticmethod
+    def _microseconds(milliseconds) -> int:
+        """Duration logged in milliseconds as integer microseconds (exact sums), -1 if absent."""
+        try:
+            return max(0, round(float(milliseconds) * 1000)) if milliseconds is not None else -1
+        except (TypeError, ValueError):
+            return -1
+
+    def append(self, event: Dict, timestamp: Optional[datetime] = None) -> None:
+        """
+        Add one event.
+
+        Args:
+            event: Event dictionary as written by UsageTracker
+            timestamp: Already parsed timestamp (parsed from the event if None)
+        """
+        if timestamp is None:
+            try:
+                timestamp = datetime.fromisoformat(event['timestamp'])
+            except (KeyError, TypeError, ValueError):
+                timestamp = None
+
+        segment_counts = event.get('segment_counts') or {}
+        values = (
+            1 if event.get('success', True) else 0,
+            int(event.get('total_segments') or 0),
+            int(event.get('message_length') or 0),
+        )
+
+        self.message_type.append(self._intern(event.get('message_type', 'UNKNOWN'),
+                                              self.message_types, self._message_type_index))
+        self.day.append(self._intern(event.get('date', 'UNKNOWN'), self.dates, self._date_index))
+        self.ordinal.append(timestamp.toordinal() if timestamp is not None else 0)
+        self.hour.append(timestamp.hour if timestamp is not None else -1)
+        self.success.append(values[0])
+        self.total_segments.append(values[1])
+        self.message_length.append(values[2])
+        self.duration.append(self._microseconds(event.get('duration_ms')))
+        self.request_duration.append(self._microseconds(event.get('request_duration_ms')))
+
+        for segment, count in segment_counts.items():
+            self.segment_ids.append(self._intern(segment, self.segment_types, self._segment_index))
+            self.segment_counts.append(count)
+        self.segment_indptr.append(len(self.segment_ids))
+
+    @classmethod
+    def from_events(cls, events: Iterable[Dict]) -> 'UsageEventColumns':
+        """Build columns from event dictionaries."""
+        columns = cls()
+        for event in events:
+            columns.append(event)
+        return columns
+
+    def aggregate(self, indices: Optional[Iterable[int]] = None) -> UsageAggregate:
+        """
+        Aggregate all events, or the events at the given positions.
+
+        Args:
+            indices: Event positions (default: all events)
+
+        Returns:
+            Aggregated counters
+        """
+        aggregate = UsageAggregate()
+
+        if indices is None:
+            message_type, day, hour = self.message_type, self.day, self.hour
+            aggregate.total = len(self)
+            aggregate.successful = sum(self.success)
+            aggregate.total_segments = sum(self.total_segments)
+            aggregate.total_message_length = sum(self.message_length)
+            segment_ids, segment_counts = self.segment_ids, self.segment_counts
+            duration, request_duration = self.duration, self.request_duration
+        else:
+            indices = list(indices)
+            message_type = [self.message_type[i] for i in indices]
+            day = [self.day[i] for i in indices]
+            hour = [self.hour[i] for i in indices]
+            aggregate.total = len(indices)
+            aggregate.successful = sum(self.success[i] for i in indices)
+            aggregate.total_segments = sum(self.total_segments[i] for i in indices)
+            aggregate.total_message_length = sum(self.message_length[i] for i in indices)
+            indptr = self.segment_indptr
+            segment_ids = [self.segment_ids[j] for i in indices for j in range(indptr[i], indptr[i + 1])]
+            segment_counts = [self.segment_counts[j] for i in indices for j in range(indptr[i], indptr[i + 1])]
+            duration = [self.duration[i] for i in indices]
+            request_duration = [self.request_duration[i] for i in indices]
+
+        for index, count in Counter(message_type).items():
+            aggregate.message_types[self.message_types[index]] = count
+
+        segment_totals = [0] * len(self.segment_types)
+        for segment_id, count in zip(segment_ids, segment_counts):
+            segment_totals[segment_id] += count
+        for segment_id in dict.fromkeys(segment_ids):
+            aggregate.segments[self.segment_types[segment_id]] = segment_totals[segment_id]
+
+        for index, count in Counter(day).items():
+            aggregate.daily[self.dates[index]] = count
+        aggregate.hourly = Counter(hour)
+        aggregate.hourly.pop(-1, None)
+
+        by_type, by_day = {}, {}
+        for type_index, day_index, value in zip(message_type, day, duration):
+            if value >= 0:
+                aggregate.latency.add(value)
+                summary = by_type.get(type_index)
+                if summary is None:
+                    summary = by_type[type_index] = LatencySummary()
+                summary.add(value)
+                summary = by_day.get(day_index)
+                if summary is None:
+                    summary = by_day[day_index] = LatencySummary()
+                summary.add(value)
+        aggregate.latency_by_type = {self.message_types[index]: summary for index, summary in by_type.items()}
+        aggregate.latency_by_day = {self.dates[index]: summary for index, summary in by_day.items()}
+        for value in request_duration:
+            if value >= 0:
+                aggregate.request_latency.add(value)
+
+        return aggregate
+
+    def aggregates_by_day(self) -> Dict[int, UsageAggregate]:
+        """
+        Aggregate events per timestamp date, so partial results can be filtered by date.
+
+        Returns:
+            Mapping of date ordinal (0 for unparsable timestamps) to aggregate
+        """
+        positions: Dict[int, List[int]] = {}
+        for position, ordinal in enumerate(self.ordinal):
+            positions.setdefault(ordinal, []).append(position)
+
+        if len(positions) == 1:
+            return {ordinal: self.aggregate() for ordinal in positions}
+        return {ordinal: self.aggregate(indices) for ordinal, indices in positions.items()}
+
+    def statistics(self) -> Dict:
+        """
+        Compute usage statistics (same structure as UsageTracker.get_statistics()).
+
+        Returns:
+            Dictionary with computed statistics
+        """
+        return self.aggregate().to_statistics()
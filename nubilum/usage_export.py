@@ -0,0 +1,299 @@
+"""Streaming export of usage events and daily statistics.
+
+Events are read line by line from the usage log and its rotated shards
+(oldest first), filtered, and encoded as NDJSON or CSV in chunks, so an
+export of months of events never holds more than one chunk in memory.
+
+Every exported event carries a cursor: the shard's inode, the byte offset
+just after the event and a fingerprint of the shard's first bytes. Passing
+the last cursor received resumes the export right after that event, also
+when the connection dropped mid-stream or the log was rotated in between
+(a rotated shard keeps its inode). A cursor whose shard was deleted or
+compressed has expired.
+"""
+
+import csv
+import hashlib
+import io
+import logging
+import os
+import re
+from datetime import date
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from nubilum import jsonutil
+from nubilum.usage_stats import UsageStatistics
+
+logger = logging.getLogger(__name__)
+
+FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+EVENT_COLUMNS = ('timestamp', 'date', 'time', 'message_type', 'success', 'error', 'total_segments',
+                 'message_length', 'duration_ms', 'request_duration_ms', 'segment_counts', 'cursor')
+
+DAILY_COLUMNS = ('date', 'anonymizations', 'successful', 'failed', 'total_segments',
+                 'total_message_length', 'distinct_message_control_ids', 'latency_p50_ms',
+                 'latency_p95_ms', 'latency_p99_ms')
+
+CHUNK_SIZE = 64 * 1024
+
+_FINGERPRINT_BYTES = 256
+_CURSOR = re.compile(r'^([0-9a-f]+)\.([0-9]+)\.([0-9a-f]{16})$')
+
+
+class UsageExportError(ValueError):
+    """Invalid export parameters or cursor."""
+
+
+class CursorExpired(UsageExportError):
+    """The shard a cursor points into no longer exists."""
+
+
+def _read_head(path: Path) -> bytes:
+    with open(path, 'rb') as f:
+        return f.read(_FINGERPRINT_BYTES)
+
+
+def _fingerprint(head: bytes, offset: int) -> str:
+    """Hash of a shard's bytes before offset, up to _FINGERPRINT_BYTES (appending never changes it)."""
+    return hashlib.sha256(head[:min(_FINGERPRINT_BYTES, offset)]).hexdigest()[:16]
+
+
+def parse_date(value: Optional[str], name: str) -> Optional[str]:
+    """Validate an optional YYYY-MM-DD parameter."""
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value).isoformat()
+    except ValueError:
+        raise UsageExportError(f"'{name}' must be a date (YYYY-MM-DD)")
+
+
+class EventFilter:
+    """Selects usage events by date range, message type and outcome."""
+
+    __slots__ = ('since', 'until', 'message_types', 'success')
+
+    def __init__(self, since: Optional[str] = None, until: Optional[str] = None,
+                 message_types: Optional[Iterable[str]] = None, success: Optional[bool] = None):
+        """
+        Args:
+            since: First date included (YYYY-MM-DD)
+            until: Last date included (YYYY-MM-DD)
+            message_types: Message types included (default: all)
+            success: Only successful (True) or failed (False) anonymizations
+        """
+        self.since = since
+        self.until = until
+        self.message_types = set(message_types) if message_types else None
+        self.success = success
+
+    def matches(self, event: Dict) -> bool:
+        event_date = event.get('date') or ''
+        if self.since and event_date < self.since:
+            return False
+        if self.until and event_date > self.until:
+            return False
+        if self.message_types is not None and event.get('message_type') not in self.message_types:
+            return False
+        if self.success is not None and bool(event.get('success', True)) != self.success:
+            return False
+        return True
+
+
+def _ordered_shards(statistics: UsageStatistics) -> List[Tuple[Path, os.stat_result]]:
+    """Shards oldest first (rotated shards by last write, then the active log)."""
+    shards = []
+    for path in statistics.shards():
+        try:
+            shards.append((path, path.stat()))
+        except OSError:
+            continue
+    active = [(path, stat) for path, stat in shards if path == statistics.log_file]
+    rotated = sorted((item for item in shards if item[0] != statistics.log_file),
+                     key=lambda item: (item[1].st_mtime, item[0].name))
+    return rotated + active
+
+
+def iter_events(statistics: UsageStatistics, event_filter: Optional[EventFilter] = None,
+                cursor: Optional[str] = None, limit: Optional[int] = None) -> Iterator[Tuple[Dict, str]]:
+    """
+    Read matching usage events, oldest first.
+
+    The cursor is checked before this returns, so errors can be reported
+    before a response starts streaming.
+
+    Args:
+        statistics: Statistics engine of the usage log (for its shards)
+        event_filter: Events to include (default: all)
+        cursor: Resume after the event this cursor was returned with
+        limit: Maximum number of events
+
+    Returns:
+        Iterator of (event, cursor) pairs
+
+    Raises:
+        UsageExportError: If the cursor is malformed
+        CursorExpired: If the cursor's shard no longer exists
+    """
+    event_filter = event_filter or EventFilter()
+    shards = _ordered_shards(statistics)
+    start_index, start_offset = 0, 0
+
+    if cursor:
+        match = _CURSOR.match(cursor)
+        if not match:
+            raise UsageExportError("Malformed cursor")
+        inode, offset, fingerprint = int(match.group(1), 16), int(match.group(2)), match.group(3)
+        for index, (path, stat) in enumerate(shards):
+            if stat.st_ino == inode and offset <= stat.st_size:
+                if _fingerprint(_read_head(path), offset) == fingerprint:
+                    start_index, start_offset = index, offset
+                    break
+        else:
+            raise CursorExpired("Cursor expired: its log shard was removed or compressed")
+
+    return _read_events(statistics.log_file, shards, start_index, start_offset, event_filter, limit)
+
+
+def _read_events(log_file: Path, shards: List[Tuple[Path, os.stat_result]], start_index: int,
+                 start_offset: int, event_filter: EventFilter,
+                 limit: Optional[int]) -> Iterator[Tuple[Dict, str]]:
+    # Shards last written before the first requested date hold no matching events
+    since = event_filter.since
+    emitted = 0
+
+    for index in range(start_index, len(shards)):
+        path, stat = shards[index]
+        if since and path != log_file and date.fromtimestamp(stat.st_mtime).isoformat() < since:
+            continue
+
+        try:
+            f = open(path, 'rb')
+        except OSError as e:
+            logger.warning(f"Cannot read usage log {path}: {e}")
+            continue
+
+        with f:
+            head = f.read(_FINGERPRINT_BYTES)
+            position = start_offset if index == start_index else 0
+            f.seek(position)
+
+            for line in f:
+                position += len(line)
+                if not line.endswith(b'\n'):
+                    break  # partially written last line
+                try:
+                    event = jsonutil.loads(line)
+                except ValueError:
+                    continue
+                if not isinstance(event, dict) or not event_filter.matches(event):
+                    continue
+
+                if len(head) < min(position, _FINGERPRINT_BYTES):
+                    head = _read_head(path)  # the shard was shorter when opened
+                yield event, f'{stat.st_ino:x}.{position}.{_fingerprint(head, position)}'
+
+                emitted += 1
+                if limit is not None and emitted >= limit:
+                    return
+
+
+def _chunked(lines: Iterable[str]) -> Iterator[str]:
+    """Join encoded lines into chunks of about CHUNK_SIZE characters."""
+    buffer: List[str] = []
+    size = 0
+    for line in lines:
+        buffer.append(line)
+        size += len(line)
+        if size >= CHUNK_SIZE:
+            yield ''.join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+def _csv_line(values: Iterable) -> str:
+    out = io.StringIO()
+    csv.writer(out, lineterminator='\n').writerow(values)
+    return out.getvalue()
+
+
+def encode_events(records: Iterable[Tuple[Dict, str]], fmt: str) -> Iterator[str]:
+    """
+    Encode (event, cursor) pairs as NDJSON or CSV chunks.
+
+    Args:
+        records: Pairs from iter_events()
+        fmt: 'ndjson' (events with a 'cursor' key) or 'csv' (EVENT_COLUMNS, with a header)
+
+    Yields:
+        Text chunks
+    """
+    if fmt == 'csv':
+        def lines():
+            yield _csv_line(EVENT_COLUMNS)
+            for event, cursor in records:
+                row = dict(event, cursor=cursor)
+                row['segment_counts'] = jsonutil.dumps(event.get('segment_counts') or {})
+                yield _csv_line('' if row.get(column) is None else row[column] for column in EVENT_COLUMNS)
+    else:
+        def lines():
+            for event, cursor in records:
+                yield jsonutil.dumps(dict(event, cursor=cursor)) + '\n'
+    return _chunked(lines())
+
+
+def daily_rows(statistics: UsageStatistics, since: Optional[str] = None,
+               until: Optional[str] = None) -> Iterator[Dict]:
+    """
+    Per-day statistics from the cached per-day partials.
+
+    Args:
+        statistics: Statistics engine of the usage log
+        since: First date included (YYYY-MM-DD)
+        until: Last date included (YYYY-MM-DD)
+
+    Yields:
+        One dict per day with DAILY_COLUMNS, oldest first
+    """
+    sketches = statistics.sketches.by_day() if statistics.sketches is not None else {}
+    for ordinal, aggregate in sorted(statistics.partials().items()):
+        if not ordinal:
+            continue  # unparsable timestamps
+        day = date.fromordinal(ordinal).isoformat()
+        if (since and day < since) or (until and day > until):
+            continue
+
+        latency = aggregate.latency.to_statistics()
+        yield {
+            'date': day,
+            'anonymizations': aggregate.total,
+            'successful': aggregate.successful,
+            'failed': aggregate.total - aggregate.successful,
+            'total_segments': aggregate.total_segments,
+            'total_message_length': aggregate.total_message_length,
+            'distinct_message_control_ids': (sketches[ordinal].control_ids.count()
+                                             if ordinal in sketches else 0),
+            'latency_p50_ms': latency.get('p50_ms'),
+            'latency_p95_ms': latency.get('p95_ms'),
+            'latency_p99_ms': latency.get('p99_ms'),
+        }
+
+
+def encode_rows(rows: Iterable[Dict], fmt: str, columns: Tuple[str, ...]) -> Iterator[str]:
+    """Encode dict rows as NDJSON or CSV chunks (CSV with a header of columns)."""
+    if fmt == 'csv':
+        def lines():
+            yield _csv_line(columns)
+            for row in rows:
+                yield _csv_line('' if row.get(column) is None else row[column] for column in columns)
+    else:
+        def lines():
+            for row in rows:
+                yield jsonutil.dumps(row) + '\n'
+    return _chunked(lines())
@@ -0,0 +1,237 @@
+"""Usage sketches maintained as events are tracked.
+
+Distinct counts (MSH-3, MSH-4, MSH-10), message length and segment count
+percentiles and the most frequent senders are kept in mergeable sketches
+(see nubilum.sketches) instead of being derived from the usage log, so the
+log holds no sender or control ID and statistics need no pass over it.
+
+Each process adds the events it tracks to in-memory sketches per day and
+merges them into its own file every few seconds and at exit:
+
+    <sketch dir>/<YYYY-MM-DD>.<pid>.json
+
+Statistics merge the files of the requested days. A file takes a few kB
+however many events it covers; there is one per worker and day.
+"""
+
+import atexit
+import logging
+import os
+import threading
+from datetime import date
+from pathlib import Path
+from typing import Dict, Optional
+
+from nubilum.fileutil import atomic_write_json, read_json
+from nubilum.sketches import DDSketch, HyperLogLog, SpaceSaving
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FLUSH_INTERVAL = 5.0  # seconds tracked sketches stay in memory before being merged to disk
+
+PERCENTILES = (50, 90, 95, 99)
+TOP_SENDERS = 10
+
+
+class UsageSketches:
+    """Mergeable sketches of the events of one day (or several days once merged)."""
+
+    __slots__ = ('applications', 'facilities', 'control_ids', 'message_lengths', 'segment_totals',
+                 'senders')
+
+    def __init__(self):
+        # Distinct MSH-3, MSH-4 and MSH-10 values
+        self.applications = HyperLogLog()
+        self.facilities = HyperLogLog()
+        self.control_ids = HyperLogLog()
+        # Distributions of message length and segments per message
+        self.message_lengths = DDSketch()
+        self.segment_totals = DDSketch()
+        # Most frequent (MSH-3, MSH-4) pairs
+        self.senders = SpaceSaving()
+
+    def add(self, application: Optional[str], facility: Optional[str], control_id: Optional[str],
+            message_length: int, total_segments: int) -> None:
+        """Add one tracked message."""
+        if application:
+            self.applications.add(application)
+        if facility:
+            self.facilities.add(facility)
+        if application is not None or facility is not None:
+            self.senders.add((application, facility))
+        if control_id:
+            self.control_ids.add(control_id)
+        self.message_lengths.add(message_length)
+        self.segment_totals.add(total_segments)
+
+    def merge(self, other: 'UsageSketches') -> 'UsageSketches':
+        """Merge another day's or worker's sketches into these (returns self)."""
+        self.applications.merge(other.applications)
+        self.facilities.merge(other.facilities)
+        self.control_ids.merge(other.control_ids)
+        self.message_lengths.merge(other.message_lengths)
+        self.segment_totals.merge(other.segment_totals)
+        self.senders.merge(other.senders)
+        return self
+
+    def to_dict(self) -> Dict:
+        return {name: getattr(self, name).to_dict() for name in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> 'UsageSketches':
+        sketches = cls()
+        sketches.applications = HyperLogLog.from_dict(data['applications'])
+        sketches.facilities = HyperLogLog.from_dict(data['facilities'])
+        sketches.control_ids = HyperLogLog.from_dict(data['control_ids'])
+        sketches.message_lengths = DDSketch.from_dict(data['message_lengths'])
+        sketches.segment_totals = DDSketch.from_dict(data['segment_totals'])
+        sketches.senders = SpaceSaving.from_dict(data['senders'])
+        return sketches
+
+    @staticmethod
+    def _percentiles(sketch: DDSketch) -> Dict[str, int]:
+        if sketch.count == 0:
+            return {}
+        values = sketch.quantiles(p / 100 for p in PERCENTILES)
+        return {f'p{p}': round(value) for p, value in zip(PERCENTILES, values)}
+
+    def to_statistics(self) -> Dict:
+        """Distinct counts, percentiles and top senders, as in UsageTracker.get_statistics()."""
+        return {
+            "distinct_sending_applications": self.applications.count(),
+            "distinct_sending_facilities": self.facilities.count(),
+            "distinct_message_control_ids": self.control_ids.count(),
+            "message_length_percentiles": self._percentiles(self.message_lengths),
+            "segments_per_message_percentiles": self._percentiles(self.segment_totals),
+            "top_senders": [
+                {"sending_application": application, "sending_facility": facility,
+                 "count": count, "max_overcount": error}
+                for (application, facility), count, error in self.senders.top(TOP_SENDERS)
+            ],
+        }
+
+
+class SketchStore:
+    """Per-day usage sketches of all workers, persisted in one directory."""
+
+    def __init__(self, directory, flush_interval: float = DEFAULT_FLUSH_INTERVAL):
+        """
+        Initialize the store.
+
+        Args:
+            directory: Directory of the per-day, per-worker sketch files
+            flush_interval: Seconds between merges of tracked sketches into this worker's files
+        """
+        self.directory = Path(directory)
+        self.flush_interval = flush_interval
+
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        # Sketches tracked since the last flush, by date (YYYY-MM-DD)
+        self._pending: Dict[str, UsageSketches] = {}
+        self._pid = os.getpid()
+        self._flusher_pid: Optional[int] = None
+        self._stopped = threading.Event()
+        atexit.register(self.flush)
+
+    def _start_flusher(self) -> None:
+        # Threads do not survive fork: a pre-forked worker starts its own on first use
+        if self._flusher_pid == os.getpid() or self._stopped.is_set():
+            return
+        self._flusher_pid = os.getpid()
+
+        def flush():
+            while not self._stopped.wait(self.flush_interval):
+                self.flush()
+
+        threading.Thread(target=flush, name='nubilum-usage-sketches', daemon=True).start()
+
+    def _own_pending(self) -> Dict[str, UsageSketches]:
+        """Pending sketches of this process (those inherited through fork belong to the parent)."""
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._pending = {}
+        return self._pending
+
+    def track(self, day: str, application: Optional[str], facility: Optional[str],
+              control_id: Optional[str], message_length: int, total_segments: int) -> None:
+        """
+        Add one tracked message to the sketches of its day.
+
+        Args:
+            day: Date of the event (YYYY-MM-DD)
+            application: Sending application (MSH-3)
+            facility: Sending facility (MSH-4)
+            control_id: Message control ID (MSH-10); only its hash enters the sketch
+            message_length: Message length in characters
+            total_segments: Number of segments
+        """
+        with self._lock:
+            self._start_flusher()
+            pending = self._own_pending()
+            sketches = pending.get(day)
+            if sketches is None:
+                sketches = pending[day] = UsageSketches()
+            sketches.add(application, facility, control_id, message_length, total_segments)
+
+    def flush(self) -> None:
+        """Merge the sketches tracked since the last flush into this worker's files."""
+        with self._flush_lock:
+            with self._lock:
+                pending = self._own_pending()
+                self._pending = {}
+            if not pending:
+                return
+
+            for day, sketches in pending.items():
+                path = self.directory / f'{day}.{os.getpid()}.json'
+                try:
+                    saved = read_json(path)
+                    merged = UsageSketches.from_dict(saved) if saved else UsageSketches()
+                    self.directory.mkdir(parents=True, exist_ok=True)
+                    atomic_write_json(path, merged.merge(sketches).to_dict(), fsync=False)
+                except (OSError, KeyError, TypeError, ValueError) as e:
+                    logger.warning(f"Cannot save usage sketches for {day}: {e}")
+                    # Kept for the next flush
+                    with self._lock:
+                        self._own_pending().setdefault(day, UsageSketches()).merge(sketches)
+
+    def by_day(self) -> Dict[int, UsageSketches]:
+        """
+        Sketches of every day, merged across workers (including this worker's unsaved ones).
+
+        Returns:
+            Mapping of date ordinal to sketches
+        """
+        self.flush()
+        days: Dict[int, UsageSketches] = {}
+        if not self.directory.is_dir():
+            return days
+
+        for path in self.directory.glob('*.json'):
+            try:
+                ordinal = date.fromisoformat(path.name.split('.', 1)[0]).toordinal()
+                saved = read_json(path)
+                if saved:
+                    days.setdefault(ordinal, UsageSketches()).merge(UsageSketches.from_dict(saved))
+            except (KeyError, TypeError, ValueError) as e:
+                logger.warning(f"Ignoring unreadable usage sketches {path.name}: {e}")
+        return days
+
+    def merged(self, cutoff: Optional[int] = None) -> UsageSketches:
+        """
+        Sketches of all days from a date on, merged.
+
+        Args:
+            cutoff: First date ordinal included (None for all days)
+        """
+        total = UsageSketches()
+        for ordinal, sketches in self.by_day().items():
+            if cutoff is None or ordinal >= cutoff:
+                total.merge(sketches)
+        return total
+
+    def close(self) -> None:
+        """Stop the flush timer and save what is pending."""
+        self._stopped.set()
+        self.flush()
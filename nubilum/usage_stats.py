@@ -0,0 +1,248 @@
+"""Map-reduce statistics over the usage log and its rotated shards.
+
+The active log (``usage_log.jsonl``) and rotated shards next to it
+(``usage_log.jsonl.1``, ``usage_log.jsonl-20250101``, ...) are split into
+byte ranges aligned on newlines. Each range is parsed into compact columns
+and aggregated per day, in the calling process by default or in a pool of
+spawned processes (not forked: the caller may be a web worker holding shared
+memory and locks); the per-day partials are then
+merged (counters add, sketches merge) and filtered by date. Distinct counts,
+percentiles and top senders come from the sketches kept as events are
+tracked (nubilum.usage_sketches), merged for the same dates.
+
+Per-shard partials are cached on disk, keyed by inode and a fingerprint of the
+first bytes, together with the offset up to which the shard was parsed. A
+closed shard is therefore parsed exactly once (also after logrotate renames
+the active log), and the active log only has its newly appended tail parsed.
+"""
+
+import hashlib
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from nubilum import jsonutil
+from nubilum.fileutil import atomic_write_json, read_json
+from nubilum.usage_events import UsageAggregate, UsageEventColumns
+from nubilum.usage_sketches import SketchStore
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RANGE_SIZE = 16 * 1024 * 1024
+PARALLEL_MIN_BYTES = 8 * 1024 * 1024  # below this, parsing in-process is faster than a pool
+
+_CACHE_VERSION = 4
+_FINGERPRINT_BYTES = 4096
+_COMPRESSED_SUFFIXES = ('.gz', '.bz2', '.xz', '.zst')
+
+
+def _aggregate_range(path: str, start: int, end: int) -> Dict[int, Dict]:
+    """Parse the complete lines in [start, end) and aggregate them per day (pool task)."""
+    columns = UsageEventColumns()
+
+    with open(path, 'rb') as f:
+        f.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            line = f.readline(remaining)
+            if not line:
+                break
+            remaining -= len(line)
+            try:
+                event = jsonutil.loads(line)
+            except ValueError:
+                continue
+            if isinstance(event, dict):
+                columns.append(event)
+
+    return {ordinal: aggregate.to_dict() for ordinal, aggregate in columns.aggregates_by_day().items()}
+
+
+def _split_ranges(path: Path, start: int, end: int, range_size: int) -> List[Tuple[int, int]]:
+    """Split [start, end) into ranges whose boundaries follow a newline."""
+    ranges = []
+    with open(path, 'rb') as f:
+        while start < end:
+            boundary = start + range_size
+            if boundary >= end:
+                ranges.append((start, end))
+                break
+            f.seek(boundary)
+            f.readline()
+            boundary = min(f.tell(), end)
+            ranges.append((start, boundary))
+            start = boundary
+    return ranges
+
+
+def _complete_end(path: Path, size: int) -> int:
+    """Offset just after the last newline (a partially written last line is left for later)."""
+    with open(path, 'rb') as f:
+        position = size
+        while position > 0:
+            block = min(64 * 1024, position)
+            f.seek(position - block)
+            data = f.read(block)
+            newline = data.rfind(b'\n')
+            if newline >= 0:
+                return position - block + newline + 1
+            position -= block
+    return 0
+
+
+def _fingerprint(path: Path, offset: int) -> str:
+    """Hash of the first bytes of a shard, up to the parsed offset (the log grows after it)."""
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read(min(_FINGERPRINT_BYTES, offset))).hexdigest()
+
+
+class UsageStatistics:
+    """Computes usage statistics over a log file and its rotated shards."""
+
+    def __init__(self, log_file, cache_dir=None, workers: int = 1,
+                 range_size: int = DEFAULT_RANGE_SIZE, sketches: Optional[SketchStore] = None):
+        """
+        Initialize the statistics engine.
+
+        Args:
+            log_file: Active usage log (JSONL)
+            cache_dir: Directory for per-shard partials (default: <log dir>/.usage-stats-cache)
+            workers: Parser processes (default: 1, parsing in-process)
+            range_size: Bytes per parse task
+            sketches: Sketches tracked with the log's events (none if None)
+        """
+        self.log_file = Path(log_file)
+        self.cache_dir = Path(cache_dir) if cache_dir else self.log_file.parent / '.usage-stats-cache'
+        self.workers = max(1, workers or 1)
+        self.range_size = range_size
+        self.sketches = sketches
+
+    def shards(self) -> List[Path]:
+        """The active log and its uncompressed rotated shards."""
+        name = self.log_file.name
+        shards = []
+        if self.log_file.parent.is_dir():
+            for path in self.log_file.parent.iterdir():
+                rotated = path.name.startswith((name + '.', name + '-'))
+                if rotated and not path.name.endswith(_COMPRESSED_SUFFIXES) and path.is_file():
+                    shards.append(path)
+        shards.sort()
+        if self.log_file.is_file():
+            shards.append(self.log_file)
+        return shards
+
+    def _cache_path(self, stat: os.stat_result) -> Path:
+        return self.cache_dir / f'{self.log_file.name}-{stat.st_dev}-{stat.st_ino}.json'
+
+    def _load_cached(self, path: Path, stat: os.stat_result) -> Tuple[int, Dict[int, UsageAggregate]]:
+        """Return (parsed offset, per-day partials) from the cache, or (0, {})."""
+        cached = read_json(self._cache_path(stat))
+        if (not cached or cached.get('version') != _CACHE_VERSION
+                or cached.get('offset', 0) > stat.st_size
+                or cached.get('fingerprint') != _fingerprint(path, cached.get('offset', 0))):
+            return 0, {}
+
+        partials = {int(ordinal): UsageAggregate.from_dict(data)
+                    for ordinal, data in cached['partials'].items()}
+        return cached['offset'], partials
+
+    def _save_cached(self, path: Path, stat: os.stat_result, offset: int,
+                     partials: Dict[int, UsageAggregate]) -> None:
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            atomic_write_json(self._cache_path(stat), {
+                'version': _CACHE_VERSION,
+                'path': path.name,
+                'offset': offset,
+                'fingerprint': _fingerprint(path, offset),
+                'partials': {str(ordinal): aggregate.to_dict() for ordinal, aggregate in partials.items()},
+            }, fsync=False)
+        except OSError as e:
+            logger.warning(f"Cannot cache usage statistics for {path.name}: {e}")
+
+    def _remove_stale_cache(self, keep: set) -> None:
+        if not self.cache_dir.is_dir():
+            return
+        for cache_file in self.cache_dir.glob(f'{self.log_file.name}-*.json'):
+            if cache_file.name not in keep:
+                try:
+                    cache_file.unlink()
+                except OSError:
+                    pass
+
+    def _run_tasks(self, tasks: List[Tuple[str, int, int]]) -> List[Dict[int, Dict]]:
+        total_bytes = sum(end - start for _, start, end in tasks)
+        if self.workers <= 1 or len(tasks) <= 1 or total_bytes < PARALLEL_MIN_BYTES:
+            return [_aggregate_range(*task) for task in tasks]
+
+        logger.info(f"Parsing {total_bytes} bytes of usage logs in {len(tasks)} ranges")
+        with ProcessPoolExecutor(max_workers=min(self.workers, len(tasks)),
+                                 mp_context=multiprocessing.get_context('spawn')) as pool:
+            return list(pool.map(_aggregate_range, *zip(*tasks)))
+
+    def partials(self) -> Dict[int, UsageAggregate]:
+        """
+        Per-day partial aggregates over all shards, parsing only uncached data.
+
+        Returns:
+            Mapping of date ordinal (0 for unparsable timestamps) to aggregate
+        """
+        shard_state = []
+        tasks = []
+        task_owner = []
+
+        for path in self.shards():
+            try:
+                stat = path.stat()
+                offset, partials = self._load_cached(path, stat)
+                end = _complete_end(path, stat.st_size)
+            except OSError as e:
+                logger.warning(f"Cannot read usage log {path}: {e}")
+                continue
+
+            shard_state.append((path, stat, end, partials, offset != end))
+            for start, range_end in _split_ranges(path, offset, end, self.range_size):
+                tasks.append((str(path), start, range_end))
+                task_owner.append(len(shard_state) - 1)
+
+        for owner, result in zip(task_owner, self._run_tasks(tasks)):
+            partials = shard_state[owner][3]
+            for ordinal, data in result.items():
+                aggregate = UsageAggregate.from_dict(data)
+                if ordinal in partials:
+                    partials[ordinal].merge(aggregate)
+                else:
+                    partials[ordinal] = aggregate
+
+        merged: Dict[int, UsageAggregate] = {}
+        for path, stat, end, partials, changed in shard_state:
+            if changed:
+                self._save_cached(path, stat, end, partials)
+            for ordinal, aggregate in partials.items():
+                merged.setdefault(ordinal, UsageAggregate()).merge(aggregate)
+
+        self._remove_stale_cache({self._cache_path(stat).name for _, stat, *_ in shard_state})
+        return merged
+
+    def compute(self, days: Optional[int] = None) -> Dict:
+        """
+        Compute usage statistics.
+
+        Args:
+            days: Number of days to look back (None for all time)
+
+        Returns:
+            Dictionary with usage statistics
+        """
+        cutoff = (date.today() - timedelta(days=days)).toordinal() if days is not None else None
+
+        total = UsageAggregate()
+        for ordinal, aggregate in sorted(self.partials().items()):
+            if cutoff is None or (ordinal and ordinal >= cutoff):
+                total.merge(aggregate)
+
+        return total.to_statistics(self.sketches.merged(cutoff) if self.sketches is not None else None)
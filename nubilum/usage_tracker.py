@@ -1,27 +1,40 @@
 """Usage tracking module for Nubilum anonymization tool."""
 
-import json
 import logging
 from datetime import datetime
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Dict, Optional
 from collections import defaultdict
 
+from nubilum import jsonutil
+from nubilum.usage_sketches import SketchStore
+from nubilum.usage_stats import UsageStatistics
+
 logger = logging.getLogger(__name__)
 
 
 class UsageTracker:
     """Tracks usage statistics for message anonymization."""
 
-    def __init__(self, log_file: str = "usage_log.jsonl"):
+    def __init__(self, log_file: str = "usage_log.jsonl", stats_workers: int = 1,
+                 stats_cache_dir: Optional[str] = None, sketch_dir: Optional[str] = None):
         """
         Initialize the usage tracker.
 
         Args:
             log_file: Path to the JSONL log file for usage tracking
+            stats_workers: Processes used to parse large logs (default: 1, in-process)
+            stats_cache_dir: Directory for cached per-shard statistics
+                (default: <log dir>/.usage-stats-cache)
+            sketch_dir: Directory for the sketches of tracked events
+                (default: <log dir>/.usage-sketches)
         """
         self.log_file = Path(log_file)
-        self._ensure_log_file()
+        self.sketches = SketchStore(sketch_dir or self.log_file.parent / '.usage-sketches')
+        self.statistics = UsageStatistics(self.log_file, cache_dir=stats_cache_dir,
+                                          workers=stats_workers, sketches=self.sketches)
+        # The log is created with the first event, not when the app is imported
+        self._log_ready = False
 
     def _ensure_log_file(self):
         """Ensure the log file exists and is writable."""
@@ -60,6 +73,35 @@ class UsageTracker:
             logger.error(f"Failed to extract message type: {e}")
             return "ERROR"
 
+    def _extract_sender(self, message: str) -> Dict[str, Optional[str]]:
+        """
+        Extract the sender and the control ID from the MSH segment.
+
+        They only feed the tracked sketches and are never written to the log.
+
+        Args:
+            message: HL7 message string
+
+        Returns:
+            Dict with 'application' (MSH-3), 'facility' (MSH-4) and
+            'control_id' (MSH-10), each None if not present
+        """
+        sender = {'application': None, 'facility': None, 'control_id': None}
+        if not message:
+            return sender
+
+        for line in message.split('\n'):
+            line = line.strip()
+            if line.startswith('MSH'):
+                fields = line.split('|')
+                if len(fields) > 3:
+                    sender['application'] = fields[2].strip()
+                    sender['facility'] = fields[3].strip()
+                if len(fields) > 9 and fields[9].strip():
+                    sender['control_id'] = fields[9].strip()
+                break
+        return sender
+
     def _count_segments(self, message: str) -> Dict[str, int]:
         """
         Count the number of each segment type in the message.
@@ -88,7 +130,8 @@ class UsageTracker:
         return dict(segment_counts)
 
     def track_anonymization(self, original_message: str, success: bool = True,
-                           error: Optional[str] = None) -> None:
+                           error: Optional[str] = None, duration_ms: Optional[float] = None,
+                           request_duration_ms: Optional[float] = None) -> None:
         """
         Track an anonymization event.
 
@@ -96,10 +139,14 @@ class UsageTracker:
             original_message: The original HL7 message before anonymization
             success: Whether the anonymization was successful
             error: Error message if anonymization failed
+            duration_ms: Time spent anonymizing the message (monotonic clock)
+            request_duration_ms: Time of the whole request, given with the
+                request's last message
         """
         try:
             message_type = self._extract_message_type(original_message)
             segment_counts = self._count_segments(original_message)
+            sender = self._extract_sender(original_message)
 
             event = {
                 "timestamp": datetime.now().isoformat(),
@@ -110,12 +157,22 @@ class UsageTracker:
                 "total_segments": sum(segment_counts.values()),
                 "message_length": len(original_message) if original_message else 0,
                 "success": success,
-                "error": error
+                "error": error,
             }
+            if duration_ms is not None:
+                event["duration_ms"] = round(duration_ms, 3)
+            if request_duration_ms is not None:
+                event["request_duration_ms"] = round(request_duration_ms, 3)
 
             # Append to JSONL file
+            if not self._log_ready:
+                self._ensure_log_file()
+                self._log_ready = True
             with open(self.log_file, 'a', encoding='utf-8') as f:
-                f.write(json.dumps(event) + '\n')
+                f.write(jsonutil.dumps(event) + '\n')
+
+            self.sketches.track(event["date"], sender['application'], sender['facility'],
+                                sender['control_id'], event["message_length"], event["total_segments"])
 
             logger.info(f"Tracked anonymization: type={message_type}, success={success}")
 
@@ -124,7 +181,7 @@ class UsageTracker:
 
     def get_statistics(self, days: Optional[int] = None) -> Dict:
         """
-        Get usage statistics from the log file.
+        Get usage statistics from the log file and its rotated shards.
 
         Args:
             days: Number of days to look back (None for all time)
@@ -136,30 +193,7 @@ class UsageTracker:
             if not self.log_file.exists():
                 return self._empty_statistics()
 
-            events = []
-            cutoff_date = None
-            if days is not None:
-                cutoff_date = datetime.now().date()
-                from datetime import timedelta
-                cutoff_date = cutoff_date - timedelta(days=days)
-
-            # Read all events from JSONL file
-            with open(self.log_file, 'r', encoding='utf-8') as f:
-                for line in f:
-                    try:
-                        event = json.loads(line.strip())
-
-                        # Filter by date if specified
-                        if cutoff_date:
-                            event_date = datetime.fromisoformat(event['timestamp']).date()
-                            if event_date < cutoff_date:
-                                continue
-
-                        events.append(event)
-                    except json.JSONDecodeError:
-                        continue
-
-            return self._compute_statistics(events)
+            return self.statistics.compute(days)
 
         except Exception as e:
             logger.error(f"Failed to get statistics: {e}")
@@ -178,64 +212,14 @@ class UsageTracker:
             "total_message_length": 0,
             "daily_counts": {},
             "hourly_distribution": {},
-        }
-
-    def _compute_statistics(self, events: List[Dict]) -> Dict:
-        """
-        Compute statistics from a list of events.
-
-        Args:
-            events: List of event dictionaries
-
-        Returns:
-            Dictionary with computed statistics
-        """
-        total = len(events)
-        successful = sum(1 for e in events if e.get('success', True))
-        failed = total - successful
-
-        message_types = defaultdict(int)
-        segments_processed = defaultdict(int)
-        total_segments = 0
-        total_message_length = 0
-        daily_counts = defaultdict(int)
-        hourly_distribution = defaultdict(int)
-
-        for event in events:
-            # Message types
-            msg_type = event.get('message_type', 'UNKNOWN')
-            message_types[msg_type] += 1
-
-            # Segments
-            for segment, count in event.get('segment_counts', {}).items():
-                segments_processed[segment] += count
-
-            total_segments += event.get('total_segments', 0)
-            total_message_length += event.get('message_length', 0)
-
-            # Daily counts
-            date = event.get('date', 'UNKNOWN')
-            daily_counts[date] += 1
-
-            # Hourly distribution
-            try:
-                timestamp = datetime.fromisoformat(event['timestamp'])
-                hour = timestamp.hour
-                hourly_distribution[hour] += 1
-            except (KeyError, ValueError):
-                pass
-
-        return {
-            "total_anonymizations": total,
-            "successful_anonymizations": successful,
-            "failed_anonymizations": failed,
-            "success_rate": round((successful / total * 100) if total > 0 else 0.0, 2),
-            "message_types": dict(sorted(message_types.items(), key=lambda x: x[1], reverse=True)),
-            "segments_processed": dict(sorted(segments_processed.items(), key=lambda x: x[1], reverse=True)),
-            "total_segments": total_segments,
-            "total_message_length": total_message_length,
-            "average_message_length": round(total_message_length / total) if total > 0 else 0,
-            "average_segments_per_message": round(total_segments / total, 1) if total > 0 else 0,
-            "daily_counts": dict(sorted(daily_counts.items())),
-            "hourly_distribution": dict(sorted(hourly_distribution.items())),
+            "distinct_sending_applications": 0,
+            "distinct_sending_facilities": 0,
+            "distinct_message_control_ids": 0,
+            "message_length_percentiles": {},
+            "segments_per_message_percentiles": {},
+            "top_senders": [],
+            "latency": {"count": 0},
+            "request_latency": {"count": 0},
+            "latency_by_message_type": {},
+            "latency_by_day": {},
         }
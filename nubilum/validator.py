@@ -0,0 +1,490 @@
+"""Local structural validation of HL7 v2 messages.
+
+Checks a message against the hl7apy definitions of its version (MSH-12) and
+message structure (MSH-9), without any network access:
+
+- segment order, required segments and groups, and segment repetitions
+- required fields and field repetitions
+- primitive data types (NM, SI, DT, DTM, TM) of fields, components and
+  subcomponents
+
+hl7apy's nested structure tuples are compiled once into flat profiles
+(segment order with the first segments of every group, and per segment the
+field rules with their type checks) and cached per version, so validating a
+message is a single pass over its segments. Table values, lengths and
+conditional rules are not checked; Z-segments are accepted anywhere.
+"""
+
+import logging
+import os
+import re
+from functools import lru_cache
+from typing import Dict, FrozenSet, List, NamedTuple, Optional, Tuple
+
+from nubilum import hl7ref
+
+logger = logging.getLogger(__name__)
+
+MAX_ISSUES = 100
+
+# auto: local check first, remote validator only for messages that pass it
+MODES = ('auto', 'local', 'remote')
+DEFAULT_MODE = 'auto'
+
+# Message structures of trigger events that share another event's structure
+# (HL7 v2.5 chapter 3); used when MSH-9.3 is missing
+_EVENT_STRUCTURES = {
+    'ADT': {
+        **dict.fromkeys(('A04', 'A08', 'A13'), 'ADT_A01'),
+        **dict.fromkeys(('A14', 'A28', 'A31'), 'ADT_A05'),
+        'A07': 'ADT_A06',
+        **dict.fromkeys(('A10', 'A11', 'A12'), 'ADT_A09'),
+        **dict.fromkeys(('A22', 'A23', 'A25', 'A26', 'A27', 'A29', 'A32', 'A33'), 'ADT_A21'),
+        **dict.fromkeys(('A34', 'A35', 'A36', 'A46', 'A47', 'A48', 'A49'), 'ADT_A30'),
+        **dict.fromkeys(('A40', 'A41', 'A42'), 'ADT_A39'),
+        'A44': 'ADT_A43',
+        'A51': 'ADT_A50',
+        **dict.fromkeys(('A53', 'A55'), 'ADT_A52'),
+        'A62': 'ADT_A61',
+    },
+    'SIU': dict.fromkeys(('S13', 'S14', 'S15', 'S16', 'S17', 'S18', 'S19', 'S20', 'S21',
+                          'S22', 'S23', 'S24', 'S26'), 'SIU_S12'),
+}
+
+# Generic query structures whose trailing segments are defined by the query
+# profile (the "segment pattern" of HL7 v2.5 chapter 5)
+_OPEN_STRUCTURES = frozenset(('QBP_Q11', 'RSP_K11'))
+
+_PRIMITIVE_PATTERNS = {
+    'NM': re.compile(r'[+-]?(?:\d+(?:\.\d*)?|\.\d+)'),
+    'SI': re.compile(r'\d+'),
+    'DT': re.compile(r'\d{4}(?:(?:0[1-9]|1[0-2])(?:0[1-9]|[12]\d|3[01])?)?'),
+    'DTM': re.compile(r'\d{4}(?:(?:0[1-9]|1[0-2])(?:(?:0[1-9]|[12]\d|3[01])'
+                      r'(?:(?:[01]\d|2[0-3])(?:[0-5]\d(?:[0-5]\d(?:\.\d{1,4})?)?)?)?)?)?'
+                      r'(?:[+-]\d{4})?'),
+    'TM': re.compile(r'(?:[01]\d|2[0-3])(?:[0-5]\d(?:[0-5]\d(?:\.\d{1,4})?)?)?(?:[+-]\d{4})?'),
+}
+
+# Before v2.5 the time of a TS is typed ST; it still has the DTM format
+_TIMESTAMP_TYPE = 'TS'
+
+_SEGMENT_NAME_RE = re.compile(r'[A-Z][A-Z0-9]{2}')
+
+# Placeholder in hl7apy structures for a segment defined by the master file or
+# the query (e.g. MFN_M01, PPR_PC1); matches any one segment
+_ANY_SEGMENT = 'ANYHL7SEGMENT'
+
+
+class FieldRule(NamedTuple):
+    """Compiled definition of one field of a segment."""
+    number: int  # HL7 field number
+    name: str
+    datatype: str
+    min: int
+    max: int  # -1 for unbounded
+    checks: Tuple[Tuple[Optional[int], Optional[int], str], ...]  # (component, subcomponent, type)
+
+
+class SegmentProfile(NamedTuple):
+    """Compiled field rules of a segment type."""
+    name: str
+    positions: Tuple[Optional[FieldRule], ...]  # rule per position in the '|'-split segment
+    required: Tuple[Tuple[int, FieldRule], ...]  # (position, rule) of required fields
+
+
+class StructureNode(NamedTuple):
+    """A segment or group in a compiled message structure."""
+    name: str
+    is_group: bool
+    min: int
+    max: int  # -1 for unbounded
+    children: Tuple['StructureNode', ...]
+    first: FrozenSet[str]  # segments that can start this node
+    optional_content: bool  # a group that can match no segment
+    choice: bool  # a group matching exactly one of its children
+
+
+class MessageProfile(NamedTuple):
+    """Compiled structure of a message type."""
+    version: str
+    structure: str
+    children: Tuple[StructureNode, ...]
+
+
+def default_mode() -> str:
+    """Validation mode from NUBILUM_VALIDATION_MODE ('local' for air-gapped deployments)."""
+    mode = os.environ.get('NUBILUM_VALIDATION_MODE', DEFAULT_MODE).strip().lower()
+    if mode not in MODES:
+        logger.warning(f"Unknown NUBILUM_VALIDATION_MODE '{mode}', using '{DEFAULT_MODE}'")
+        return DEFAULT_MODE
+    return mode
+
+
+def _library(version: str):
+    import hl7apy
+
+    return hl7apy.load_library(version)
+
+
+def _long_name(name: Optional[str]) -> str:
+    return (name or '').replace('_', ' ').title()
+
+
+def _type_checks(definition) -> Tuple[Tuple[Optional[int], Optional[int], str], ...]:
+    """Primitive type checks of a field definition from hl7apy's tables."""
+    if definition[0] == 'leaf':
+        datatype = definition[2]
+        return ((None, None, datatype),) if datatype in _PRIMITIVE_PATTERNS else ()
+    if definition[0] != 'sequence' or not definition[1]:
+        return ()
+
+    checks = []
+    for component, (_, child, _, _) in enumerate(definition[1]):
+        if not child:
+            continue
+        if child[0] == 'leaf':
+            datatype = child[2]
+            if definition[2] == _TIMESTAMP_TYPE and component == 0:
+                datatype = 'DTM'
+            if datatype in _PRIMITIVE_PATTERNS:
+                checks.append((component, None, datatype))
+        elif child[1]:
+            for subcomponent, (_, grandchild, _, _) in enumerate(child[1]):
+                if grandchild and grandchild[0] == 'leaf' and grandchild[2] in _PRIMITIVE_PATTERNS:
+                    checks.append((component, subcomponent, grandchild[2]))
+    return tuple(checks)
+
+
+@lru_cache(maxsize=4096)
+def segment_profile(version: str, segment: str) -> Optional[SegmentProfile]:
+    """
+    Field rules of a segment type, compiled from hl7apy and cached.
+
+    Returns:
+        The profile, or None if the version does not define the segment
+    """
+    definition = _library(version).SEGMENTS.get(segment)
+    # Also skips the few definitions hl7apy does not ship as a field sequence
+    if definition is None or segment == _ANY_SEGMENT or definition[0] != 'sequence' \
+            or len(definition) < 2:
+        return None
+
+    # After splitting, MSH fields are shifted by one (MSH-1 is the separator);
+    # MSH-1 and MSH-2 are checked with the header
+    shift = 1 if segment == 'MSH' else 0
+    positions: List[Optional[FieldRule]] = [None]
+    for name, field, (minimum, maximum), _ in definition[1]:
+        number = int(name.rpartition('_')[2])
+        if number - shift < 1 or (shift and number == 2):
+            continue
+        while len(positions) < number - shift:
+            positions.append(None)
+        positions.append(FieldRule(
+            number=number,
+            name=_long_name(field[3]),
+            datatype=field[2],
+            min=minimum,
+            max=maximum,
+            checks=_type_checks(field),
+        ))
+
+    required = tuple((index, rule) for index, rule in enumerate(positions)
+                     if rule is not None and rule.min > 0)
+    return SegmentProfile(segment, tuple(positions), required)
+
+
+def _compile_node(name: str, definition, cardinality, kind: str) -> StructureNode:
+    minimum, maximum = cardinality
+    if kind != 'GRP':
+        return StructureNode(name, False, minimum, maximum, (), frozenset((name,)), False, False)
+
+    children = tuple(_compile_node(*child) for child in definition[1])
+    choice = definition[0] == 'choice'
+    first = set()
+    if choice:
+        for child in children:
+            first |= child.first
+        optional_content = any(child.min == 0 or child.optional_content for child in children)
+    else:
+        optional_content = True
+        for child in children:
+            first |= child.first
+            if child.min > 0 and not child.optional_content:
+                optional_content = False
+                break
+    # Short group names: ADT_A01_PROCEDURE -> PROCEDURE
+    short_name = name.split('_', 2)[-1] if name.count('_') >= 2 else name
+    return StructureNode(short_name, True, minimum, maximum, children, frozenset(first),
+                         optional_content, choice)
+
+
+@lru_cache(maxsize=4096)
+def message_profile(version: str, structure: str) -> Optional[MessageProfile]:
+    """
+    Segment structure of a message type, compiled from hl7apy and cached.
+
+    Returns:
+        The profile, or None if the version does not define the structure
+    """
+    definition = _library(version).MESSAGES.get(structure)
+    if definition is None:
+        return None
+    children = tuple(_compile_node(*child) for child in definition[1])
+    return MessageProfile(version, structure, children)
+
+
+def resolve_structure(version: str, message_type: str) -> Optional[str]:
+    """
+    Message structure for an MSH-9 value (e.g. 'ADT^A04' -> 'ADT_A01').
+
+    Returns:
+        Structure name known to the version, or None
+    """
+    messages = _library(version).MESSAGES
+    parts = message_type.split('^')
+    code = parts[0]
+    event = parts[1] if len(parts) > 1 else ''
+
+    candidates = [parts[2] if len(parts) > 2 else '', f'{code}_{event}' if event else code,
+                  _EVENT_STRUCTURES.get(code, {}).get(event, '')]
+    for candidate in candidates:
+        if candidate and candidate in messages:
+            return candidate
+    return None
+
+
+def preload(versions) -> int:
+    """
+    Compile the message and segment profiles of the given versions.
+
+    Returns:
+        Number of profiles compiled
+    """
+    count = 0
+    for version in versions:
+        try:
+            library = _library(version)
+        except Exception as e:
+            logger.warning(f"Cannot preload HL7 v{version} validation profiles: {e}")
+            continue
+        for structure in library.MESSAGES:
+            message_profile(version, structure)
+            count += 1
+        for segment in library.SEGMENTS:
+            if segment != _ANY_SEGMENT:
+                segment_profile(version, segment)
+                count += 1
+    return count
+
+
+class _Issues:
+    """Collects errors and warnings up to MAX_ISSUES."""
+
+    def __init__(self):
+        self.errors: List[Dict] = []
+        self.warnings: List[Dict] = []
+
+    def add(self, level: str, code: str, location: str, line: Optional[int], message: str) -> None:
+        target = self.errors if level == 'ERROR' else self.warnings
+        if len(self.errors) + len(self.warnings) < MAX_ISSUES:
+            target.append({'level': level, 'code': code, 'location': location,
+                           'line': line, 'message': message})
+
+
+def _starts(node: StructureNode, name: str) -> bool:
+    return name in node.first or _ANY_SEGMENT in node.first
+
+
+def _match(children: Tuple[StructureNode, ...], names: List[str], lines: List[int],
+           position: int, issues: _Issues, in_repetition: bool = False) -> int:
+    """
+    Match segments from position against a sequence of nodes; return the next position.
+
+    Inside a repeating group a segment stops at its maximum, so that the next
+    one starts a new repetition of the group; elsewhere extra repetitions are
+    consumed and reported.
+    """
+    count_names = len(names)
+    for child in children:
+        count = 0
+        start = position
+        if child.is_group:
+            repeating = in_repetition or child.max != 1
+            while position < count_names and _starts(child, names[position]) and (
+                    child.max < 0 or count < child.max):
+                members = child.children
+                if child.choice:
+                    members = tuple(member for member in members if _starts(member, names[position]))[:1]
+                next_position = _match(members, names, lines, position, issues, repeating)
+                if next_position == position:
+                    break
+                position = next_position
+                count += 1
+        else:
+            limit = child.max if in_repetition and child.max >= 0 else count_names
+            while position < count_names and count < limit and (
+                    names[position] == child.name or child.name == _ANY_SEGMENT):
+                position += 1
+                count += 1
+            if 0 <= child.max < count:
+                issues.add('ERROR', 'cardinality', child.name, lines[start + child.max],
+                           f"Segment {child.name} repeats {count} times (at most {child.max} allowed)")
+
+        if count < child.min:
+            line = lines[position] if position < count_names else None
+            if child.is_group:
+                starts = '/'.join(sorted(child.first))
+                message = f"Required group {child.name} (starting with {starts}) is missing"
+            else:
+                message = f"Required segment {child.name} is missing"
+            issues.add('ERROR', 'missing_segment', child.name, line, message)
+    return position
+
+
+def _check_value(value: str, datatype: str, location: str, line: int, issues: _Issues) -> None:
+    if value and value != '""' and '\\' not in value and not _PRIMITIVE_PATTERNS[datatype].fullmatch(value):
+        issues.add('ERROR', 'datatype', location, line,
+                   f"{location} value '{value[:40]}' is not a valid {datatype}")
+
+
+def _check_segment(profile: SegmentProfile, fields: List[str], encoding: str, line: int,
+                   issues: _Issues) -> None:
+    """Check required fields, repetitions and primitive types of one segment."""
+    component_separator, repetition_separator, _, subcomponent_separator = encoding
+    positions = profile.positions
+    count = len(fields)
+
+    for index, rule in profile.required:
+        if index >= count or not fields[index] or fields[index] == '""':
+            location = f"{profile.name}-{rule.number}"
+            issues.add('ERROR', 'required', location, line,
+                       f"Required field {location} ({rule.name}) is empty")
+
+    for index in range(1, min(count, len(positions))):
+        value = fields[index]
+        rule = positions[index]
+        if not value or rule is None or value == '""':
+            continue
+
+        repetitions = value.split(repetition_separator) if repetition_separator in value else (value,)
+        # 'varies' fields (e.g. QPD-3) are defined by the message profile
+        if 0 <= rule.max < len(repetitions) and rule.datatype != 'varies':
+            location = f"{profile.name}-{rule.number}"
+            issues.add('ERROR', 'cardinality', location, line,
+                       f"Field {location} ({rule.name}) repeats {len(repetitions)} times "
+                       f"(at most {rule.max} allowed)")
+
+        if not rule.checks:
+            continue
+        location = f"{profile.name}-{rule.number}"
+        for repetition in repetitions:
+            components = None
+            for component, subcomponent, datatype in rule.checks:
+                if component is None:
+                    _check_value(repetition, datatype, location, line, issues)
+                    continue
+                if components is None:
+                    components = repetition.split(component_separator)
+                if component >= len(components):
+                    continue
+                value = components[component]
+                if subcomponent is None:
+                    _check_value(value, datatype, f"{location}.{component + 1}", line, issues)
+                else:
+                    parts = value.split(subcomponent_separator)
+                    if subcomponent < len(parts):
+                        _check_value(parts[subcomponent], datatype,
+                                     f"{location}.{component + 1}.{subcomponent + 1}", line, issues)
+
+    if count > len(positions) and any(fields[len(positions):]):
+        shift = 1 if profile.name == 'MSH' else 0
+        issues.add('WARNING', 'extra_fields', profile.name, line,
+                   f"Segment {profile.name} has {count - 1 + shift} fields; "
+                   f"only {len(positions) - 1 + shift} are defined")
+
+
+def validate_message(message: str, default_version: str = hl7ref.DEFAULT_VERSION) -> Dict:
+    """
+    Validate one message against the hl7apy definitions of its version.
+
+    Args:
+        message: HL7 message in ER7 format (one segment per line)
+        default_version: Version used when MSH-12 is missing or unknown
+
+    Returns:
+        Dict with 'valid', 'version', 'structure', 'errors' and 'warnings';
+        every issue has 'level', 'code', 'location', 'line' (1-based) and 'message'
+    """
+    import hl7apy
+
+    issues = _Issues()
+    segments = []
+    for line_number, line in enumerate(message.replace('\r', '\n').split('\n'), 1):
+        line = line.strip()
+        if line:
+            segments.append((line_number, line))
+
+    if not segments or not segments[0][1].startswith('MSH|'):
+        issues.add('ERROR', 'header', 'MSH', segments[0][0] if segments else None,
+                   "Message does not start with an MSH segment")
+        return {'valid': False, 'version': None, 'structure': None,
+                'errors': issues.errors, 'warnings': issues.warnings}
+
+    header = segments[0][1].split('|')
+    encoding = header[1] if len(header) > 1 else ''
+    if len(encoding) < 4:
+        issues.add('ERROR', 'header', 'MSH-2', 1, "MSH-2 must contain the four encoding characters")
+        encoding = (encoding + '^~\\&'[len(encoding):])
+
+    version = header[11].split(encoding[0])[0] if len(header) > 11 else ''
+    if version not in hl7apy.SUPPORTED_LIBRARIES:
+        if version:
+            issues.add('WARNING', 'version', 'MSH-12', 1,
+                       f"HL7 version {version} is not supported; using v{default_version} definitions")
+        version = default_version
+
+    message_type = header[8] if len(header) > 8 else ''
+    structure = resolve_structure(version, message_type) if message_type else None
+
+    library = _library(version)
+    names = []
+    lines = []
+    for line_number, line in segments:
+        fields = line.split('|')
+        name = fields[0]
+        if not _SEGMENT_NAME_RE.fullmatch(name):
+            issues.add('ERROR', 'segment', name[:3], line_number, f"Invalid segment name '{name[:10]}'")
+            continue
+        if name.startswith('Z'):
+            continue
+        if name not in library.SEGMENTS:
+            issues.add('ERROR', 'segment', name, line_number,
+                       f"Segment {name} is not defined in HL7 v{version}")
+            continue
+
+        names.append(name)
+        lines.append(line_number)
+        profile = segment_profile(version, name)
+        if profile is not None:
+            _check_segment(profile, fields, encoding, line_number, issues)
+
+    if structure is None:
+        if message_type:
+            issues.add('WARNING', 'structure', 'MSH-9', 1,
+                       f"No v{version} message structure for {message_type}; segment order not checked")
+    else:
+        profile = message_profile(version, structure)
+        position = _match(profile.children, names, lines, 0, issues)
+        if structure in _OPEN_STRUCTURES:
+            position = len(names)
+        for name, line_number in zip(names[position:], lines[position:]):
+            issues.add('ERROR', 'unexpected_segment', name, line_number,
+                       f"Segment {name} is not expected here in {structure}")
+
+    return {
+        'valid': not issues.errors,
+        'version': version,
+        'structure': structure,
+        'errors': issues.errors,
+        'warnings': issues.warnings,
+    }
@@ -0,0 +1,141 @@
+"""Explicit warm-up phase for Nubilum workers.
+
+Under gunicorn with ``preload_app`` the warm-up runs once in the master
+process before workers are forked (see ``docker/gunicorn.conf.py``), so every
+worker starts with hl7apy's reference tables, the field name cache, the
+compiled validation profiles, the surrogate dictionaries and the compiled
+profile rule plans already in memory, shared copy-on-write.
+"""
+
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Optional
+
+from nubilum import hl7ref, surrogates, validator
+from nubilum.anonymizer import HL7Anonymizer
+
+logger = logging.getLogger(__name__)
+
+# Small message touching every built-in segment handler
+_WARMUP_MESSAGE = "\n".join([
+    "MSH|^~\\&|APP|FAC|REC|FAC|20250101000000||ADT^A01|WARMUP|P|2.5",
+    "EVN|A01|20250101000000|||OP^Operator^Warm",
+    "PID|1||000^^^FAC^MR||Warm^Up||20000101|U|||Street^^City^^0000-000||+351000000000",
+    "NK1|1|Warm^Kin|OTH|Street^^City|+351000000000",
+    "PV1|1|O|||||DOC^Doctor^Warm",
+    "OBX|1|TX|NOTE||Warm Up note 000000000||||||F",
+    "NTE|1||Warm Kin note",
+])
+
+_lock = threading.Lock()
+_state: Dict = {
+    'ready': False,
+    'started': False,
+    'started_at': None,
+    'completed_at': None,
+    'duration_seconds': None,
+    'steps': {},
+    'pid': None,
+    'error': None,
+}
+
+
+def preload_versions() -> list:
+    """HL7 versions to preload (NUBILUM_PRELOAD_VERSIONS, comma-separated; default 2.5)."""
+    value = os.environ.get('NUBILUM_PRELOAD_VERSIONS', hl7ref.DEFAULT_VERSION)
+    return [version.strip() for version in value.split(',') if version.strip()]
+
+
+def warm_up(profile_registry=None, versions: Optional[list] = None) -> Dict:
+    """
+    Run the warm-up steps once and mark the process ready.
+
+    Args:
+        profile_registry: ProfileRegistry whose rule plans should be resolved
+        versions: HL7 versions to preload (default: preload_versions())
+
+    Returns:
+        Warm-up state (see readiness())
+    """
+    with _lock:
+        already_started = _state['started']
+        if not already_started:
+            _state['started'] = True
+            _state['started_at'] = datetime.now().isoformat()
+    # readiness() takes the lock itself
+    if already_started:
+        return readiness()
+
+    started = time.perf_counter()
+    steps = {}
+
+    try:
+        step_start = time.perf_counter()
+        import hl7apy  # noqa: F401
+        from hl7apy.core import Field  # noqa: F401
+        steps['import_hl7apy'] = time.perf_counter() - step_start
+
+        versions = versions or preload_versions()
+        step_start = time.perf_counter()
+        cached = hl7ref.preload(versions)
+        steps['field_names'] = time.perf_counter() - step_start
+
+        step_start = time.perf_counter()
+        compiled = validator.preload(versions)
+        steps['validation_profiles'] = time.perf_counter() - step_start
+
+        step_start = time.perf_counter()
+        surrogate_entries = surrogates.dictionaries().preload()
+        steps['surrogates'] = time.perf_counter() - step_start
+
+        step_start = time.perf_counter()
+        profiles = profile_registry.profiles() if profile_registry else []
+        for profile in profiles:
+            for segment_type in HL7Anonymizer.SEGMENT_HANDLERS:
+                profile.rules_for(segment_type)
+            HL7Anonymizer(profile=profile).anonymize_message(_WARMUP_MESSAGE)
+        if not profiles:
+            HL7Anonymizer().anonymize_message(_WARMUP_MESSAGE)
+        steps['rule_plans'] = time.perf_counter() - step_start
+
+        error = None
+        logger.info(f"Warm-up completed in {time.perf_counter() - started:.3f}s "
+                    f"({cached} field names, {compiled} validation profiles, {surrogate_entries} surrogates, "
+                    f"{len(profiles)} profile(s))")
+
+    except Exception as e:
+        error = str(e)
+        logger.error(f"Warm-up failed: {e}", exc_info=True)
+
+    with _lock:
+        _state['steps'] = {name: round(seconds, 4) for name, seconds in steps.items()}
+        _state['duration_seconds'] = round(time.perf_counter() - started, 4)
+        _state['completed_at'] = datetime.now().isoformat()
+        _state['pid'] = os.getpid()
+        _state['error'] = error
+        # A failed warm-up still serves requests; lookups fall back to lazy loading
+        _state['ready'] = True
+
+    return readiness()
+
+
+def warm_up_in_background(profile_registry=None) -> None:
+    """Start the warm-up on a daemon thread if it has not been started yet."""
+    if _state['started']:
+        return
+    threading.Thread(target=warm_up, args=(profile_registry,),
+                     name='nubilum-warmup', daemon=True).start()
+
+
+def readiness() -> Dict:
+    """Current warm-up state; 'warmed_in_pid' differs from 'pid' in forked workers."""
+    with _lock:
+        state = dict(_state)
+        state['steps'] = dict(_state['steps'])
+
+    state['warmed_in_pid'] = state.pop('pid')
+    state['pid'] = os.getpid()
+    return state
@@ -0,0 +1,91 @@
+"""Test script for the production asset build and HTTP caching."""
+
+import os
+import shutil
+import stat
+import tempfile
+from pathlib import Path
+
+from nubilum.assets import STATIC_DIR, build_assets
+
+# Stand-in for esbuild: prints the input file unchanged
+FAKE_ESBUILD = "#!/bin/sh\ncat \"$1\"\n"
+
+
+def _build(tmpdir: Path) -> tuple:
+    static_dir = tmpdir / 'static'
+    shutil.copytree(STATIC_DIR, static_dir, ignore=shutil.ignore_patterns('dist'))
+    esbuild = tmpdir / 'esbuild'
+    esbuild.write_text(FAKE_ESBUILD)
+    esbuild.chmod(esbuild.stat().st_mode | stat.S_IEXEC)
+    return static_dir, build_assets(static_dir, str(esbuild))
+
+
+def test_build_hashed_bundles():
+    """Bundles are content-hashed and the production page loads them without Babel."""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        static_dir, manifest = _build(Path(tmpdir))
+
+        script = static_dir / manifest['app.js']
+        assert script.exists() and manifest['app.js'].startswith('dist/app.')
+        assert (static_dir / manifest['styles.css']).exists()
+
+        index = (static_dir / 'dist' / 'index.html').read_text()
+        assert f'src="/{manifest["app.js"]}"' in index
+        assert f'href="/{manifest["styles.css"]}"' in index
+        assert 'babel' not in index and 'app.jsx' not in index
+
+        # Same sources give the same names
+        again = Path(tmpdir) / 'again'
+        again.mkdir()
+        assert _build(again)[1] == manifest
+
+    print("✓ Content-hashed bundles built")
+
+
+def test_static_and_metadata_caching():
+    """Hashed bundles are immutable; metadata endpoints answer conditional requests."""
+    os.environ.setdefault('NUBILUM_LOG_DIR', tempfile.mkdtemp())
+    from nubilum.app import app
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        static_dir, manifest = _build(Path(tmpdir))
+        original_static = app.static_folder
+        app.static_folder = str(static_dir)
+        try:
+            client = app.test_client()
+
+            page = client.get('/')
+            assert page.status_code == 200 and b'/dist/app.' in page.data
+            assert page.headers['Cache-Control'] == 'no-cache'
+            assert client.get('/', headers={'If-None-Match': page.headers['ETag']}).status_code == 304
+
+            bundle = client.get('/' + manifest['app.js'])
+            assert 'immutable' in bundle.headers['Cache-Control']
+        finally:
+            app.static_folder = original_static
+
+        version = client.get('/api/version')
+        assert version.headers['ETag'].startswith('W/')
+        repeat = client.get('/api/version', headers={'If-None-Match': version.headers['ETag']})
+        assert repeat.status_code == 304 and repeat.data == b''
+
+        health = client.get('/api/health')
+        assert client.get('/api/health', headers={'If-None-Match': health.headers['ETag']}).status_code == 304
+
+    print("✓ Static and metadata caching headers correct")
+
+
+if __name__ == '__main__':
+    print("Testing Assets and HTTP Caching\n" + "=" * 50)
+
+    try:
+        test_build_hashed_bundles()
+        test_static_and_metadata_caching()
+
+        print("\n" + "=" * 50)
+        print("✅ All asset tests passed!")
+
+    except AssertionError as e:
+        print(f"\n❌ Test failed: {e}")
+        exit(1)
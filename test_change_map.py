@@ -0,0 +1,118 @@
+"""Tests for change maps: offsets, transform kinds and field names of rewritten values."""
+
+import os
+import tempfile
+
+from nubilum.anonymizer import HL7Anonymizer
+from nubilum.change_map import build_change_map
+from nubilum.profiles import compile_profile
+from nubilum.segment_cache import SegmentCache
+
+MESSAGE = "\n".join([
+    "MSH|^~\\&|APP|FAC|REC|FAC|20250107120000||ADT^A01|MSG1|P|2.5",
+    "PID|1||12345^^^HOSP^MR||Silva^Ana^M||19800101|F|||Rua X 1^^Lisboa||912345678",
+    "PV1|1|O|||||D1^Costa^Rui",
+    "OBX|1|TX|NOTE||Seen by Silva Ana||||||F",
+    "ZPV|SECRET|kept",
+])
+
+PROFILE = compile_profile({
+    'name': 'site',
+    'rules': [
+        {'segment': 'ZPV', 'field': 1, 'action': 'redact'},
+    ],
+})
+
+
+def test_changes_locate_rewritten_values():
+    """Offsets slice the rewritten values out of the output; kinds name the transform."""
+    anonymizer = HL7Anonymizer(profile=PROFILE, record_changes=True)
+    output = anonymizer.anonymize_message(MESSAGE)
+
+    # Recording changes never alters the output
+    assert output == HL7Anonymizer(profile=PROFILE).anonymize_message(MESSAGE)
+
+    lines = output.split('\n')
+    kinds = {}
+    for segment, field, component, start, end, kind in anonymizer.changes:
+        value = lines[segment].split('|')[field]
+        if component is not None:
+            value = value.split('^')[component - 1]
+        assert output[start:end] == value
+        kinds[(lines[segment][:3], field, component)] = kind
+
+    assert kinds[('PID', 3, 1)] == 'pseudonym'
+    assert kinds[('PID', 5, 1)] == kinds[('PID', 5, 2)] == 'name'
+    assert kinds[('PID', 7, 1)] == 'date'
+    assert kinds[('PID', 11, 1)] == 'address'
+    assert kinds[('PID', 13, 1)] == 'phone'
+    assert kinds[('OBX', 5, 1)] == 'scrub'
+    assert kinds[('ZPV', 1, 1)] == 'redact'
+    assert ('MSH', 7, 1) not in kinds and ('ZPV', 2, 1) not in kinds
+
+    # Changes are reset for every message; without the option none are recorded
+    anonymizer.anonymize_message("MSH|^~\\&|APP|FAC|REC|FAC|20250107120000||ADT^A01|MSG2|P|2.5")
+    assert anonymizer.changes == []
+    plain = HL7Anonymizer()
+    plain.anonymize_message(MESSAGE)
+    assert plain.changes == [] and plain._change_log is None
+
+    print("✓ Changes locate rewritten values")
+
+
+def test_recording_bypasses_segment_cache():
+    """Segments served from the cache would carry no changes, so recording skips it."""
+    cache = SegmentCache()
+    warm = HL7Anonymizer(segment_cache=cache)
+    for _ in range(3):
+        warm.anonymize_message(MESSAGE)
+    hits = cache.stats()['hits']
+
+    anonymizer = HL7Anonymizer(segment_cache=cache, record_changes=True)
+    for _ in range(2):
+        anonymizer.anonymize_message(MESSAGE)
+        assert any(change[0] == 2 for change in anonymizer.changes)
+    assert cache.stats()['hits'] == hits
+
+    print("✓ Recording bypasses the segment cache")
+
+
+def test_change_map_offsets_and_endpoint():
+    """Offsets are absolute in the combined output; the API returns the map on request."""
+    second = MESSAGE.replace('MSG1', 'MSG2').replace('|2.5', '|2.3')
+    anonymizer = HL7Anonymizer(record_changes=True)
+    outputs, changes = [], []
+    for message in (MESSAGE, second):
+        outputs.append(anonymizer.anonymize_message(message))
+        changes.append(anonymizer.changes)
+
+    change_map = build_change_map(outputs, changes)
+    combined = '\n\n'.join(outputs)
+    assert change_map['columns'] == ['segment', 'field', 'component', 'start', 'end', 'kind']
+    assert [entry['version'] for entry in change_map['messages']] == ['2.5', '2.3']
+    assert change_map['messages'][0]['fields']['PID-5'] == 'Patient Name'
+
+    for entry, output, message_changes in zip(change_map['messages'], outputs, changes):
+        for row, (_, _, _, start, end, _) in zip(entry['changes'], message_changes):
+            assert combined[row[3]:row[4]] == output[start:end]
+
+    os.environ.setdefault('NUBILUM_LOG_DIR', tempfile.mkdtemp())
+    from nubilum import app as app_module
+
+    client = app_module.app.test_client()
+    data = client.post('/api/anonymize', json={'message': MESSAGE + '\n\n' + second,
+                                               'include_changes': True}).get_json()
+    assert data['success'] and data['anonymized_message'] == combined
+    assert data['change_map'] == change_map
+
+    data = client.post('/api/anonymize', json={'message': MESSAGE}).get_json()
+    assert 'change_map' not in data
+
+    print("✓ Change map offsets and endpoint")
+
+
+if __name__ == '__main__':
+    test_changes_locate_rewritten_values()
+    test_recording_bypasses_segment_cache()
+    test_change_map_offsets_and_endpoint()
+    print("\nAll change map tests passed!")
@@ -0,0 +1,103 @@
+"""Test script for the columnar (Parquet/Arrow) export."""
+
+import tempfile
+import time
+from pathlib import Path
+
+import pytest
+
+from nubilum import columnar
+from nubilum.columnar import ColumnarError, export_messages, segment_rows
+from nubilum.jobs import JobManager
+
+MESSAGE = "\r".join([
+    "MSH|^~\\&|LAB|HOSPITAL|EHR|HOSPITAL|20250107120000||ORU^R01|MSG1|P|2.5",
+    "PID|1||PID123456^^^HOSPITAL^MR||Doe^John",
+    "OBX|1|NM|GLU^Glucose||5.4|mmol/L",
+])
+
+
+def test_segment_rows():
+    """Fields are numbered as in HL7 (MSH-1 is the separator) and empty fields skipped."""
+    rows = list(segment_rows(MESSAGE))
+
+    assert rows[0] == (0, 'MSH', 1, '|')
+    assert rows[1] == (0, 'MSH', 2, '^~\\&')
+    assert (0, 'MSH', 9, 'ORU^R01') in rows
+    assert (0, 'MSH', 10, 'MSG1') in rows
+    assert (1, 'PID', 3, 'PID123456^^^HOSPITAL^MR') in rows
+    assert (2, 'OBX', 5, '5.4') in rows
+    assert not any(segment == 'PID' and field == 2 for _, segment, field, _ in rows)
+
+    print("✓ Messages flattened to segment fields")
+
+
+def test_export_round_trip():
+    """Parquet and Arrow files hold one row per field, written in bounded batches."""
+    pa = pytest.importorskip('pyarrow')
+    import pyarrow.parquet as pq
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        messages = [MESSAGE.replace('MSG1', f'MSG{n}') for n in range(50)]
+        rows_per_message = len(list(segment_rows(MESSAGE)))
+
+        parquet_path = Path(tmpdir) / 'export.parquet'
+        stats = export_messages(messages, parquet_path, 'parquet', batch_rows=100)
+        assert stats['messages'] == 50 and stats['rows'] == 50 * rows_per_message
+        assert stats['batches'] > 1
+
+        table = pq.read_table(parquet_path)
+        assert table.num_rows == stats['rows']
+        glucose = table.filter(pa.compute.equal(table['segment'].cast(pa.string()), 'OBX'))
+        assert set(glucose.column('control_id').cast(pa.string()).to_pylist()) == {
+            f'MSG{n}' for n in range(50)}
+
+        arrow_path = Path(tmpdir) / 'export.arrow'
+        export_messages(messages, arrow_path, 'arrow', batch_rows=100)
+        with pa.ipc.open_file(arrow_path) as reader:
+            assert reader.read_all().num_rows == stats['rows']
+
+        assert not list(Path(tmpdir).glob('.*.tmp'))
+
+    print("✓ Parquet and Arrow export round trip")
+
+
+def test_job_export():
+    """Job results can be exported; without pyarrow a clear error is raised."""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        manager = JobManager(spool_dir=tmpdir, ttl=60)
+        job = manager.submit(MESSAGE.replace('\r', '\n'))
+
+        deadline = time.monotonic() + 10
+        while manager.status(job['job_id'])['state'] != 'completed':
+            assert time.monotonic() < deadline
+            time.sleep(0.02)
+
+        if not columnar.available():
+            with pytest.raises(ColumnarError):
+                manager.export_result(job['job_id'], 'parquet')
+        else:
+            path = manager.export_result(job['job_id'], 'parquet')
+            assert path.suffix == '.parquet' and path.stat().st_size > 0
+            assert manager.export_result(job['job_id'], 'parquet') == path
+
+        with pytest.raises(ColumnarError):
+            manager.export_result(job['job_id'], 'csv')
+
+    print("✓ Job results exported")
+
+
+if __name__ == '__main__':
+    print("Testing Columnar Export\n" + "=" * 50)
+
+    try:
+        test_segment_rows()
+        test_export_round_trip()
+        test_job_export()
+
+        print("\n" + "=" * 50)
+        print("✅ All columnar export tests passed!")
+
+    except AssertionError as e:
+        print(f"\n❌ Test failed: {e}")
+        exit(1)
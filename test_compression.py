@@ -0,0 +1,107 @@
+"""Tests for compressed request bodies and compressed API responses."""
+
+import gzip
+import zlib
+
+import pytest
+from flask import Flask, jsonify
+
+from nubilum import compression
+
+BODY = b'{"message": "' + b'MSH|^~\\\\&|APP|FAC|REC|FAC|20250107||ADT^A01|MSG1|P|2.5 ' * 200 + b'"}'
+
+
+def _app(max_decompressed: int = 1024 * 1024) -> Flask:
+    app = Flask(__name__)
+    app.config['MAX_DECOMPRESSED_LENGTH'] = max_decompressed
+    compression.init_app(app)
+
+    @app.route('/api/echo', methods=['POST'])
+    def echo():
+        data = compression.get_request_json()
+        return jsonify({'success': True, 'message': data['message'] if data else None})
+
+    @app.route('/api/small', methods=['GET'])
+    def small():
+        return jsonify({'success': True})
+
+    return app
+
+
+def test_compressed_request_bodies():
+    """gzip, deflate and (when installed) br bodies are decoded before the endpoint parses them."""
+    client = _app().test_client()
+    expected = client.post('/api/echo', data=BODY, content_type='application/json').get_json()['message']
+    assert expected.startswith('MSH|')
+
+    bodies = {'gzip': gzip.compress(BODY), 'x-gzip': gzip.compress(BODY), 'deflate': zlib.compress(BODY)}
+    if 'br' in compression.DECODERS:
+        import brotli
+        bodies['br'] = brotli.compress(BODY)
+
+    for encoding, body in bodies.items():
+        response = client.post('/api/echo', data=body, content_type='application/json',
+                               headers={'Content-Encoding': encoding})
+        assert response.status_code == 200, encoding
+        assert response.get_json()['message'] == expected
+
+    print("✓ Compressed request bodies decoded")
+
+
+def test_compressed_responses():
+    """Large API responses use the best accepted encoding; small ones are sent as-is."""
+    client = _app().test_client()
+
+    response = client.post('/api/echo', data=BODY, content_type='application/json',
+                           headers={'Accept-Encoding': 'gzip'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in response.headers['Vary']
+    assert gzip.decompress(response.get_data()).startswith(b'{')
+
+    response = client.post('/api/echo', data=BODY, content_type='application/json',
+                           headers={'Accept-Encoding': 'deflate;q=1.0, gzip;q=0.5'})
+    assert response.headers['Content-Encoding'] == 'deflate'
+    assert zlib.decompress(response.get_data()).startswith(b'{')
+
+    assert 'Content-Encoding' not in client.get('/api/small', headers={'Accept-Encoding': 'gzip'}).headers
+    assert 'Content-Encoding' not in client.post('/api/echo', data=BODY, content_type='application/json').headers
+
+    print("✓ Responses compressed")
+
+
+def test_rejected_bodies():
+    """Bombs get 413 without being expanded, garbage gets 400 and unknown encodings 415."""
+    limit = 64 * 1024
+    client = _app(limit).test_client()
+    bomb = b'{"message": "' + b'A' * (100 * 1024 * 1024) + b'"}'
+
+    bombs = {'gzip': gzip.compress(bomb), 'deflate': zlib.compress(bomb)}
+    if 'br' in compression.DECODERS:
+        import brotli
+        bombs['br'] = brotli.compress(bomb, quality=5)
+
+    for encoding, body in bombs.items():
+        response = client.post('/api/echo', data=body, content_type='application/json',
+                               headers={'Content-Encoding': encoding})
+        assert response.status_code == 413, encoding
+        with pytest.raises(compression.DecompressedTooLarge):
+            compression.decompress(body, encoding, limit)
+
+    for encoding in bombs:
+        response = client.post('/api/echo', data=b'not compressed at all', content_type='application/json',
+                               headers={'Content-Encoding': encoding})
+        assert response.status_code == 400, encoding
+        assert response.get_json()['success'] is False
+
+    response = client.post('/api/echo', data=BODY, content_type='application/json',
+                           headers={'Content-Encoding': 'lzma'})
+    assert response.status_code == 415
+
+    print("✓ Bombs, garbage and unknown encodings rejected")
+
+
+if __name__ == '__main__':
+    test_compressed_request_bodies()
+    test_compressed_responses()
+    test_rejected_bodies()
+    print("\nAll compression tests passed!")
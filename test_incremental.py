@@ -0,0 +1,88 @@
+"""Test script for incremental segment re-anonymization."""
+
+from nubilum.anonymizer import HL7Anonymizer
+from nubilum.incremental import build_state, message_segments, reanonymize_segments
+from nubilum.session_state import StateTokenError, decode_state, encode_state
+
+KEY = b'test-key'
+
+MESSAGE = "\n".join([
+    "MSH|^~\\&|LAB|HOSPITAL|EHR|HOSPITAL|20250107120000||ORU^R01|MSG1|P|2.5",
+    "PID|1||123456^^^HOSPITAL^MR||Silva^Ana||19800515|F|||Rua Augusta^^Lisboa",
+    "OBX|1|TX|NOTE||Ana Silva called about her results||||||F",
+    "NTE|1||Follow up with Silva next week",
+])
+
+
+def _full(text: str) -> list:
+    return message_segments(HL7Anonymizer().anonymize_message(text))
+
+
+def test_incremental_matches_full_anonymization():
+    """Re-anonymizing edited segments gives the same output as a full run."""
+    anonymizer = HL7Anonymizer()
+    anonymizer.anonymize_message(MESSAGE)
+    token = encode_state(build_state(anonymizer, [MESSAGE]), KEY)
+
+    # Edit a free-text segment only
+    edited = MESSAGE.replace("next week", "tomorrow")
+    results, new_state, context_changed = reanonymize_segments(
+        decode_state(token, KEY),
+        [{'message': 0, 'segment': 3, 'text': message_segments(edited)[3]}],
+        HL7Anonymizer())
+    assert context_changed == []
+    assert results[0]['anonymized'] == _full(edited)[3]
+    assert 'Silva' not in results[0]['anonymized']
+
+    # Rename the patient: the free-text context follows the new PID
+    renamed = MESSAGE.replace("Silva", "Costa")
+    segments = message_segments(renamed)
+    results, _, context_changed = reanonymize_segments(
+        new_state,
+        [{'message': 0, 'segment': i, 'text': text} for i, text in enumerate(segments)],
+        HL7Anonymizer())
+    assert context_changed == [0]
+    assert [r['anonymized'] for r in results] == _full(renamed)
+    assert all('Costa' not in r['anonymized'] for r in results)
+
+    print("✓ Incremental output matches full anonymization")
+
+
+def test_state_token_is_verified():
+    """Tampered and foreign-key tokens are rejected."""
+    token = encode_state({'profile': 'default', 'pseudonyms': {}, 'terms': {}}, KEY)
+    assert decode_state(token, KEY)['profile'] == 'default'
+
+    body, signature = token.split('.')
+    for bad_token, key in ((body + 'A.' + signature, KEY), (token, b'other-key'), ('garbage', KEY),
+                           (body + 'é.' + signature, KEY), (body + '.' + signature + 'é', KEY)):
+        try:
+            decode_state(bad_token, key)
+        except StateTokenError:
+            pass
+        else:
+            raise AssertionError("Invalid token accepted")
+
+    try:
+        decode_state(token, KEY, max_age=-1)
+    except StateTokenError:
+        pass
+    else:
+        raise AssertionError("Expired token accepted")
+
+    print("✓ State tokens verified")
+
+
+if __name__ == '__main__':
+    print("Testing Incremental Anonymization\n" + "=" * 50)
+
+    try:
+        test_incremental_matches_full_anonymization()
+        test_state_token_is_verified()
+
+        print("\n" + "=" * 50)
+        print("✅ All incremental tests passed!")
+
+    except AssertionError as e:
+        print(f"\n❌ Test failed: {e}")
+        exit(1)
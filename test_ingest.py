@@ -0,0 +1,118 @@
+"""Fuzz and performance regression tests for guarded message splitting."""
+
+import random
+import time
+
+from nubilum.ingest import IngestError, IngestLimits, check_messages, split_messages
+
+UNLIMITED = IngestLimits(max_messages=0, max_segments=0, max_fields=0)
+
+
+def reference_split(text):
+    """The original line-based splitter, kept as the behavioural reference."""
+    messages = []
+    current = []
+    for line in text.split('\n'):
+        stripped = line.strip()
+        if stripped.startswith('MSH|') and current:
+            messages.append('\n'.join(current))
+            current = [line]
+        elif stripped:
+            current.append(line)
+    if current:
+        messages.append('\n'.join(current))
+    return messages
+
+
+def test_matches_reference_on_fuzzed_input():
+    """Random mixes of segments, blank lines, whitespace and separators split as before."""
+    rng = random.Random(1234)
+    pieces = ['MSH|^~\\&|A|B', '  MSH|x', 'PID|1||123', 'OBX|1|TX|||a|b', 'MSH', 'MSHX|',
+              '', ' ', '\t', '\r', '\x1c', '\x0b', '|', '||||', 'NTE|1||text with spaces  ',
+              ' ', 'Zé|ç']
+
+    for _ in range(2000):
+        separators = ['\n', '\r\n', '\n\n', '\r']
+        text = ''.join(rng.choice(pieces) + rng.choice(separators)
+                       for _ in range(rng.randint(0, 12)))
+        if rng.random() < 0.5:
+            text = text.rstrip('\n')
+        assert split_messages(text, UNLIMITED) == reference_split(text), repr(text)
+        assert check_messages(text, UNLIMITED) == len(reference_split(text))
+
+    print("✓ Splitting matches the reference on fuzzed input")
+
+
+def test_limits_report_positions():
+    """Each limit is enforced with the message, line and column where it was crossed."""
+    limits = IngestLimits(max_messages=2, max_segments=3, max_fields=5)
+
+    text = "MSH|a\nPID|1\n\nMSH|b\n  MSH|c"
+    try:
+        split_messages(text, limits)
+        assert False, "message limit not enforced"
+    except IngestError as e:
+        assert e.limit == 'messages'
+        assert e.position() == {'message': 3, 'line': 5, 'column': 3, 'offset': text.index('MSH|c')}
+
+    text = "MSH|a\nPID|1\nPV1|1\nOBX|1"
+    try:
+        split_messages(text, limits)
+        assert False, "segment limit not enforced"
+    except IngestError as e:
+        assert e.limit == 'segments'
+        assert (e.message_number, e.line, e.column) == (1, 4, 1)
+
+    text = "MSH|a\nPID|1|2|3|4|5|6"
+    try:
+        split_messages(text, limits)
+        assert False, "field limit not enforced"
+    except IngestError as e:
+        assert e.limit == 'fields'
+        assert (e.line, e.column) == (2, 12)
+        assert text[e.offset] == '|' and text[:e.offset].count('|') == 1 + 4
+
+    assert split_messages("MSH|a\nPID|1|2|3|4", limits) == ["MSH|a\nPID|1|2|3|4"]
+
+    print("✓ Limits enforced with precise positions")
+
+
+def test_pathological_input_rejected_quickly():
+    """A 1MB line of separators and 100k tiny messages are rejected without blowing up."""
+    limits = IngestLimits()
+
+    separators = 'PID' + '|' * (1024 * 1024)
+    started = time.perf_counter()
+    try:
+        split_messages(separators, limits)
+        assert False, "field limit not enforced"
+    except IngestError as e:
+        assert e.limit == 'fields'
+    assert time.perf_counter() - started < 0.5
+
+    tiny = 'MSH|\n' * 100000
+    started = time.perf_counter()
+    try:
+        split_messages(tiny, limits)
+        assert False, "message limit not enforced"
+    except IngestError as e:
+        assert e.limit == 'messages' and e.line == limits.max_messages + 1
+    assert time.perf_counter() - started < 0.5
+
+    print("✓ Pathological input rejected quickly")
+
+
+if __name__ == '__main__':
+    print("Testing Input Limits\n" + "=" * 50)
+
+    try:
+        test_matches_reference_on_fuzzed_input()
+        test_limits_report_positions()
+        test_pathological_input_rejected_quickly()
+
+        print("\n" + "=" * 50)
+        print("✅ All ingest tests passed!")
+
+    except AssertionError as e:
+        print(f"\n❌ Test failed: {e}")
+        exit(1)
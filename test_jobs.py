@@ -0,0 +1,190 @@
+"""Test script for asynchronous anonymization jobs."""
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from nubilum.jobs import JobManager, JobNotFound, JobNotReady
+
+SAMPLE_BATCH = "\n\n".join(
+    f"MSH|^~\\&|APP|FAC|REC|FAC|20250107||ADT^A01|MSG{n}|P|2.5\n"
+    f"PID|1||{n}123456^^^HOSP^MR||Doe^John||19800515|M"
+    for n in range(20)
+)
+
+
+def _wait(manager: JobManager, job_id: str, timeout: float = 10.0) -> dict:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        status = manager.status(job_id)
+        if status['state'] in ('completed', 'failed'):
+            return status
+        time.sleep(0.02)
+    raise AssertionError("Job did not finish in time")
+
+
+def test_job_lifecycle():
+    """A job runs in the background, streams its result and expires."""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        tracked = []
+        manager = JobManager(spool_dir=tmpdir, ttl=60,
+                             message_callback=lambda message, success, error, duration_ms: tracked.append(success))
+
+        job = manager.submit(SAMPLE_BATCH)
+        status = _wait(manager, job['job_id'])
+
+        assert status['state'] == 'completed'
+        assert status['messages_done'] == 20
+        assert status['progress'] == 100.0
+        assert tracked == [True] * 20
+
+        result = b''.join(manager.iter_result(job['job_id'])).decode()
+        assert result.count('MSH|') == 20
+        assert 'Doe^John' not in result
+
+        # The submitted messages are not kept once processed
+        job_dir = Path(tmpdir) / job['job_id']
+        assert not (job_dir / 'input.hl7').exists()
+
+        # After the TTL the job and its result are gone
+        manager.ttl = 0
+        expired = manager.submit(SAMPLE_BATCH)
+        _wait_until_gone(manager, expired['job_id'])
+        manager.cleanup(force=True)
+        assert not (Path(tmpdir) / expired['job_id']).exists()
+
+    print("✓ Job lifecycle correct")
+
+
+def _wait_until_gone(manager: JobManager, job_id: str, timeout: float = 10.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            manager.status(job_id)
+        except JobNotFound:
+            return
+        time.sleep(0.02)
+    raise AssertionError("Job did not expire")
+
+
+def test_invalid_job_ids():
+    """Unknown or malformed job ids are rejected without touching the filesystem."""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        manager = JobManager(spool_dir=tmpdir)
+
+        for job_id in ('../etc', 'abc', '0' * 32):
+            try:
+                manager.status(job_id)
+            except JobNotFound:
+                continue
+            raise AssertionError(f"Job id should be rejected: {job_id}")
+
+        try:
+            manager.iter_result('../../etc/passwd')
+        except (JobNotFound, JobNotReady):
+            pass
+        else:
+            raise AssertionError("Result for an invalid id should be rejected")
+
+    print("✓ Invalid job ids rejected")
+
+
+def test_expired_jobs_removed_without_requests():
+    """Expired jobs are deleted by the cleanup timer or on access; no job keeps its input or journal."""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        manager = JobManager(spool_dir=tmpdir, ttl=1)
+        try:
+            job = manager.submit(SAMPLE_BATCH)
+            job_dir = Path(tmpdir) / job['job_id']
+            assert _wait(manager, job['job_id'])['state'] == 'completed'
+            assert not (job_dir / 'input.hl7').exists() and not (job_dir / 'pseudonyms.jsonl').exists()
+
+            # No further submit: the timer removes the result
+            deadline = time.monotonic() + 10
+            while job_dir.exists() and time.monotonic() < deadline:
+                time.sleep(0.1)
+            assert not job_dir.exists()
+
+            failed = manager.submit(SAMPLE_BATCH, key='not bytes')
+            assert _wait(manager, failed['job_id'])['state'] == 'failed'
+            assert not (Path(tmpdir) / failed['job_id'] / 'input.hl7').exists()
+        finally:
+            manager.close()
+
+        manager = JobManager(spool_dir=tmpdir, ttl=3600)
+        try:
+            job = manager.submit(SAMPLE_BATCH)
+            _wait(manager, job['job_id'])
+            job_file = Path(tmpdir) / job['job_id'] / 'job.json'
+            metadata = json.loads(job_file.read_text())
+            metadata['expires'] = time.time() - 1
+            job_file.write_text(json.dumps(metadata))
+            try:
+                manager.iter_result(job['job_id'])
+                assert False, "expected JobNotFound"
+            except JobNotFound:
+                pass
+            assert not job_file.parent.exists()
+        finally:
+            manager.close()
+
+    print("✓ Expired jobs removed without requests")
+
+
+def test_long_jobs_kept_abandoned_jobs_removed():
+    """Jobs running past the maximum age are kept; jobs of dead or silent processes are removed."""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        manager = JobManager(spool_dir=tmpdir, max_age=2,
+                             message_callback=lambda *args: time.sleep(0.2))
+        try:
+            job = manager.submit(SAMPLE_BATCH)
+            time.sleep(3)
+            manager.cleanup(force=True)
+            assert _wait(manager, job['job_id'])['state'] == 'completed'
+        finally:
+            manager.close()
+
+        dead = subprocess.Popen([sys.executable, '-c', 'pass'])
+        dead.wait()
+        jobs = {
+            'a' * 32: (dead.pid, time.time()),      # process gone
+            'b' * 32: (os.getpid(), time.time() - 10),  # no heartbeat
+            'c' * 32: (os.getpid(), time.time()),   # old but alive
+        }
+        for job_id, (pid, heartbeat) in jobs.items():
+            job_dir = Path(tmpdir) / job_id
+            job_dir.mkdir()
+            job_file = job_dir / 'job.json'
+            job_file.write_text(json.dumps({'job_id': job_id, 'state': 'running', 'pid': pid,
+                                            'created': time.time() - 3600, 'expires': None}))
+            os.utime(job_file, (heartbeat, heartbeat))
+
+        manager = JobManager(spool_dir=tmpdir, max_age=5)
+        try:
+            assert manager.cleanup(force=True) == 2
+            assert [job_id for job_id in jobs if (Path(tmpdir) / job_id).exists()] == ['c' * 32]
+        finally:
+            manager.close()
+
+    print("✓ Long jobs kept, abandoned jobs removed")
+
+
+if __name__ == '__main__':
+    print("Testing Asynchronous Jobs\n" + "=" * 50)
+
+    try:
+        test_job_lifecycle()
+        test_invalid_job_ids()
+        test_expired_jobs_removed_without_requests()
+        test_long_jobs_kept_abandoned_jobs_removed()
+
+        print("\n" + "=" * 50)
+        print("✅ All job tests passed!")
+
+    except AssertionError as e:
+        print(f"\n❌ Test failed: {e}")
+        exit(1)
@@ -0,0 +1,65 @@
+"""Test script for the pluggable JSON backend."""
+
+import json
+import uuid
+from datetime import datetime
+
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+from nubilum import jsonutil
+from nubilum.jsonutil import FastJSONProvider
+
+
+def test_roundtrip_matches_stdlib():
+    """The active backend parses and writes the same data as the stdlib."""
+    event = {"message_type": "ORU^R01", "segment_counts": {"MSH": 1, "OBX": 3},
+             "success": True, "error": None, "note": "Açores"}
+    text = jsonutil.dumps(event)
+
+    assert json.loads(text) == event
+    assert jsonutil.loads(text) == event
+    assert jsonutil.loads(text.encode('utf-8')) == event
+    assert jsonutil.loads(jsonutil.dumps_bytes(event)) == event
+
+    try:
+        jsonutil.loads('not json')
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("Invalid JSON accepted")
+
+    print(f"✓ {jsonutil.BACKEND} round-trip matches stdlib")
+
+
+def test_flask_provider_compatible():
+    """Responses keep Flask's sorted keys, integer keys and date handling."""
+    app = Flask(__name__)
+    fast, default = FastJSONProvider(app), DefaultJSONProvider(app)
+    value = {
+        "b": 1,
+        "a": {"hourly_distribution": {9: 2, 14: 5}},
+        "when": datetime(2025, 1, 7, 12, 0, 0),
+        "id": uuid.UUID(int=1),
+    }
+
+    assert json.loads(fast.dumps(value)) == json.loads(default.dumps(value))
+    assert fast.dumps(value).index('"a"') < fast.dumps(value).index('"b"')
+    assert fast.loads('{"message": "MSH|"}') == {"message": "MSH|"}
+
+    print("✓ Flask JSON provider compatible with the default provider")
+
+
+if __name__ == '__main__':
+    print("Testing JSON Backend\n" + "=" * 50)
+
+    try:
+        test_roundtrip_matches_stdlib()
+        test_flask_provider_compatible()
+
+        print("\n" + "=" * 50)
+        print("✅ All JSON backend tests passed!")
+
+    except AssertionError as e:
+        print(f"\n❌ Test failed: {e}")
+        exit(1)
@@ -0,0 +1,172 @@
+"""Test script for anonymization profiles."""
+
+import json
+import os
+import pickle
+import tempfile
+from pathlib import Path
+
+from nubilum.anonymizer import HL7Anonymizer
+from nubilum.profiles import ProfileError, ProfileRegistry, compile_profile, load_profile_source
+
+SAMPLE_MESSAGE = """MSH|^~\\&|SENDING_APP|SENDING_FACILITY|RECEIVING_APP|RECEIVING_FACILITY|20250107120000||ADT^A40|MSG00001|P|2.5
+PID|1||123456789^^^HOSPITAL^MR||Doe^John^Robert||19800515|M
+MRG|555666^^^HOSPITAL^MR||||||Old^Name
+ZPI|1|LOCAL123|secret note"""
+
+
+def test_default_profile_matches_builtin_rules():
+    """The default profile produces exactly the built-in output."""
+    registry = ProfileRegistry()
+    with_profile = HL7Anonymizer(profile=registry.get()).anonymize_message(SAMPLE_MESSAGE)
+    builtin = HL7Anonymizer().anonymize_message(SAMPLE_MESSAGE)
+
+    assert with_profile == builtin
+    assert 'LOCAL123' in builtin
+
+    print("✓ Default profile matches built-in rules")
+
+
+def test_profile_rules():
+    """Profile rules cover extra segments and override built-in rules."""
+    profile = compile_profile({
+        'name': 'site',
+        'rules': [
+            {'segment': 'MRG', 'field': 1, 'component': 1, 'action': 'hash', 'prefix': 'PID'},
+            {'segment': 'MRG', 'field': 7, 'action': 'redact'},
+            {'segment': 'Z*', 'field': 2, 'action': 'hash', 'prefix': 'ZPI'},
+            {'segment': 'ZPI', 'field': 3, 'action': 'constant', 'value': 'REMOVED'},
+            {'segment': 'PID', 'field': 5, 'component': 2, 'action': 'keep'},
+            {'segment': 'MSH', 'field': 4, 'action': 'constant', 'value': 'FAC'},
+        ]
+    })
+
+    anonymizer = HL7Anonymizer(profile=profile)
+    lines = anonymizer.anonymize_message(SAMPLE_MESSAGE).split('\n')
+
+    msh, pid, mrg, zpi = [line.split('|') for line in lines]
+
+    assert msh[3] == 'FAC'
+    assert pid[5].split('^')[1] == 'John'
+    assert pid[5].split('^')[0] != 'Doe'
+    assert mrg[1].startswith('PID') and mrg[1].endswith('^^^HOSPITAL^MR')
+    assert mrg[7] == ''
+    assert zpi[2].startswith('ZPI')
+    assert zpi[3] == 'REMOVED'
+
+    # Same identifier gets the same pseudonym everywhere in the message
+    assert mrg[1].split('^')[0] == anonymizer._generate_pseudo_id('555666', 'PID')
+
+    print("✓ Profile rules applied correctly")
+
+
+def test_rules_only_profile():
+    """With builtin disabled only the profile rules are applied."""
+    profile = compile_profile({
+        'name': 'minimal',
+        'builtin': False,
+        'rules': [{'segment': 'PID', 'field': 3, 'action': 'redact'}],
+    })
+
+    pid = HL7Anonymizer(profile=profile).anonymize_message(SAMPLE_MESSAGE).split('\n')[1].split('|')
+
+    assert pid[3] == ''
+    assert pid[5] == 'Doe^John^Robert'
+
+    print("✓ Rules-only profile leaves other fields untouched")
+
+
+def test_invalid_profiles_rejected():
+    """Invalid profiles fail validation with a clear error."""
+    invalid = [
+        {'rules': []},
+        {'name': 'x', 'rules': [{'segment': 'pid', 'field': 3, 'action': 'redact'}]},
+        {'name': 'x', 'rules': [{'segment': 'PID', 'field': 0, 'action': 'redact'}]},
+        {'name': 'x', 'rules': [{'segment': 'PID', 'field': 3, 'action': 'encrypt'}]},
+        {'name': 'x', 'rules': [{'segment': 'PID', 'field': 3, 'action': 'constant'}]},
+        {'name': 'x', 'rules': [{'segment': 'PID', 'field': 3, 'action': 'constant', 'value': 'a|b'}]},
+        {'name': 'x', 'rules': [{'segment': 'MSH', 'field': 2, 'action': 'redact'}]},
+    ]
+
+    for definition in invalid:
+        try:
+            compile_profile(definition)
+        except ProfileError:
+            continue
+        raise AssertionError(f"Profile should be rejected: {definition}")
+
+    print("✓ Invalid profiles rejected")
+
+
+def test_registry_loads_directory_and_caches():
+    """Profiles are loaded from a directory and compiled once per source."""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        source = json.dumps({
+            'name': 'site',
+            'rules': [{'segment': 'ZPI', 'field': 2, 'action': 'redact'}],
+        })
+        Path(tmpdir, 'site.json').write_text(source)
+        Path(tmpdir, 'broken.json').write_text('{not json')
+
+        registry = ProfileRegistry(tmpdir).load()
+
+        assert registry.names() == ['default', 'site']
+        assert registry.get('site') is load_profile_source(source.encode())
+
+        try:
+            registry.get('missing')
+        except ProfileError:
+            pass
+        else:
+            raise AssertionError("Unknown profile should raise ProfileError")
+
+    print("✓ Registry loads profiles from directory")
+
+
+def test_profile_names_and_plans():
+    """Non-string profile names are rejected with 400; plans survive pickling."""
+    registry = ProfileRegistry()
+    for name in (['default'], {'name': 'default'}, 1):
+        try:
+            registry.get(name)
+        except ProfileError:
+            pass
+        else:
+            raise AssertionError(f"Profile name {name!r} should raise ProfileError")
+
+    os.environ.setdefault('NUBILUM_LOG_DIR', tempfile.mkdtemp())
+    from nubilum import app as app_module
+    client = app_module.app.test_client()
+    for name in (['default'], {'name': 'default'}):
+        response = client.post('/api/anonymize', json={'message': SAMPLE_MESSAGE, 'profile': name})
+        assert response.status_code == 400 and not response.get_json()['success']
+
+    profile = compile_profile({
+        'name': 'site',
+        'rules': [{'segment': 'ZPI', 'field': 2, 'action': 'redact'},
+                  {'segment': 'Z*', 'field': 1, 'action': 'redact'}],
+    })
+    copy = pickle.loads(pickle.dumps(profile))
+    assert [rule.field for rule in copy.rules_for('ZPI')] == [2, 1]
+    assert copy.rules_for('ZXY') == profile.rules_for('ZXY')
+
+    print("✓ Profile names checked, plans picklable")
+
+
+if __name__ == '__main__':
+    print("Testing Anonymization Profiles\n" + "=" * 50)
+
+    try:
+        test_default_profile_matches_builtin_rules()
+        test_profile_rules()
+        test_rules_only_profile()
+        test_invalid_profiles_rejected()
+        test_registry_loads_directory_and_caches()
+        test_profile_names_and_plans()
+
+        print("\n" + "=" * 50)
+        print("✅ All profile tests passed!")
+
+    except AssertionError as e:
+        print(f"\n❌ Test failed: {e}")
+        exit(1)
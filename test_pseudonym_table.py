@@ -0,0 +1,94 @@
+"""Test script for the shared-memory pseudonym table."""
+
+import multiprocessing
+
+from nubilum.anonymizer import HL7Anonymizer
+from nubilum.pseudonym_table import SharedPseudonymTable
+
+MESSAGE = "\n".join([
+    "MSH|^~\\&|LAB|HOSPITAL|EHR|HOSPITAL|20250107120000||ADT^A01|MSG1|P|2.5",
+    "PID|1||123456^^^HOSPITAL^MR||Silva^Ana||19800515|F|||Rua Augusta^^Lisboa",
+    "NK1|1|Silva^Rui|SPO|Rua Augusta^^Lisboa",
+    "PV1|1|I|||||DOC1^Costa^Rui|||||||||||V1",
+])
+
+
+def _insert_in_child(table, count):
+    for n in range(count):
+        table.put(f"key{n}", f"PSEUDO{n}")
+
+
+def test_put_get_and_capacity():
+    """Entries are found, duplicates ignored and the table never overfills."""
+    table = SharedPseudonymTable(slots=64)
+    try:
+        assert table.get('missing') is None
+        assert table.put('a', 'Example01')
+        assert table.put('a', 'ignored')
+        assert table.get('a') == 'Example01'
+        assert len(table) == 1
+
+        assert not table.put('long', 'x' * 100)
+
+        accepted = sum(table.put(f"k{n}", f"v{n}") for n in range(200))
+        assert len(table) < table.slots
+        assert accepted == len(table) - 1
+        assert all(table.get(f"k{n}") == f"v{n}" for n in range(accepted))
+    finally:
+        table.close()
+        table.unlink()
+
+    print("✓ Put/get and capacity limit correct")
+
+
+def test_visible_across_processes():
+    """Entries added by a forked worker are visible to the other processes."""
+    table = SharedPseudonymTable(slots=1024)
+    try:
+        process = multiprocessing.get_context('fork').Process(
+            target=_insert_in_child, args=(table, 100))
+        process.start()
+        process.join(10)
+
+        assert process.exitcode == 0
+        assert len(table) == 100
+        assert table.get('key42') == 'PSEUDO42'
+    finally:
+        table.close()
+        table.unlink()
+
+    print("✓ Entries shared across processes")
+
+
+def test_anonymizer_output_unchanged():
+    """Using the shared table does not change anonymization output."""
+    table = SharedPseudonymTable(slots=1024)
+    try:
+        expected = HL7Anonymizer().anonymize_message(MESSAGE)
+        first = HL7Anonymizer(pseudonym_table=table).anonymize_message(MESSAGE)
+        second = HL7Anonymizer(pseudonym_table=table).anonymize_message(MESSAGE)
+
+        assert first == second == expected
+        assert table.stats()['hits'] > 0
+        assert 'Silva' not in str(bytes(table._shm.buf))
+    finally:
+        table.close()
+        table.unlink()
+
+    print("✓ Anonymizer output identical with shared table")
+
+
+if __name__ == '__main__':
+    print("Testing Shared Pseudonym Table\n" + "=" * 50)
+
+    try:
+        test_put_get_and_capacity()
+        test_visible_across_processes()
+        test_anonymizer_output_unchanged()
+
+        print("\n" + "=" * 50)
+        print("✅ All pseudonym table tests passed!")
+
+    except AssertionError as e:
+        print(f"\n❌ Test failed: {e}")
+        exit(1)
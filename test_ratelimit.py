@@ -0,0 +1,163 @@
+"""Test script for per-client rate limiting and concurrency caps."""
+
+import multiprocessing
+import time
+
+from flask import Flask, jsonify
+
+from nubilum import ratelimit
+from nubilum.ratelimit import SharedRateLimiter
+
+
+def _acquire_in_child(limiter, client, count):
+    for _ in range(count):
+        limiter.acquire(client)
+
+
+def test_token_bucket_and_concurrency():
+    """Bursts are capped, tokens refill over time and in-flight requests are limited."""
+    limiter = SharedRateLimiter(rate=1000.0, burst=3, max_concurrent=0, slots=64)
+    try:
+        decisions = [limiter.acquire('ip:10.0.0.1') for _ in range(4)]
+        assert [d.allowed for d in decisions] == [True, True, True, False]
+        assert decisions[-1].reason == 'rate' and decisions[-1].retry_after > 0
+        assert limiter.acquire('ip:10.0.0.2').allowed
+
+        limiter.rate = 0.001
+        limiter.max_concurrent = 2
+        first = limiter.acquire('key:abc')
+        second = limiter.acquire('key:abc')
+        third = limiter.acquire('key:abc')
+        assert first.allowed and second.allowed
+        assert not third.allowed and third.reason == 'concurrency'
+
+        limiter.release(first)
+        assert limiter.acquire('key:abc').allowed
+
+        metrics = limiter.metrics()
+        assert metrics['rejected_rate'] == 1
+        assert metrics['rejected_concurrency'] == 1
+        assert metrics['in_flight'] >= 2
+        assert 'abc' not in str(bytes(limiter._shm.buf))
+    finally:
+        limiter.close()
+        limiter.unlink()
+
+    print("✓ Token bucket and concurrency cap correct")
+
+
+def test_requests_of_killed_workers_expire():
+    """In-flight requests never released are dropped after the lease; a zero rate does not fail."""
+    limiter = SharedRateLimiter(rate=0.0, burst=10, max_concurrent=2, slots=64, lease=0.2)
+    try:
+        # Two requests whose worker was killed: never released
+        assert limiter.acquire('ip:10.0.0.3').allowed and limiter.acquire('ip:10.0.0.3').allowed
+        assert limiter.acquire('ip:10.0.0.3').reason == 'concurrency'
+
+        time.sleep(0.3)
+        assert limiter.metrics()['in_flight'] == 0
+        current = limiter.acquire('ip:10.0.0.3')
+        assert current.allowed
+
+        # A late release of an expired request does not free the current one
+        stale = limiter.acquire('ip:10.0.0.4')
+        time.sleep(0.3)
+        fresh = [limiter.acquire('ip:10.0.0.4') for _ in range(2)]
+        limiter.release(stale)
+        assert all(d.allowed for d in fresh) and limiter.acquire('ip:10.0.0.4').reason == 'concurrency'
+
+        limiter.max_concurrent = 0
+        for _ in range(10):
+            limiter.acquire('ip:10.0.0.5')
+        rejected = limiter.acquire('ip:10.0.0.5')
+        assert rejected.reason == 'rate' and rejected.retry_after > 0
+    finally:
+        limiter.close()
+        limiter.unlink()
+
+    print("✓ Requests of killed workers expire")
+
+
+def test_shared_across_processes():
+    """Tokens consumed by a forked worker count against the same client."""
+    limiter = SharedRateLimiter(rate=0.001, burst=10, max_concurrent=0, slots=64)
+    try:
+        process = multiprocessing.get_context('fork').Process(
+            target=_acquire_in_child, args=(limiter, 'ip:10.0.0.9', 10))
+        process.start()
+        process.join(10)
+
+        assert process.exitcode == 0
+        assert not limiter.acquire('ip:10.0.0.9').allowed
+        assert limiter.metrics()['allowed'] == 10
+    finally:
+        limiter.close()
+        limiter.unlink()
+
+    print("✓ Limits shared across processes")
+
+
+def test_flask_integration():
+    """Limited endpoints return 429 with Retry-After; the slot is released after each request."""
+    limiter = SharedRateLimiter(rate=0.001, burst=2, max_concurrent=1, slots=64)
+    app = Flask(__name__)
+
+    @app.route('/limited', methods=['POST'])
+    def limited():
+        return jsonify({'success': True})
+
+    @app.route('/open', methods=['POST'])
+    def open_endpoint():
+        return jsonify({'success': True})
+
+    ratelimit.init_app(app, limiter, endpoints=('limited',))
+    client = app.test_client()
+    try:
+        assert client.post('/limited').status_code == 200
+        assert client.post('/limited').status_code == 200  # concurrency slot was released
+
+        response = client.post('/limited')
+        assert response.status_code == 429
+        assert response.get_json()['success'] is False
+        assert int(response.headers['Retry-After']) >= 1
+
+        # Unvalidated keys are limited by address, so a new key per request gains nothing
+        assert client.post('/limited', headers={'X-API-Key': 'random'}).status_code == 429
+        assert client.post('/open').status_code == 200
+        assert limiter.metrics()['in_flight'] == 0
+    finally:
+        limiter.close()
+        limiter.unlink()
+
+    # Keys the application validates get their own bucket
+    limiter = SharedRateLimiter(rate=0.001, burst=1, max_concurrent=1, slots=64)
+    app = Flask(__name__)
+    app.add_url_rule('/limited', 'limited', limited, methods=['POST'])
+    ratelimit.init_app(app, limiter, endpoints=('limited',), key_validator=lambda api_key: api_key == 'tenant')
+    client = app.test_client()
+    try:
+        assert client.post('/limited', headers={'X-API-Key': 'random'}).status_code == 200
+        assert client.post('/limited', headers={'X-API-Key': 'other'}).status_code == 429
+        assert client.post('/limited', headers={'X-API-Key': 'tenant'}).status_code == 200
+    finally:
+        limiter.close()
+        limiter.unlink()
+
+    print("✓ Flask integration returns 429 with Retry-After")
+
+
+if __name__ == '__main__':
+    print("Testing Rate Limiting\n" + "=" * 50)
+
+    try:
+        test_token_bucket_and_concurrency()
+        test_requests_of_killed_workers_expire()
+        test_shared_across_processes()
+        test_flask_integration()
+
+        print("\n" + "=" * 50)
+        print("✅ All rate limiting tests passed!")
+
+    except AssertionError as e:
+        print(f"\n❌ Test failed: {e}")
+        exit(1)
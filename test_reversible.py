@@ -0,0 +1,135 @@
+"""Test script for reversible pseudonymization and re-identification."""
+
+import os
+import tempfile
+from pathlib import Path
+
+import pytest
+
+from nubilum.anonymizer import HL7Anonymizer
+from nubilum.batch import BatchJob
+from nubilum.reversible import (ReidentificationMap, ReversibleError, load_key_file, pseudonym_key,
+                                reidentify_text, write_key_file)
+
+MESSAGE = "\n".join([
+    "MSH|^~\\&|LAB|HOSPITAL|EHR|HOSPITAL|20250107120000||ADT^A01|MSG1|P|2.5",
+    "PID|1||123456^^^HOSPITAL^MR||Silva^Ana^Maria||19800515|F",
+    "NK1|1|Silva^Rui|SPO",
+    "PV1|1|I|||||DOC1^Costa^Rui|||||||||||V1",
+    "NTE|1||Contact ana.silva@mail.pt, Ana Silva",
+])
+
+
+def _mapping(anonymizer):
+    pairs = list(anonymizer.processed_ids.items()) + list(anonymizer.processed_names.items())
+    return {pseudo[-16:]: (pseudo, original) for original, pseudo in pairs}
+
+
+def test_keyed_pseudonyms():
+    """Keyed pseudonyms are deterministic per key and end in a 16-digit code."""
+    first = HL7Anonymizer(key=b'k' * 32).anonymize_message(MESSAGE)
+    again = HL7Anonymizer(key=b'k' * 32).anonymize_message(MESSAGE)
+    other = HL7Anonymizer(key=b'x' * 32).anonymize_message(MESSAGE)
+
+    assert first == again
+    assert first != other
+    assert 'Silva' not in first and '123456' not in first
+
+    pid = first.split('\n')[1].split('|')
+    assert pid[3].startswith('PID') and len(pid[3].split('^')[0]) == 3 + 16
+
+    # Without a key the one-way 6-digit pseudonyms are unchanged
+    plain = HL7Anonymizer().anonymize_message(MESSAGE).split('\n')[1].split('|')
+    assert len(plain[3].split('^')[0]) == 3 + 6
+
+    print("✓ Keyed pseudonyms deterministic and key-dependent")
+
+
+def test_reidentify_text():
+    """Identifiers, names, provider names and e-mail addresses are restored."""
+    anonymizer = HL7Anonymizer(key=b'k' * 32)
+    anonymized = anonymizer.anonymize_message(MESSAGE)
+
+    restored, count = reidentify_text(anonymized, _mapping(anonymizer))
+
+    assert count > 0
+    lines = restored.split('\n')
+    assert lines[1].split('|')[3] == '123456^^^HOSPITAL^MR'
+    assert lines[1].split('|')[5] == 'Silva^Ana^Maria'
+    assert lines[2].split('|')[2] == 'Silva^Rui'
+    assert lines[3].split('|')[7] == 'DOC1^Costa^Rui'
+    assert lines[4] == MESSAGE.split('\n')[4]
+
+    # Unknown codes and ordinary numbers are left alone
+    assert reidentify_text('OBX|1|NM|||1234567890123456', {}) == ('OBX|1|NM|||1234567890123456', 0)
+
+    print("✓ Re-identification restores original values")
+
+
+def test_key_file():
+    """Key files are created once, owner-readable, and validated on load."""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        key_path = os.path.join(tmpdir, 'research.key')
+        write_key_file(key_path)
+
+        assert os.stat(key_path).st_mode & 0o077 == 0
+        assert len(load_key_file(key_path)) == 32
+        assert pseudonym_key(load_key_file(key_path)) != load_key_file(key_path)
+
+        with pytest.raises(ReversibleError):
+            write_key_file(key_path)
+
+        Path(key_path).write_text('not a key\n')
+        with pytest.raises(ReversibleError):
+            load_key_file(key_path)
+
+    print("✓ Key files created and validated")
+
+
+def test_batch_map_round_trip():
+    """A reversible batch run writes an encrypted map that restores the input."""
+    pytest.importorskip('cryptography')
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        tmp = Path(tmpdir)
+        key_path = tmp / 'research.key'
+        write_key_file(key_path)
+        master_key = load_key_file(key_path)
+
+        (tmp / 'archive.hl7').write_text(MESSAGE + '\n\n' + MESSAGE.replace('123456', '654321') + '\n')
+        (tmp / 'manifest.txt').write_text(str(tmp / 'archive.hl7') + '\n')
+
+        reid_map = ReidentificationMap(tmp / 'research.map', master_key)
+        BatchJob(tmp / 'manifest.txt', tmp / 'out', chunk_size=1, reidentification_map=reid_map).run()
+
+        output = (tmp / 'out' / 'archive.hl7').read_text()
+        # Keyed codes and surrogates may contain these strings by chance; the original values may not
+        assert '123456^' not in output and 'Silva^' not in output
+        assert b'Silva' not in (tmp / 'research.map').read_bytes()
+        assert len((tmp / 'research.map').read_bytes().splitlines()) == 2  # one record per chunk
+
+        restored, _ = reidentify_text(output, ReidentificationMap(tmp / 'research.map', master_key).load())
+        assert '123456^^^HOSPITAL^MR' in restored and '654321^^^HOSPITAL^MR' in restored
+        assert 'Silva^Ana^Maria' in restored
+
+        with pytest.raises(ReversibleError):
+            ReidentificationMap(tmp / 'research.map', b'x' * 32).load()
+
+    print("✓ Encrypted map round trip")
+
+
+if __name__ == '__main__':
+    print("Testing Reversible Pseudonymization\n" + "=" * 50)
+
+    try:
+        test_keyed_pseudonyms()
+        test_reidentify_text()
+        test_key_file()
+        test_batch_map_round_trip()
+
+        print("\n" + "=" * 50)
+        print("✅ All reversible pseudonymization tests passed!")
+
+    except AssertionError as e:
+        print(f"\n❌ Test failed: {e}")
+        exit(1)
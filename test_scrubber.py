@@ -0,0 +1,101 @@
+"""Test script for free-text PHI scrubbing."""
+
+from nubilum.anonymizer import HL7Anonymizer
+from nubilum.scrubber import AhoCorasick, FreeTextScrubber, collect_identifying_terms
+
+SAMPLE_MESSAGE = """MSH|^~\\&|LAB|HOSPITAL|EHR|HOSPITAL|20250107120000||ORU^R01|MSG00001|P|2.5
+PID|1||123456789^^^HOSPITAL^MR||Ferreira^Joana^Maria||19800515|F|||Rua das Flores 12^^Porto^^4000-123
+NK1|1|Ferreira^Manuel|FTH
+OBX|1|TX|NOTE||Doente JOANA FERREIRA, NIF 234567890, tel. +351 912 345 678, contactar Manuel||||||F
+OBX|2|NM|GLU||123456789|mg/dL|||||F
+NTE|1||Morada: Rua das Flores 12, 4000-123 Porto. Email joana.f@example.pt"""
+
+
+def test_aho_corasick_longest_match():
+    """The automaton reports the longest term ending at each position."""
+    automaton = AhoCorasick({'ana': 1, 'mariana': 2, 'rian': 3})
+    matches = list(automaton.iter_matches('mariana e ana'))
+
+    assert (0, 7, 2) in matches
+    assert (10, 13, 1) in matches
+
+    print("✓ Aho-Corasick finds overlapping terms")
+
+
+def test_scrubber_word_boundaries():
+    """Message terms only match whole words, case-insensitively."""
+    terms = collect_identifying_terms(SAMPLE_MESSAGE.split('\n'))
+    scrubber = FreeTextScrubber(terms, lambda kind, value: f"<{kind}>")
+
+    assert scrubber.scrub("JOANA e Joanaria") == "<first_name> e Joanaria"
+    assert scrubber.scrub("Sr. ferreira") == "Sr. <last_name>"
+    assert scrubber.scrub("codigo 4000-123") == "codigo <postal_code>"
+
+    print("✓ Scrubber respects word boundaries")
+
+
+def test_shorter_term_on_word_boundary():
+    """A longest term that fails the word-boundary check falls back to shorter terms ending there."""
+    terms = {'maria ana': ('Maria Ana', 'first_name'), 'ana': ('Ana', 'first_name')}
+    scrubber = FreeTextScrubber(terms, lambda kind, value: f"<{value}>")
+
+    assert scrubber.scrub("Maria Ana") == "<Maria Ana>"
+    assert scrubber.scrub("Rosamaria Ana") == "Rosamaria <Ana>"
+
+    automaton = AhoCorasick({'maria ana': 1, 'ana': 2})
+    assert list(automaton.iter_matches('xmaria ana', lambda start, end: start != 1)) == [(7, 10, 2)]
+
+    print("✓ Shorter terms found on word boundaries")
+
+
+def test_nif_and_phone_formats():
+    """Bare nine-digit numbers starting with 2 are NIFs; landlines need a prefix or separator."""
+    scrubber = FreeTextScrubber({}, lambda kind, value: f"<{kind}>")
+
+    assert scrubber.scrub("NIF 234567890") == "NIF <nif>"
+    assert scrubber.scrub("tel 234 567 890") == "tel <phone>"
+    assert scrubber.scrub("tel +351234567890") == "tel <phone>"
+    assert scrubber.scrub("tel 912345678") == "tel <phone>"
+
+    print("✓ NIF and phone formats distinguished")
+
+
+def test_free_text_fields_scrubbed():
+    """OBX-5 and NTE-3 are scrubbed consistently with the structured fields."""
+    anonymizer = HL7Anonymizer()
+    lines = anonymizer.anonymize_message(SAMPLE_MESSAGE).split('\n')
+    pid, obx_text, obx_numeric, nte = (lines[1].split('|'), lines[3].split('|'),
+                                       lines[4].split('|'), lines[5].split('|'))
+
+    for secret in ('JOANA', 'FERREIRA', '234567890', '912 345 678', 'Manuel'):
+        assert secret not in obx_text[5], secret
+
+    for secret in ('Rua das Flores 12', '4000-123', 'joana.f@example.pt'):
+        assert secret not in nte[3], secret
+
+    # Free-text pseudonyms match the PID-5 pseudonyms
+    last_name, first_name = pid[5].split('^')[:2]
+    assert f"{first_name} {last_name}" in obx_text[5]
+
+    # Numeric results are never touched
+    assert obx_numeric[5] == '123456789'
+
+    print("✓ OBX-5/NTE-3 scrubbed consistently")
+
+
+if __name__ == '__main__':
+    print("Testing Free-Text Scrubbing\n" + "=" * 50)
+
+    try:
+        test_aho_corasick_longest_match()
+        test_scrubber_word_boundaries()
+        test_shorter_term_on_word_boundary()
+        test_nif_and_phone_formats()
+        test_free_text_fields_scrubbed()
+
+        print("\n" + "=" * 50)
+        print("✅ All scrubbing tests passed!")
+
+    except AssertionError as e:
+        print(f"\n❌ Test failed: {e}")
+        exit(1)
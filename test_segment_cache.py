@@ -0,0 +1,168 @@
+"""Tests for the segment cache: cached output must match fresh anonymization exactly."""
+
+import os
+import random
+import tempfile
+from pathlib import Path
+
+from nubilum.anonymizer import HL7Anonymizer
+from nubilum.batch import BatchJob
+from nubilum.profiles import compile_profile
+from nubilum.segment_cache import SegmentCache
+
+NAMES = ['Silva', 'Costa', 'Santos', 'Ana', 'Rui', 'Maria']
+IDS = ['1001', '1002', '2001', 'V77']
+
+PROFILE = compile_profile({
+    'name': 'site',
+    'rules': [
+        {'segment': 'Z*', 'field': 1, 'action': 'hash', 'prefix': 'Z'},
+        {'segment': 'ZPV', 'field': 2, 'action': 'scrub'},
+        {'segment': 'AIL', 'field': 3, 'component': 1, 'action': 'hash', 'prefix': 'LOC'},
+    ],
+})
+
+
+def _messages(count: int, seed: int = 3) -> list:
+    """Messages reusing a few names and identifiers in different roles."""
+    rnd = random.Random(seed)
+    messages = []
+    for n in range(count):
+        segments = [f"MSH|^~\\&|APP|FAC|REC|FAC|20250107120000||ADT^A01|MSG{n}|P|2.5"]
+        for _ in range(rnd.randrange(1, 8)):
+            first, last, value = rnd.choice(NAMES), rnd.choice(NAMES), rnd.choice(IDS)
+            segments.append(rnd.choice([
+                f"PID|1||{value}^^^HOSP^MR||{last}^{first}||19800101|F",
+                f"PV1|1|O|||||D1^{last}^{first}||||||||||||{value}",
+                f"ORC|NW|{value}|{rnd.choice(IDS)}|||||||{last}^X",
+                "EVN|A01|20250107120000|||OPER^Clerk",
+                f"OBX|1|TX|NOTE||Seen by {last} {first}, id {value}||||||F",
+                f"AIL|1||{first}^Room",
+                f"ZPV|{value}|{last} called",
+            ]))
+        messages.append('\n'.join(segments))
+    return messages
+
+
+def _assert_same_state(fresh: HL7Anonymizer, cached: HL7Anonymizer):
+    # Same pseudonyms, recorded in the same order (batch journals rely on it)
+    assert list(fresh.processed_ids.items()) == list(cached.processed_ids.items())
+    assert list(fresh.processed_names.items()) == list(cached.processed_names.items())
+
+
+def test_cached_output_matches_fresh():
+    """Output and pseudonym state are identical with and without the cache."""
+    messages = _messages(1500)
+
+    for options in ({}, {'profile': PROFILE}, {'key': b'k' * 32}):
+        cache = SegmentCache(max_entries=100)
+        fresh = HL7Anonymizer(**options)
+        cached = HL7Anonymizer(segment_cache=cache, **options)
+
+        for message in messages:
+            assert cached.anonymize_message(message) == fresh.anonymize_message(message)
+        _assert_same_state(fresh, cached)
+
+        stats = cache.stats()
+        assert stats['hits'] > 0 and stats['uncacheable'] > 0
+        assert stats['entries'] <= 100
+
+    print("✓ Cached output matches fresh output")
+
+
+def test_shared_cache_across_anonymizers():
+    """Anonymizers with other histories, profiles or keys never get a wrong line."""
+    messages = _messages(400, seed=5)
+    cache = SegmentCache()
+    rnd = random.Random(11)
+
+    for trial in range(30):
+        options = rnd.choice([{}, {'profile': PROFILE}, {'key': b'a' * 32}, {'key': b'b' * 32}])
+        state = {'ids': {rnd.choice(IDS): 'PID999999'}, 'names': {rnd.choice(NAMES): 'Restored'}}
+        fresh = HL7Anonymizer(**options)
+        cached = HL7Anonymizer(segment_cache=cache, **options)
+        if trial % 2:
+            fresh.load_state(state)
+            cached.load_state(state)
+
+        for message in rnd.sample(messages, 40):
+            assert cached.anonymize_message(message) == fresh.anonymize_message(message)
+        _assert_same_state(fresh, cached)
+
+    assert cache.stats()['conflicts'] > 0
+    print("✓ Shared cache is safe across anonymizers")
+
+
+def test_cache_admission_and_bounds():
+    """Lines are stored on their second sighting; the LRU is bounded; originals are not kept."""
+    cache = SegmentCache(max_entries=2)
+    anonymizer = HL7Anonymizer(segment_cache=cache)
+    lines = [f"PV1|1|O|||||Costa{n}^Rui" for n in range(3)]
+
+    anonymizer.anonymize_segment(lines[0])
+    assert cache.stats()['entries'] == 0
+
+    expected = anonymizer.anonymize_segment(lines[0])
+    assert cache.stats()['entries'] == 1
+
+    # A new anonymizer gets the line from the shared cache, with its pseudonyms
+    other = HL7Anonymizer(segment_cache=cache)
+    assert other.anonymize_segment(lines[0]) == expected
+    assert set(other.processed_names) == {'Costa0', 'Rui'}
+    assert cache.stats()['hits'] == 1
+
+    for line in lines[1:] * 2:
+        anonymizer.anonymize_segment(line)
+    stats = cache.stats()
+    assert stats['entries'] == 2 and stats['evictions'] == 1
+
+    for output, pseudonyms in cache._entries.values():
+        assert 'Costa' not in output and 'Rui' not in output
+        assert all(isinstance(offset, int) and 'Costa' not in pseudo
+                   for _, offset, _, pseudo in pseudonyms)
+
+    print("✓ Admission, bounds and stored content")
+
+
+def test_batch_and_endpoint_stats():
+    """Batch jobs report cache counters; the API exposes the worker's cache."""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        tmp = Path(tmpdir)
+        (tmp / 'feed.hl7').write_text('\n\n'.join(_messages(200, seed=9)) + '\n')
+        (tmp / 'manifest.txt').write_text('feed.hl7\n')
+
+        outputs = []
+        for cache in (None, SegmentCache()):
+            job = BatchJob(tmp / 'manifest.txt', tmp / f'out{len(outputs)}', chunk_size=50,
+                           segment_cache=cache)
+            status = job.run()
+            outputs.append((tmp / f'out{len(outputs)}' / 'feed.hl7').read_text())
+
+        assert outputs[0] == outputs[1]
+        assert status['segment_cache']['hits'] > 0
+
+    os.environ.setdefault('NUBILUM_LOG_DIR', tempfile.mkdtemp())
+    from nubilum import app as app_module
+
+    client = app_module.app.test_client()
+    message = "\n".join([
+        "MSH|^~\\&|APP|FAC|REC|FAC|20250107120000||ADT^A01|MSG1|P|2.5",
+        "EVN|A01|20250107120000|||OPER^Clerk",
+        "PV1|1|O|||||D1^Costa^Rui",
+    ])
+    for _ in range(3):
+        assert client.post('/api/anonymize', json={'message': message}).status_code == 200
+
+    data = client.get('/api/segment-cache/stats').get_json()
+    assert data['enabled'] and data['hits'] > 0
+    assert set(data) >= {'entries', 'misses', 'hit_rate', 'uncacheable', 'conflicts', 'evictions'}
+
+    print("✓ Batch and endpoint statistics")
+
+
+if __name__ == '__main__':
+    test_cached_output_matches_fresh()
+    test_shared_cache_across_anonymizers()
+    test_cache_admission_and_bounds()
+    test_batch_and_endpoint_stats()
+    print("\nAll segment cache tests passed!")
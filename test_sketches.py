@@ -0,0 +1,145 @@
+"""Tests for the usage analytics sketches and the statistics built on them."""
+
+import json
+import multiprocessing
+import random
+import tempfile
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from nubilum.sketches import DDSketch, HyperLogLog, SpaceSaving
+from nubilum.usage_events import UsageEventColumns
+from nubilum.usage_stats import UsageStatistics
+from nubilum.usage_tracker import UsageTracker
+
+
+def _roundtrip(sketch):
+    return type(sketch).from_dict(json.loads(json.dumps(sketch.to_dict())))
+
+
+def test_hyperloglog_accuracy_and_merge():
+    """Distinct counts are within a few percent; merged halves equal one pass."""
+    for count in (0, 50, 3000, 60000):
+        whole, left, right = HyperLogLog(), HyperLogLog(), HyperLogLog()
+        for n in range(count):
+            value = f"MSG{n}"
+            whole.add(value)
+            (left if n % 3 else right).add(value)
+            left.add(f"MSG{n // 2}")  # duplicates are not counted twice
+
+        merged = _roundtrip(left).merge(_roundtrip(right))
+        assert merged.count() == whole.count()
+        assert abs(whole.count() - count) <= max(1, count * 0.05)
+
+    print("✓ HyperLogLog accuracy and merge")
+
+
+def test_ddsketch_relative_accuracy():
+    """Quantiles are within the relative accuracy; merging is exact."""
+    rnd = random.Random(7)
+    values = [int(rnd.lognormvariate(7, 1)) for _ in range(20000)] + [0] * 50
+    whole, left, right = DDSketch(), DDSketch(), DDSketch()
+    for n, value in enumerate(values):
+        whole.add(value)
+        (left if n % 2 else right).add(value)
+
+    assert _roundtrip(left).merge(right).to_dict() == whole.to_dict()
+
+    values.sort()
+    quantiles = [0.0, 0.5, 0.9, 0.95, 0.99, 1.0]
+    for q, estimate in zip(quantiles, whole.quantiles(quantiles)):
+        exact = values[int(q * (len(values) - 1))]
+        assert abs(estimate - exact) <= exact * 0.011
+
+    assert DDSketch().quantiles([0.5]) == [None]
+    print("✓ DDSketch relative accuracy")
+
+
+def test_space_saving_top_k():
+    """Counts are exact under capacity; heavy hitters and bounds survive overflow."""
+    rnd = random.Random(3)
+    stream = [f"APP{rnd.randrange(5)}" for _ in range(5000)] + [f"RARE{n}" for n in range(300)]
+    rnd.shuffle(stream)
+    exact = {item: stream.count(item) for item in set(stream)}
+
+    small = SpaceSaving(capacity=400)
+    for item in stream:
+        small.add(item)
+    assert {item: count for item, count, _ in small.top()} == exact
+
+    left, right = SpaceSaving(capacity=20), SpaceSaving(capacity=20)
+    for n, item in enumerate(stream):
+        (left if n % 2 else right).add(item)
+    top = _roundtrip(left).merge(right).top(5)
+
+    assert {item for item, _, _ in top} == {f"APP{n}" for n in range(5)}
+    for item, count, error in top:
+        assert count - error <= exact[item] <= count
+
+    print("✓ Space-Saving top-K")
+
+
+def _track(tracker: UsageTracker, numbers) -> None:
+    for n in numbers:
+        segments = "\n".join(f"OBX|{i}|TX|NOTE||text" for i in range(n % 6))
+        tracker.track_anonymization(
+            f"MSH|^~\\&|APP{n % 4}|FAC{n % 2}|REC|FAC|20250107||ORU^R01|CTRL{n % 100}|P|2.5\n"
+            f"PID|1||{n}\n{segments}")
+
+
+def _worker(tracker: UsageTracker, numbers) -> None:
+    _track(tracker, numbers)
+    tracker.sketches.flush()  # multiprocessing children skip atexit
+
+
+def test_tracked_sketch_statistics():
+    """Sketches are kept as events are tracked, merged across workers, and never rebuilt from the log."""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        log_file = Path(tmpdir) / 'usage_log.jsonl'
+        tracker = UsageTracker(str(log_file), stats_workers=1)
+
+        # Half of the events are tracked by a forked worker
+        child = multiprocessing.get_context('fork').Process(target=_worker, args=(tracker, range(60)))
+        child.start()
+        child.join()
+        assert child.exitcode == 0
+        _track(tracker, range(60, 120))
+
+        content = log_file.read_text()
+        assert 'CTRL1' not in content and 'APP0' not in content and 'sending_application' not in content
+
+        # Old events, logged without sketches, are still counted
+        now = datetime.now() - timedelta(days=1)
+        old = {"timestamp": now.isoformat(), "date": now.strftime("%Y-%m-%d"), "message_type": "ADT^A01",
+               "segment_counts": {"MSH": 1}, "total_segments": 1, "message_length": 40, "success": True}
+        (Path(tmpdir) / 'usage_log.jsonl.1').write_text(json.dumps(old) + '\n')
+
+        stats = tracker.get_statistics()
+        assert stats['total_anonymizations'] == 121
+        assert stats['distinct_sending_applications'] == 4
+        assert stats['distinct_sending_facilities'] == 2
+        assert abs(stats['distinct_message_control_ids'] - 100) <= 2
+        assert stats['segments_per_message_percentiles']['p50'] == 4
+        assert stats['top_senders'][0]['count'] == 30
+        assert {(s['sending_application'], s['sending_facility']) for s in stats['top_senders']} == {
+            ('APP0', 'FAC0'), ('APP1', 'FAC1'), ('APP2', 'FAC0'), ('APP3', 'FAC1')}
+        assert tracker.get_statistics(days=0)['top_senders'][0]['count'] == 30
+        assert len(list((Path(tmpdir) / '.usage-sketches').glob('*.json'))) == 2
+        tracker.sketches.close()
+
+        events = [json.loads(line) for line in content.splitlines()]
+        expected = UsageEventColumns.from_events([old] + events).statistics()
+        assert expected['top_senders'] == [] and expected['total_anonymizations'] == 121
+        sharded = UsageStatistics(log_file, workers=1, range_size=1024)
+        assert sharded.compute() == expected
+        assert sharded.compute() == expected  # from the cached partials
+
+    print("✓ Tracked sketch statistics")
+
+
+if __name__ == '__main__':
+    test_hyperloglog_accuracy_and_merge()
+    test_ddsketch_relative_accuracy()
+    test_space_saving_top_k()
+    test_tracked_sketch_statistics()
+    print("\nAll sketch tests passed!")
@@ -0,0 +1,133 @@
+"""Test script for the spool-directory ingestion daemon."""
+
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from nubilum.anonymizer import HL7Anonymizer
+from nubilum.spool import SpoolDaemon, read_status
+
+MESSAGE = "\r".join([
+    "MSH|^~\\&|LAB|HOSPITAL|EHR|HOSPITAL|20250107120000||ADT^A01|MSG1|P|2.5",
+    "PID|1||123456^^^HOSPITAL^MR||Silva^Ana||19800515|F",
+])
+
+
+def _drop(directory: Path, name: str, data: bytes) -> None:
+    """Write a file the way an interface engine should: temporary name, then rename."""
+    tmp = directory / f".{name}.tmp"
+    tmp.write_bytes(data)
+    os.replace(tmp, directory / name)
+
+
+def _wait_for(condition, timeout=15.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def _run_daemon(use_inotify):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        inbound = Path(tmpdir) / 'in'
+        outbound = Path(tmpdir) / 'out'
+        inbound.mkdir()
+
+        # Waiting before the daemon starts
+        _drop(inbound, 'early.hl7', (MESSAGE + '\r\n').encode())
+
+        daemon = SpoolDaemon([inbound], outbound, workers=2, batch_size=4,
+                             poll_interval=0.1, use_inotify=use_inotify)
+        thread = threading.Thread(target=daemon.run)
+        thread.start()
+        try:
+            for n in range(10):
+                _drop(inbound, f"burst{n}.hl7", (MESSAGE + '\n\n' + MESSAGE).encode())
+            _drop(inbound, 'poison.hl7', b'MSH|^~\\&|\xff\xfe broken')
+
+            quarantine = outbound / '.nubilum-spool' / 'quarantine'
+            assert _wait_for(lambda: len(list(outbound.glob('*.hl7'))) == 11
+                             and (quarantine / 'poison.hl7.error.json').exists())
+        finally:
+            daemon.stop()
+            thread.join(15)
+
+        assert not thread.is_alive()
+        assert not list(inbound.iterdir())
+
+        expected = HL7Anonymizer().anonymize_message(MESSAGE.replace('\r', '\n'))
+        assert (outbound / 'early.hl7').read_text() == expected + '\n\n'
+        assert (outbound / 'burst3.hl7').read_text() == (expected + '\n\n') * 2
+        assert not list(outbound.glob('.*.tmp'))
+
+        assert (quarantine / 'poison.hl7').read_bytes().endswith(b'broken')
+        assert 'byte' in (quarantine / 'poison.hl7.error.json').read_text()
+
+        status = read_status(outbound / '.nubilum-spool')
+        assert status['state'] == 'stopped'
+        assert use_inotify or status['watcher'] == 'polling'
+        assert status['files_processed'] == 11 and status['messages_processed'] == 21
+        assert status['files_quarantined'] == 1
+        assert status['queue_depth'] == 0 and status['in_flight'] == 0
+
+
+def test_failed_output_retried():
+    """A file whose output cannot be written stays in the spool and is retried after a backoff."""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        inbound = Path(tmpdir) / 'in'
+        outbound = Path(tmpdir) / 'out'
+        inbound.mkdir()
+        # A directory where the output belongs makes the write fail, like a full disk
+        (outbound / 'stuck.hl7').mkdir(parents=True)
+
+        daemon = SpoolDaemon([inbound], outbound, workers=1, poll_interval=0.1, retry_delay=0.2)
+        thread = threading.Thread(target=daemon.run)
+        thread.start()
+        try:
+            _drop(inbound, 'stuck.hl7', MESSAGE.encode())
+            assert _wait_for(lambda: daemon.status()['files_failed'] >= 2)
+            assert (inbound / 'stuck.hl7').exists() and daemon.status()['retry_pending'] == 1
+
+            (outbound / 'stuck.hl7').rmdir()
+            assert _wait_for(lambda: (outbound / 'stuck.hl7').is_file())
+        finally:
+            daemon.stop()
+            thread.join(15)
+
+        assert not (inbound / 'stuck.hl7').exists()
+        status = read_status(outbound / '.nubilum-spool')
+        assert status['files_processed'] == 1 and status['retry_pending'] == 0
+
+    print("✓ Failed output retried")
+
+
+def test_spool_inotify():
+    """New files are anonymized atomically, poison files quarantined (inotify when available)."""
+    _run_daemon(use_inotify=True)
+    print("✓ Spool daemon processes and quarantines files")
+
+
+def test_spool_polling():
+    """The polling fallback picks up the same files."""
+    _run_daemon(use_inotify=False)
+    print("✓ Polling fallback works")
+
+
+if __name__ == '__main__':
+    print("Testing Spool Daemon\n" + "=" * 50)
+
+    try:
+        test_spool_inotify()
+        test_spool_polling()
+        test_failed_output_retried()
+
+        print("\n" + "=" * 50)
+        print("✅ All spool daemon tests passed!")
+
+    except AssertionError as e:
+        print(f"\n❌ Test failed: {e}")
+        exit(1)
@@ -0,0 +1,117 @@
+"""Tests for the surrogate dictionaries and the realistic names and addresses drawn from them."""
+
+import random
+import re
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+
+from nubilum.anonymizer import HL7Anonymizer
+from nubilum.surrogates import (DEFAULT_PATH, SOURCE_DIR, TABLES, SurrogateDictionaries, alias_table,
+                                build, dictionaries, read_source)
+
+MESSAGE = "\n".join([
+    "MSH|^~\\&|APP|FAC|REC|FAC|20250107120000||ADT^A01|MSG1|P|2.5",
+    "PID|1||12345^^^HOSP^MR||Silva^Ana^Maria||19800101|F|||Rua das Flores 12^3 Esq^Porto^Porto^4000-123^PT",
+    "NK1|1|Silva^Rui|SPO|Rua das Flores 12^^Porto^^4000-123",
+    "OBX|1|TX|NOTE||Ana Silva, Rua das Flores 12, 4000-123 Porto||||||F",
+])
+
+
+def test_bundled_file_matches_sources():
+    """The bundled file is the build of the TSV sources, entry for entry."""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        output = Path(tmpdir) / 'surrogates.bin'
+        build(SOURCE_DIR, output)
+        assert output.read_bytes() == DEFAULT_PATH.read_bytes(), "rebuild with: nubilum surrogates build"
+
+    loaded = SurrogateDictionaries(DEFAULT_PATH)
+    for name, columns in TABLES.items():
+        entries, _ = read_source(SOURCE_DIR / f'{name}.tsv', len(columns))
+        table = loaded[name]
+        assert len(table) == len(entries) > 100
+        for index in (0, len(entries) // 2, len(entries) - 1):
+            assert tuple(table.value(index, c) for c in range(len(columns))) == entries[index]
+
+    print("✓ Bundled file matches sources")
+
+
+def test_alias_sampling_follows_weights():
+    """Alias tables reproduce the weights exactly; draws from hashes follow them."""
+    weights = [7, 1, 1, 40, 3, 13, 1, 2]
+    table = alias_table(weights)
+    mass = [0] * len(weights)
+    for slot, (threshold, alias) in enumerate(table):
+        mass[slot] += threshold
+        mass[alias] += 2 ** 32 - threshold
+    total = sum(weights)
+    for weight, share in zip(weights, mass):
+        assert abs(share - weight * len(weights) * 2 ** 32 / total) <= len(weights)
+
+    surnames = dictionaries()['surnames']
+    entries, source_weights = read_source(SOURCE_DIR / 'surnames.tsv', 1)
+    rnd = random.Random(5)
+    draws = 200000
+    counts = Counter(surnames.index(rnd.getrandbits(64)) for _ in range(draws))
+    total = sum(source_weights)
+    for index in range(5):
+        expected = draws * source_weights[index] / total
+        assert abs(counts[index] - expected) < 5 * expected ** 0.5, entries[index]
+
+    print("✓ Alias sampling follows weights")
+
+
+def test_surrogates_are_deterministic_and_never_the_original():
+    """Equal values get equal surrogates in both modes; no surrogate is part of its original."""
+    for key in (None, b'k' * 32):
+        output = HL7Anonymizer(key=key).anonymize_message(MESSAGE)
+        assert output == HL7Anonymizer(key=key).anonymize_message(MESSAGE)
+        assert 'Silva' not in output and 'Flores' not in output and '4000-123' not in output
+
+        pid, nk1, obx = (line.split('|') for line in output.split('\n')[1:])
+        surname, given, middle = pid[5].split('^')
+        street, designation, city, district, postal_code, country = pid[11].split('^')
+        assert nk1[2].split('^')[0] == surname and nk1[4].split('^')[0] == street
+        assert designation == "" and country == "PT" and re.fullmatch(r'\d{4}-\d{3}', postal_code)
+        assert f"{given} {surname}, {street}, {postal_code}" in obx[5]
+
+    # Keyed names keep their reversible code after the surrogate
+    assert re.fullmatch(r'\D+\d{16}', surname)
+
+    # Originals that contain a dictionary entry get another entry
+    anonymizer = HL7Anonymizer()
+    surnames = dictionaries()['surnames']
+    for n in range(2 * len(surnames)):
+        entry = surnames.value(n % len(surnames))
+        original = entry if n < len(surnames) else f"{entry}-{n}"
+        assert entry.casefold() not in anonymizer._derive_pseudo_name(original, 'last_name').casefold()
+
+    print("✓ Surrogates are deterministic and never the original")
+
+
+def test_original_containing_every_entry():
+    """An original containing every dictionary entry gets a suffixed surrogate instead of redrawing forever."""
+    tables = dictionaries()
+    surnames = ' '.join(tables['surnames'].value(n) for n in range(len(tables['surnames'])))
+    given = ' '.join(tables['given_names'].value(n) for n in range(len(tables['given_names'])))
+    message = MESSAGE.replace('Silva^Ana^Maria', f'{surnames}^{given}^{given}')
+
+    for key in (None, b'k' * 32):
+        started = time.perf_counter()
+        output = HL7Anonymizer(key=key).anonymize_message(message)
+        assert time.perf_counter() - started < 5
+        surname, given_name, _ = output.split('\n')[1].split('|')[5].split('^')
+        assert re.fullmatch(r"[^\W\d_][\w' ]*-[a-z]{5}\d*", surname)
+        assert surname.casefold() not in surnames.casefold()
+        assert given_name.casefold() not in given.casefold()
+
+    print("✓ Original containing every entry")
+
+
+if __name__ == '__main__':
+    test_bundled_file_matches_sources()
+    test_alias_sampling_follows_weights()
+    test_surrogates_are_deterministic_and_never_the_original()
+    test_original_containing_every_entry()
+    print("\nAll surrogate tests passed!")
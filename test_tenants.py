@@ -0,0 +1,183 @@
+"""Tests for multi-tenant anonymization: tenant selection, cached engines and isolation."""
+
+import json
+import os
+import tempfile
+import time
+from pathlib import Path
+
+from nubilum.anonymizer import HL7Anonymizer
+from nubilum.profiles import ProfileRegistry
+from nubilum.pseudonym_table import PseudonymCache
+from nubilum.reversible import load_key_file, pseudonym_key, write_key_file
+from nubilum.tenants import TenantAuthError, TenantError, TenantRegistry, api_key_digest
+
+MESSAGE = "\n".join([
+    "MSH|^~\\&|APP|FAC|REC|FAC|20250107120000||ADT^A01|MSG1|P|2.5",
+    "PID|1||12345^^^HOSP^MR||Silva^Ana^Maria||19800101|F|||Rua das Flores 12^^Porto^^4000-123",
+])
+
+RESEARCH_PROFILE = {
+    "name": "research",
+    "rules": [{"segment": "PID", "field": 7, "action": "redact"}],
+}
+
+
+def _write_tenants(tmpdir: Path, tenants: list, **options) -> Path:
+    """Tenants file with a key file for every tenant that has 'key_file'."""
+    for tenant in tenants:
+        if 'key_file' in tenant:
+            write_key_file(tmpdir / tenant['key_file'])
+    (tmpdir / 'research.json').write_text(json.dumps(RESEARCH_PROFILE))
+    path = tmpdir / 'tenants.json'
+    path.write_text(json.dumps({"tenants": tenants, **options}))
+    return path
+
+
+def test_tenant_resolution():
+    """API keys and the tenant header select tenants; invalid selections are rejected."""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = _write_tenants(Path(tmpdir), [
+            {"id": "hospital-a", "api_keys": [api_key_digest("key-a")], "key_file": "a.key"},
+            {"id": "hospital-b", "api_keys": [api_key_digest("key-b")], "profile_file": "research.json"},
+            {"id": "gateway", "profile": "default"},
+        ])
+        registry = TenantRegistry.load(path, ProfileRegistry())
+
+        assert registry.resolve("key-a").id == "hospital-a"
+        assert registry.resolve("key-b", "hospital-b").profile.name == "research"
+        assert registry.resolve(tenant_id="gateway").id == "gateway"
+        assert registry.resolve() is None
+
+        for api_key, tenant_id in (("wrong", None), ("key-a", "hospital-b"), (None, "hospital-a"), (None, "nope")):
+            try:
+                registry.resolve(api_key, tenant_id)
+                assert False, f"expected TenantAuthError for {api_key}, {tenant_id}"
+            except TenantAuthError:
+                pass
+
+        strict = TenantRegistry.load(_write_tenants(Path(tmpdir), [{"id": "x"}], require_tenant=True),
+                                     ProfileRegistry())
+        try:
+            strict.resolve()
+            assert False, "expected TenantAuthError"
+        except TenantAuthError:
+            pass
+
+        for tenants in ([{"id": "a"}, {"id": "a"}], [{"id": "bad id"}], [{"id": "a", "api_keys": ["key-a"]}],
+                        [{"id": "a", "profile": "missing"}], [{"id": "a", "key_file": "missing.key"}]):
+            path = Path(tmpdir) / 'invalid.json'
+            path.write_text(json.dumps({"tenants": tenants}))
+            try:
+                TenantRegistry.load(path, ProfileRegistry())
+                assert False, f"expected TenantError for {tenants}"
+            except TenantError:
+                pass
+
+    print("✓ Tenant resolution")
+
+
+def test_engines_are_cached_and_bounded():
+    """Engines are reused across tenant switches, evicted beyond the limit, and keep their tenant's output."""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        tenants = [{"id": f"t{n}", "api_keys": [api_key_digest(f"key-{n}")], "key_file": f"t{n}.key"}
+                   for n in range(5)]
+        registry = TenantRegistry.load(_write_tenants(Path(tmpdir), tenants), ProfileRegistry(), max_engines=3)
+
+        first = registry.engine(registry.resolve("key-0"))
+        second = registry.engine(registry.resolve("key-1"))
+        assert registry.engine(registry.resolve("key-0")) is first
+        assert registry.engine(registry.resolve("key-1")) is second
+        assert registry.stats()['hits'] == 2 and registry.stats()['misses'] == 2
+
+        # Building an engine reads the key file; cached engines do not
+        os.unlink(Path(tmpdir) / 't0.key')
+        assert registry.engine(registry.resolve("key-0")) is first
+
+        for n in range(2, 5):
+            registry.engine(registry.resolve(f"key-{n}"))
+        stats = registry.stats()
+        assert stats['engines'] == 3 and stats['evictions'] == 2
+
+        # Output equals a plain anonymizer with the tenant's key, also when served from the cache
+        key = pseudonym_key(load_key_file(Path(tmpdir) / 't1.key'))
+        expected = HL7Anonymizer(key=key).anonymize_message(MESSAGE)
+        assert second.anonymizer().anonymize_message(MESSAGE) == expected
+        assert second.anonymizer().anonymize_message(MESSAGE) == expected
+        assert second.pseudonyms.stats()['hits'] > 0
+
+        # Keyed entries never reach anonymizers with another key (or none)
+        cache = PseudonymCache(1000)
+        keyed = HL7Anonymizer(key=key, pseudonym_table=cache).anonymize_message(MESSAGE)
+        assert HL7Anonymizer(pseudonym_table=cache).anonymize_message(MESSAGE) == HL7Anonymizer().anonymize_message(MESSAGE)
+        assert keyed == expected
+
+        small = PseudonymCache(2)
+        for n in range(5):
+            small.put(f"k{n}", f"v{n}")
+        assert len(small) == 2 and small.get("k4") == "v4" and small.get("k0") is None
+
+    print("✓ Engines are cached and bounded")
+
+
+def test_endpoints_isolate_tenants():
+    """Tenants get their own pseudonyms, state tokens and jobs through the API."""
+    os.environ.setdefault('NUBILUM_LOG_DIR', tempfile.mkdtemp())
+    from nubilum import app as app_module
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = _write_tenants(Path(tmpdir), [
+            {"id": "hospital-a", "api_keys": [api_key_digest("key-a")], "key_file": "a.key"},
+            {"id": "hospital-b", "api_keys": [api_key_digest("key-b")], "key_file": "b.key",
+             "profile_file": "research.json"},
+        ])
+        original = app_module.tenant_registry
+        app_module.tenant_registry = TenantRegistry.load(path, app_module.profile_registry)
+        try:
+            client = app_module.app.test_client()
+
+            def anonymize(api_key, **payload):
+                return client.post('/api/anonymize', json={"message": MESSAGE, **payload},
+                                   headers={"X-API-Key": api_key} if api_key else {})
+
+            a = anonymize("key-a", include_state=True).get_json()
+            b = anonymize("key-b").get_json()
+            plain = anonymize(None).get_json()
+            outputs = {a['anonymized_message'], b['anonymized_message'], plain['anonymized_message']}
+            assert len(outputs) == 3 and all('Silva^' not in output for output in outputs)
+            assert anonymize("key-a").get_json()['anonymized_message'] == a['anonymized_message']
+
+            assert anonymize("wrong").status_code == 401
+            assert anonymize("key-b", profile="default").status_code == 400
+
+            segments = {"state": a['state'], "segments": [{"message": 0, "segment": 1, "text": MESSAGE.split("\n")[1]}]}
+            response = client.post('/api/anonymize/segments', json=segments, headers={"X-API-Key": "key-a"})
+            assert response.status_code == 200
+            assert response.get_json()['segments'][0]['anonymized'] == a['anonymized_message'].split("\n")[1]
+            assert client.post('/api/anonymize/segments', json=segments,
+                               headers={"X-API-Key": "key-b"}).status_code == 400
+
+            job = client.post('/api/jobs', json={"message": MESSAGE}, headers={"X-API-Key": "key-b"}).get_json()
+            status_url = job['status_url']
+            for _ in range(100):
+                status = client.get(status_url, headers={"X-API-Key": "key-b"}).get_json()['job']
+                if status['state'] in ('completed', 'failed'):
+                    break
+                time.sleep(0.05)
+            assert status['state'] == 'completed' and status['tenant'] == 'hospital-b'
+            result = client.get(job['result_url'], headers={"X-API-Key": "key-b"}).get_data(as_text=True)
+            assert result.strip() == b['anonymized_message']
+            assert client.get(status_url, headers={"X-API-Key": "key-a"}).status_code == 404
+            assert client.get(status_url).status_code == 404
+            assert client.delete(status_url, headers={"X-API-Key": "key-b"}).status_code == 200
+        finally:
+            app_module.tenant_registry = original
+
+    print("✓ Endpoints isolate tenants")
+
+
+if __name__ == '__main__':
+    test_tenant_resolution()
+    test_engines_are_cached_and_bounded()
+    test_endpoints_isolate_tenants()
+    print("\nAll tenant tests passed!")
@@ -0,0 +1,138 @@
+"""Tests for the streaming usage export: filters, formats and resumable cursors."""
+
+import csv
+import io
+import json
+import os
+import tempfile
+import time
+from pathlib import Path
+
+from nubilum.usage_export import CursorExpired, EventFilter, encode_events, iter_events
+from nubilum.usage_stats import UsageStatistics
+
+
+def _event(n: int) -> dict:
+    day = f"2025-01-{1 + n % 20:02d}"
+    return {
+        "timestamp": f"{day}T10:{n % 60:02d}:00", "date": day, "time": f"10:{n % 60:02d}:00",
+        "message_type": ("ADT^A01", "ORU^R01", "ORM^O01")[n % 3], "segment_counts": {"MSH": 1, "PID": 1},
+        "total_segments": 2, "message_length": 100 + n, "success": n % 7 != 0, "error": None,
+        "sending_application": "RIS", "sending_facility": "HOSP", "duration_ms": 1.5,
+    }
+
+
+def _write(path: Path, events: list) -> None:
+    with open(path, 'a') as f:
+        f.write(''.join(json.dumps(event) + '\n' for event in events))
+
+
+def test_filtered_export_across_shards():
+    """Events come oldest first across rotated shards, filtered and encoded."""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        log_file = Path(tmpdir) / 'usage_log.jsonl'
+        events = [_event(n) for n in range(300)]
+        rotated = Path(tmpdir) / 'usage_log.jsonl.1'
+        _write(rotated, events[:100])
+        os.utime(rotated, (time.time() - 60, time.time() - 60))
+        _write(log_file, events[100:])
+        with open(log_file, 'a') as f:
+            f.write('not json\n{"timestamp": "2025-01-02T')  # partially written last line
+
+        statistics = UsageStatistics(log_file, workers=1)
+        exported = [event for event, _ in iter_events(statistics)]
+        assert exported == events
+
+        event_filter = EventFilter(since="2025-01-05", until="2025-01-10",
+                                   message_types=["ADT^A01", "ORU^R01"], success=True)
+        expected = [e for e in events if "2025-01-05" <= e['date'] <= "2025-01-10"
+                    and e['message_type'] != "ORM^O01" and e['success']]
+        records = list(iter_events(statistics, event_filter))
+        assert [event for event, _ in records] == expected
+
+        ndjson = ''.join(encode_events(iter(records), 'ndjson')).splitlines()
+        assert [json.loads(line)['cursor'] for line in ndjson] == [cursor for _, cursor in records]
+
+        rows = list(csv.DictReader(io.StringIO(''.join(encode_events(iter(records), 'csv')))))
+        assert len(rows) == len(expected) and rows[0]['message_type'] == expected[0]['message_type']
+        assert json.loads(rows[0]['segment_counts']) == {"MSH": 1, "PID": 1}
+
+    print("✓ Filtered export across shards")
+
+
+def test_cursor_resumes_after_rotation():
+    """A cursor resumes after its event, also after the log was rotated; removed shards expire it."""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        log_file = Path(tmpdir) / 'usage_log.jsonl'
+        events = [_event(n) for n in range(120)]
+        _write(log_file, events[:80])
+        statistics = UsageStatistics(log_file, workers=1)
+
+        page = list(iter_events(statistics, limit=50))
+        assert [event for event, _ in page] == events[:50]
+        cursor = page[-1][1]
+
+        # logrotate renames the active log and a new one is started
+        os.utime(log_file, (time.time() - 60, time.time() - 60))
+        log_file.rename(Path(tmpdir) / 'usage_log.jsonl.1')
+        _write(log_file, events[80:])
+
+        rest = [event for event, _ in iter_events(statistics, cursor=cursor)]
+        assert rest == events[50:]
+
+        (Path(tmpdir) / 'usage_log.jsonl.1').unlink()
+        try:
+            iter_events(statistics, cursor=cursor)
+            assert False, "expected CursorExpired"
+        except CursorExpired:
+            pass
+
+    print("✓ Cursor resumes after rotation")
+
+
+def test_export_endpoint():
+    """The endpoint streams events and daily rows, and rejects bad parameters."""
+    os.environ.setdefault('NUBILUM_LOG_DIR', tempfile.mkdtemp())
+    from nubilum import app as app_module
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        log_file = Path(tmpdir) / 'usage_log.jsonl'
+        events = [_event(n) for n in range(60)]
+        _write(log_file, events)
+
+        original = app_module.usage_tracker.statistics
+        app_module.usage_tracker.statistics = UsageStatistics(log_file, workers=1,
+                                                              cache_dir=Path(tmpdir) / 'cache')
+        try:
+            client = app_module.app.test_client()
+
+            response = client.get('/api/usage/export?limit=25&message_type=ADT^A01')
+            assert response.status_code == 200 and response.mimetype == 'application/x-ndjson'
+            first = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+            assert len(first) == 20 and all(e['message_type'] == 'ADT^A01' for e in first)
+
+            response = client.get('/api/usage/export', query_string={
+                'format': 'csv', 'limit': 5, 'cursor': first[9]['cursor'], 'message_type': 'ADT^A01'})
+            rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+            assert [row['timestamp'] for row in rows] == [e['timestamp'] for e in first[10:15]]
+
+            response = client.get('/api/usage/export?view=daily&format=csv&since=2025-01-03&until=2025-01-04')
+            rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+            assert [row['date'] for row in rows] == ['2025-01-03', '2025-01-04']
+            assert rows[0]['anonymizations'] == '3' and rows[0]['latency_p50_ms']
+
+            for query in ('format=xml', 'since=yesterday', 'success=maybe', 'limit=0', 'cursor=abc',
+                          'view=monthly'):
+                assert client.get(f'/api/usage/export?{query}').status_code == 400
+            assert client.get(f'/api/usage/export?cursor=ffffff.10.{"0" * 16}').status_code == 410
+        finally:
+            app_module.usage_tracker.statistics = original
+
+    print("✓ Export endpoint")
+
+
+if __name__ == '__main__':
+    test_filtered_export_across_shards()
+    test_cursor_resumes_after_rotation()
+    test_export_endpoint()
+    print("\nAll usage export tests passed!")
@@ -0,0 +1,105 @@
+"""Test script for sharded, cached usage statistics."""
+
+import json
+import tempfile
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from nubilum import usage_stats
+from nubilum.usage_events import UsageEventColumns
+from nubilum.usage_stats import UsageStatistics
+
+
+def _events(count: int) -> list:
+    now = datetime.now()
+    events = []
+    for n in range(count):
+        timestamp = now - timedelta(days=n % 20, hours=n % 7)
+        events.append({
+            "timestamp": timestamp.isoformat(),
+            "date": timestamp.strftime("%Y-%m-%d"),
+            "message_type": ("ADT^A01", "ORU^R01", "ORM^O01")[n % 3],
+            "segment_counts": {"MSH": 1, "PID": 1, "OBX": n % 4},
+            "total_segments": 2 + n % 4,
+            "message_length": 100 + n,
+            "success": n % 10 != 0,
+        })
+    return events
+
+
+def _lines(events: list) -> str:
+    return ''.join(json.dumps(event) + '\n' for event in events)
+
+
+def test_sharded_statistics_match_single_pass():
+    """Statistics over ranges of rotated shards equal a single pass over all events."""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        events = _events(600)
+        log_file = Path(tmpdir) / 'usage_log.jsonl'
+        (Path(tmpdir) / 'usage_log.jsonl.1').write_text(_lines(events[:200]))
+        (Path(tmpdir) / 'usage_log.jsonl-20250101').write_text(_lines(events[200:400]) + 'garbage\n')
+        log_file.write_text(_lines(events[400:]))
+
+        engine = UsageStatistics(log_file, workers=1, range_size=4096)
+        expected = UsageEventColumns.from_events(events)
+
+        assert engine.compute() == expected.statistics()
+
+        cutoff = (datetime.now() - timedelta(days=5)).date()
+        recent = [e for e in events if datetime.fromisoformat(e['timestamp']).date() >= cutoff]
+        assert engine.compute(days=5) == UsageEventColumns.from_events(recent).statistics()
+
+    print("✓ Sharded statistics match a single pass")
+
+
+def test_closed_shards_not_reparsed():
+    """Cached shards are not parsed again; only the appended tail of the active log is."""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        events = _events(300)
+        rotated = Path(tmpdir) / 'usage_log.jsonl.1'
+        log_file = Path(tmpdir) / 'usage_log.jsonl'
+        rotated.write_text(_lines(events[:200]))
+        log_file.write_text(_lines(events[200:250]))
+
+        engine = UsageStatistics(log_file, workers=1)
+        engine.compute()
+
+        parsed = []
+        original = usage_stats._aggregate_range
+        usage_stats._aggregate_range = lambda path, start, end: parsed.append((path, start)) or original(path, start, end)
+        try:
+            assert engine.compute()['total_anonymizations'] == 250
+            assert parsed == []
+
+            with open(log_file, 'a') as f:
+                f.write(_lines(events[250:]))
+            offset = len(_lines(events[200:250]).encode())
+
+            assert engine.compute()['total_anonymizations'] == 300
+            assert parsed == [(str(log_file), offset)]
+
+            # Rotation renames the active log: its cache entry follows the inode
+            parsed.clear()
+            log_file.rename(Path(tmpdir) / 'usage_log.jsonl.2')
+            log_file.touch()
+            assert engine.compute()['total_anonymizations'] == 300
+            assert parsed == []
+        finally:
+            usage_stats._aggregate_range = original
+
+    print("✓ Closed shards served from cache")
+
+
+if __name__ == '__main__':
+    print("Testing Usage Statistics Engine\n" + "=" * 50)
+
+    try:
+        test_sharded_statistics_match_single_pass()
+        test_closed_shards_not_reparsed()
+
+        print("\n" + "=" * 50)
+        print("✅ All usage statistics tests passed!")
+
+    except AssertionError as e:
+        print(f"\n❌ Test failed: {e}")
+        exit(1)
@@ -113,6 +113,78 @@ def test_multiple_messages():
         print(f"  Message type breakdown: {stats['message_types']}")
 
 
+def test_segment_and_hourly_aggregation():
+    """Test segment totals, daily counts and hours across events."""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        log_file = Path(tmpdir) / "test_usage.jsonl"
+        events = [
+            {"timestamp": "2025-01-07T09:15:00", "date": "2025-01-07", "message_type": "ADT^A01",
+             "segment_counts": {"MSH": 1, "PID": 1}, "total_segments": 2, "message_length": 100,
+             "success": True},
+            {"timestamp": "2025-01-08T14:00:00", "date": "2025-01-08", "message_type": "ORU^R01",
+             "segment_counts": {"MSH": 1, "OBX": 3}, "total_segments": 4, "message_length": 300,
+             "success": False},
+        ]
+        log_file.write_text(''.join(json.dumps(e) + '\n' for e in events) + 'not json\n')
+
+        stats = UsageTracker(str(log_file)).get_statistics()
+
+        assert stats['total_anonymizations'] == 2
+        assert stats['segments_processed'] == {"OBX": 3, "MSH": 2, "PID": 1}
+        assert stats['daily_counts'] == {"2025-01-07": 1, "2025-01-08": 1}
+        assert stats['hourly_distribution'] == {9: 1, 14: 1}
+        assert stats['average_message_length'] == 200
+        assert stats['average_segments_per_message'] == 3.0
+
+        print("\n✓ Segment, daily and hourly aggregation correct")
+
+
+def test_processing_time_statistics():
+    """Test latency percentiles and throughput per message type and day."""
+    with tempfile.TemporaryDirectory() as tmpdir:
+        log_file = Path(tmpdir) / "test_usage.jsonl"
+        events = []
+        for n in range(200):
+            day = 7 + n % 2
+            events.append({
+                "timestamp": f"2025-01-{day:02d}T10:00:00", "date": f"2025-01-{day:02d}",
+                "message_type": ("ADT^A01", "ORU^R01")[n % 4 // 2], "segment_counts": {"MSH": 1},
+                "total_segments": 1, "message_length": 100, "success": True,
+                "duration_ms": (n % 100 + 1) / 10 * (1 + n % 4 // 2),
+                **({"request_duration_ms": 50.0} if n % 10 == 9 else {}),
+            })
+        # Events logged before durations were recorded are not timed
+        events.append({"timestamp": "2025-01-07T10:00:00", "date": "2025-01-07", "message_type": "ADT^A01",
+                       "segment_counts": {}, "total_segments": 0, "message_length": 0, "success": True})
+        log_file.write_text(''.join(json.dumps(e) + '\n' for e in events))
+
+        stats = UsageTracker(str(log_file), stats_workers=1).get_statistics()
+        latency = stats['latency']
+
+        durations = sorted(e['duration_ms'] for e in events if 'duration_ms' in e)
+        assert latency['count'] == 200
+        for p in (50, 95, 99):
+            exact = durations[int(p / 100 * (len(durations) - 1))]
+            assert abs(latency[f'p{p}_ms'] - exact) <= exact * 0.011
+        assert latency['throughput_per_second'] == round(200 * 1000 / sum(e.get('duration_ms', 0) for e in events), 1)
+        assert stats['request_latency']['count'] == 20 and abs(stats['request_latency']['p50_ms'] - 50) <= 0.5
+
+        by_type = stats['latency_by_message_type']
+        assert by_type['ORU^R01']['p50_ms'] > 1.8 * by_type['ADT^A01']['p50_ms']
+        assert by_type['ADT^A01']['throughput_per_second'] > by_type['ORU^R01']['throughput_per_second']
+        assert set(stats['latency_by_day']) == {"2025-01-07", "2025-01-08"}
+        assert stats['latency_by_day']["2025-01-07"]['count'] == 100
+
+        # The tracker records durations given by the caller
+        tracker = UsageTracker(str(Path(tmpdir) / "tracked.jsonl"))
+        tracker.track_anonymization("MSH|^~\\&|A|B|C|D|20250107||ADT^A01|1|P|2.5", duration_ms=1.23456,
+                                    request_duration_ms=2.5)
+        event = json.loads((Path(tmpdir) / "tracked.jsonl").read_text())
+        assert event['duration_ms'] == 1.235 and event['request_duration_ms'] == 2.5
+
+        print("\n✓ Processing time statistics correct")
+
+
 if __name__ == '__main__':
     print("Testing Usage Tracking\n" + "=" * 50)
 
@@ -120,6 +192,8 @@ if __name__ == '__main__':
         test_basic_tracking()
         test_failed_anonymization()
         test_multiple_messages()
+        test_segment_and_hourly_aggregation()
+        test_processing_time_statistics()
 
         print("\n" + "=" * 50)
         print("✅ All usage tracking tests passed!")
@@ -0,0 +1,177 @@
+"""Tests for the local structural validator and the /api/validate modes."""
+
+import os
+import tempfile
+import time
+
+from nubilum import validator
+
+ADT_A04 = "\n".join([
+    "MSH|^~\\&|APP|FAC|REC|FAC|20250107120000||ADT^A04|MSG1|P|2.5",
+    "EVN|A04|20250107120000",
+    "PID|1||123456^^^HOSP^MR~654321^^^HOSP^AN||Doe^John||19800515|M",
+    "ZPI|custom|segment",
+    "PV1|1|O",
+])
+
+ORU_R01 = "\n".join([
+    "MSH|^~\\&|LAB|FAC|EHR|FAC|20250107120000||ORU^R01^ORU_R01|MSG2|P|2.5",
+    "PID|1||123456^^^HOSP^MR||Doe^John",
+    "OBR|1|ORD1|FIL1|CBC^Blood count",
+    "OBX|1|NM|HGB^Hemoglobin||13.5|g/dL|||||F",
+    "OBX|2|NM|WBC^Leukocytes||6.1|10*9/L|||||F",
+    "NTE|1||Normal",
+    "OBR|2|ORD2|FIL2|GLU^Glucose",
+    "OBX|1|NM|GLU^Glucose||5.2|mmol/L|||||F",
+])
+
+
+def codes(result):
+    return [(issue['code'], issue['location']) for issue in result['errors']]
+
+
+def test_valid_messages():
+    """Conforming messages pass; the structure is resolved from the trigger event."""
+    result = validator.validate_message(ADT_A04)
+    assert result['valid'], result['errors']
+    assert (result['version'], result['structure']) == ('2.5', 'ADT_A01')
+    assert result['warnings'] == []
+
+    # Consecutive OBX segments start new repetitions of the OBSERVATION group
+    result = validator.validate_message(ORU_R01)
+    assert result['valid'], result['errors']
+    assert result['structure'] == 'ORU_R01'
+
+    print("✓ Conforming messages pass")
+
+
+def test_structure_errors():
+    """Missing, repeated and misplaced segments are reported with their line."""
+    lines = ADT_A04.split("\n")
+
+    missing_event = "\n".join(lines[:1] + lines[2:])
+    assert codes(validator.validate_message(missing_event)) == [('missing_segment', 'EVN')]
+
+    repeated_patient = "\n".join(lines + [lines[4]])
+    result = validator.validate_message(repeated_patient)
+    assert codes(result) == [('cardinality', 'PV1')]
+    assert result['errors'][0]['line'] == 6
+
+    misplaced = "\n".join(lines[:2] + [lines[4], lines[2]])
+    result = validator.validate_message(misplaced)
+    assert ('missing_segment', 'PID') in codes(result)
+    assert ('unexpected_segment', 'PID') in codes(result)
+
+    unknown = validator.validate_message(ADT_A04 + "\nXYZ|1")
+    assert codes(unknown) == [('segment', 'XYZ')]
+
+    print("✓ Structure errors reported")
+
+
+def test_field_errors():
+    """Required fields, field repetitions and primitive data types are checked."""
+    message = "\n".join([
+        "MSH|^~\\&|APP|FAC|REC|FAC|2025-01-07||ADT^A01|MSG1|P|2.5",
+        "EVN|A01|20250107120000",
+        "PID|x||123456^^^HOSP^MR||||19801315|M|||||||||||||||||||||||||||||||||extra",
+        "PV1|1|O|||||||||||||||||||||||||||||||||||||||||||||||||||||||",
+    ])
+    result = validator.validate_message(message)
+
+    assert ('datatype', 'MSH-7.1') in codes(result)
+    assert ('datatype', 'PID-1') in codes(result)
+    assert ('required', 'PID-5') in codes(result)
+    assert ('datatype', 'PID-7.1') in codes(result)
+    assert [issue['code'] for issue in result['warnings']] == ['extra_fields']
+    assert all(issue['line'] in (1, 3) for issue in result['errors'])
+
+    # Escaped values and explicit nulls are not type-checked
+    assert validator.validate_message(ADT_A04.replace('|M', '|M|""'))['valid']
+
+    print("✓ Field errors reported")
+
+
+def test_versions_and_unknown_structures():
+    """MSH-12 selects the definitions; unknown versions and structures degrade to warnings."""
+    result = validator.validate_message(ADT_A04.replace('|P|2.5', '|P|2.3'))
+    assert result['valid'] and result['version'] == '2.3'
+
+    result = validator.validate_message(ADT_A04.replace('|P|2.5', '|P|9.9'))
+    assert result['valid'] and result['version'] == '2.5'
+    assert [issue['code'] for issue in result['warnings']] == ['version']
+
+    result = validator.validate_message(ADT_A04.replace('ADT^A04', 'ZZZ^Z99'))
+    assert result['valid'] and result['structure'] is None
+    assert [issue['code'] for issue in result['warnings']] == ['structure']
+
+    result = validator.validate_message("PID|1||123")
+    assert not result['valid'] and codes(result) == [('header', 'MSH')]
+
+    print("✓ Versions and unknown structures handled")
+
+
+def test_local_validation_speed():
+    """Compiled profiles make validating a message a sub-millisecond operation."""
+    validator.validate_message(ORU_R01)
+
+    started = time.perf_counter()
+    for _ in range(1000):
+        validator.validate_message(ORU_R01)
+    elapsed = time.perf_counter() - started
+
+    assert elapsed < 1.0, f"1000 validations took {elapsed:.2f}s"
+    print(f"✓ Local validation: {elapsed * 1000:.0f}µs per message")
+
+
+def test_validate_endpoint_modes():
+    """Auto mode only calls the remote validator for messages passing the local check."""
+    os.environ.setdefault('NUBILUM_LOG_DIR', tempfile.mkdtemp())
+    from nubilum import app as app_module
+
+    remote_calls = []
+
+    def fake_remote(message_number, message):
+        remote_calls.append(message_number)
+        return {'message_number': message_number, 'valid': True, 'message': 'OK',
+                'source': 'remote', 'details': {'statusCode': 'ok'}}
+
+    original = app_module.remote_validation_result
+    app_module.remote_validation_result = fake_remote
+    try:
+        client = app_module.app.test_client()
+        invalid = ADT_A04.replace('Doe^John', '')
+        text = f"{ADT_A04}\n\n{invalid}"
+
+        response = client.post('/api/validate', json={'message': text, 'mode': 'auto'})
+        data = response.get_json()
+        assert response.status_code == 200 and data['mode'] == 'auto'
+        assert remote_calls == [1]
+        first, second = data['results']
+        assert first['source'] == 'remote' and first['local']['structure'] == 'ADT_A01'
+        assert second['source'] == 'local' and not second['valid']
+        assert second['details']['details'][0]['location'] == 'PID-5'
+
+        remote_calls.clear()
+        data = client.post('/api/validate', json={'message': text, 'mode': 'local'}).get_json()
+        assert remote_calls == []
+        assert [result['valid'] for result in data['results']] == [True, False]
+
+        data = client.post('/api/validate', json={'message': text, 'mode': 'remote'}).get_json()
+        assert remote_calls == [1, 2]
+
+        response = client.post('/api/validate', json={'message': text, 'mode': 'offline'})
+        assert response.status_code == 400
+    finally:
+        app_module.remote_validation_result = original
+
+    print("✓ Validation modes")
+
+
+if __name__ == '__main__':
+    test_valid_messages()
+    test_structure_errors()
+    test_field_errors()
+    test_versions_and_unknown_structures()
+    test_local_validation_speed()
+    test_validate_endpoint_modes()
+    print("\nAll validator tests passed!")
@@ -0,0 +1,115 @@
+"""Tests for the warm-up phase, the readiness endpoint and the cached field name lookups."""
+
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from nubilum import hl7ref, warmup
+
+
+def test_ready_before_and_after_warm_up():
+    """/api/ready answers 503 and starts the warm-up, then 200 with the timed steps."""
+    os.environ.setdefault('NUBILUM_LOG_DIR', tempfile.mkdtemp())
+    from nubilum import app as app_module
+
+    original = warmup._state
+    warmup._state = {
+        'ready': False, 'started': False, 'started_at': None, 'completed_at': None,
+        'duration_seconds': None, 'steps': {}, 'pid': None, 'error': None,
+    }
+    try:
+        client = app_module.app.test_client()
+
+        response = client.get('/api/ready')
+        assert response.status_code == 503
+        assert response.get_json()['status'] == 'warming_up'
+
+        deadline = time.monotonic() + 60
+        while client.get('/api/ready').status_code != 200:
+            assert time.monotonic() < deadline, "warm-up did not complete"
+            time.sleep(0.05)
+
+        state = client.get('/api/ready').get_json()['warmup']
+        assert state['ready'] and state['error'] is None
+        assert set(state['steps']) == {'import_hl7apy', 'field_names', 'validation_profiles',
+                                       'surrogates', 'rule_plans'}
+        assert state['warmed_in_pid'] == state['pid'] == os.getpid()
+
+        # A second warm-up is a no-op
+        assert warmup.warm_up()['completed_at'] == state['completed_at']
+    finally:
+        warmup._state = original
+
+    print("✓ Ready before and after warm-up")
+
+
+def test_field_names():
+    """Field names use HL7 numbering (shifted for MSH) and fall back for unknown versions and segments."""
+    assert hl7ref.resolve_field_name('PID', 5) == {'field_name': 'Patient Name', 'version': '2.5'}
+    assert hl7ref.resolve_field_name('MSH', 0)['field_name'] == 'Segment ID'
+    assert hl7ref.resolve_field_name('MSH', 1)['field_name'] == 'Encoding Characters'
+    assert hl7ref.resolve_field_name('MSH', 2)['field_name'] == 'Sending Application'  # MSH-3
+    assert hl7ref.resolve_field_name('MSH', 9)['field_name'] == 'Message Control Id'  # MSH-10
+
+    assert hl7ref.resolve_field_name('PID', 5, '2.3') == {'field_name': 'Patient Name', 'version': '2.3'}
+    fallback = hl7ref.resolve_field_name('PID', 5, '9.9')
+    assert fallback['field_name'] == 'Patient Name' and fallback['version'] == '2.5' and 'v9.9' in fallback['note']
+
+    unknown = hl7ref.resolve_field_name('ZZZ', 3)
+    assert unknown == {'field_name': 'ZZZ-3', 'version': '2.5', 'note': 'Field definition not found'}
+
+    # Repeated lookups are answered from the cache
+    hits = hl7ref.field_long_name.cache_info().hits
+    hl7ref.resolve_field_name('PID', 5)
+    assert hl7ref.field_long_name.cache_info().hits == hits + 1
+    assert hl7ref.preload(['2.5']) > 1000
+
+    print("✓ Field names resolved")
+
+
+def test_field_name_endpoint():
+    """/api/field-name returns the resolved name with its fallback note and cache headers."""
+    os.environ.setdefault('NUBILUM_LOG_DIR', tempfile.mkdtemp())
+    from nubilum import app as app_module
+
+    client = app_module.app.test_client()
+    data = client.get('/api/field-name?segment=msh&field=2').get_json()
+    assert data['field_name'] == 'Sending Application' and data['segment'] == 'MSH'
+
+    response = client.get('/api/field-name?segment=PID&field=5&version=9.9')
+    assert response.get_json()['version'] == '2.5' and 'note' in response.get_json()
+    assert 'max-age=86400' in response.headers['Cache-Control']
+
+    assert client.get('/api/field-name?segment=PID').status_code == 400
+
+    print("✓ Field name endpoint")
+
+
+def test_import_has_no_side_effects():
+    """Importing the app creates no log directory and configures no logging; create_app() does both."""
+    probe = (
+        "import logging, os\n"
+        "import nubilum.app as app_module\n"
+        "assert not os.path.exists(os.environ['NUBILUM_LOG_DIR']) and not logging.getLogger().handlers\n"
+        "assert app_module.create_app() is app_module.app\n"
+        "assert len(logging.getLogger().handlers) == 2\n"
+    )
+    with tempfile.TemporaryDirectory() as tmpdir:
+        log_dir = Path(tmpdir) / 'logs'
+        env = dict(os.environ, NUBILUM_LOG_DIR=str(log_dir))
+        subprocess.run([sys.executable, '-c', probe], env=env, check=True,
+                       cwd=os.path.dirname(os.path.abspath(__file__)))
+        assert [path.name for path in log_dir.iterdir()][0].startswith('nubilum_')
+
+    print("✓ Import has no side effects")
+
+
+if __name__ == '__main__':
+    test_ready_before_and_after_warm_up()
+    test_field_names()
+    test_field_name_endpoint()
+    test_import_has_no_side_effects()
+    print("\nAll warm-up tests passed!")